@@ -0,0 +1,448 @@
+"""Message retention and the cold storage archive.
+
+Messages older than a channel's ``archive_after_days`` are moved out of the
+``messages`` table into append-only, gzip-compressed NDJSON segment files,
+one directory per channel. Each segment covers a contiguous run of the
+channel's oldest messages and is indexed by an ``ArchiveSegment`` row
+(id range, time range, count), so readers can skip whole segments without
+opening them. Messages older than ``delete_after_days`` are dropped from
+both tiers.
+
+Policies resolve channel first, then server, then the ``ARCHIVE_AFTER_DAYS``
+setting. Run one pass with ``python -m app.archive``.
+"""
+
+import argparse
+import gzip
+import logging
+import os
+import time
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import orjson
+from sqlalchemy.orm import Session, joinedload
+
+from .config import settings
+from .metrics import archive_messages_total
+from .models import ArchiveSegment, Attachment, Channel, Message, RetentionPolicy, User
+from .sharding import ShardRouter, attach_users
+
+logger = logging.getLogger(__name__)
+
+# Columns stored for each archived message
+ARCHIVED_FIELDS = ("id", "channel_id", "user_id", "content", "created_at", "updated_at", "is_edited")
+
+
+class ArchiveStore:
+    """Reads and writes segment files under one root directory."""
+
+    def __init__(self, root: str):
+        """Initialize the store.
+
+        Args:
+            root: Directory holding one subdirectory per channel
+        """
+        self.root = root
+
+    def path_for(self, channel_id: int, first_id: int, last_id: int) -> str:
+        """Relative path of the segment holding ``first_id..last_id``."""
+        return os.path.join(str(channel_id), f"{first_id:019d}-{last_id:019d}.ndjson.gz")
+
+    def write(self, path: str, rows: List[dict]):
+        """Write a segment atomically (temp file, fsync, rename)."""
+        full_path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        temp_path = f"{full_path}.tmp"
+        with open(temp_path, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0) as segment:
+                for row in rows:
+                    segment.write(orjson.dumps(row))
+                    segment.write(b"\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(temp_path, full_path)
+
+    def read(self, path: str) -> Iterator[dict]:
+        """Yield a segment's messages, oldest first."""
+        with gzip.open(os.path.join(self.root, path), "rb") as segment:
+            for line in segment:
+                row = orjson.loads(line)
+                row["created_at"] = datetime.fromisoformat(row["created_at"])
+                row["updated_at"] = datetime.fromisoformat(row["updated_at"])
+                yield row
+
+    def delete(self, path: str):
+        """Remove a segment file if it exists."""
+        try:
+            os.remove(os.path.join(self.root, path))
+        except FileNotFoundError:
+            pass
+
+
+class Archiver:
+    """Applies retention policies: archives old messages, deletes expired ones."""
+
+    def __init__(
+        self,
+        store: ArchiveStore,
+        archive_after_days: int = 0,
+        batch_size: int = 5000,
+        shard_router: Optional[ShardRouter] = None,
+    ):
+        """Initialize the archiver.
+
+        Args:
+            store: Segment file store
+            archive_after_days: Default age at which messages are archived (0 never)
+            batch_size: Messages per segment at most
+            shard_router: Message shards (None keeps messages on the primary)
+        """
+        self.store = store
+        self.archive_after_days = archive_after_days
+        self.batch_size = batch_size
+        self.shard_router = shard_router
+
+    def plan(self, db: Session) -> List[Tuple[int, int, int]]:
+        """Resolve every channel's policy.
+
+        A channel policy overrides its server's policy field by field; unset
+        fields fall back to the ``archive_after_days`` default.
+
+        Returns:
+            ``(channel_id, archive_after_days, delete_after_days)`` per
+            channel, 0 meaning never
+        """
+        by_server, by_channel = {}, {}
+        for policy in db.query(RetentionPolicy).all():
+            fields = (policy.archive_after_days, policy.delete_after_days)
+            if policy.channel_id is not None:
+                by_channel[policy.channel_id] = fields
+            else:
+                by_server[policy.server_id] = fields
+
+        plan = []
+        # Deleted channels are left to the purge job
+        live_channels = db.query(Channel.id, Channel.server_id).filter(Channel.deleted_at.is_(None))
+        for channel_id, server_id in live_channels.all():
+            archive_after, delete_after = self.archive_after_days, 0
+            for policy in (by_server.get(server_id), by_channel.get(channel_id)):
+                if policy is None:
+                    continue
+                if policy[0] is not None:
+                    archive_after = policy[0]
+                if policy[1] is not None:
+                    delete_after = policy[1]
+            plan.append((channel_id, archive_after, delete_after))
+        return plan
+
+    def run_once(self, db: Session, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Apply every channel's policy.
+
+        Args:
+            db: Primary database session (policies and channels)
+            now: Reference time (defaults to the current UTC time)
+
+        Returns:
+            Counts of ``archived`` and ``deleted`` messages
+        """
+        now = now or datetime.utcnow()
+        totals = {"archived": 0, "deleted": 0}
+        for channel_id, archive_after, delete_after in self.plan(db):
+            if not (archive_after or delete_after):
+                continue
+            with self._message_session(channel_id, db) as message_db:
+                if delete_after:
+                    totals["deleted"] += self.expire_channel(
+                        message_db, channel_id, now - timedelta(days=delete_after), primary=db
+                    )
+                if archive_after:
+                    totals["archived"] += self.archive_channel(
+                        message_db, channel_id, now - timedelta(days=archive_after)
+                    )
+        if totals["archived"] or totals["deleted"]:
+            logger.info(
+                "Retention pass archived %d and deleted %d messages", totals["archived"], totals["deleted"]
+            )
+        return totals
+
+    def _message_session(self, channel_id: int, db: Session):
+        """Session holding the channel's messages and segment index."""
+        if self.shard_router is None:
+            return nullcontext(db)
+        return self.shard_router.session(channel_id, db)
+
+    def archive_channel(self, db: Session, channel_id: int, cutoff: datetime) -> int:
+        """Move a channel's messages created before ``cutoff`` into segments.
+
+        Each segment is written to disk first; its index row and the deletion
+        of the hot rows then commit together. If another archiver got to the
+        same rows first, the delete count does not match and the batch is
+        rolled back.
+
+        Returns:
+            Number of messages archived
+        """
+        archived = 0
+        while True:
+            batch = db.query(Message).filter(
+                Message.channel_id == channel_id,
+                Message.created_at < cutoff
+            ).order_by(Message.id).limit(self.batch_size).all()
+            if not batch:
+                return archived
+
+            rows = [
+                {
+                    **{field: getattr(message, field) for field in ARCHIVED_FIELDS},
+                    "created_at": message.created_at.isoformat(),
+                    "updated_at": message.updated_at.isoformat(),
+                }
+                for message in batch
+            ]
+            ids = [message.id for message in batch]
+            path = self.store.path_for(channel_id, ids[0], ids[-1])
+            self.store.write(path, rows)
+
+            deleted = db.query(Message).filter(Message.id.in_(ids)).delete(synchronize_session=False)
+            if deleted != len(ids):
+                db.rollback()
+                if not db.query(ArchiveSegment).filter(ArchiveSegment.path == path).first():
+                    self.store.delete(path)
+                logger.warning("Channel %s archived concurrently; skipping this pass", channel_id)
+                return archived
+            db.add(ArchiveSegment(
+                channel_id=channel_id,
+                first_id=ids[0],
+                last_id=ids[-1],
+                first_created_at=min(message.created_at for message in batch),
+                last_created_at=max(message.created_at for message in batch),
+                message_count=len(ids),
+                path=path,
+            ))
+            db.commit()
+
+            archived += len(ids)
+            archive_messages_total.inc("archived", amount=len(ids))
+            if len(ids) < self.batch_size:
+                return archived
+
+    def expire_channel(
+        self, db: Session, channel_id: int, cutoff: datetime, primary: Optional[Session] = None
+    ) -> int:
+        """Delete a channel's messages created before ``cutoff`` from both tiers.
+
+        Segments are dropped whole once their newest message is past the
+        cutoff, so a few expired messages may outlive it inside a segment.
+        The attachments posted with expired messages go with them.
+
+        Args:
+            db: Session holding the channel's messages
+            channel_id: Channel ID
+            cutoff: Messages created before this are deleted
+            primary: Session holding attachments, when messages are on a shard
+
+        Returns:
+            Number of messages deleted
+        """
+        attachment_db = primary if primary is not None else db
+        expired = (Message.channel_id == channel_id, Message.created_at < cutoff)
+        ids = [message_id for message_id, in db.query(Message.id).filter(*expired)]
+        for start in range(0, len(ids), self.batch_size):
+            attachment_db.query(Attachment).filter(
+                Attachment.message_id.in_(ids[start:start + self.batch_size])
+            ).delete(synchronize_session=False)
+        deleted = db.query(Message).filter(*expired).delete(synchronize_session=False)
+
+        segments = db.query(ArchiveSegment).filter(
+            ArchiveSegment.channel_id == channel_id,
+            ArchiveSegment.last_created_at < cutoff
+        ).all()
+        paths = [segment.path for segment in segments]
+        for segment in segments:
+            attachment_db.query(Attachment).filter(
+                Attachment.channel_id == channel_id,
+                Attachment.message_id.between(segment.first_id, segment.last_id)
+            ).delete(synchronize_session=False)
+            deleted += segment.message_count
+            db.delete(segment)
+        db.commit()
+        if attachment_db is not db:
+            attachment_db.commit()
+        # Files go only after the index rows are gone, so readers never miss one
+        for path in paths:
+            self.store.delete(path)
+
+        if deleted:
+            archive_messages_total.inc("deleted", amount=deleted)
+        return deleted
+
+    def run_with_session(self, session_factory) -> Dict[str, int]:
+        """Run one pass in a fresh session, logging instead of raising."""
+        db = session_factory()
+        try:
+            return self.run_once(db)
+        except Exception as e:
+            logger.exception("Retention pass failed: %s", e)
+            db.rollback()
+            return {"archived": 0, "deleted": 0}
+        finally:
+            db.close()
+
+
+def set_policy(
+    db: Session,
+    archive_after_days: Optional[int],
+    delete_after_days: Optional[int],
+    server_id: Optional[int] = None,
+    channel_id: Optional[int] = None,
+) -> RetentionPolicy:
+    """Create or replace the retention policy of a server or a channel (caller commits).
+
+    Args:
+        db: Database session
+        archive_after_days: Archive age in days, or None to inherit
+        delete_after_days: Delete age in days, or None to inherit
+        server_id: Server the policy applies to
+        channel_id: Channel the policy applies to (instead of ``server_id``)
+
+    Returns:
+        The stored policy
+    """
+    query = db.query(RetentionPolicy)
+    if channel_id is not None:
+        policy = query.filter(RetentionPolicy.channel_id == channel_id).first()
+    else:
+        policy = query.filter(RetentionPolicy.server_id == server_id).first()
+    if policy is None:
+        policy = RetentionPolicy(
+            server_id=None if channel_id is not None else server_id, channel_id=channel_id
+        )
+        db.add(policy)
+    policy.archive_after_days = archive_after_days
+    policy.delete_after_days = delete_after_days
+    return policy
+
+
+def read_history(
+    db: Session,
+    segment_store: ArchiveStore,
+    channel_id: int,
+    skip: int,
+    limit: int,
+    before: Optional[int] = None,
+    users_db: Optional[Session] = None,
+) -> List:
+    """Read a page of a channel's history across the hot table and the archive.
+
+    Pages are counted back from the newest message, or from ``before`` when
+    a cursor is given, in id order. The archive is only touched once a page
+    runs past the oldest hot message, and whole segments before the page
+    are skipped by count.
+
+    Args:
+        db: Database session
+        segment_store: Segment store
+        channel_id: Channel ID
+        skip: Messages to skip, newest first
+        limit: Messages to return
+        before: Only messages with a smaller id (cursor)
+        users_db: Session holding users, when ``db`` is a message shard
+
+    Returns:
+        Messages, oldest first; archived ones are ``ArchivedMessage`` objects
+    """
+    users_db = users_db or db
+    query = db.query(Message).filter(Message.channel_id == channel_id)
+    if before is not None:
+        query = query.filter(Message.id < before)
+    if users_db is db:
+        query = query.options(joinedload(Message.user))
+    messages = query.order_by(Message.id.desc()).offset(skip).limit(limit).all()
+    if users_db is not db:
+        messages = attach_users(users_db, messages)
+
+    missing = limit - len(messages)
+    if missing > 0:
+        if messages or not skip:
+            hot_count = skip + len(messages)
+        else:
+            hot_count = query.count()
+        archived = _read_archive(
+            db, users_db, segment_store, channel_id, max(0, skip - hot_count), missing, before
+        )
+        messages.extend(archived)
+
+    # Reverse to show oldest first in the returned list
+    messages.reverse()
+    return messages
+
+
+class ArchivedMessage:
+    """Read-only stand-in for ``Message`` built from an archive row."""
+
+    __slots__ = ARCHIVED_FIELDS + ("user", "attachments")
+
+    def __init__(self, row: dict, user: User):
+        for field in ARCHIVED_FIELDS:
+            setattr(self, field, row[field])
+        self.user = user
+        self.attachments = []
+
+
+def _read_archive(
+    db: Session,
+    users_db: Session,
+    store: ArchiveStore,
+    channel_id: int,
+    skip: int,
+    limit: int,
+    before: Optional[int] = None,
+) -> List[ArchivedMessage]:
+    """Read ``limit`` archived messages older than ``before`` after skipping ``skip``, newest first."""
+    rows: List[dict] = []
+    segments = db.query(ArchiveSegment).filter(ArchiveSegment.channel_id == channel_id)
+    if before is not None:
+        segments = segments.filter(ArchiveSegment.first_id < before)
+    for segment in segments.order_by(ArchiveSegment.last_id.desc()):
+        whole = before is None or segment.last_id < before
+        if whole and skip >= segment.message_count:
+            skip -= segment.message_count
+            continue
+        newest_first = [
+            row for row in reversed(list(store.read(segment.path))) if before is None or row["id"] < before
+        ]
+        if skip >= len(newest_first):
+            skip -= len(newest_first)
+            continue
+        rows.extend(newest_first[skip:skip + limit - len(rows)])
+        skip = 0
+        if len(rows) >= limit:
+            break
+
+    user_ids = {row["user_id"] for row in rows}
+    users = {user.id: user for user in users_db.query(User).filter(User.id.in_(user_ids))} if user_ids else {}
+    # Authors deleted since archiving took their hot messages with them; do the same here
+    return [ArchivedMessage(row, users[row["user_id"]]) for row in rows if row["user_id"] in users]
+
+
+def main():
+    """Run one retention pass against the configured database."""
+    parser = argparse.ArgumentParser(description="Apply message retention policies once")
+    parser.parse_args()
+    from .database import SessionLocal, init_db
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    shards = ShardRouter(settings.message_shard_urls_list)
+    archiver = Archiver(
+        ArchiveStore(settings.ARCHIVE_DIR), settings.ARCHIVE_AFTER_DAYS, settings.ARCHIVE_BATCH_SIZE, shards
+    )
+    started = time.perf_counter()
+    totals = archiver.run_with_session(SessionLocal)
+    print(f"archived={totals['archived']} deleted={totals['deleted']} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""Bulk loader for users, servers, members, channels and messages.
+
+Reads NDJSON records such as::
+
+    {"type": "user", "id": 1, "username": "alice", "email": "alice@example.com", "password": "secret"}
+    {"type": "server", "id": 1, "name": "Staging", "owner_id": 1}
+    {"type": "member", "server_id": 1, "user_id": 1, "role": "owner"}
+    {"type": "channel", "id": 1, "server_id": 1, "name": "general"}
+    {"type": "message", "channel_id": 1, "user_id": 1, "content": "hi", "created_at": "2024-01-01T00:00:00Z"}
+
+Records reference each other by the ids given in the file, so parents must
+appear before their children. Users carry either a plain ``password``
+(hashed on a process pool) or an existing bcrypt ``password_hash``.
+Message ids are not taken from the file: each message gets a snowflake
+built from its ``created_at``, so imported history sorts by time.
+
+Rows are buffered per table and written in batches with executemany
+``INSERT`` (``COPY`` on PostgreSQL). Non-unique indexes of the loaded
+tables are dropped for the load and rebuilt once at the end. Each batch
+commits on its own, so an interrupted import keeps the rows loaded so far.
+
+Run with ``python -m app.bulk_import data.ndjson [more.ndjson ...]``.
+"""
+
+import argparse
+import csv
+import io
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import bcrypt
+import orjson
+from sqlalchemy import Table, func, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from .models import Channel, MemberRole, Message, Server, ServerMember, User, UserStatus
+from .utils.helpers import to_utc_naive
+from .utils.snowflake import (
+    BACKFILL_WORKER_ID, EPOCH, MAX_SEQUENCE, make_snowflake, next_message_id, snowflake_ms, snowflake_time
+)
+
+logger = logging.getLogger(__name__)
+
+# Record types in dependency order: each may only reference earlier ones
+TABLES: Dict[str, Table] = {
+    "user": User.__table__,
+    "server": Server.__table__,
+    "member": ServerMember.__table__,
+    "channel": Channel.__table__,
+    "message": Message.__table__,
+}
+
+# Columns read from each record type; anything else in a record is ignored
+COLUMNS = {
+    "user": ("id", "username", "email", "password_hash", "status", "created_at", "updated_at"),
+    "server": ("id", "name", "description", "owner_id", "created_at"),
+    "member": ("id", "server_id", "user_id", "role", "joined_at"),
+    "channel": ("id", "server_id", "name", "description", "created_at"),
+    "message": ("channel_id", "user_id", "content", "created_at", "updated_at", "is_edited"),
+}
+DATETIME_COLUMNS = ("created_at", "updated_at", "joined_at")
+
+# Distinct message milliseconds whose snowflake sequence counters are kept
+SEQUENCE_WINDOW = 100_000
+# Seconds between progress log lines
+PROGRESS_INTERVAL = 5.0
+
+
+class RecordError(ValueError):
+    """Raised for a record that cannot be imported."""
+
+
+def hash_password(password: str, rounds: int) -> str:
+    """Hash one password (runs in a worker process)."""
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+
+class BulkImporter:
+    """Buffers NDJSON records and writes them to the database in batches."""
+
+    def __init__(
+        self,
+        engine: Engine,
+        batch_size: int = 10_000,
+        workers: Optional[int] = None,
+        bcrypt_rounds: int = 12,
+        defer_indexes: bool = True,
+    ):
+        """Initialize the importer.
+
+        Args:
+            engine: Target database (tables must already exist)
+            batch_size: Rows per executemany or COPY
+            workers: Password hashing processes (defaults to the CPU count)
+            bcrypt_rounds: bcrypt cost for plain passwords
+            defer_indexes: Drop non-unique indexes during the load
+        """
+        self.engine = engine
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.bcrypt_rounds = bcrypt_rounds
+        self.defer_indexes = defer_indexes
+        self.counts = {record_type: 0 for record_type in TABLES}
+        self._pending: Dict[str, List[dict]] = {record_type: [] for record_type in TABLES}
+        self._passwords: List[Optional[str]] = []
+        # Next snowflake sequence number per recent millisecond of message time
+        self._message_sequences: Dict[int, int] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._use_copy = engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2"
+
+    def run(self, lines: Iterable[bytes]) -> Dict[str, float]:
+        """Load every record and return a report.
+
+        Args:
+            lines: NDJSON lines (blank lines are skipped)
+
+        Returns:
+            Row count per record type, ``rows``, ``seconds`` and ``rows_per_second``
+
+        Raises:
+            RecordError: If a record has an unknown type or misses a column
+        """
+        started = time.perf_counter()
+        with self.engine.connect() as conn:
+            dropped = self._drop_indexes(conn) if self.defer_indexes else []
+            try:
+                self._load(conn, lines, started)
+            finally:
+                if self._pool is not None:
+                    self._pool.shutdown()
+                    self._pool = None
+                # Rebuild even after a failure so the database is never left without them
+                self._create_indexes(conn, dropped)
+            self._reset_sequences(conn)
+
+        elapsed = time.perf_counter() - started
+        rows = sum(self.counts.values())
+        return {
+            **self.counts,
+            "rows": rows,
+            "seconds": round(elapsed, 2),
+            "rows_per_second": round(rows / elapsed) if elapsed else 0,
+        }
+
+    def _load(self, conn: Connection, lines: Iterable[bytes], started: float):
+        next_progress = started + PROGRESS_INTERVAL
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                pending = self._add(orjson.loads(line))
+            except (orjson.JSONDecodeError, KeyError, ValueError) as e:
+                raise RecordError(f"line {line_number}: {e}") from e
+            if len(pending) >= self.batch_size:
+                self._flush(conn)
+                if time.perf_counter() >= next_progress:
+                    next_progress = time.perf_counter() + PROGRESS_INTERVAL
+                    rows = sum(self.counts.values())
+                    logger.info("Imported %d rows (%.0f rows/s)", rows, rows / (time.perf_counter() - started))
+        self._flush(conn)
+
+    def _add(self, record: dict) -> List[dict]:
+        """Convert a record to a row and buffer it; returns that table's buffer."""
+        record_type = record["type"]
+        if record_type not in TABLES:
+            raise ValueError(f"unknown record type {record_type!r}")
+        row = {column: record[column] for column in COLUMNS[record_type] if column in record}
+        for column in DATETIME_COLUMNS:
+            if isinstance(row.get(column), str):
+                row[column] = to_utc_naive(datetime.fromisoformat(row[column]))
+
+        if record_type == "user":
+            if "password_hash" not in row:
+                self._passwords.append(record["password"])
+                row["password_hash"] = None
+            else:
+                self._passwords.append(None)
+            row["status"] = UserStatus(row.get("status", "offline"))
+            row.setdefault("created_at", datetime.utcnow())
+            row.setdefault("updated_at", row["created_at"])
+        elif record_type == "member":
+            row["role"] = MemberRole(row.get("role", "member"))
+            row.setdefault("joined_at", datetime.utcnow())
+        elif record_type == "message":
+            if "created_at" in row:
+                row["id"] = self._backfill_id(row["created_at"])
+            else:
+                row["id"] = next_message_id()
+                row["created_at"] = snowflake_time(row["id"])
+            row.setdefault("updated_at", row["created_at"])
+            row.setdefault("is_edited", False)
+        else:
+            row.setdefault("created_at", datetime.utcnow())
+            row.setdefault("description", None)
+        pending = self._pending[record_type]
+        pending.append(row)
+        return pending
+
+    def _backfill_id(self, created_at: datetime) -> int:
+        """Snowflake for a message created at ``created_at``, under the reserved backfill worker.
+
+        Messages sharing a millisecond get consecutive sequence numbers. The
+        counters cover the last ``SEQUENCE_WINDOW`` milliseconds seen, so
+        a collision is only possible when a file is far out of time order,
+        and then it fails on the primary key.
+        """
+        if created_at < EPOCH:
+            raise ValueError(f"created_at {created_at.isoformat()} is before the id epoch {EPOCH.isoformat()}")
+        timestamp_ms = snowflake_ms(created_at)
+        sequence = self._message_sequences.get(timestamp_ms, 0)
+        if sequence > MAX_SEQUENCE:
+            raise ValueError(f"more than {MAX_SEQUENCE + 1} messages created in one millisecond")
+        if len(self._message_sequences) >= SEQUENCE_WINDOW:
+            self._message_sequences.clear()
+        self._message_sequences[timestamp_ms] = sequence + 1
+        return make_snowflake(timestamp_ms, BACKFILL_WORKER_ID, sequence)
+
+    def _flush(self, conn: Connection):
+        """Write every buffered row, parents before children, and commit."""
+        if self._passwords:
+            self._hash_passwords()
+        for record_type, table in TABLES.items():
+            rows = self._pending[record_type]
+            if not rows:
+                continue
+            # executemany needs one column set per statement: rows with and without ids
+            with_ids = [row for row in rows if "id" in row]
+            without_ids = [row for row in rows if "id" not in row]
+            for group in (with_ids, without_ids):
+                if group:
+                    self._write(conn, table, group)
+            self.counts[record_type] += len(rows)
+            self._pending[record_type] = []
+        conn.commit()
+
+    def _hash_passwords(self):
+        users = self._pending["user"]
+        plain = [(row, password) for row, password in zip(users, self._passwords) if password is not None]
+        self._passwords = []
+        if not plain:
+            return
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        hashes = self._pool.map(
+            hash_password,
+            [password for _, password in plain],
+            [self.bcrypt_rounds] * len(plain),
+            chunksize=max(1, len(plain) // (self.workers * 4)),
+        )
+        for (row, _), password_hash in zip(plain, hashes):
+            row["password_hash"] = password_hash
+
+    def _write(self, conn: Connection, table: Table, rows: List[dict]):
+        if self._use_copy:
+            self._copy(conn, table, rows)
+        else:
+            conn.execute(insert(table), rows)
+
+    def _copy(self, conn: Connection, table: Table, rows: List[dict]):
+        """Load rows with ``COPY ... FROM STDIN`` (psycopg2 only)."""
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            # Enum columns store member names, like SQLAlchemy does
+            writer.writerow([
+                "\\N" if row[column] is None else
+                row[column].name if isinstance(row[column], (UserStatus, MemberRole)) else
+                row[column] for column in columns
+            ])
+        buffer.seek(0)
+        cursor = conn.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer
+            )
+        finally:
+            cursor.close()
+
+    def _drop_indexes(self, conn: Connection) -> list:
+        """Drop the loaded tables' non-unique indexes; unique ones keep enforcing integrity."""
+        dropped = [index for table in TABLES.values() for index in table.indexes if not index.unique]
+        for index in dropped:
+            index.drop(bind=conn, checkfirst=True)
+        conn.commit()
+        return dropped
+
+    def _create_indexes(self, conn: Connection, indexes: list):
+        conn.rollback()
+        started = time.perf_counter()
+        for index in indexes:
+            index.create(bind=conn, checkfirst=True)
+        conn.commit()
+        if indexes:
+            logger.info("Rebuilt %d indexes in %.1fs", len(indexes), time.perf_counter() - started)
+
+    def _reset_sequences(self, conn: Connection):
+        """Move PostgreSQL id sequences past explicitly imported ids."""
+        if self.engine.dialect.name != "postgresql":
+            return
+        for table in TABLES.values():
+            top = conn.execute(select(func.max(table.c.id))).scalar()
+            if top is not None:
+                conn.execute(
+                    text("SELECT setval(pg_get_serial_sequence(:table, 'id'), :top)"),
+                    {"table": table.name, "top": top},
+                )
+        conn.commit()
+
+
+def read_lines(paths: List[str]) -> Iterable[bytes]:
+    """Yield the lines of each file in turn (``-`` reads stdin)."""
+    for path in paths:
+        if path == "-":
+            yield from sys.stdin.buffer
+        else:
+            with open(path, "rb") as source:
+                yield from source
+
+
+def main():
+    """Import NDJSON files into the configured database."""
+    parser = argparse.ArgumentParser(description="Bulk-load users, servers, channels and messages from NDJSON")
+    parser.add_argument("paths", nargs="+", help="NDJSON files, in dependency order (- for stdin)")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=None, help="password hashing processes")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--keep-indexes", action="store_true", help="do not drop indexes during the load")
+    args = parser.parse_args()
+    from .database import engine, init_db
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    importer = BulkImporter(
+        engine,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        bcrypt_rounds=args.bcrypt_rounds,
+        defer_indexes=not args.keep_indexes,
+    )
+    try:
+        report = importer.run(read_lines(args.paths))
+    except RecordError as e:
+        parser.exit(1, f"Import failed at {e}\n")
+    print(orjson.dumps(report, option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,14 @@ class Settings(BaseSettings):
     # Security
     SECRET_KEY: str = "your-secret-key-change-this-in-production"
     ALGORITHM: str = "HS256"
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 1440  # 24 hours
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 15  # renewed through /auth/refresh
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    REVOCATION_SYNC_INTERVAL_SECONDS: float = 2.0  # how fast other workers see a logout
+    BCRYPT_POOL_SIZE: int = 4  # threads dedicated to password hashing
+    JWT_BACKEND: str = "jose"  # "jose" or "native" (HMAC algorithms only)
+    TOKEN_CACHE_SIZE: int = 10_000  # verified tokens kept in memory (0 disables)
+    PERMISSION_CACHE_SIZE: int = 50_000  # (user, server) permission entries kept in memory (0 disables)
+    PERMISSION_CACHE_TTL_SECONDS: float = 30.0  # how fast other workers see a role change
     
     # Database
     DATABASE_URL: str = "sqlite:///./discord_clone.db"
@@ -25,11 +32,102 @@ class Settings(BaseSettings):
     # Environment
     ENVIRONMENT: str = "development"
     
+    # Logging
+    LOG_LEVEL: str = ""  # empty: INFO in development, WARNING otherwise
+    LOG_FORMAT: str = "text"  # "text" or "json"
+    LOG_SAMPLING: str = ""  # e.g. "app.websocket.manager=0.01,app.routes.messages=0.1"
+    SQL_ECHO: bool = False
+    
+    # Response compression
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # bytes
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    
+    # WebSocket session resume
+    WS_REPLAY_BUFFER_SIZE: int = 500  # events kept per channel
+    WS_SESSION_TTL_SECONDS: int = 300  # how long a dropped session can resume
+    
+    # WebSocket heartbeat (0 disables); silent sockets are reaped after INTERVAL + TIMEOUT
+    WS_HEARTBEAT_INTERVAL_SECONDS: float = 30.0
+    WS_HEARTBEAT_TIMEOUT_SECONDS: float = 10.0
+    WS_REAP_BATCH_SIZE: int = 200  # dead sockets dropped per heartbeat tick
+    
+    # Graceful drain on shutdown
+    DRAIN_ON_SIGTERM: bool = True
+    DRAIN_BATCH_SIZE: int = 500  # sockets closed per batch
+    DRAIN_BATCH_INTERVAL_SECONDS: float = 0.5
+    DRAIN_MAX_RECONNECT_DELAY_SECONDS: float = 10.0  # jitter bound sent to clients
+    DRAIN_TIMEOUT_SECONDS: float = 30.0
+    
+    # Message retention and archive (0 days: never; per-server/channel policies override)
+    ARCHIVE_AFTER_DAYS: int = 0
+    ARCHIVE_DIR: str = "./archive"
+    ARCHIVE_BATCH_SIZE: int = 5000  # messages per segment file
+    ARCHIVE_INTERVAL_SECONDS: float = 3600.0  # 0 disables the in-process archiver
+    
+    # Purge of deleted servers and channels (rows per batched DELETE)
+    PURGE_BATCH_SIZE: int = 10_000
+    PURGE_INTERVAL_SECONDS: float = 60.0  # 0 disables the in-process purge job
+    
+    # Background job scheduler (cluster jobs run on one elected worker)
+    SCHEDULER_TICK_SECONDS: float = 1.0  # 0 disables every background job in this process
+    SCHEDULER_POLL_SECONDS: float = 5.0  # how often leadership is renewed and due jobs are claimed
+    SCHEDULER_LEASE_SECONDS: float = 30.0  # a dead leader or job run is taken over after this
+    SCHEDULER_RETRY_SECONDS: float = 60.0  # delay before a failed job runs again
+    SCHEDULER_MAX_CONCURRENCY: int = 1  # jobs of one kind running at once per worker
+    ARCHIVE_CRON: str = ""  # e.g. "30 3 * * *"; overrides ARCHIVE_INTERVAL_SECONDS
+    
+    # File attachments (blobs are stored once per distinct SHA-256)
+    ATTACHMENT_DIR: str = "./attachments"
+    ATTACHMENT_MAX_BYTES: int = 25 * 1024 * 1024
+    ATTACHMENT_WRITE_BUFFER_BYTES: int = 1024 * 1024  # upload bytes gathered per disk write
+    ATTACHMENT_READ_CHUNK_BYTES: int = 256 * 1024  # download chunk when zero-copy send is unavailable
+    THUMBNAIL_WORKERS: int = 2  # threads rendering thumbnails (0 disables thumbnails)
+    THUMBNAIL_SIZE: int = 256  # longest side in pixels
+    THUMBNAIL_QUEUE_SIZE: int = 1000  # images waiting for a worker; more are marked failed
+    
+    # Message shards: comma-separated database URLs; empty keeps messages on DATABASE_URL
+    MESSAGE_SHARD_URLS: str = ""
+    
+    # Message ids (snowflakes). Each process needs a distinct worker id (0-1022);
+    # by default it is SNOWFLAKE_NODE_ID (0-30, one per host) plus 5 bits of the pid
+    SNOWFLAKE_NODE_ID: int = 0
+    SNOWFLAKE_WORKER_ID: int = -1  # set >= 0 to assign worker ids explicitly
+    
+    # Metrics
+    METRICS_ENABLED: bool = True
+    
+    # Rate limiting (token buckets: RATE tokens/second, up to BURST)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"  # "memory" or "redis"
+    RATE_LIMIT_REDIS_URL: str = "redis://localhost:6379/0"
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+    RATE_LIMIT_TRUST_FORWARDED: bool = False
+    RATE_LIMIT_USER_RATE: float = 20.0
+    RATE_LIMIT_USER_BURST: int = 60
+    RATE_LIMIT_MESSAGE_RATE: float = 5.0
+    RATE_LIMIT_MESSAGE_BURST: int = 10
+    RATE_LIMIT_AUTH_RATE: float = 0.2
+    RATE_LIMIT_AUTH_BURST: int = 20
+    RATE_LIMIT_WS_RATE: float = 10.0
+    RATE_LIMIT_WS_BURST: int = 30
+    RATE_LIMIT_EXPORT_RATE: float = 0.05
+    RATE_LIMIT_EXPORT_BURST: int = 3
+    RATE_LIMIT_UPLOAD_RATE: float = 1.0
+    RATE_LIMIT_UPLOAD_BURST: int = 10
+    
     @property
     def allowed_origins_list(self) -> List[str]:
         """Parse CORS allowed origins into list."""
         return [origin.strip() for origin in self.ALLOWED_ORIGINS.split(",")]
     
+    @property
+    def message_shard_urls_list(self) -> List[str]:
+        """Parse message shard database URLs into list (empty when sharding is off)."""
+        return [url.strip() for url in self.MESSAGE_SHARD_URLS.split(",") if url.strip()]
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
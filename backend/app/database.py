@@ -1,41 +1,142 @@
 """Database connection and session management."""
 
-from sqlalchemy import create_engine
+import hashlib
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, create_engine, delete, insert, select
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.requests import HTTPConnection
 from .config import settings
 
-# Create database engine
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {},
-    echo=settings.ENVIRONMENT == "development"
-)
+logger = logging.getLogger(__name__)
+
+
+def create_db_engine(url: str) -> Engine:
+    """Create an engine for a database URL.
+    
+    SQL statements are logged through the "sqlalchemy.engine" logger when
+    SQL_ECHO is set (see logging_config). An in-memory SQLite database lives
+    in a single shared connection, so every session sees the same tables.
+    """
+    if not url.startswith("sqlite"):
+        return create_engine(url)
+    connect_args = {"check_same_thread": False}
+    if url in ("sqlite://", "sqlite:///:memory:"):
+        return create_engine(url, connect_args=connect_args, poolclass=StaticPool)
+    return create_engine(url, connect_args=connect_args)
 
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def create_session_factory(bind: Engine) -> sessionmaker:
+    """Create a session factory bound to ``bind``."""
+    return sessionmaker(autocommit=False, autoflush=False, bind=bind)
+
+
+# Engine and sessions for command-line tools; each application built by
+# ``main.create_app`` has its own
+engine = create_db_engine(settings.DATABASE_URL)
+SessionLocal = create_session_factory(engine)
 
 # Create declarative base for models
 Base = declarative_base()
 
 
-def get_db():
+def get_db(connection: HTTPConnection):
     """Dependency to get database session.
     
+    Args:
+        connection: Incoming request or WebSocket
+        
     Yields:
-        Database session that auto-closes after use.
+        Database session from the application's own session factory
+        (``app.state.session_factory``) that auto-closes after use.
     """
-    db = SessionLocal()
+    db = connection.app.state.session_factory()
     try:
         yield db
     finally:
         db.close()
 
 
-def init_db():
+# Fingerprint of the schema each database was last created with, per metadata
+# ("main" or "shard"). Kept outside ``Base`` so it is not part of any fingerprint.
+schema_versions = Table(
+    "schema_version",
+    MetaData(),
+    Column("name", String(32), primary_key=True),
+    Column("version", String(64), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def schema_fingerprint(metadata: MetaData) -> str:
+    """Hash of every table, column and index in ``metadata``.
+    
+    It changes whenever a model gains or changes a table, column or index,
+    so it serves as the schema version without a hand-maintained number.
+    """
+    digest = hashlib.sha256()
+    for table in metadata.sorted_tables:
+        digest.update(table.name.encode())
+        for column in table.columns:
+            digest.update(f"|{column.name}:{column.type!r}:{column.nullable}:{column.primary_key}".encode())
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            columns = ",".join(column.name for column in index.columns)
+            digest.update(f"|{index.name}({columns}):{index.unique}".encode())
+    return digest.hexdigest()
+
+
+def ensure_schema(bind, metadata: MetaData, name: str = "main") -> bool:
+    """Create missing tables, unless the database was stamped with this schema already.
+    
+    ``create_all`` checks every table one by one (a round trip each on a
+    server database); a matching stamp costs one query instead. Columns
+    added to existing tables still need a manual ``ALTER TABLE``.
+    
+    Args:
+        bind: Engine of the database
+        metadata: Tables that belong there
+        name: Stamp key, so several metadata can share a database
+        
+    Returns:
+        True if tables were checked and the stamp written
+    """
+    version = schema_fingerprint(metadata)
+    try:
+        with bind.connect() as conn:
+            current = conn.execute(
+                select(schema_versions.c.version).where(schema_versions.c.name == name)
+            ).scalar()
+    except DBAPIError:
+        # No stamp table yet
+        current = None
+    if current == version:
+        return False
+    with bind.begin() as conn:
+        metadata.create_all(conn)
+        schema_versions.create(conn, checkfirst=True)
+        conn.execute(delete(schema_versions).where(schema_versions.c.name == name))
+        conn.execute(insert(schema_versions).values(name=name, version=version, applied_at=datetime.utcnow()))
+    logger.info("Schema %s stamped with version %s", name, version[:12])
+    return True
+
+
+def init_db(bind: Optional[Engine] = None) -> bool:
     """Initialize database tables.
     
-    Creates all tables defined in models if they don't exist.
+    Creates all tables defined in models if they don't exist, skipping the
+    check when the database already carries the current schema version.
+    
+    Args:
+        bind: Engine of the database (default: the module-level ``engine``)
+        
+    Returns:
+        True if the schema was checked and stamped
     """
     from . import models  # noqa: F401
-    Base.metadata.create_all(bind=engine)
+    return ensure_schema(bind or engine, Base.metadata)
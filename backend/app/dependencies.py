@@ -1,29 +1,89 @@
 """Shared dependencies for FastAPI routes."""
 
-from fastapi import Depends, HTTPException, status
+import math
+
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
+from starlette.requests import HTTPConnection
 from sqlalchemy.orm import Session
-from jose import JWTError, jwt
 from typing import Optional
 
+from .archive import ArchiveStore
+from .attachments import AttachmentStore, ThumbnailWorker
 from .database import get_db
-from .config import settings
 from .models import User
+from .metrics import rate_limit_rejections_total
+from .permissions import Permission, PermissionCache, Scope
 from .schemas import TokenData
+from .sharding import ShardRouter
+from .utils.rate_limit import RateLimiter, client_address
+from .utils.revocation import RevocationList
+from .utils.security import AccessTokens
+from .websocket.manager import ConnectionManager
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
+def get_tokens(connection: HTTPConnection) -> AccessTokens:
+    """Get the application's access token service.
+    
+    Args:
+        connection: Incoming request or WebSocket
+        
+    Returns:
+        Token service stored on ``app.state``
+    """
+    return connection.app.state.tokens
+
+
+def get_revocations(connection: HTTPConnection) -> RevocationList:
+    """Get the application's access token revocation list.
+    
+    Args:
+        connection: Incoming request or WebSocket
+        
+    Returns:
+        Revocation list stored on ``app.state``
+    """
+    return connection.app.state.revocations
+
+
+def get_permissions(connection: HTTPConnection) -> PermissionCache:
+    """Get the application's permission cache.
+    
+    Args:
+        connection: Incoming request or WebSocket
+        
+    Returns:
+        Permission cache stored on ``app.state``
+    """
+    return connection.app.state.permissions
+
+
+def get_limiter(connection: HTTPConnection) -> RateLimiter:
+    """Get the application's rate limiter.
+    
+    Args:
+        connection: Incoming request or WebSocket
+        
+    Returns:
+        Rate limiter stored on ``app.state``
+    """
+    return connection.app.state.limiter
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    tokens: AccessTokens = Depends(get_tokens)
 ) -> User:
     """Get current authenticated user from JWT token.
     
     Args:
         token: JWT token from Authorization header
         db: Database session
+        tokens: The application's token service
         
     Returns:
         Current authenticated user
@@ -37,21 +97,22 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    # Verified once, then served from the token cache until it expires
+    payload = tokens.decode_access_token(token)
+    if payload is None:
+        raise credentials_exception
+    
+    user_id_str: Optional[str] = payload.get("sub")
+    if user_id_str is None:
+        raise credentials_exception
+    
+    # Конвертируем строку в int
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id_str: Optional[str] = payload.get("sub")
-        if user_id_str is None:
-            raise credentials_exception
-        
-        # Конвертируем строку в int
-        try:
-            user_id = int(user_id_str)
-        except (ValueError, TypeError):
-            raise credentials_exception
-            
-        token_data = TokenData(user_id=user_id)
-    except JWTError:
+        user_id = int(user_id_str)
+    except (ValueError, TypeError):
         raise credentials_exception
+        
+    token_data = TokenData(user_id=user_id)
     
     user = db.query(User).filter(User.id == token_data.user_id).first()
     if user is None:
@@ -74,3 +135,159 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
     """
     # In the future, you can add user.is_active check here
     return current_user
+
+
+def get_manager(connection: HTTPConnection) -> ConnectionManager:
+    """Get the application's WebSocket connection manager.
+    
+    Args:
+        connection: Incoming request or WebSocket
+        
+    Returns:
+        Connection manager stored on ``app.state``
+    """
+    return connection.app.state.manager
+
+
+def get_shards(connection: HTTPConnection) -> ShardRouter:
+    """Get the application's message shard router.
+    
+    Args:
+        connection: Incoming request or WebSocket
+        
+    Returns:
+        Shard router stored on ``app.state``
+    """
+    return connection.app.state.shards
+
+
+def get_store(connection: HTTPConnection) -> ArchiveStore:
+    """Get the application's archive segment store.
+    
+    Args:
+        connection: Incoming request or WebSocket
+        
+    Returns:
+        Segment store stored on ``app.state``
+    """
+    return connection.app.state.store
+
+
+def get_attachment_store(connection: HTTPConnection) -> AttachmentStore:
+    """Get the application's attachment blob store.
+    
+    Args:
+        connection: Incoming request or WebSocket
+        
+    Returns:
+        Attachment store stored on ``app.state``
+    """
+    return connection.app.state.attachments
+
+
+def get_thumbnails(connection: HTTPConnection) -> ThumbnailWorker:
+    """Get the application's thumbnail worker.
+    
+    Args:
+        connection: Incoming request or WebSocket
+        
+    Returns:
+        Thumbnail worker stored on ``app.state``
+    """
+    return connection.app.state.thumbnails
+
+
+def require(permission: Permission):
+    """Create a dependency that checks the user's permissions for the route.
+    
+    The scope is the channel from the ``channel_id`` path parameter, or else
+    the server from ``server_id``. The check is served from the permission
+    cache, so a warm request runs no query for it.
+    
+    Args:
+        permission: Permission bits the user must all hold
+        
+    Returns:
+        FastAPI dependency returning the resolved ``Scope``, raising 404 if
+        the channel or server does not exist and 403 if a bit is missing
+    """
+    async def dependency(
+        request: Request,
+        db: Session = Depends(get_db),
+        current_user: User = Depends(get_current_user),
+        permissions: PermissionCache = Depends(get_permissions)
+    ) -> Scope:
+        if "channel_id" in request.path_params:
+            scope = permissions.for_channel(db, current_user.id, int(request.path_params["channel_id"]))
+            kind = "Channel"
+        else:
+            scope = permissions.for_server(db, current_user.id, int(request.path_params["server_id"]))
+            kind = "Server"
+        if scope is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"{kind} not found"
+            )
+        if not scope.allows(permission):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You don't have permission to do this" if scope.role else "You are not a member"
+            )
+        return scope
+    
+    return dependency
+
+
+def _too_many_requests(budget: str, retry_after: float) -> HTTPException:
+    """Build a 429 response carrying a Retry-After hint."""
+    rate_limit_rejections_total.inc(budget)
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many requests",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def user_rate_limit(budget: str = "user"):
+    """Create a dependency that rate limits the authenticated user.
+    
+    Args:
+        budget: Rate limit budget name
+        
+    Returns:
+        FastAPI dependency raising 429 when the user's bucket is empty
+    """
+    async def dependency(
+        current_user: User = Depends(get_current_user),
+        limiter: RateLimiter = Depends(get_limiter)
+    ) -> None:
+        retry_after = await limiter.hit(budget, current_user.id)
+        if retry_after:
+            raise _too_many_requests(budget, retry_after)
+    
+    return dependency
+
+
+def ip_rate_limit(budget: str):
+    """Create a dependency that rate limits by client address.
+    
+    Used for unauthenticated routes such as login and registration.
+    
+    Args:
+        budget: Rate limit budget name
+        
+    Returns:
+        FastAPI dependency raising 429 when the address's bucket is empty
+    """
+    async def dependency(request: Request, limiter: RateLimiter = Depends(get_limiter)) -> None:
+        host = request.client.host if request.client else None
+        key = client_address(
+            host,
+            request.headers.get("x-forwarded-for"),
+            request.app.state.settings.RATE_LIMIT_TRUST_FORWARDED
+        )
+        retry_after = await limiter.hit(budget, key)
+        if retry_after:
+            raise _too_many_requests(budget, retry_after)
+    
+    return dependency
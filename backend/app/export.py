@@ -0,0 +1,179 @@
+"""Streaming export of a channel's full message history.
+
+Rows come from the archive segments first (they hold the oldest messages)
+and then from the hot table through a server-side cursor, and are encoded
+and flushed in fixed-size chunks. Memory use therefore depends on the
+chunk and fetch sizes, not on how many messages the channel holds.
+"""
+
+import csv
+import io
+import zlib
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterable, Iterator, Optional
+
+import orjson
+from sqlalchemy.orm import Session
+
+from .archive import ArchiveStore
+from .models import ArchiveSegment, Message, User
+from .utils.helpers import to_utc_naive
+
+# Columns written for each message, in CSV column order
+EXPORT_FIELDS = ("id", "channel_id", "user_id", "username", "content", "created_at", "updated_at", "is_edited")
+# Rows fetched per database round trip (and archive rows resolved per user lookup)
+FETCH_SIZE = 1000
+# Encoded bytes buffered before a chunk is handed to the response
+CHUNK_SIZE = 64 * 1024
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def export_rows(
+    db: Session,
+    segment_store: ArchiveStore,
+    channel_id: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    users_db: Optional[Session] = None,
+) -> Iterator[dict]:
+    """Yield a channel's messages oldest first, across the archive and the hot table.
+
+    Messages the archiver moves while an export is running may be missing
+    from it; exports are not a snapshot.
+
+    Args:
+        db: Database session holding the channel's messages (must stay open
+            while the iterator is consumed)
+        segment_store: Segment store
+        channel_id: Channel ID
+        since: Only messages created at or after this time
+        until: Only messages created before this time
+        users_db: Session holding users, when ``db`` is a message shard
+
+    Yields:
+        One dict per message with the ``EXPORT_FIELDS`` keys
+    """
+    since, until = to_utc_naive(since), to_utc_naive(until)
+    usernames: Dict[int, str] = {}
+    users_db = users_db or db
+
+    segments = db.query(ArchiveSegment.path).filter(ArchiveSegment.channel_id == channel_id)
+    if since is not None:
+        segments = segments.filter(ArchiveSegment.last_created_at >= since)
+    if until is not None:
+        segments = segments.filter(ArchiveSegment.first_created_at < until)
+    for (path,) in segments.order_by(ArchiveSegment.first_id).all():
+        rows = (
+            row for row in segment_store.read(path)
+            if (since is None or row["created_at"] >= since) and (until is None or row["created_at"] < until)
+        )
+        yield from _with_usernames(users_db, usernames, rows)
+
+    # Usernames are looked up separately rather than joined, since users
+    # stay on the primary database when messages are sharded
+    query = db.query(
+        Message.id, Message.channel_id, Message.user_id, Message.content,
+        Message.created_at, Message.updated_at, Message.is_edited
+    ).filter(Message.channel_id == channel_id)
+    if since is not None:
+        query = query.filter(Message.created_at >= since)
+    if until is not None:
+        query = query.filter(Message.created_at < until)
+    # yield_per streams from a server-side cursor where the driver supports one
+    rows = (row._asdict() for row in query.order_by(Message.id).yield_per(FETCH_SIZE))
+    yield from _with_usernames(users_db, usernames, rows)
+
+
+def _with_usernames(users_db: Session, usernames: Dict[int, str], rows: Iterable[dict]) -> Iterator[dict]:
+    """Add usernames to rows, resolving ``FETCH_SIZE`` rows at a time.
+
+    ``usernames`` caches names across calls.
+    """
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, FETCH_SIZE))
+        if not batch:
+            return
+        unknown = {row["user_id"] for row in batch} - usernames.keys()
+        if unknown:
+            usernames.update(users_db.query(User.id, User.username).filter(User.id.in_(unknown)).all())
+        for row in batch:
+            # Authors deleted since are left out, as in read_history
+            username = usernames.get(row["user_id"])
+            if username is not None:
+                row["username"] = username
+                yield {field: row[field] for field in EXPORT_FIELDS}
+
+
+def encode_ndjson(rows: Iterable[dict]) -> Iterator[bytes]:
+    """Encode rows as newline-delimited JSON in ``CHUNK_SIZE`` chunks."""
+    buffer = bytearray()
+    for row in rows:
+        buffer += orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE)
+        if len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def encode_csv(rows: Iterable[dict]) -> Iterator[bytes]:
+    """Encode rows as CSV with a header line in ``CHUNK_SIZE`` chunks."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        writer.writerow([
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in (row[field] for field in EXPORT_FIELDS)
+        ])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a byte stream into a gzip file on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+ENCODERS = {"ndjson": encode_ndjson, "csv": encode_csv}
+
+
+def stream_export(
+    db: Session,
+    segment_store: ArchiveStore,
+    channel_id: int,
+    export_format: str = "ndjson",
+    compress: bool = False,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    users_db: Optional[Session] = None,
+) -> Iterator[bytes]:
+    """Build the byte stream of a channel export.
+
+    Args:
+        db: Database session (must stay open while the stream is consumed)
+        segment_store: Segment store
+        channel_id: Channel ID
+        export_format: ``"ndjson"`` or ``"csv"``
+        compress: Wrap the output in a gzip file
+        since: Only messages created at or after this time
+        until: Only messages created before this time
+        users_db: Session holding users, when ``db`` is a message shard
+
+    Returns:
+        Iterator of encoded chunks
+    """
+    chunks = ENCODERS[export_format](export_rows(db, segment_store, channel_id, since, until, users_db))
+    return gzip_chunks(chunks) if compress else chunks
@@ -0,0 +1,116 @@
+"""Graceful drain on shutdown.
+
+Uvicorn closes every open WebSocket as soon as it receives SIGTERM, before
+the application's shutdown handlers run, so all clients would reconnect at
+the same instant. ``DrainController`` takes over SIGTERM instead: it stops
+accepting new WebSockets, fails the health check so load balancers move
+traffic away, sends clients jittered reconnect hints in batches, runs the
+registered shutdown hooks (flushing pending background work) and only then
+lets the server exit.
+"""
+
+import asyncio
+import inspect
+import logging
+import signal
+import threading
+from typing import Awaitable, Callable, List, Optional, Union
+
+from .websocket.manager import ConnectionManager
+
+logger = logging.getLogger(__name__)
+
+ShutdownHook = Callable[[], Union[None, Awaitable[None]]]
+
+
+class DrainController:
+    """Coordinates drain mode and shutdown hooks for one application."""
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        batch_size: int = 500,
+        batch_interval: float = 0.5,
+        max_reconnect_delay: float = 10.0,
+        timeout: float = 30.0,
+    ):
+        """Initialize the controller.
+
+        Args:
+            manager: WebSocket connection manager to drain
+            batch_size: Sockets closed per batch
+            batch_interval: Pause between batches in seconds
+            max_reconnect_delay: Upper bound of the client reconnect hint
+            timeout: Give up on draining sockets after this many seconds
+        """
+        self.manager = manager
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.max_reconnect_delay = max_reconnect_delay
+        self.timeout = timeout
+        self._hooks: List[ShutdownHook] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def draining(self) -> bool:
+        """True once drain has started."""
+        return self.manager.draining
+
+    def add_shutdown_hook(self, hook: ShutdownHook):
+        """Register work to flush after sockets are drained.
+
+        Hooks run in registration order; they may be sync or async.
+        """
+        self._hooks.append(hook)
+
+    async def drain(self):
+        """Drain sockets and run shutdown hooks (only once)."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._drain())
+        await asyncio.shield(self._task)
+
+    async def _drain(self):
+        try:
+            drained = await asyncio.wait_for(
+                self.manager.drain(self.batch_size, self.batch_interval, self.max_reconnect_delay),
+                timeout=self.timeout,
+            )
+            logger.info("Drained %d WebSocket connections", drained)
+        except asyncio.TimeoutError:
+            logger.warning("WebSocket drain timed out after %.1fs", self.timeout)
+
+        for hook in self._hooks:
+            try:
+                result = hook()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Shutdown hook %r failed", hook)
+
+    def install_signal_handler(self) -> bool:
+        """Drain on SIGTERM before handing shutdown back to the server.
+
+        Once drained, SIGINT is raised so the server's own handler performs
+        its normal shutdown. Only possible from the main thread on platforms
+        with loop signal handlers.
+
+        Returns:
+            True if the handler was installed
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return False
+        loop = asyncio.get_running_loop()
+
+        def on_sigterm():
+            logger.info("SIGTERM received, draining before shutdown")
+            loop.create_task(self._drain_then_exit())
+
+        try:
+            loop.add_signal_handler(signal.SIGTERM, on_sigterm)
+        except (NotImplementedError, RuntimeError):
+            return False
+        return True
+
+    async def _drain_then_exit(self):
+        await self.drain()
+        signal.raise_signal(signal.SIGINT)
@@ -0,0 +1,171 @@
+"""Non-blocking, structured logging setup.
+
+Application threads only append records to an in-memory queue; a background
+``QueueListener`` thread does the formatting and the (blocking) writes to
+stderr. Records can be rendered as JSON lines, and chatty hot-path loggers
+can be sampled so only a fraction of their INFO/DEBUG records are kept.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import orjson
+
+# Attributes every LogRecord has; anything else was passed via ``extra=``
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "taskName"
+}
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Render records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode("utf-8")
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of low-severity records from selected loggers.
+
+    Rates are matched by logger name prefix (the longest prefix wins).
+    WARNING and above are never dropped.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._resolved: Dict[str, float] = {}
+
+    def _rate_for(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            best = -1
+            for prefix, prefix_rate in self.rates.items():
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > best:
+                    rate, best = prefix_rate, len(prefix)
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The stock ``prepare`` runs the full formatter on the calling thread. Here
+    only the %-interpolation is done eagerly (so later mutation of the
+    arguments can't change the message); timestamps, JSON encoding and
+    tracebacks are rendered by the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """Parse ``"app.websocket=0.1,app.routes.messages=0.5"`` into a dict.
+
+    Args:
+        spec: Comma-separated ``logger=rate`` pairs
+
+    Returns:
+        Mapping of logger name prefix to keep-rate between 0 and 1
+    """
+    rates = {}
+    for item in spec.split(","):
+        name, _, rate = item.strip().partition("=")
+        if name and rate:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+def setup_logging(config) -> logging.handlers.QueueListener:
+    """Route all logging through a background queue listener.
+
+    Args:
+        config: Application settings
+
+    Returns:
+        The started listener (stopped automatically at exit)
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    if config.LOG_LEVEL:
+        level = logging.getLevelName(config.LOG_LEVEL.upper())
+    else:
+        level = logging.INFO if config.ENVIRONMENT == "development" else logging.WARNING
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if config.LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    rates = parse_sampling(config.LOG_SAMPLING)
+    if rates:
+        queue_handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, _QueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    # Let uvicorn's loggers (including the per-request access log) share the queue
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    # SQL echo is controlled by SQL_ECHO only; keep sqlalchemy quiet otherwise
+    logging.getLogger("sqlalchemy.engine").setLevel(
+        logging.INFO if config.SQL_ECHO else logging.WARNING
+    )
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -1,64 +1,239 @@
-"""FastAPI main application entry point."""
+"""FastAPI main application entry point.
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, Query
+``create_app`` builds an application with its own database engine, session
+factory, message shards, archive and attachment stores, thumbnail workers,
+access tokens, revocation list, permission cache, rate limiter, connection
+manager and background jobs, so several isolated instances can run in one
+process (tests, benchmarks). ``app`` is the instance built from the
+environment's settings.
+"""
+
+from fastapi import APIRouter, FastAPI, Request, WebSocket, WebSocketDisconnect, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from sqlalchemy.orm import Session
 import logging
+import time
 from typing import Optional
 
-from .config import settings
-from .database import init_db, get_db
-from .dependencies import get_current_user
-from .models import User
-from .utils.security import decode_access_token
+from .archive import ArchiveStore, Archiver
+from .attachments import LocalAttachmentStore, ThumbnailWorker
+from .purge import Purger
+from .scheduler import CronTrigger, IntervalTrigger, Scheduler, with_session
+from .config import Settings, settings
+from .database import create_db_engine, create_session_factory, init_db, get_db
+from .logging_config import setup_logging
+from .dependencies import get_limiter, get_manager, get_permissions, get_tokens, user_rate_limit
+from .lifecycle import DrainController
+from .metrics import instrument_engine, rate_limit_rejections_total, registry
+from .middleware.compression import CompressionMiddleware
+from .middleware.metrics import MetricsMiddleware
+from .permissions import Permission, PermissionCache, Scope
+from .routes import auth, users, servers, channels, messages, attachments
+from .sharding import ShardRouter
+from .utils.rate_limit import RateLimiter, create_rate_limiter
+from .utils.revocation import RevocationList
+from .utils.security import AccessTokens, create_access_tokens
 from .websocket.manager import ConnectionManager
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO if settings.ENVIRONMENT == "development" else logging.WARNING,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+# Configure logging (queue-based, written by a background thread). Logging
+# and metrics are process-wide; everything else belongs to one application.
+setup_logging(settings)
 logger = logging.getLogger(__name__)
 
-# Create FastAPI app
-app = FastAPI(
-    title="Discord Clone API",
-    description="A full-featured Discord clone backend with real-time messaging",
-    version="1.0.0",
-    docs_url="/docs",
-    redoc_url="/redoc"
-)
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, use settings.allowed_origins_list
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# WebSocket connection manager
-manager = ConnectionManager()
-
-
-@app.on_event("startup")
-async def startup_event():
-    """Initialize application on startup."""
-    logger.info("Starting Discord Clone Backend...")
-    init_db()
-    logger.info("Database initialized")
-    logger.info(f"Environment: {settings.ENVIRONMENT}")
-    logger.info(f"Server running on {settings.HOST}:{settings.PORT}")
-
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Cleanup on application shutdown."""
-    logger.info("Shutting down Discord Clone Backend...")
-
-
-@app.get("/")
+# Endpoints outside the feature routers
+router = APIRouter()
+
+
+def create_app(config: Optional[Settings] = None) -> FastAPI:
+    """Build an application and the resources it owns.
+    
+    Args:
+        config: Settings to build from (default: the environment's settings)
+        
+    Returns:
+        The application; its resources are on ``app.state`` (``settings``,
+        ``engine``, ``session_factory``, ``shards``, ``store``,
+        ``attachments``, ``thumbnails``, ``revocations``, ``tokens``,
+        ``permissions``, ``limiter``, ``manager``, ``drain``, ``scheduler``)
+    """
+    config = config or settings
+    app = FastAPI(
+        title="Discord Clone API",
+        description="A full-featured Discord clone backend with real-time messaging",
+        version="1.0.0",
+        docs_url="/docs",
+        redoc_url="/redoc",
+        default_response_class=ORJSONResponse
+    )
+    
+    # Database, message shards, archive and attachments; dependencies read them from ``app.state``
+    engine = create_db_engine(config.DATABASE_URL)
+    session_factory = create_session_factory(engine)
+    shards = ShardRouter(config.message_shard_urls_list)
+    store = ArchiveStore(config.ARCHIVE_DIR)
+    attachment_store = LocalAttachmentStore(config.ATTACHMENT_DIR)
+    thumbnails = ThumbnailWorker(
+        attachment_store,
+        workers=config.THUMBNAIL_WORKERS,
+        size=config.THUMBNAIL_SIZE,
+        queue_size=config.THUMBNAIL_QUEUE_SIZE,
+    )
+    
+    # Tokens, permissions and rate limits; dependencies read them from ``app.state`` too
+    revocations = RevocationList()
+    tokens = create_access_tokens(config, revocations)
+    permissions = PermissionCache(config.PERMISSION_CACHE_SIZE, config.PERMISSION_CACHE_TTL_SECONDS)
+    limiter = create_rate_limiter(config)
+    
+    # Configure CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # In production, use config.allowed_origins_list
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    # Compress large responses (message history, member lists)
+    if config.COMPRESSION_ENABLED:
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=config.COMPRESSION_MINIMUM_SIZE,
+            gzip_level=config.COMPRESSION_GZIP_LEVEL,
+            brotli_quality=config.COMPRESSION_BROTLI_QUALITY,
+            zstd_level=config.COMPRESSION_ZSTD_LEVEL,
+        )
+    
+    # Request latency/count instrumentation and per-query timing
+    if config.METRICS_ENABLED:
+        app.add_middleware(MetricsMiddleware)
+        instrument_engine(engine)
+        for shard_engine in shards.engines:
+            instrument_engine(shard_engine)
+    
+    # WebSocket connection manager; routes reach it through ``dependencies.get_manager``
+    manager = ConnectionManager(
+        replay_buffer_size=config.WS_REPLAY_BUFFER_SIZE,
+        session_ttl=config.WS_SESSION_TTL_SECONDS,
+        heartbeat_interval=config.WS_HEARTBEAT_INTERVAL_SECONDS,
+        heartbeat_timeout=config.WS_HEARTBEAT_TIMEOUT_SECONDS,
+        reap_batch_size=config.WS_REAP_BATCH_SIZE,
+    )
+    
+    # Background jobs: revocation sync runs in every worker, the rest on one worker per cluster
+    scheduler = Scheduler(
+        tick_seconds=config.SCHEDULER_TICK_SECONDS,
+        poll_seconds=config.SCHEDULER_POLL_SECONDS,
+        lease_seconds=config.SCHEDULER_LEASE_SECONDS,
+        retry_seconds=config.SCHEDULER_RETRY_SECONDS,
+        default_limit=config.SCHEDULER_MAX_CONCURRENCY,
+    )
+    if config.REVOCATION_SYNC_INTERVAL_SECONDS > 0:
+        scheduler.add_job(
+            "revocation_sync",
+            with_session(session_factory, revocations.sync),
+            IntervalTrigger(config.REVOCATION_SYNC_INTERVAL_SECONDS),
+            cluster=False,
+        )
+    if not config.WS_HEARTBEAT_INTERVAL_SECONDS:
+        # The heartbeat tick expires resume sessions; without it this worker sweeps on its own
+        scheduler.add_job(
+            "ws_session_sweep",
+            manager.expire_sessions,
+            IntervalTrigger(max(1.0, config.WS_SESSION_TTL_SECONDS / 4)),
+            cluster=False,
+        )
+    if config.ARCHIVE_CRON:
+        archive_trigger = CronTrigger(config.ARCHIVE_CRON)
+    elif config.ARCHIVE_INTERVAL_SECONDS > 0:
+        archive_trigger = IntervalTrigger(config.ARCHIVE_INTERVAL_SECONDS)
+    else:
+        archive_trigger = None
+    if archive_trigger is not None:
+        archiver = Archiver(store, config.ARCHIVE_AFTER_DAYS, config.ARCHIVE_BATCH_SIZE, shards)
+        scheduler.add_job(
+            "archive", with_session(session_factory, archiver.run_once), archive_trigger, kind="maintenance"
+        )
+    if config.PURGE_INTERVAL_SECONDS > 0:
+        purger = Purger(store, batch_size=config.PURGE_BATCH_SIZE, shard_router=shards)
+        scheduler.add_job(
+            "purge",
+            with_session(session_factory, purger.run_once),
+            IntervalTrigger(config.PURGE_INTERVAL_SECONDS),
+            kind="maintenance",
+        )
+    
+    # Drain mode: refuse new sockets, spread reconnects, flush, then exit
+    drain = DrainController(
+        manager,
+        batch_size=config.DRAIN_BATCH_SIZE,
+        batch_interval=config.DRAIN_BATCH_INTERVAL_SECONDS,
+        max_reconnect_delay=config.DRAIN_MAX_RECONNECT_DELAY_SECONDS,
+        timeout=config.DRAIN_TIMEOUT_SECONDS,
+    )
+    drain.add_shutdown_hook(scheduler.stop)
+    drain.add_shutdown_hook(thumbnails.stop)
+    drain.add_shutdown_hook(engine.dispose)
+    drain.add_shutdown_hook(shards.dispose)
+    
+    app.state.settings = config
+    app.state.engine = engine
+    app.state.session_factory = session_factory
+    app.state.shards = shards
+    app.state.store = store
+    app.state.attachments = attachment_store
+    app.state.thumbnails = thumbnails
+    app.state.revocations = revocations
+    app.state.tokens = tokens
+    app.state.permissions = permissions
+    app.state.limiter = limiter
+    app.state.manager = manager
+    app.state.drain = drain
+    app.state.scheduler = scheduler
+    
+    @app.on_event("startup")
+    async def startup_event():
+        """Initialize application on startup."""
+        logger.info("Starting Discord Clone Backend...")
+        started = time.perf_counter()
+        checked = init_db(engine)
+        shards.create_all()
+        logger.info(
+            "Database initialized in %.0f ms (%d message shards, schema %s)",
+            (time.perf_counter() - started) * 1000, len(shards), "stamped" if checked else "up to date"
+        )
+        # Load revocations from other workers, then keep following them
+        revocations.sync_once(session_factory)
+        scheduler.start(session_factory)
+        thumbnails.start(session_factory)
+        logger.info("Environment: %s", config.ENVIRONMENT)
+        logger.info("Server running on %s:%s", config.HOST, config.PORT)
+        manager.start_heartbeat()
+        if config.DRAIN_ON_SIGTERM and drain.install_signal_handler():
+            logger.info("SIGTERM will drain WebSocket connections before shutdown")
+    
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        """Cleanup on application shutdown."""
+        logger.info("Shutting down Discord Clone Backend...")
+        # No-op if SIGTERM already drained; otherwise drains whatever is still open
+        await drain.drain()
+    
+    # Authenticated routers share a per-user request budget; auth routes are limited per IP
+    rate_limited = [Depends(user_rate_limit())]
+    
+    app.include_router(router)
+    app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
+    app.include_router(users.router, prefix="/users", tags=["Users"], dependencies=rate_limited)
+    app.include_router(servers.router, prefix="/servers", tags=["Servers"], dependencies=rate_limited)
+    app.include_router(channels.router, prefix="/channels", tags=["Channels"], dependencies=rate_limited)
+    app.include_router(messages.router, prefix="/messages", tags=["Messages"], dependencies=rate_limited)
+    app.include_router(attachments.router, prefix="/attachments", tags=["Attachments"], dependencies=rate_limited)
+    return app
+
+
+@router.get("/")
 async def root():
     """Root endpoint."""
     return {
@@ -69,43 +244,102 @@ async def root():
     }
 
 
-@app.get("/health")
-async def health_check():
-    """Health check endpoint."""
+@router.get("/health")
+async def health_check(request: Request):
+    """Health check endpoint.
+    
+    Returns 503 while draining so load balancers stop routing here.
+    """
+    if request.app.state.drain.draining:
+        return ORJSONResponse(status_code=503, content={"status": "draining"})
     return {"status": "healthy", "timestamp": "2024-01-01T00:00:00Z"}
 
 
-@app.websocket("/ws/{user_id}/{server_id}/{channel_id}")
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics endpoint."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+def _channel_scope(permissions: PermissionCache, db: Session, user_id: int, channel_id: int) -> Optional[Scope]:
+    """Resolve a socket user's permissions in a channel through the permission cache.
+    
+    The session goes back to the pool right after: sockets stay open for
+    hours and must not hold a database connection each.
+    """
+    try:
+        return permissions.for_channel(db, user_id, channel_id)
+    finally:
+        db.close()
+
+
+@router.websocket("/ws/{user_id}/{server_id}/{channel_id}")
 async def websocket_endpoint(
     websocket: WebSocket,
     user_id: int,
     server_id: int,
     channel_id: int,
     token: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    session_id: Optional[str] = Query(None),
+    last_seq: Optional[int] = Query(None),
+    db: Session = Depends(get_db),
+    manager: ConnectionManager = Depends(get_manager),
+    tokens: AccessTokens = Depends(get_tokens),
+    permissions: PermissionCache = Depends(get_permissions),
+    limiter: RateLimiter = Depends(get_limiter)
 ):
     """WebSocket endpoint for real-time messaging.
     
+    Every broadcast event carries a per-channel ``seq``. The first frame is a
+    ``hello`` event with a ``session_id``; reconnecting with ``session_id``
+    and ``last_seq`` replays the missed events, or sends ``resync_required``
+    when they are no longer buffered and history must be refetched.
+    
+    Only members who may view the channel can connect, and each inbound
+    message needs ``SEND_MESSAGES``. The socket joins the channel's own
+    server for server events, whatever ``server_id`` says.
+    
     Args:
         websocket: WebSocket connection
         user_id: User ID
-        server_id: Server ID
+        server_id: Server ID (the channel's server is used)
         channel_id: Channel ID
         token: JWT authentication token
+        session_id: Session to resume
+        last_seq: Last sequence number received on that session
         db: Database session
+        manager: The application's connection manager
+        tokens: The application's token service
+        permissions: The application's permission cache
+        limiter: The application's rate limiter
     """
+    # Refuse new sockets while draining; clients retry against another node
+    if manager.draining:
+        await websocket.close(code=1012, reason="Server restarting")
+        return
+    
     # Verify token
     if not token:
         await websocket.close(code=1008, reason="Authentication required")
         return
     
-    payload = decode_access_token(token)
-    if not payload or payload.get("sub") != user_id:
+    payload = tokens.decode_access_token(token)
+    # "sub" is issued as a string, the path parameter is an int
+    if not payload or payload.get("sub") != str(user_id):
         await websocket.close(code=1008, reason="Invalid token")
         return
     
+    # Members only, registered under the server the channel belongs to
+    scope = _channel_scope(permissions, db, user_id, channel_id)
+    if scope is None or not scope.allows(Permission.VIEW):
+        await websocket.close(code=1008, reason="Not a member of this channel")
+        return
+    server_id = scope.server_id
+    
     # Accept connection
-    await manager.connect(websocket, user_id, server_id, channel_id)
+    session_id = await manager.connect(
+        websocket, user_id, server_id, channel_id, session_id=session_id, last_seq=last_seq
+    )
     
     try:
         # Notify others that user joined
@@ -124,6 +358,25 @@ async def websocket_endpoint(
         # Listen for messages
         while True:
             data = await websocket.receive_json()
+            # Any inbound frame proves the peer is alive
+            manager.touch(user_id, channel_id)
+            
+            # Shed abusive clients before they reach the broadcast fan-out
+            if await limiter.hit("ws", user_id):
+                rate_limit_rejections_total.inc("ws")
+                await websocket.close(code=1008, reason="Rate limit exceeded")
+                raise WebSocketDisconnect(code=1008)
+            
+            # Heartbeat replies carry no payload for the channel
+            if isinstance(data, dict) and data.get("type") == "pong":
+                continue
+            
+            # Checked per message through the cache, so role changes and removals
+            # made on other workers reach open sockets too
+            scope = _channel_scope(permissions, db, user_id, channel_id)
+            if scope is None or not scope.allows(Permission.SEND_MESSAGES):
+                await websocket.close(code=1008, reason="Not allowed to send messages")
+                raise WebSocketDisconnect(code=1008)
             
             # Broadcast message to all users in channel
             await manager.broadcast(
@@ -135,31 +388,17 @@ async def websocket_endpoint(
             )
             
     except WebSocketDisconnect:
-        manager.disconnect(websocket, user_id, server_id, channel_id)
-        
-        # Notify others that user left
-        await manager.broadcast(
-            {
-                "type": "user_leave",
-                "data": {
-                    "user_id": user_id,
-                    "channel_id": channel_id
-                }
-            },
-            channel_id
-        )
-        
-        logger.info(f"User {user_id} disconnected from channel {channel_id}")
-
+        pass
+    finally:
+        # Notify others that user left; a no-op if the heartbeat reaper
+        # already removed this socket or a reconnect replaced it
+        await manager.leave(websocket, user_id, server_id, channel_id, session_id=session_id)
 
-# Import and include routers
-from .routes import auth, users, servers, channels, messages
 
-app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
-app.include_router(users.router, prefix="/users", tags=["Users"])
-app.include_router(servers.router, prefix="/servers", tags=["Servers"])
-app.include_router(channels.router, prefix="/channels", tags=["Channels"])
-app.include_router(messages.router, prefix="/messages", tags=["Messages"])
+app = create_app()
+# The default application's connection manager and drain controller
+manager = app.state.manager
+drain = app.state.drain
 
 
 if __name__ == "__main__":
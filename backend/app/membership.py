@@ -0,0 +1,199 @@
+"""Server membership changes: invites, joins, removals and bulk adds.
+
+Membership writes are batched. Adding any number of users is one
+``INSERT ... SELECT`` that skips unknown users and existing members in the
+database, and removing them is one ``DELETE``. Once the change is committed,
+``announce_changes`` brings the permission cache and the WebSocket layer up
+to date for every affected user in one pass.
+"""
+
+import logging
+import secrets
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Sequence
+
+from sqlalchemy import delete, exists, insert, literal, or_, select, update
+from sqlalchemy.orm import Session
+
+from .models import Invite, MemberRole, Server, ServerMember, User
+from .permissions import PermissionCache
+from .websocket.manager import ConnectionManager
+
+logger = logging.getLogger(__name__)
+
+# Random bytes per invite code (8 URL-safe characters)
+INVITE_CODE_BYTES = 6
+
+
+def create_invite(
+    db: Session,
+    server_id: int,
+    created_by: int,
+    max_uses: Optional[int] = None,
+    max_age_seconds: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> Invite:
+    """Add an invite code for a server (the caller commits).
+
+    Args:
+        db: Database session
+        server_id: Server ID
+        created_by: ID of the user creating it
+        max_uses: Joins allowed through the code (None for unlimited)
+        max_age_seconds: Seconds until the code expires (None for never)
+        now: Current time (for tests)
+
+    Returns:
+        The new invite
+    """
+    now = now or datetime.utcnow()
+    invite = Invite(
+        code=secrets.token_urlsafe(INVITE_CODE_BYTES),
+        server_id=server_id,
+        created_by=created_by,
+        max_uses=max_uses,
+        uses=0,
+        expires_at=now + timedelta(seconds=max_age_seconds) if max_age_seconds else None,
+        created_at=now,
+    )
+    db.add(invite)
+    return invite
+
+
+def _usable(now: datetime):
+    return (
+        or_(Invite.max_uses.is_(None), Invite.uses < Invite.max_uses),
+        or_(Invite.expires_at.is_(None), Invite.expires_at > now),
+    )
+
+
+def find_invite(db: Session, code: str, now: Optional[datetime] = None) -> Optional[Invite]:
+    """Look up an invite that can still be used, to a server that is not deleted."""
+    return db.query(Invite).join(Server, Server.id == Invite.server_id).filter(
+        Invite.code == code, Server.deleted_at.is_(None), *_usable(now or datetime.utcnow())
+    ).first()
+
+
+def use_invite(db: Session, invite_id: int, now: Optional[datetime] = None) -> bool:
+    """Count one use of an invite (the caller commits).
+
+    The check and the increment are one conditional ``UPDATE``, so
+    concurrent joins cannot use a code more than ``max_uses`` times.
+
+    Returns:
+        Whether a use was left and has been taken
+    """
+    result = db.execute(
+        update(Invite)
+        .where(Invite.id == invite_id, *_usable(now or datetime.utcnow()))
+        .values(uses=Invite.uses + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def add_members(
+    db: Session, server_id: int, user_ids: Iterable[int], role: MemberRole = MemberRole.MEMBER
+) -> List[int]:
+    """Add users to a server in a single statement (the caller commits).
+
+    Unknown users and existing members are skipped by the statement itself,
+    so the rows are never loaded into Python.
+
+    Args:
+        db: Database session
+        server_id: Server ID
+        user_ids: Users to add
+        role: Role given to all of them
+
+    Returns:
+        IDs of the users actually added
+    """
+    ids = sorted(set(user_ids))
+    if not ids:
+        return []
+    already_member = exists().where(ServerMember.server_id == server_id, ServerMember.user_id == User.id)
+    candidates = (
+        select(
+            literal(server_id),
+            User.id,
+            literal(role, ServerMember.role.type),
+            literal(datetime.utcnow(), ServerMember.joined_at.type),
+        )
+        .where(User.id.in_(ids), ~already_member)
+    )
+    statement = insert(ServerMember).from_select(
+        ["server_id", "user_id", "role", "joined_at"], candidates
+    )
+    if db.get_bind().dialect.insert_returning:
+        added = sorted(db.scalars(statement.returning(ServerMember.user_id)))
+    else:
+        added = sorted(db.scalars(candidates.with_only_columns(User.id)))
+        db.execute(statement)
+    logger.info("Added %d of %d users to server %s", len(added), len(ids), server_id)
+    return added
+
+
+def remove_members(db: Session, server_id: int, user_ids: Iterable[int]) -> List[int]:
+    """Remove users from a server in a single statement (the caller commits).
+
+    The owner is never removed.
+
+    Returns:
+        IDs of the users actually removed
+    """
+    ids = sorted(set(user_ids))
+    if not ids:
+        return []
+    condition = (
+        ServerMember.server_id == server_id,
+        ServerMember.user_id.in_(ids),
+        ServerMember.role != MemberRole.OWNER,
+    )
+    removed = sorted(db.scalars(select(ServerMember.user_id).where(*condition)))
+    if removed:
+        db.execute(delete(ServerMember).where(*condition).execution_options(synchronize_session=False))
+    return removed
+
+
+async def announce_changes(
+    manager: ConnectionManager,
+    permissions: PermissionCache,
+    server_id: int,
+    added: Sequence[int] = (),
+    removed: Sequence[int] = (),
+    role: MemberRole = MemberRole.MEMBER,
+):
+    """Apply committed membership changes to the cache and live connections.
+
+    Cached permissions of every affected user are dropped, removed users'
+    sockets in the server are closed, and the server's members get one
+    ``member_add`` and one ``member_remove`` event for the whole batch.
+
+    Args:
+        manager: WebSocket connection manager
+        permissions: Permission cache to invalidate
+        server_id: Server ID
+        added: IDs of users who joined
+        removed: IDs of users who left or were removed
+        role: Role the added users got
+    """
+    for user_id in (*added, *removed):
+        permissions.invalidate(server_id, user_id)
+    if removed:
+        await manager.remove_from_server(server_id, removed)
+        await manager.broadcast_to_server(
+            {
+                "type": "member_remove",
+                "data": {"server_id": server_id, "user_ids": list(removed)}
+            },
+            server_id
+        )
+    if added:
+        await manager.broadcast_to_server(
+            {
+                "type": "member_add",
+                "data": {"server_id": server_id, "user_ids": list(added), "role": role.value}
+            },
+            server_id
+        )
@@ -0,0 +1,355 @@
+"""Lightweight Prometheus-compatible metrics.
+
+Implements just enough of the Prometheus data model (counters, gauges and
+histograms with labels) to expose ``/metrics`` in the text exposition format
+without an external dependency. Updates are a dict lookup plus an
+uncontended lock, so instrumentation can stay on under full load.
+"""
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+# Latency buckets in seconds, tuned for sub-millisecond to multi-second calls
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """Render a Prometheus label set such as ``{method="GET",route="/"}``."""
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    """Render a sample value, keeping integers free of a trailing ``.0``."""
+    if not math.isfinite(value):
+        return "NaN" if math.isnan(value) else ("+Inf" if value > 0 else "-Inf")
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    """Base class holding name, help text and label names."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        """Render HELP/TYPE headers and samples."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1.0):
+        """Increase the counter for the given label values."""
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def value(self, *labelvalues) -> float:
+        """Get the current value for the given label values."""
+        return self._values.get(labelvalues, 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, optionally computed on scrape."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, *labelvalues):
+        """Set the gauge for the given label values."""
+        self._values[labelvalues] = value
+
+    def inc(self, *labelvalues, amount: float = 1.0):
+        """Increase the gauge."""
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def dec(self, *labelvalues, amount: float = 1.0):
+        """Decrease the gauge."""
+        self.inc(*labelvalues, amount=-amount)
+
+    def set_function(self, function: Callable[[], float]):
+        """Compute the (unlabelled) value lazily at scrape time."""
+        self._function = function
+
+    def value(self, *labelvalues) -> float:
+        """Get the current value for the given label values."""
+        if self._function is not None and not labelvalues:
+            return float(self._function())
+        return self._values.get(labelvalues, 0.0)
+
+    def _samples(self) -> List[str]:
+        if self._function is not None:
+            return [f"{self.name} {_format_value(float(self._function()))}"]
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket..., +Inf count, sum]
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *labelvalues):
+        """Record one observation."""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                state = self._values[labelvalues] = [0] * (len(self.buckets) + 2)
+            state[index] += 1
+            state[-1] += value
+
+    def count(self, *labelvalues) -> int:
+        """Get the number of observations for the given label values."""
+        state = self._values.get(labelvalues)
+        return int(sum(state[:-1])) if state else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(state)) for labels, state in self._values.items()]
+        lines = []
+        for labels, state in items:
+            cumulative = 0
+            bounds = [repr(b) for b in self.buckets] + ["+Inf"]
+            for bound, bucket_count in zip(bounds, state[:-1]):
+                cumulative += bucket_count
+                label_str = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together on scrape."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Add a metric, returning the existing one if already registered."""
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# HTTP
+http_requests_total = registry.counter(
+    "http_requests_total", "HTTP requests by method, route and status", ("method", "route", "status")
+)
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+
+# Database
+db_query_duration_seconds = registry.histogram(
+    "db_query_duration_seconds", "SQL statement execution time by operation", ("operation",)
+)
+
+# WebSocket
+ws_active_connections = registry.gauge(
+    "ws_active_connections", "Open WebSocket connections"
+)
+ws_active_channels = registry.gauge(
+    "ws_active_channels", "Channels with at least one open WebSocket"
+)
+ws_broadcast_duration_seconds = registry.histogram(
+    "ws_broadcast_duration_seconds", "Time to fan a broadcast out to a channel"
+)
+ws_broadcast_recipients = registry.histogram(
+    "ws_broadcast_recipients",
+    "Sockets reached per broadcast",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000),
+)
+ws_send_failures_total = registry.counter(
+    "ws_send_failures_total", "Failed WebSocket sends"
+)
+ws_reaped_connections_total = registry.counter(
+    "ws_reaped_connections_total", "Connections dropped for missing heartbeats or failed sends"
+)
+ws_resumes_total = registry.counter(
+    "ws_resumes_total", "WebSocket resume attempts by outcome", ("outcome",)
+)
+ws_replayed_events_total = registry.counter(
+    "ws_replayed_events_total", "Events replayed from the channel buffer on resume"
+)
+
+# Password hashing
+bcrypt_queue_depth = registry.gauge(
+    "bcrypt_queue_depth", "bcrypt jobs waiting for a worker thread"
+)
+bcrypt_duration_seconds = registry.histogram(
+    "bcrypt_duration_seconds", "bcrypt hash/verify time", ("operation",)
+)
+
+# Retention
+archive_messages_total = registry.counter(
+    "archive_messages_total", "Messages moved to the archive or deleted by retention", ("action",)
+)
+
+# Purge of deleted servers and channels
+purge_rows_total = registry.counter(
+    "purge_rows_total", "Rows deleted by the purge job", ("table",)
+)
+purge_pending = registry.gauge(
+    "purge_pending", "Deleted servers and channels left to purge, as of the last pass", ("kind",)
+)
+
+# Attachments
+attachment_uploads_total = registry.counter(
+    "attachment_uploads_total", "Attachment uploads by outcome", ("result",)
+)
+attachment_upload_bytes_total = registry.counter(
+    "attachment_upload_bytes_total", "Bytes received in attachment uploads"
+)
+attachment_download_bytes_total = registry.counter(
+    "attachment_download_bytes_total", "Attachment bytes sent, by how they were sent", ("method",)
+)
+thumbnail_queue_depth = registry.gauge(
+    "thumbnail_queue_depth", "Images waiting for a thumbnail worker"
+)
+thumbnail_duration_seconds = registry.histogram(
+    "thumbnail_duration_seconds",
+    "Thumbnail render time",
+    ("status",),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+# Background jobs
+scheduler_job_runs_total = registry.counter(
+    "scheduler_job_runs_total", "Background job runs by outcome", ("job", "status")
+)
+scheduler_job_duration_seconds = registry.histogram(
+    "scheduler_job_duration_seconds",
+    "Background job run time",
+    ("job",),
+    buckets=(0.01, 0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600),
+)
+scheduler_is_leader = registry.gauge(
+    "scheduler_is_leader", "1 if this worker runs the cluster's background jobs"
+)
+
+# Token verification
+token_cache_lookups_total = registry.counter(
+    "token_cache_lookups_total", "Verified-token cache lookups", ("result",)
+)
+revoked_tokens_active = registry.gauge(
+    "revoked_tokens_active", "Revoked access tokens that have not expired yet"
+)
+
+# Permissions
+permission_cache_lookups_total = registry.counter(
+    "permission_cache_lookups_total", "Member permission cache lookups", ("result",)
+)
+
+# Rate limiting
+rate_limit_rejections_total = registry.counter(
+    "rate_limit_rejections_total", "Requests or frames rejected by the rate limiter", ("budget",)
+)
+
+
+def instrument_engine(engine) -> None:
+    """Time every SQL statement executed through ``engine``.
+
+    Args:
+        engine: SQLAlchemy engine to attach cursor events to
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement else "OTHER"
+        db_query_duration_seconds.observe(time.perf_counter() - started, operation)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        # after_cursor_execute is skipped on errors; keep the timing stack balanced
+        connection = context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
@@ -0,0 +1,274 @@
+"""Negotiated response compression middleware (brotli, zstd, gzip)."""
+
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+# Content types worth compressing; binary formats are usually compressed already
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "text/",
+)
+
+
+class _GzipEncoder:
+    """Streaming gzip encoder backed by zlib."""
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    """Streaming brotli encoder."""
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdEncoder:
+    """Streaming zstandard encoder."""
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def available_encodings() -> List[str]:
+    """Get supported encodings in server preference order.
+
+    Returns:
+        Encoding names, best compression ratio first
+    """
+    encodings = []
+    if brotli is not None:
+        encodings.append("br")
+    if zstandard is not None:
+        encodings.append("zstd")
+    encodings.append("gzip")
+    return encodings
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {encoding: q-value}.
+
+    Args:
+        header: Raw Accept-Encoding header value
+
+    Returns:
+        Mapping of lower-cased encoding names to quality values
+    """
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def negotiate_encoding(header: str, encodings: List[str]) -> Optional[str]:
+    """Pick the best encoding both client and server support.
+
+    Args:
+        header: Raw Accept-Encoding header value
+        encodings: Server encodings in preference order
+
+    Returns:
+        Encoding name or None if nothing acceptable
+    """
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    best: Optional[Tuple[float, int, str]] = None
+    for rank, encoding in enumerate(encodings):
+        q = accepted.get(encoding, wildcard)
+        if q <= 0:
+            continue
+        # Higher q wins; on ties the server preference order decides
+        candidate = (q, -rank, encoding)
+        if best is None or candidate > best:
+            best = candidate
+    return best[2] if best else None
+
+
+def vary_on_encoding(message: Message) -> bool:
+    """Add ``Vary: Accept-Encoding`` to a response start message if its body could be compressed.
+
+    Args:
+        message: ``http.response.start`` message, modified in place
+
+    Returns:
+        True if the response is a compression candidate
+    """
+    headers = MutableHeaders(raw=message["headers"])
+    compressible = (
+        "content-encoding" not in headers
+        and "accept-ranges" not in headers
+        and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+    )
+    if compressible:
+        # Caches must not serve a compressed copy to a client that did not ask for one, or vice versa
+        headers.add_vary_header("Accept-Encoding")
+    return compressible
+
+
+class CompressionMiddleware:
+    """Compress HTTP responses with the best encoding the client accepts.
+
+    Responses smaller than ``minimum_size``, responses that already carry a
+    ``Content-Encoding``, byte-range capable responses (``Accept-Ranges``,
+    whose offsets refer to the raw bytes) and non-text content types are
+    passed through untouched. Streaming responses are compressed chunk by chunk.
+    Every compressible response varies on ``Accept-Encoding``, whether or not
+    it ends up compressed.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        zstd_level: int = 3,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.zstd_level = zstd_level
+        self.encodings = available_encodings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate_encoding(accept, self.encodings)
+        if encoding is None:
+
+            async def send_identity(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    vary_on_encoding(message)
+                await send(message)
+
+            await self.app(scope, receive, send_identity)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+    def make_encoder(self, encoding: str):
+        """Create a fresh streaming encoder for one response."""
+        if encoding == "br":
+            return _BrotliEncoder(self.brotli_quality)
+        if encoding == "zstd":
+            return _ZstdEncoder(self.zstd_level)
+        return _GzipEncoder(self.gzip_level)
+
+
+class _CompressionResponder:
+    """Per-response state for CompressionMiddleware."""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+        self.encoder = None
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            # Hold the headers back until we know whether to compress
+            self.initial_message = message
+            self.passthrough = not vary_on_encoding(message)
+            if self.passthrough:
+                # Nothing to decide; the body may also come as a zero-copy or path send
+                self.started = True
+                await self.downstream(message)
+            return
+
+        if message_type != "http.response.body":
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if not self.started:
+            self.started = True
+            if self.passthrough or (not more_body and len(body) < self.middleware.minimum_size):
+                self.passthrough = True
+                await self.downstream(self.initial_message)
+                await self.downstream(message)
+                return
+
+            self.encoder = self.middleware.make_encoder(self.encoding)
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+
+            if more_body:
+                del headers["Content-Length"]
+                body = self.encoder.compress(body)
+            else:
+                body = self.encoder.compress(body) + self.encoder.finish()
+                headers["Content-Length"] = str(len(body))
+
+            await self.downstream(self.initial_message)
+            await self.downstream({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+
+        if self.passthrough:
+            await self.downstream(message)
+            return
+
+        chunk = self.encoder.compress(body)
+        if not more_body:
+            chunk += self.encoder.finish()
+        await self.downstream({"type": "http.response.body", "body": chunk, "more_body": more_body})
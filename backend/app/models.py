@@ -1,11 +1,17 @@
 """SQLAlchemy database models."""
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, Boolean
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Enum, Boolean, CheckConstraint, Index
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from datetime import datetime
 import enum
 from .database import Base
+from .utils.snowflake import next_message_id, snowflake_time, TIMESTAMP_SHIFT
+
+# 64-bit ids; on SQLite INTEGER PRIMARY KEY is already 64-bit and stays the rowid
+SnowflakeId = BigInteger().with_variant(Integer, "sqlite")
 
 
 class UserStatus(str, enum.Enum):
@@ -40,6 +46,7 @@ class User(Base):
     owned_servers = relationship("Server", back_populates="owner", cascade="all, delete-orphan")
     server_memberships = relationship("ServerMember", back_populates="user", cascade="all, delete-orphan")
     messages = relationship("Message", back_populates="user", cascade="all, delete-orphan")
+    refresh_tokens = relationship("RefreshToken", back_populates="user", cascade="all, delete-orphan")
     
     def __repr__(self):
         return f"<User(id={self.id}, username='{self.username}')>"
@@ -54,11 +61,14 @@ class Server(Base):
     description = Column(Text, nullable=True)
     owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Set when deleted; the purge job removes the row and its children later
+    deleted_at = Column(DateTime, nullable=True, index=True)
     
     # Relationships
     owner = relationship("User", back_populates="owned_servers")
     members = relationship("ServerMember", back_populates="server", cascade="all, delete-orphan")
     channels = relationship("Channel", back_populates="server", cascade="all, delete-orphan")
+    invites = relationship("Invite", back_populates="server", cascade="all, delete-orphan")
     
     def __repr__(self):
         return f"<Server(id={self.id}, name='{self.name}')>"
@@ -67,6 +77,10 @@ class Server(Base):
 class ServerMember(Base):
     """Server membership model."""
     __tablename__ = "server_members"
+    __table_args__ = (
+        # One row per member; also serves the membership lookups of every permission check
+        Index("ix_server_members_server_id_user_id", "server_id", "user_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     server_id = Column(Integer, ForeignKey("servers.id", ondelete="CASCADE"), nullable=False)
@@ -82,6 +96,31 @@ class ServerMember(Base):
         return f"<ServerMember(server_id={self.server_id}, user_id={self.user_id}, role={self.role})>"
 
 
+class Invite(Base):
+    """Server invite code.
+    
+    Each join through the code counts one use. The code stops working once
+    ``uses`` reaches ``max_uses`` or ``expires_at`` passes; either may be
+    unset.
+    """
+    __tablename__ = "invites"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    code = Column(String(16), unique=True, index=True, nullable=False)
+    server_id = Column(Integer, ForeignKey("servers.id", ondelete="CASCADE"), nullable=False, index=True)
+    created_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    max_uses = Column(Integer, nullable=True)
+    uses = Column(Integer, default=0, nullable=False)
+    expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Relationships
+    server = relationship("Server", back_populates="invites")
+    
+    def __repr__(self):
+        return f"<Invite(code='{self.code}', server_id={self.server_id}, uses={self.uses})>"
+
+
 class Channel(Base):
     """Channel model (text channels within servers)."""
     __tablename__ = "channels"
@@ -91,6 +130,8 @@ class Channel(Base):
     name = Column(String(100), nullable=False)
     description = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Set when deleted; the purge job removes the row and its messages later
+    deleted_at = Column(DateTime, nullable=True, index=True)
     
     # Relationships
     server = relationship("Server", back_populates="channels")
@@ -100,16 +141,32 @@ class Channel(Base):
         return f"<Channel(id={self.id}, name='{self.name}', server_id={self.server_id})>"
 
 
+def _created_at_from_id(context) -> datetime:
+    """Default ``created_at``: the time encoded in the message's snowflake id."""
+    message_id = context.get_current_parameters().get("id")
+    if message_id is None or message_id >> TIMESTAMP_SHIFT == 0:
+        return datetime.utcnow()
+    return snowflake_time(message_id)
+
+
 class Message(Base):
-    """Message model."""
+    """Message model.
+    
+    ``id`` is a time-ordered snowflake (see ``utils.snowflake``): history is
+    ordered and paginated by id alone, and ``created_at`` defaults to the
+    time encoded in it.
+    """
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_channel_id_id", "channel_id", "id"),
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(SnowflakeId, primary_key=True, index=True, default=next_message_id)
     channel_id = Column(Integer, ForeignKey("channels.id", ondelete="CASCADE"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime, default=_created_at_from_id, nullable=False)
+    updated_at = Column(DateTime, default=_created_at_from_id, onupdate=datetime.utcnow, nullable=False)
     is_edited = Column(Boolean, default=False, nullable=False)
     
     # Relationships
@@ -118,3 +175,147 @@ class Message(Base):
     
     def __repr__(self):
         return f"<Message(id={self.id}, user_id={self.user_id}, channel_id={self.channel_id})>"
+
+
+class Attachment(Base):
+    """File uploaded to a channel.
+    
+    The bytes live in the attachment store under the SHA-256 of the content,
+    so identical uploads share one blob (and one thumbnail). ``message_id``
+    is set once a message is sent with the attachment; until then only the
+    uploader can fetch it. It has no foreign key because messages may live
+    on a shard.
+    """
+    __tablename__ = "attachments"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    channel_id = Column(Integer, ForeignKey("channels.id", ondelete="CASCADE"), nullable=False, index=True)
+    uploader_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    message_id = Column(SnowflakeId, nullable=True, index=True)
+    filename = Column(String(255), nullable=False)
+    content_type = Column(String(100), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    sha256 = Column(String(64), nullable=False, index=True)
+    width = Column(Integer, nullable=True)  # of the original image, once its thumbnail is rendered
+    height = Column(Integer, nullable=True)
+    thumbnail_status = Column(String(20), default="none", nullable=False)  # none, pending, ready, failed
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<Attachment(id={self.id}, sha256='{self.sha256[:12]}', message_id={self.message_id})>"
+
+
+class RefreshToken(Base):
+    """Refresh token, stored as a SHA-256 hash.
+    
+    Every refresh rotates the token within its ``family_id``; presenting an
+    already rotated token revokes the whole family.
+    """
+    __tablename__ = "refresh_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    family_id = Column(String(32), index=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Relationships
+    user = relationship("User", back_populates="refresh_tokens")
+    
+    def __repr__(self):
+        return f"<RefreshToken(id={self.id}, user_id={self.user_id}, family_id='{self.family_id}')>"
+
+
+class RevokedToken(Base):
+    """Revoked access token ``jti``, kept until the token would have expired."""
+    __tablename__ = "revoked_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String(32), unique=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<RevokedToken(jti='{self.jti}', expires_at={self.expires_at})>"
+
+
+class RetentionPolicy(Base):
+    """Retention policy for a whole server or one channel.
+    
+    Unset fields fall back to the server's policy, then to the
+    ``ARCHIVE_AFTER_DAYS`` setting. Messages older than
+    ``archive_after_days`` move to the archive; older than
+    ``delete_after_days`` they are deleted from both tiers.
+    """
+    __tablename__ = "retention_policies"
+    __table_args__ = (
+        CheckConstraint("(server_id IS NULL) != (channel_id IS NULL)", name="ck_retention_target"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    server_id = Column(Integer, ForeignKey("servers.id", ondelete="CASCADE"), nullable=True, unique=True)
+    channel_id = Column(Integer, ForeignKey("channels.id", ondelete="CASCADE"), nullable=True, unique=True)
+    archive_after_days = Column(Integer, nullable=True)
+    delete_after_days = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<RetentionPolicy(server_id={self.server_id}, channel_id={self.channel_id})>"
+
+
+class ArchiveSegment(Base):
+    """Index entry for one compressed file of archived channel messages."""
+    __tablename__ = "archive_segments"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    channel_id = Column(Integer, ForeignKey("channels.id", ondelete="CASCADE"), nullable=False, index=True)
+    first_id = Column(SnowflakeId, nullable=False)
+    last_id = Column(SnowflakeId, nullable=False)
+    first_created_at = Column(DateTime, nullable=False)
+    last_created_at = Column(DateTime, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    path = Column(String(255), unique=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<ArchiveSegment(channel_id={self.channel_id}, ids={self.first_id}-{self.last_id})>"
+
+
+class ScheduledJob(Base):
+    """State of one cluster-wide periodic job.
+    
+    A worker claims a due run by setting ``locked_by`` and ``locked_until``
+    and keeps extending the lock while the job runs. A run whose lock
+    expires unfinished (its worker died) is claimed again, so every run
+    happens at least once.
+    """
+    __tablename__ = "scheduled_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), unique=True, index=True, nullable=False)
+    trigger = Column(String(100), nullable=False)
+    next_run_at = Column(DateTime, nullable=False)
+    locked_by = Column(String(100), nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)  # runs started since the last success
+    last_started_at = Column(DateTime, nullable=True)
+    last_finished_at = Column(DateTime, nullable=True)
+    last_status = Column(String(20), nullable=True)
+    last_error = Column(Text, nullable=True)
+    
+    def __repr__(self):
+        return f"<ScheduledJob(name='{self.name}', next_run_at={self.next_run_at})>"
+
+
+class SchedulerLease(Base):
+    """Leadership lease: the holder runs the cluster's periodic jobs until it expires."""
+    __tablename__ = "scheduler_leases"
+    
+    name = Column(String(50), primary_key=True)
+    holder = Column(String(100), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f"<SchedulerLease(name='{self.name}', holder='{self.holder}')>"
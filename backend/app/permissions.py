@@ -0,0 +1,191 @@
+"""Member permissions resolved to bitsets and cached per user and server.
+
+A member's role maps to a ``Permission`` bitset; routes check it through
+``dependencies.require``. Resolved bitsets are cached per ``(user, server)``
+and the server of each channel is cached too, so a warm check costs two
+dict probes instead of the channel and membership queries every route used
+to run.
+
+Role, membership and channel changes made in this process invalidate the
+affected entries at once. Other workers see them when their entries expire
+after ``PERMISSION_CACHE_TTL_SECONDS``.
+"""
+
+import enum
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+
+from .metrics import permission_cache_lookups_total
+from .models import Channel, MemberRole, Server, ServerMember
+
+
+class Permission(enum.IntFlag):
+    """Actions a member may take in a server and its channels."""
+
+    NONE = 0
+    VIEW = 1 << 0  # see the server, its channels, members and settings
+    SEND_MESSAGES = 1 << 1
+    READ_HISTORY = 1 << 2  # message history and export
+    MANAGE_MESSAGES = 1 << 3  # delete other members' messages
+    MANAGE_CHANNELS = 1 << 4  # create and edit channels
+    DELETE_CHANNELS = 1 << 5
+    MANAGE_SERVER = 1 << 6  # server details and retention policies
+    MANAGE_ROLES = 1 << 7  # change the roles of members below one's own
+    DELETE_SERVER = 1 << 8
+    CREATE_INVITES = 1 << 9
+    KICK_MEMBERS = 1 << 10  # remove members below one's own role
+    ADD_MEMBERS = 1 << 11  # add users directly, without an invite
+
+
+_MEMBER = Permission.VIEW | Permission.SEND_MESSAGES | Permission.READ_HISTORY | Permission.CREATE_INVITES
+_MODERATOR = _MEMBER | Permission.MANAGE_CHANNELS | Permission.KICK_MEMBERS
+_ADMIN = (
+    _MODERATOR | Permission.MANAGE_MESSAGES | Permission.DELETE_CHANNELS
+    | Permission.MANAGE_SERVER | Permission.MANAGE_ROLES | Permission.ADD_MEMBERS
+)
+
+ROLE_PERMISSIONS = {
+    MemberRole.MEMBER: _MEMBER,
+    MemberRole.MODERATOR: _MODERATOR,
+    MemberRole.ADMIN: _ADMIN,
+    MemberRole.OWNER: _ADMIN | Permission.DELETE_SERVER,
+}
+
+# A member may assign and take away only roles ranked below their own
+ROLE_RANK = {MemberRole.OWNER: 3, MemberRole.ADMIN: 2, MemberRole.MODERATOR: 1, MemberRole.MEMBER: 0}
+
+
+class Scope(NamedTuple):
+    """Server a request acts on and the caller's permissions there."""
+
+    server_id: int
+    permissions: Permission
+    role: Optional[MemberRole]
+
+    def allows(self, permission: Permission) -> bool:
+        """Check that every bit of ``permission`` is granted."""
+        return self.permissions & permission == permission
+
+
+class PermissionCache:
+    """Bounded LRU of ``(user_id, server_id)`` → resolved role and permissions.
+
+    Non-members are cached too (as ``Permission.NONE``), so repeated denied
+    requests do not reach the database either.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, clock=time.monotonic):
+        """Initialize the cache.
+
+        Args:
+            maxsize: Entries kept at most, for each of members and channels (0 disables caching)
+            ttl: Seconds an entry is trusted before it is resolved again
+            clock: Time source (for tests)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        # {(user_id, server_id): (role or None, expires_at)}
+        self._members: "OrderedDict[Tuple[int, int], Tuple[Optional[MemberRole], float]]" = OrderedDict()
+        # {channel_id: (server_id, expires_at)}; expiring lets other workers notice deleted channels
+        self._channel_servers: "OrderedDict[int, Tuple[int, float]]" = OrderedDict()
+
+    def for_server(self, db: Session, user_id: int, server_id: int) -> Optional[Scope]:
+        """Resolve a user's permissions in a server.
+
+        Args:
+            db: Database session
+            user_id: User ID
+            server_id: Server ID
+
+        Returns:
+            The scope, or None if the server does not exist or is deleted
+        """
+        key = (user_id, server_id)
+        entry = self._get(self._members, key)
+        if entry is not None:
+            permission_cache_lookups_total.inc("hit")
+            role = entry[0]
+        else:
+            permission_cache_lookups_total.inc("miss")
+            # One query tells a missing server apart from a missing membership
+            row = db.query(Server.id, ServerMember.role).outerjoin(
+                ServerMember, and_(ServerMember.server_id == Server.id, ServerMember.user_id == user_id)
+            ).filter(Server.id == server_id, Server.deleted_at.is_(None)).first()
+            if row is None:
+                return None
+            role = row.role
+            self._put(self._members, key, role)
+        return Scope(server_id, ROLE_PERMISSIONS.get(role, Permission.NONE), role)
+
+    def for_channel(self, db: Session, user_id: int, channel_id: int) -> Optional[Scope]:
+        """Resolve a user's permissions in a channel's server.
+
+        Channels have no overrides of their own yet, so this is the server's
+        scope.
+
+        Returns:
+            The scope, or None if the channel or its server does not exist or is deleted
+        """
+        entry = self._get(self._channel_servers, channel_id)
+        if entry is not None:
+            server_id = entry[0]
+        else:
+            server_id = db.query(Channel.server_id).filter(
+                Channel.id == channel_id, Channel.deleted_at.is_(None)
+            ).scalar()
+            if server_id is None:
+                return None
+            self._put(self._channel_servers, channel_id, server_id)
+        return self.for_server(db, user_id, server_id)
+
+    def _get(self, entries: OrderedDict, key) -> Optional[tuple]:
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        if self._clock() >= entry[1]:
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return entry
+
+    def _put(self, entries: OrderedDict, key, value):
+        if not self.maxsize:
+            return
+        entries[key] = (value, self._clock() + self.ttl)
+        entries.move_to_end(key)
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def invalidate(self, server_id: int, user_id: Optional[int] = None):
+        """Forget one member's entry, or every member's of a server.
+
+        Call after changing roles or memberships, once the change is committed.
+        """
+        if user_id is not None:
+            self._members.pop((user_id, server_id), None)
+            return
+        for key in [key for key in self._members if key[1] == server_id]:
+            del self._members[key]
+
+    def forget_channel(self, channel_id: int):
+        """Forget a deleted channel's server."""
+        self._channel_servers.pop(channel_id, None)
+
+    def clear(self):
+        """Forget everything."""
+        self._members.clear()
+        self._channel_servers.clear()
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+
+def can_manage_role(actor: Optional[MemberRole], target: MemberRole) -> bool:
+    """Check that ``actor`` outranks ``target``, so it may assign or take away that role."""
+    return actor is not None and ROLE_RANK[actor] > ROLE_RANK[target]
+
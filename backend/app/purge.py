@@ -0,0 +1,222 @@
+"""Background purge of deleted servers and channels.
+
+Deleting a server or channel only sets its ``deleted_at``, which hides it at
+once. This job removes what was behind it afterwards: messages, archive
+segments and their files, attachment rows, retention policies, members and
+invites, then the rows themselves. Attachment blobs stay, as other
+attachments may share them. Children are deleted by set-based ``DELETE``s of at
+most ``PURGE_BATCH_SIZE`` rows, each committed on its own, so no request
+waits for it and no single transaction holds the write lock for long.
+
+The application's scheduler runs it every ``PURGE_INTERVAL_SECONDS``, on
+one worker of the cluster; run it once with ``python -m app.purge``
+(``--status`` only counts what is left).
+"""
+
+import argparse
+import logging
+import time
+from contextlib import nullcontext
+from typing import Dict, Optional
+
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.orm import Session
+
+from .archive import ArchiveStore
+from .config import settings
+from .metrics import purge_pending, purge_rows_total
+from .models import ArchiveSegment, Attachment, Channel, Invite, Message, RetentionPolicy, Server, ServerMember
+from .sharding import ShardRouter
+
+logger = logging.getLogger(__name__)
+
+
+class Purger:
+    """Deletes soft-deleted servers and channels in bounded batches."""
+
+    def __init__(
+        self,
+        store: ArchiveStore,
+        batch_size: int = 10_000,
+        shard_router: Optional[ShardRouter] = None,
+    ):
+        """Initialize the purger.
+
+        Args:
+            store: Segment file store (files of purged channels are removed)
+            batch_size: Rows deleted per statement and transaction at most
+            shard_router: Message shards (None keeps messages on the primary)
+        """
+        self.store = store
+        self.batch_size = batch_size
+        self.shard_router = shard_router
+
+    def pending(self, db: Session) -> Dict[str, int]:
+        """Count the deleted servers and channels still to purge.
+
+        Channels of a deleted server count even if they were not deleted
+        themselves.
+        """
+        return {
+            "servers": db.query(func.count(Server.id)).filter(Server.deleted_at.isnot(None)).scalar(),
+            "channels": db.query(func.count(Channel.id)).filter(self._doomed_channel()).scalar(),
+        }
+
+    def run_once(self, db: Session) -> Dict[str, int]:
+        """Purge everything deleted so far.
+
+        Channels go first; a deleted server is removed once none of its
+        channels are left.
+
+        Args:
+            db: Primary database session
+
+        Returns:
+            Counts of purged ``servers`` and ``channels`` and deleted
+            ``messages``, ``segments`` and ``members``
+        """
+        totals = {"servers": 0, "channels": 0, "messages": 0, "segments": 0, "members": 0}
+        channel_ids = list(db.scalars(select(Channel.id).where(self._doomed_channel()).order_by(Channel.id)))
+        for position, channel_id in enumerate(channel_ids, 1):
+            purged = self.purge_channel(db, channel_id)
+            totals["channels"] += 1
+            totals["messages"] += purged["messages"]
+            totals["segments"] += purged["segments"]
+            purge_pending.set(len(channel_ids) - position, "channels")
+            logger.info(
+                "Purged channel %s: %d messages, %d segments (%d of %d channels)",
+                channel_id, purged["messages"], purged["segments"], position, len(channel_ids)
+            )
+
+        deleted_servers = select(Server.id).where(Server.deleted_at.isnot(None)).order_by(Server.id)
+        server_ids = list(db.scalars(deleted_servers))
+        for position, server_id in enumerate(server_ids, 1):
+            members = self.purge_server(db, server_id)
+            if members is None:
+                continue
+            totals["servers"] += 1
+            totals["members"] += members
+            purge_pending.set(len(server_ids) - position, "servers")
+            logger.info(
+                "Purged server %s: %d members (%d of %d servers)", server_id, members, position, len(server_ids)
+            )
+
+        for kind, count in self.pending(db).items():
+            purge_pending.set(count, kind)
+        return totals
+
+    def purge_channel(self, db: Session, channel_id: int) -> Dict[str, int]:
+        """Delete a channel's messages, archive and attachments in batches, then the channel.
+
+        Returns:
+            Counts of deleted ``messages`` and ``segments``
+        """
+        with self._message_session(channel_id, db) as message_db:
+            messages = self._delete_batches(message_db, Message, Message.channel_id == channel_id)
+            segments = self._delete_segments(message_db, channel_id)
+        self._delete_batches(db, Attachment, Attachment.channel_id == channel_id)
+        self._delete_batches(db, RetentionPolicy, RetentionPolicy.channel_id == channel_id)
+        self._delete_batches(db, Channel, Channel.id == channel_id)
+        return {"messages": messages, "segments": segments}
+
+    def purge_server(self, db: Session, server_id: int) -> Optional[int]:
+        """Delete a server's members, invites and policies in batches, then the server.
+
+        Returns:
+            Number of members deleted, or None if the server still has
+            channels (they are purged first)
+        """
+        if db.query(Channel.id).filter(Channel.server_id == server_id).first() is not None:
+            return None
+        members = self._delete_batches(db, ServerMember, ServerMember.server_id == server_id)
+        self._delete_batches(db, Invite, Invite.server_id == server_id)
+        self._delete_batches(db, RetentionPolicy, RetentionPolicy.server_id == server_id)
+        self._delete_batches(db, Server, Server.id == server_id)
+        return members
+
+    def _delete_batches(self, db: Session, model, condition) -> int:
+        """Delete the rows matching ``condition``, ``batch_size`` per committed statement."""
+        table = model.__tablename__
+        deleted = 0
+        while True:
+            batch = select(model.id).where(condition).limit(self.batch_size)
+            count = db.execute(
+                delete(model).where(model.id.in_(batch)).execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            if count:
+                deleted += count
+                purge_rows_total.inc(table, amount=count)
+            if count < self.batch_size:
+                return deleted
+
+    def _delete_segments(self, db: Session, channel_id: int) -> int:
+        """Delete a channel's segment index rows in batches, and their files after each commit."""
+        deleted = 0
+        while True:
+            segments = db.query(ArchiveSegment.id, ArchiveSegment.path).filter(
+                ArchiveSegment.channel_id == channel_id
+            ).limit(self.batch_size).all()
+            if not segments:
+                return deleted
+            db.execute(
+                delete(ArchiveSegment)
+                .where(ArchiveSegment.id.in_([segment.id for segment in segments]))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            for segment in segments:
+                self.store.delete(segment.path)
+            deleted += len(segments)
+            purge_rows_total.inc(ArchiveSegment.__tablename__, amount=len(segments))
+
+    def _message_session(self, channel_id: int, db: Session):
+        """Session holding the channel's messages and segment index."""
+        if self.shard_router is None:
+            return nullcontext(db)
+        return self.shard_router.session(channel_id, db)
+
+    @staticmethod
+    def _doomed_channel():
+        deleted_servers = select(Server.id).where(Server.deleted_at.isnot(None))
+        return or_(Channel.deleted_at.isnot(None), Channel.server_id.in_(deleted_servers))
+
+    def run_with_session(self, session_factory) -> Dict[str, int]:
+        """Run one pass in a fresh session, logging instead of raising."""
+        db = session_factory()
+        try:
+            return self.run_once(db)
+        except Exception as e:
+            logger.exception("Purge pass failed: %s", e)
+            db.rollback()
+            return {"servers": 0, "channels": 0, "messages": 0, "segments": 0, "members": 0}
+        finally:
+            db.close()
+
+
+def main():
+    """Purge deleted servers and channels once, or report what is left."""
+    parser = argparse.ArgumentParser(description="Purge deleted servers and channels")
+    parser.add_argument("--status", action="store_true", help="only count what is left to purge")
+    args = parser.parse_args()
+    from .database import SessionLocal, init_db
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    purger = Purger(
+        ArchiveStore(settings.ARCHIVE_DIR),
+        batch_size=settings.PURGE_BATCH_SIZE,
+        shard_router=ShardRouter(settings.message_shard_urls_list),
+    )
+    if args.status:
+        with SessionLocal() as db:
+            pending = purger.pending(db)
+        print(f"servers={pending['servers']} channels={pending['channels']} pending")
+        return
+    started = time.perf_counter()
+    totals = purger.run_with_session(SessionLocal)
+    print(" ".join(f"{key}={value}" for key, value in totals.items()) + f" in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
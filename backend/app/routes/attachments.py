@@ -0,0 +1,133 @@
+"""Attachment routes for downloading files and thumbnails."""
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.orm import Session
+import logging
+
+from ..attachments import AttachmentStore, RangeFileResponse, blob_key, content_disposition, thumbnail_key
+from ..database import get_db
+from ..models import Attachment, User
+from ..permissions import Permission, PermissionCache
+from ..dependencies import get_attachment_store, get_current_user, get_permissions
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def _readable_attachment(
+    db: Session, permissions: PermissionCache, attachment_id: int, user: User
+) -> Attachment:
+    """Load an attachment the user may read.
+    
+    Posted attachments need ``READ_HISTORY`` in their channel; ones not
+    posted yet are visible to their uploader only.
+    """
+    attachment = db.query(Attachment).filter(Attachment.id == attachment_id).first()
+    if attachment is None or (attachment.message_id is None and attachment.uploader_id != user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Attachment not found"
+        )
+    
+    scope = permissions.for_channel(db, user.id, attachment.channel_id)
+    if not scope or not scope.allows(Permission.READ_HISTORY):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have access to this attachment"
+        )
+    return attachment
+
+
+@router.get("/{attachment_id}")
+async def download_attachment(
+    attachment_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    attachment_store: AttachmentStore = Depends(get_attachment_store),
+    current_user: User = Depends(get_current_user),
+    permissions: PermissionCache = Depends(get_permissions)
+):
+    """Download an attachment, whole or one byte range.
+    
+    A ``Range`` header gets ``206 Partial Content`` (resumed downloads,
+    media seeking). The ETag is the content hash and never changes, so
+    ``If-None-Match`` revalidation and ``If-Range`` work as usual.
+    
+    Args:
+        attachment_id: Attachment ID
+        request: Incoming request (conditional and range headers)
+        db: Database session
+        attachment_store: Attachment blob store
+        current_user: Current authenticated user
+        permissions: The application's permission cache
+        
+    Returns:
+        The file
+        
+    Raises:
+        HTTPException: If not found or user not authorized
+    """
+    attachment = _readable_attachment(db, permissions, attachment_id, current_user)
+    
+    return RangeFileResponse(
+        attachment_store,
+        blob_key(attachment.sha256),
+        attachment.size,
+        attachment.content_type,
+        etag=attachment.sha256,
+        headers={"content-disposition": content_disposition(attachment.filename, attachment.content_type)},
+        range_header=request.headers.get("range"),
+        if_none_match=request.headers.get("if-none-match"),
+        if_range=request.headers.get("if-range"),
+        chunk_size=request.app.state.settings.ATTACHMENT_READ_CHUNK_BYTES
+    )
+
+
+@router.get("/{attachment_id}/thumbnail")
+async def download_thumbnail(
+    attachment_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    attachment_store: AttachmentStore = Depends(get_attachment_store),
+    current_user: User = Depends(get_current_user),
+    permissions: PermissionCache = Depends(get_permissions)
+):
+    """Download the WebP thumbnail of an image attachment.
+    
+    Args:
+        attachment_id: Attachment ID
+        request: Incoming request (conditional headers)
+        db: Database session
+        attachment_store: Attachment blob store
+        current_user: Current authenticated user
+        permissions: The application's permission cache
+        
+    Returns:
+        The thumbnail
+        
+    Raises:
+        HTTPException: If not found, not authorized, or the thumbnail is
+            not ready (see ``thumbnail_status``)
+    """
+    attachment = _readable_attachment(db, permissions, attachment_id, current_user)
+    size = request.app.state.settings.THUMBNAIL_SIZE
+    key = thumbnail_key(attachment.sha256, size)
+    if attachment.thumbnail_status != "ready" or not attachment_store.exists(key):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No thumbnail for this attachment"
+        )
+    
+    with attachment_store.open(key) as thumbnail:
+        length = thumbnail.seek(0, 2)
+    return RangeFileResponse(
+        attachment_store,
+        key,
+        length,
+        "image/webp",
+        etag=f"{attachment.sha256}-{size}",
+        range_header=request.headers.get("range"),
+        if_none_match=request.headers.get("if-none-match"),
+        if_range=request.headers.get("if-range")
+    )
@@ -1,23 +1,40 @@
 """Authentication routes for user registration and login."""
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from datetime import timedelta
+from datetime import datetime, timedelta
+from typing import Optional
 import logging
+import secrets
 
 from ..database import get_db
-from ..models import User, UserStatus
-from ..schemas import UserCreate, UserResponse, Token
-from ..utils.security import verify_password, get_password_hash, create_access_token
-from ..config import settings
+from ..models import User, UserStatus, RefreshToken
+from ..schemas import UserCreate, UserResponse, Token, RefreshRequest, LogoutRequest
+from ..utils.revocation import RevocationList
+from ..utils.security import (
+    AccessTokens,
+    verify_password_async,
+    get_password_hash_async,
+    new_refresh_token,
+    hash_refresh_token,
+)
+from ..dependencies import get_current_user, get_revocations, get_tokens, ip_rate_limit, oauth2_scheme
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Login and registration are unauthenticated, so they are limited per client address
+auth_rate_limit = [Depends(ip_rate_limit("auth"))]
 
-@router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
+
+@router.post(
+    "/register",
+    response_model=UserResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=auth_rate_limit
+)
 async def register(
     user_data: UserCreate,
     db: Session = Depends(get_db)
@@ -51,7 +68,7 @@ async def register(
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     new_user = User(
         username=user_data.username,
         email=user_data.email,
@@ -63,24 +80,28 @@ async def register(
     db.commit()
     db.refresh(new_user)
     
-    logger.info(f"New user registered: {new_user.username} (ID: {new_user.id})")
+    logger.info("New user registered: %s (ID: %s)", new_user.username, new_user.id)
     
     return new_user
 
 
-@router.post("/login", response_model=Token)
+@router.post("/login", response_model=Token, dependencies=auth_rate_limit)
 async def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    access_tokens: AccessTokens = Depends(get_tokens)
 ):
     """Login and receive JWT access token.
     
     Args:
+        request: Incoming request (settings)
         form_data: OAuth2 form data (username and password)
         db: Database session
+        access_tokens: The application's token service
         
     Returns:
-        JWT access token
+        JWT access token and refresh token
         
     Raises:
         HTTPException: If credentials are invalid
@@ -89,7 +110,7 @@ async def login(
     user = db.query(User).filter(User.username == form_data.username).first()
     
     # Verify user exists and password is correct
-    if not user or not verify_password(form_data.password, user.password_hash):
+    if not user or not await verify_password_async(form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -98,34 +119,155 @@ async def login(
     
     # Update user status to online
     user.status = UserStatus.ONLINE
+    tokens = _issue_tokens(db, user, access_tokens, request.app.state.settings.REFRESH_TOKEN_EXPIRE_DAYS)
     db.commit()
     
-    # Create access token with user_id as STRING (важно для совместимости)
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": str(user.id), "username": user.username},
-        expires_delta=access_token_expires
+    logger.info("User logged in: %s (ID: %s)", user.username, user.id)
+    
+    return tokens
+
+
+@router.post("/refresh", response_model=Token, dependencies=auth_rate_limit)
+async def refresh(
+    request: Request,
+    refresh_data: RefreshRequest,
+    db: Session = Depends(get_db),
+    access_tokens: AccessTokens = Depends(get_tokens)
+):
+    """Exchange a refresh token for a new access and refresh token pair.
+    
+    The presented refresh token is rotated out. Presenting one that was
+    already rotated means it leaked, so its whole family is revoked.
+    
+    Args:
+        request: Incoming request (settings)
+        refresh_data: Refresh token from login or the previous refresh
+        db: Database session
+        access_tokens: The application's token service
+        
+    Returns:
+        New JWT access token and refresh token
+        
+    Raises:
+        HTTPException: If the refresh token is unknown, expired or revoked
+    """
+    invalid_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
     )
     
-    logger.info(f"User logged in: {user.username} (ID: {user.id})")
+    stored = db.query(RefreshToken).filter(
+        RefreshToken.token_hash == hash_refresh_token(refresh_data.refresh_token)
+    ).first()
+    if not stored:
+        raise invalid_exception
+    
+    now = datetime.utcnow()
+    if stored.revoked_at is None and stored.expires_at <= now:
+        raise invalid_exception
+    
+    # Claim the token in one conditional UPDATE: of two concurrent refreshes
+    # with it (on any workers) only one matches, and the other is reuse
+    claimed = db.query(RefreshToken).filter(
+        RefreshToken.id == stored.id,
+        RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: now}, synchronize_session=False)
+    if not claimed:
+        _revoke_family(db, stored.family_id, now)
+        db.commit()
+        logger.warning("Refresh token reuse for user %s; family %s revoked", stored.user_id, stored.family_id)
+        raise invalid_exception
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    tokens = _issue_tokens(
+        db,
+        stored.user,
+        access_tokens,
+        request.app.state.settings.REFRESH_TOKEN_EXPIRE_DAYS,
+        family_id=stored.family_id
+    )
+    db.commit()
+    
+    return tokens
 
 
 @router.post("/logout", status_code=status.HTTP_200_OK)
 async def logout(
-    current_user: User = Depends(get_db),
-    db: Session = Depends(get_db)
+    logout_data: Optional[LogoutRequest] = None,
+    token: str = Depends(oauth2_scheme),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    access_tokens: AccessTokens = Depends(get_tokens),
+    revocations: RevocationList = Depends(get_revocations)
 ):
-    """Logout user and set status to offline.
+    """Logout user, revoke the access token and set status to offline.
     
     Args:
+        logout_data: Optional refresh token to revoke along with its family
+        token: Access token being logged out
         current_user: Current authenticated user
         db: Database session
+        access_tokens: The application's token service
+        revocations: The application's revocation list
         
     Returns:
         Success message
     """
-    # Note: In a real implementation, you would need to get current_user from token
-    # For now, this is a placeholder
+    payload = access_tokens.decode_access_token(token)
+    if payload.get("jti") is not None:
+        # Committed on its own, so a repeated logout cannot roll back the rest
+        revocations.revoke(db, payload["jti"], payload["exp"])
+    
+    if logout_data and logout_data.refresh_token:
+        stored = db.query(RefreshToken).filter(
+            RefreshToken.token_hash == hash_refresh_token(logout_data.refresh_token),
+            RefreshToken.user_id == current_user.id
+        ).first()
+        if stored:
+            _revoke_family(db, stored.family_id, datetime.utcnow())
+    
+    current_user.status = UserStatus.OFFLINE
+    db.commit()
+    
+    logger.info("User logged out: %s (ID: %s)", current_user.username, current_user.id)
+    
     return {"message": "Logged out successfully"}
+
+
+def _issue_tokens(
+    db: Session,
+    user: User,
+    access_tokens: AccessTokens,
+    refresh_expire_days: int,
+    family_id: Optional[str] = None
+) -> dict:
+    """Create an access token and a stored refresh token (caller commits)."""
+    access_token_expires = access_tokens.lifetime
+    # Create access token with user_id as STRING (важно для совместимости)
+    access_token = access_tokens.create_access_token(
+        data={"sub": str(user.id), "username": user.username},
+        expires_delta=access_token_expires
+    )
+    
+    refresh_token, token_hash = new_refresh_token()
+    db.add(RefreshToken(
+        user_id=user.id,
+        token_hash=token_hash,
+        family_id=family_id or secrets.token_hex(16),
+        expires_at=datetime.utcnow() + timedelta(days=refresh_expire_days)
+    ))
+    
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "expires_in": int(access_token_expires.total_seconds()),
+    }
+
+
+def _revoke_family(db: Session, family_id: str, now: datetime):
+    """Revoke every live refresh token descended from the same login."""
+    db.query(RefreshToken).filter(
+        RefreshToken.family_id == family_id,
+        RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: now}, synchronize_session=False)
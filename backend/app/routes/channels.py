@@ -1,20 +1,36 @@
 """Channel routes for channel management."""
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from typing import Optional
 import logging
+import os
 
 from ..database import get_db
-from ..models import User, Channel, ServerMember
-from ..schemas import ChannelResponse, ChannelUpdate
-from ..dependencies import get_current_user
+from ..archive import ArchiveStore, set_policy
+from ..attachments import AttachmentStore, EmptyUpload, ThumbnailWorker, UploadTooLarge, receive_upload
+from ..export import MEDIA_TYPES, stream_export
+from ..metrics import attachment_uploads_total
+from ..models import Attachment, User, Channel, RetentionPolicy
+from ..schemas import (
+    AttachmentResponse, ChannelResponse, ChannelUpdate, RetentionPolicyResponse, RetentionPolicyUpdate
+)
+from ..dependencies import (
+    get_attachment_store, get_current_user, get_manager, get_permissions, get_shards, get_store, get_thumbnails,
+    require, user_rate_limit
+)
+from ..permissions import Permission, PermissionCache
+from ..sharding import ShardRouter
+from ..websocket.manager import ConnectionManager
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
-@router.get("/{channel_id}", response_model=ChannelResponse)
+@router.get("/{channel_id}", response_model=ChannelResponse, dependencies=[Depends(require(Permission.VIEW))])
 async def get_channel(
     channel_id: int,
     db: Session = Depends(get_db),
@@ -33,7 +49,7 @@ async def get_channel(
     Raises:
         HTTPException: If channel not found or user not authorized
     """
-    channel = db.query(Channel).filter(Channel.id == channel_id).first()
+    channel = db.query(Channel).filter(Channel.id == channel_id, Channel.deleted_at.is_(None)).first()
     
     if not channel:
         raise HTTPException(
@@ -41,27 +57,20 @@ async def get_channel(
             detail="Channel not found"
         )
     
-    # Check if user is a member of the server
-    membership = db.query(ServerMember).filter(
-        ServerMember.server_id == channel.server_id,
-        ServerMember.user_id == current_user.id
-    ).first()
-    
-    if not membership:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have access to this channel"
-        )
-    
     return channel
 
 
-@router.patch("/{channel_id}", response_model=ChannelResponse)
+@router.patch(
+    "/{channel_id}",
+    response_model=ChannelResponse,
+    dependencies=[Depends(require(Permission.MANAGE_CHANNELS))]
+)
 async def update_channel(
     channel_id: int,
     channel_update: ChannelUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    manager: ConnectionManager = Depends(get_manager)
 ):
     """Update channel details.
     
@@ -70,6 +79,7 @@ async def update_channel(
         channel_update: Channel update data
         db: Database session
         current_user: Current authenticated user
+        manager: WebSocket connection manager
         
     Returns:
         Updated channel
@@ -77,7 +87,7 @@ async def update_channel(
     Raises:
         HTTPException: If not authorized or channel not found
     """
-    channel = db.query(Channel).filter(Channel.id == channel_id).first()
+    channel = db.query(Channel).filter(Channel.id == channel_id, Channel.deleted_at.is_(None)).first()
     
     if not channel:
         raise HTTPException(
@@ -85,49 +95,58 @@ async def update_channel(
             detail="Channel not found"
         )
     
-    # Check if user has permission (not just a regular member)
-    membership = db.query(ServerMember).filter(
-        ServerMember.server_id == channel.server_id,
-        ServerMember.user_id == current_user.id
-    ).first()
-    
-    if not membership or membership.role == "member":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have permission to update this channel"
-        )
-    
-    # Update channel fields
+    # Update channel fields, keeping the delta for connected members
+    changes = {}
     if channel_update.name:
-        channel.name = channel_update.name
+        channel.name = changes["name"] = channel_update.name
     if channel_update.description is not None:
-        channel.description = channel_update.description
+        channel.description = changes["description"] = channel_update.description
     
     db.commit()
     db.refresh(channel)
     
-    logger.info(f"Channel updated: {channel.name} (ID: {channel.id})")
+    logger.info("Channel updated: %s (ID: %s)", channel.name, channel.id)
+    
+    if changes:
+        await manager.broadcast_to_server(
+            {
+                "type": "channel_update",
+                "data": {"id": channel.id, "server_id": channel.server_id, **changes}
+            },
+            channel.server_id
+        )
     
     return channel
 
 
-@router.delete("/{channel_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete(
+    "/{channel_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[Depends(require(Permission.DELETE_CHANNELS))]
+)
 async def delete_channel(
     channel_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    manager: ConnectionManager = Depends(get_manager),
+    permissions: PermissionCache = Depends(get_permissions)
 ):
     """Delete a channel.
     
+    The channel is only marked deleted here; its messages and archive are
+    removed later by the purge job, in batches.
+    
     Args:
         channel_id: Channel ID
         db: Database session
         current_user: Current authenticated user
+        manager: WebSocket connection manager
+        permissions: The application's permission cache
         
     Raises:
         HTTPException: If not authorized or channel not found
     """
-    channel = db.query(Channel).filter(Channel.id == channel_id).first()
+    channel = db.query(Channel).filter(Channel.id == channel_id, Channel.deleted_at.is_(None)).first()
     
     if not channel:
         raise HTTPException(
@@ -135,19 +154,243 @@ async def delete_channel(
             detail="Channel not found"
         )
     
-    # Check if user has permission
-    membership = db.query(ServerMember).filter(
-        ServerMember.server_id == channel.server_id,
-        ServerMember.user_id == current_user.id
-    ).first()
+    server_id = channel.server_id
+    channel.deleted_at = datetime.utcnow()
+    db.commit()
+    permissions.forget_channel(channel_id)
+    
+    logger.info("Channel deleted: %s (ID: %s)", channel.name, channel.id)
+    
+    await manager.broadcast_to_server(
+        {
+            "type": "channel_delete",
+            "data": {"id": channel_id, "server_id": server_id}
+        },
+        server_id
+    )
+
+
+@router.get(
+    "/{channel_id}/retention",
+    response_model=RetentionPolicyResponse,
+    dependencies=[Depends(require(Permission.VIEW))]
+)
+async def get_channel_retention(
+    channel_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get a channel's own message retention policy.
+    
+    Args:
+        channel_id: Channel ID
+        db: Database session
+        current_user: Current authenticated user
+        
+    Returns:
+        Retention policy (all fields null if the channel inherits everything)
+        
+    Raises:
+        HTTPException: If channel not found or user not a member
+    """
+    policy = db.query(RetentionPolicy).filter(RetentionPolicy.channel_id == channel_id).first()
+    return policy or RetentionPolicyResponse(channel_id=channel_id)
+
+
+@router.put(
+    "/{channel_id}/retention",
+    response_model=RetentionPolicyResponse,
+    dependencies=[Depends(require(Permission.MANAGE_SERVER))]
+)
+async def set_channel_retention(
+    channel_id: int,
+    policy_data: RetentionPolicyUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Set a channel's message retention policy (owner or admin).
+    
+    Args:
+        channel_id: Channel ID
+        policy_data: Archive and delete ages in days (null inherits the server policy)
+        db: Database session
+        current_user: Current authenticated user
+        
+    Returns:
+        Stored retention policy
+        
+    Raises:
+        HTTPException: If not authorized or channel not found
+    """
+    policy = set_policy(
+        db, policy_data.archive_after_days, policy_data.delete_after_days, channel_id=channel_id
+    )
+    db.commit()
+    db.refresh(policy)
+    
+    logger.info("Retention policy set for channel %s: %s", channel_id, policy_data.model_dump())
+    
+    return policy
+
+
+@router.get(
+    "/{channel_id}/export",
+    dependencies=[Depends(require(Permission.READ_HISTORY)), Depends(user_rate_limit("export"))]
+)
+async def export_channel(
+    channel_id: int,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Output format"),
+    gzip: bool = Query(False, description="Return a gzip file"),
+    since: Optional[datetime] = Query(None, description="Only messages created at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only messages created before this time"),
+    db: Session = Depends(get_db),
+    shards: ShardRouter = Depends(get_shards),
+    store: ArchiveStore = Depends(get_store),
+    current_user: User = Depends(get_current_user)
+):
+    """Stream a channel's full message history, oldest first.
+    
+    Rows are read through a server-side cursor and sent in chunks, so
+    memory use stays flat however long the history is. Archived messages
+    are included.
+    
+    Args:
+        channel_id: Channel ID
+        format: "ndjson" (one JSON object per line) or "csv"
+        gzip: Compress the file itself (independent of Accept-Encoding)
+        since: Lower bound on created_at (inclusive)
+        until: Upper bound on created_at (exclusive)
+        db: Database session
+        shards: Message shard router
+        store: Archive segment store
+        current_user: Current authenticated user
+        
+    Returns:
+        Streaming file download
+        
+    Raises:
+        HTTPException: If channel not found or user not authorized
+    """
+    filename = f"channel-{channel_id}.{format}" + (".gz" if gzip else "")
+    logger.info("User %s exporting channel %s as %s", current_user.username, channel_id, filename)
+    
+    def chunks():
+        # Messages are read from the channel's shard, usernames from the primary
+        with shards.session(channel_id, db) as message_db:
+            yield from stream_export(
+                message_db, store, channel_id, format, gzip, since, until, users_db=db
+            )
     
-    if not membership or membership.role not in ["owner", "admin"]:
+    # The session from get_db is closed only after the response has been sent,
+    # and Starlette iterates this sync generator in a worker thread
+    return StreamingResponse(
+        chunks(),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.post(
+    "/{channel_id}/attachments",
+    response_model=AttachmentResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(require(Permission.SEND_MESSAGES)), Depends(user_rate_limit("upload"))],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/octet-stream": {"schema": {"type": "string", "format": "binary"}}},
+        }
+    }
+)
+async def upload_attachment(
+    channel_id: int,
+    request: Request,
+    filename: str = Query(..., min_length=1, max_length=255, description="Name the file is shown with"),
+    db: Session = Depends(get_db),
+    attachment_store: AttachmentStore = Depends(get_attachment_store),
+    thumbnails: ThumbnailWorker = Depends(get_thumbnails),
+    current_user: User = Depends(get_current_user)
+):
+    """Upload a file to attach to a message in the channel.
+    
+    The raw request body is the file and its ``Content-Type`` is stored
+    with it. The body is streamed to storage in blocks, never held in memory
+    whole; identical content is stored once. Send a message with the
+    returned id in ``attachment_ids`` to post it.
+    
+    Args:
+        channel_id: Channel ID
+        request: Incoming request (its body is the file)
+        filename: File name
+        db: Database session
+        attachment_store: Attachment blob store
+        thumbnails: Thumbnail worker
+        current_user: Current authenticated user
+        
+    Returns:
+        Created attachment, not yet attached to a message
+        
+    Raises:
+        HTTPException: If the channel is not found, the user may not send
+            messages there, or the file is empty or too large
+    """
+    max_bytes = request.app.state.settings.ATTACHMENT_MAX_BYTES
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Attachments are limited to {max_bytes} bytes"
+    )
+    # Refuse a declared oversize body before reading any of it
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_bytes:
+        attachment_uploads_total.inc("too_large")
+        raise too_large
+    
+    name = os.path.basename(filename.replace("\\", "/")).strip()
+    if not name:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have permission to delete this channel"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid file name"
         )
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
     
-    db.delete(channel)
+    try:
+        sha256, size, created = await receive_upload(
+            attachment_store,
+            request.stream(),
+            max_bytes,
+            request.app.state.settings.ATTACHMENT_WRITE_BUFFER_BYTES
+        )
+    except UploadTooLarge:
+        attachment_uploads_total.inc("too_large")
+        raise too_large
+    except EmptyUpload:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Empty file"
+        )
+    attachment_uploads_total.inc("stored" if created else "deduplicated")
+    
+    attachment = Attachment(
+        channel_id=channel_id,
+        uploader_id=current_user.id,
+        filename=name,
+        content_type=content_type[:100] or "application/octet-stream",
+        size=size,
+        sha256=sha256
+    )
+    if thumbnails.accepts(attachment.content_type):
+        attachment.thumbnail_status = "pending"
+    db.add(attachment)
     db.commit()
+    db.refresh(attachment)
+    # Rendered in the background; a thumbnail of the same content is reused.
+    # A full queue marks the attachment failed at once.
+    if attachment.thumbnail_status == "pending" and not await thumbnails.submit(attachment.id, sha256):
+        db.refresh(attachment)
+    
+    logger.info(
+        "User %s uploaded %s (%d bytes, %s) to channel %s",
+        current_user.username, name, size, "new" if created else "duplicate", channel_id
+    )
     
-    logger.info(f"Channel deleted: {channel.name} (ID: {channel.id})")
+    return attachment
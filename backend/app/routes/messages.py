@@ -2,59 +2,66 @@
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import logging
 
+from ..archive import ArchiveStore, read_history
+from ..attachments import attach_files
 from ..database import get_db
-from ..models import User, Message, Channel, ServerMember
+from ..models import Attachment, User, Message
+from ..permissions import Permission, PermissionCache
 from ..schemas import MessageCreate, MessageResponse, MessageUpdate
-from ..dependencies import get_current_user
+from ..dependencies import get_current_user, get_permissions, get_shards, get_store, require, user_rate_limit
+from ..sharding import ShardRouter, attach_users
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
-@router.post("/channels/{channel_id}/messages", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/channels/{channel_id}/messages",
+    response_model=MessageResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(require(Permission.SEND_MESSAGES)), Depends(user_rate_limit("send_message"))]
+)
 async def send_message(
     channel_id: int,
     message_data: MessageCreate,
     db: Session = Depends(get_db),
+    shards: ShardRouter = Depends(get_shards),
     current_user: User = Depends(get_current_user)
 ):
     """Send a message to a channel.
     
+    Attachments in ``attachment_ids`` must have been uploaded to this
+    channel by the sender and not be posted with another message yet.
+    
     Args:
         channel_id: Channel ID
-        message_data: Message content
+        message_data: Message content and attachment IDs
         db: Database session
+        shards: Message shard router
         current_user: Current authenticated user
         
     Returns:
         Created message
         
     Raises:
-        HTTPException: If channel not found or user not authorized
+        HTTPException: If channel not found, user not authorized or an
+            attachment cannot be posted
     """
-    # Check if channel exists
-    channel = db.query(Channel).filter(Channel.id == channel_id).first()
-    
-    if not channel:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Channel not found"
-        )
-    
-    # Check if user is a member of the server
-    membership = db.query(ServerMember).filter(
-        ServerMember.server_id == channel.server_id,
-        ServerMember.user_id == current_user.id
-    ).first()
-    
-    if not membership:
+    attachment_ids = set(message_data.attachment_ids)
+    unposted = db.query(Attachment).filter(
+        Attachment.id.in_(list(attachment_ids)),
+        Attachment.channel_id == channel_id,
+        Attachment.uploader_id == current_user.id,
+        Attachment.message_id.is_(None)
+    )
+    if attachment_ids and unposted.count() != len(attachment_ids):
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have access to this channel"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unknown or already posted attachment"
         )
     
     # Create message
@@ -65,21 +72,46 @@ async def send_message(
         is_edited=False
     )
     
-    db.add(new_message)
-    db.commit()
-    db.refresh(new_message)
+    with shards.session(channel_id, db) as message_db:
+        message_db.add(new_message)
+        message_db.commit()
+        message_db.refresh(new_message)
+    attach_users(db, [new_message])
+    
+    if attachment_ids:
+        # Messages may be on a shard, so the attachments are claimed after the message is written;
+        # a concurrent send that claimed one first makes this message go away again
+        claimed = unposted.update({Attachment.message_id: new_message.id}, synchronize_session=False)
+        if claimed != len(attachment_ids):
+            db.rollback()
+            with shards.session(channel_id, db) as message_db:
+                message_db.query(Message).filter(Message.id == new_message.id).delete()
+                message_db.commit()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Attachment already posted"
+            )
+        db.commit()
+        attach_files(db, [new_message])
     
-    logger.info(f"Message sent by {current_user.username} in channel {channel_id}")
+    logger.debug("Message sent by %s in channel %s", current_user.username, channel_id)
     
     return new_message
 
 
-@router.get("/channels/{channel_id}/messages", response_model=List[MessageResponse])
+@router.get(
+    "/channels/{channel_id}/messages",
+    response_model=List[MessageResponse],
+    dependencies=[Depends(require(Permission.READ_HISTORY))]
+)
 async def get_messages(
     channel_id: int,
     skip: int = Query(0, ge=0, description="Number of messages to skip"),
     limit: int = Query(50, ge=1, le=100, description="Maximum number of messages to return"),
+    before: Optional[int] = Query(None, ge=1, description="Only messages older than this message ID"),
     db: Session = Depends(get_db),
+    shards: ShardRouter = Depends(get_shards),
+    store: ArchiveStore = Depends(get_store),
     current_user: User = Depends(get_current_user)
 ):
     """Get message history for a channel.
@@ -88,59 +120,42 @@ async def get_messages(
         channel_id: Channel ID
         skip: Number of messages to skip (for pagination)
         limit: Maximum number of messages to return (max 100)
+        before: Cursor; pass the oldest ID of the previous page to get the next
         db: Database session
+        shards: Message shard router
+        store: Archive segment store
         current_user: Current authenticated user
         
     Returns:
-        List of messages (newest first)
+        Page of messages counted from the newest (or from ``before``), in
+        chronological order
         
     Raises:
         HTTPException: If channel not found or user not authorized
     """
-    # Check if channel exists
-    channel = db.query(Channel).filter(Channel.id == channel_id).first()
-    
-    if not channel:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Channel not found"
-        )
-    
-    # Check if user is a member of the server
-    membership = db.query(ServerMember).filter(
-        ServerMember.server_id == channel.server_id,
-        ServerMember.user_id == current_user.id
-    ).first()
-    
-    if not membership:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have access to this channel"
-        )
-    
-    # Get messages (newest first)
-    messages = db.query(Message).filter(
-        Message.channel_id == channel_id
-    ).order_by(Message.created_at.desc()).offset(skip).limit(limit).all()
-    
-    # Reverse to show oldest first in the returned list
-    messages.reverse()
-    
-    return messages
+    # Newest first from the hot table, continuing into the archive past its end
+    with shards.session(channel_id, db) as message_db:
+        messages = read_history(message_db, store, channel_id, skip, limit, before, users_db=db)
+    # Attachments of the whole page in one query
+    return attach_files(db, messages)
 
 
 @router.get("/messages/{message_id}", response_model=MessageResponse)
 async def get_message(
     message_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    shards: ShardRouter = Depends(get_shards),
+    current_user: User = Depends(get_current_user),
+    permissions: PermissionCache = Depends(get_permissions)
 ):
     """Get a specific message by ID.
     
     Args:
         message_id: Message ID
         db: Database session
+        shards: Message shard router
         current_user: Current authenticated user
+        permissions: The application's permission cache
         
     Returns:
         Message details
@@ -148,28 +163,24 @@ async def get_message(
     Raises:
         HTTPException: If message not found or user not authorized
     """
-    message = db.query(Message).filter(Message.id == message_id).first()
-    
-    if not message:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Message not found"
-        )
-    
-    # Check if user has access to the channel
-    channel = db.query(Channel).filter(Channel.id == message.channel_id).first()
-    membership = db.query(ServerMember).filter(
-        ServerMember.server_id == channel.server_id,
-        ServerMember.user_id == current_user.id
-    ).first()
-    
-    if not membership:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have access to this message"
-        )
-    
-    return message
+    # Without a channel id the message could be on any shard
+    with shards.find_message(message_id, db) as (message, _):
+        if not message:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Message not found"
+            )
+        
+        # Check if user has access to the channel
+        scope = permissions.for_channel(db, current_user.id, message.channel_id)
+        
+        if not scope or not scope.allows(Permission.READ_HISTORY):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You don't have access to this message"
+            )
+        
+        return attach_files(db, [message])[0]
 
 
 @router.patch("/messages/{message_id}", response_model=MessageResponse)
@@ -177,6 +188,7 @@ async def update_message(
     message_id: int,
     message_update: MessageUpdate,
     db: Session = Depends(get_db),
+    shards: ShardRouter = Depends(get_shards),
     current_user: User = Depends(get_current_user)
 ):
     """Update (edit) a message.
@@ -185,6 +197,7 @@ async def update_message(
         message_id: Message ID
         message_update: Updated message content
         db: Database session
+        shards: Message shard router
         current_user: Current authenticated user
         
     Returns:
@@ -193,73 +206,76 @@ async def update_message(
     Raises:
         HTTPException: If not authorized or message not found
     """
-    message = db.query(Message).filter(Message.id == message_id).first()
-    
-    if not message:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Message not found"
-        )
-    
-    # Only message author can edit
-    if message.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You can only edit your own messages"
-        )
-    
-    # Update message
-    message.content = message_update.content
-    message.is_edited = True
-    
-    db.commit()
-    db.refresh(message)
-    
-    logger.info(f"Message {message_id} edited by user {current_user.username}")
-    
-    return message
+    # Without a channel id the message could be on any shard
+    with shards.find_message(message_id, db) as (message, message_db):
+        if not message:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Message not found"
+            )
+        
+        # Only message author can edit
+        if message.user_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You can only edit your own messages"
+            )
+        
+        # Update message
+        message.content = message_update.content
+        message.is_edited = True
+        
+        message_db.commit()
+        message_db.refresh(message)
+        attach_users(db, [message])
+        
+        logger.info("Message %s edited by user %s", message_id, current_user.username)
+        
+        return attach_files(db, [message])[0]
 
 
 @router.delete("/messages/{message_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_message(
     message_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    shards: ShardRouter = Depends(get_shards),
+    current_user: User = Depends(get_current_user),
+    permissions: PermissionCache = Depends(get_permissions)
 ):
     """Delete a message.
     
     Args:
         message_id: Message ID
         db: Database session
+        shards: Message shard router
         current_user: Current authenticated user
+        permissions: The application's permission cache
         
     Raises:
         HTTPException: If not authorized or message not found
     """
-    message = db.query(Message).filter(Message.id == message_id).first()
-    
-    if not message:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Message not found"
-        )
-    
-    # Only message author or server admin/owner can delete
-    if message.user_id != current_user.id:
-        # Check if user is admin/owner
-        channel = db.query(Channel).filter(Channel.id == message.channel_id).first()
-        membership = db.query(ServerMember).filter(
-            ServerMember.server_id == channel.server_id,
-            ServerMember.user_id == current_user.id
-        ).first()
-        
-        if not membership or membership.role not in ["owner", "admin"]:
+    # Without a channel id the message could be on any shard
+    with shards.find_message(message_id, db) as (message, message_db):
+        if not message:
             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You don't have permission to delete this message"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Message not found"
             )
-    
-    db.delete(message)
-    db.commit()
-    
-    logger.info(f"Message {message_id} deleted")
+        
+        # Only message author or members who manage messages can delete
+        if message.user_id != current_user.id:
+            scope = permissions.for_channel(db, current_user.id, message.channel_id)
+            
+            if not scope or not scope.allows(Permission.MANAGE_MESSAGES):
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="You don't have permission to delete this message"
+                )
+        
+        message_db.delete(message)
+        message_db.commit()
+        # The rows only; blobs may be shared with other attachments
+        db.query(Attachment).filter(Attachment.message_id == message_id).delete(synchronize_session=False)
+        db.commit()
+        
+        logger.info("Message %s deleted", message_id)
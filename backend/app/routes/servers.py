@@ -1,69 +1,134 @@
 """Server routes for server management."""
 
+from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
 from typing import List
 import logging
 
 from ..database import get_db
-from ..models import User, Server, ServerMember, MemberRole, Channel
-from ..schemas import ServerCreate, ServerResponse, ServerUpdate, ChannelCreate, ChannelResponse, ServerMemberResponse
-from ..dependencies import get_current_user
+from ..models import User, Server, ServerMember, MemberRole, Channel, RetentionPolicy, Invite
+from ..schemas import (
+    ServerCreate, ServerCreatedResponse, ServerResponse, ServerUpdate, ChannelCreate, ChannelResponse,
+    ServerMemberResponse,
+    ServerMemberUpdate, ServerMembersAdd, ServerMembersAddResponse, InviteCreate, InviteResponse,
+    RetentionPolicyResponse, RetentionPolicyUpdate,
+)
+from ..archive import set_policy
+from ..membership import add_members, announce_changes, create_invite, find_invite, remove_members, use_invite
+from ..dependencies import get_current_user, get_manager, get_permissions, require
+from ..permissions import Permission, PermissionCache, Scope, can_manage_role
+from ..websocket.manager import ConnectionManager
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
-@router.post("", response_model=ServerResponse, status_code=status.HTTP_201_CREATED)
+# Channels of a server created without a template
+DEFAULT_CHANNELS = [ChannelCreate(name="general", description="General discussion channel")]
+
+
+@router.post("", response_model=ServerCreatedResponse, status_code=status.HTTP_201_CREATED)
 async def create_server(
     server_data: ServerCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Create a new server.
+    """Create a new server with its owner membership and channels.
+    
+    Everything is written in one transaction, so a failure never leaves a
+    server without its owner. The response is built from the flushed
+    objects before the commit expires them, so no row is read back.
     
     Args:
-        server_data: Server creation data
+        server_data: Server creation data, optionally with a channel template
         db: Database session
         current_user: Current authenticated user
         
     Returns:
-        Created server object
+        Created server with its members and channels
     """
-    # Create server
     new_server = Server(
         name=server_data.name,
         description=server_data.description,
-        owner_id=current_user.id
+        owner_id=current_user.id,
+        members=[ServerMember(user=current_user, role=MemberRole.OWNER)],
+        channels=[
+            Channel(name=channel.name, description=channel.description)
+            for channel in server_data.channels or DEFAULT_CHANNELS
+        ]
     )
     
     db.add(new_server)
+    # Database defaults are set in Python, so the flush leaves nothing to fetch back
+    db.flush()
+    response = ServerCreatedResponse.model_validate(new_server)
     db.commit()
-    db.refresh(new_server)
     
-    # Add owner as member with OWNER role
-    owner_member = ServerMember(
-        server_id=new_server.id,
-        user_id=current_user.id,
-        role=MemberRole.OWNER
-    )
+    logger.info("Server created: %s (ID: %s) by user %s", response.name, response.id, response.owner_id)
     
-    db.add(owner_member)
+    return response
+
+
+@router.post("/join/{code}", response_model=ServerResponse)
+async def join_server(
+    code: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    manager: ConnectionManager = Depends(get_manager),
+    permissions: PermissionCache = Depends(get_permissions)
+):
+    """Join a server through an invite code.
     
-    # Create default "general" channel
-    general_channel = Channel(
-        server_id=new_server.id,
-        name="general",
-        description="General discussion channel"
-    )
+    Joining a server one is already in returns it without using the code.
     
-    db.add(general_channel)
-    db.commit()
+    Args:
+        code: Invite code
+        db: Database session
+        current_user: Current authenticated user
+        manager: WebSocket connection manager
+        permissions: The application's permission cache
+        
+    Returns:
+        The joined server
+        
+    Raises:
+        HTTPException: If the code is unknown, expired or used up
+    """
+    invite = find_invite(db, code)
+    
+    if not invite:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Invite not found or expired"
+        )
     
-    logger.info(f"Server created: {new_server.name} (ID: {new_server.id}) by user {current_user.username}")
+    server_id = invite.server_id
+    scope = permissions.for_server(db, current_user.id, server_id)
+    if scope is not None and scope.role is None:
+        # Count the use and add the member in one transaction, so neither happens alone
+        if not use_invite(db, invite.id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Invite not found or expired"
+            )
+        try:
+            added = add_members(db, server_id, [current_user.id])
+        except IntegrityError:
+            added = []
+        if added:
+            db.commit()
+        else:
+            # A concurrent join got there first; give the use back
+            db.rollback()
+        
+        if added:
+            logger.info("User %s joined server %s with invite %s", current_user.id, server_id, code)
+            await announce_changes(manager, permissions, server_id, added=added)
     
-    return new_server
+    return db.query(Server).filter(Server.id == server_id).first()
 
 
 @router.get("", response_model=List[ServerResponse])
@@ -87,12 +152,12 @@ async def get_user_servers(
     
     # Get servers from memberships
     server_ids = [m.server_id for m in memberships]
-    servers = db.query(Server).filter(Server.id.in_(server_ids)).all()
+    servers = db.query(Server).filter(Server.id.in_(server_ids), Server.deleted_at.is_(None)).all()
     
     return servers
 
 
-@router.get("/{server_id}", response_model=ServerResponse)
+@router.get("/{server_id}", response_model=ServerResponse, dependencies=[Depends(require(Permission.VIEW))])
 async def get_server(
     server_id: int,
     db: Session = Depends(get_db),
@@ -111,7 +176,7 @@ async def get_server(
     Raises:
         HTTPException: If server not found or user not a member
     """
-    server = db.query(Server).filter(Server.id == server_id).first()
+    server = db.query(Server).filter(Server.id == server_id, Server.deleted_at.is_(None)).first()
     
     if not server:
         raise HTTPException(
@@ -119,27 +184,20 @@ async def get_server(
             detail="Server not found"
         )
     
-    # Check if user is a member
-    membership = db.query(ServerMember).filter(
-        ServerMember.server_id == server_id,
-        ServerMember.user_id == current_user.id
-    ).first()
-    
-    if not membership:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You are not a member of this server"
-        )
-    
     return server
 
 
-@router.patch("/{server_id}", response_model=ServerResponse)
+@router.patch(
+    "/{server_id}",
+    response_model=ServerResponse,
+    dependencies=[Depends(require(Permission.MANAGE_SERVER))]
+)
 async def update_server(
     server_id: int,
     server_update: ServerUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    manager: ConnectionManager = Depends(get_manager)
 ):
     """Update server details.
     
@@ -148,6 +206,7 @@ async def update_server(
         server_update: Server update data
         db: Database session
         current_user: Current authenticated user
+        manager: WebSocket connection manager
         
     Returns:
         Updated server
@@ -155,7 +214,7 @@ async def update_server(
     Raises:
         HTTPException: If not authorized or server not found
     """
-    server = db.query(Server).filter(Server.id == server_id).first()
+    server = db.query(Server).filter(Server.id == server_id, Server.deleted_at.is_(None)).first()
     
     if not server:
         raise HTTPException(
@@ -163,49 +222,59 @@ async def update_server(
             detail="Server not found"
         )
     
-    # Check if user is owner or admin
-    membership = db.query(ServerMember).filter(
-        ServerMember.server_id == server_id,
-        ServerMember.user_id == current_user.id
-    ).first()
-    
-    if not membership or membership.role not in [MemberRole.OWNER, MemberRole.ADMIN]:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have permission to update this server"
-        )
-    
-    # Update server fields
+    # Update server fields, keeping the delta for connected members
+    changes = {}
     if server_update.name:
-        server.name = server_update.name
+        server.name = changes["name"] = server_update.name
     if server_update.description is not None:
-        server.description = server_update.description
+        server.description = changes["description"] = server_update.description
     
     db.commit()
     db.refresh(server)
     
-    logger.info(f"Server updated: {server.name} (ID: {server.id})")
+    logger.info("Server updated: %s (ID: %s)", server.name, server.id)
+    
+    if changes:
+        await manager.broadcast_to_server(
+            {
+                "type": "server_update",
+                "data": {"id": server.id, **changes}
+            },
+            server.id
+        )
     
     return server
 
 
-@router.delete("/{server_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete(
+    "/{server_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[Depends(require(Permission.DELETE_SERVER))]
+)
 async def delete_server(
     server_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    manager: ConnectionManager = Depends(get_manager),
+    permissions: PermissionCache = Depends(get_permissions)
 ):
     """Delete a server (owner only).
     
+    The server is only marked deleted here, which hides it and its channels
+    at once; the purge job removes its channels, messages and members
+    later, in batches.
+    
     Args:
         server_id: Server ID
         db: Database session
         current_user: Current authenticated user
+        manager: WebSocket connection manager
+        permissions: The application's permission cache
         
     Raises:
         HTTPException: If not owner or server not found
     """
-    server = db.query(Server).filter(Server.id == server_id).first()
+    server = db.query(Server).filter(Server.id == server_id, Server.deleted_at.is_(None)).first()
     
     if not server:
         raise HTTPException(
@@ -213,20 +282,27 @@ async def delete_server(
             detail="Server not found"
         )
     
-    # Only owner can delete server
-    if server.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Only the server owner can delete this server"
-        )
-    
-    db.delete(server)
+    server.deleted_at = datetime.utcnow()
     db.commit()
+    # Channel lookups resolve through the server's entries, so this hides its channels too
+    permissions.invalidate(server_id)
     
-    logger.info(f"Server deleted: {server.name} (ID: {server.id})")
+    logger.info("Server deleted: %s (ID: %s)", server.name, server.id)
+    
+    await manager.broadcast_to_server(
+        {
+            "type": "server_delete",
+            "data": {"id": server_id}
+        },
+        server_id
+    )
 
 
-@router.get("/{server_id}/members", response_model=List[ServerMemberResponse])
+@router.get(
+    "/{server_id}/members",
+    response_model=List[ServerMemberResponse],
+    dependencies=[Depends(require(Permission.VIEW))]
+)
 async def get_server_members(
     server_id: int,
     db: Session = Depends(get_db),
@@ -245,67 +321,334 @@ async def get_server_members(
     Raises:
         HTTPException: If user not a member
     """
-    # Check if user is a member
-    membership = db.query(ServerMember).filter(
+    # Get all members
+    members = db.query(ServerMember).options(joinedload(ServerMember.user)).filter(
+        ServerMember.server_id == server_id
+    ).all()
+    
+    return members
+
+
+@router.patch("/{server_id}/members/{user_id}", response_model=ServerMemberResponse)
+async def update_server_member(
+    server_id: int,
+    user_id: int,
+    member_update: ServerMemberUpdate,
+    db: Session = Depends(get_db),
+    scope: Scope = Depends(require(Permission.MANAGE_ROLES)),
+    manager: ConnectionManager = Depends(get_manager),
+    permissions: PermissionCache = Depends(get_permissions)
+):
+    """Change a member's role.
+    
+    Members may assign and take away only roles below their own, so
+    ownership cannot be granted or removed here.
+    
+    Args:
+        server_id: Server ID
+        user_id: ID of the member to change
+        member_update: New role
+        db: Database session
+        scope: Caller's permissions in the server
+        manager: WebSocket connection manager
+        permissions: The application's permission cache
+        
+    Returns:
+        Updated membership
+        
+    Raises:
+        HTTPException: If not authorized or the user is not a member
+    """
+    member = db.query(ServerMember).options(joinedload(ServerMember.user)).filter(
         ServerMember.server_id == server_id,
-        ServerMember.user_id == current_user.id
+        ServerMember.user_id == user_id
     ).first()
     
-    if not membership:
+    if not member:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Member not found"
+        )
+    
+    if not (can_manage_role(scope.role, member.role) and can_manage_role(scope.role, member_update.role)):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="You are not a member of this server"
+            detail="You can only manage roles below your own"
         )
     
-    # Get all members
-    members = db.query(ServerMember).filter(
-        ServerMember.server_id == server_id
-    ).all()
+    member.role = member_update.role
+    db.commit()
+    db.refresh(member)
+    # Drop the cached permissions only once the new role is visible to the next lookup
+    permissions.invalidate(server_id, user_id)
+    
+    logger.info("Member %s of server %s is now %s", user_id, server_id, member.role.value)
+    
+    await manager.broadcast_to_server(
+        {
+            "type": "member_update",
+            "data": {"server_id": server_id, "user_id": user_id, "role": member.role.value}
+        },
+        server_id
+    )
     
-    return members
+    return member
 
 
-@router.post("/{server_id}/channels", response_model=ChannelResponse, status_code=status.HTTP_201_CREATED)
-async def create_channel(
+@router.post("/{server_id}/members", response_model=ServerMembersAddResponse)
+async def add_server_members(
     server_id: int,
-    channel_data: ChannelCreate,
+    members_add: ServerMembersAdd,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    scope: Scope = Depends(require(Permission.ADD_MEMBERS)),
+    manager: ConnectionManager = Depends(get_manager),
+    permissions: PermissionCache = Depends(get_permissions)
 ):
-    """Create a new channel in a server.
+    """Add many users to a server at once, without invites.
+    
+    All rows are written by one statement. Unknown users and existing
+    members are skipped.
     
     Args:
         server_id: Server ID
-        channel_data: Channel creation data
+        members_add: User IDs and the role to give them
         db: Database session
-        current_user: Current authenticated user
+        scope: Caller's permissions in the server
+        manager: WebSocket connection manager
+        permissions: The application's permission cache
         
     Returns:
-        Created channel
+        IDs of the users added and how many were skipped
         
     Raises:
-        HTTPException: If not authorized or server not found
+        HTTPException: If not authorized or the role is not below the caller's
     """
-    # Check if server exists
-    server = db.query(Server).filter(Server.id == server_id).first()
-    if not server:
+    if not can_manage_role(scope.role, members_add.role):
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Server not found"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You can only manage roles below your own"
         )
     
-    # Check if user has permission (owner, admin, or moderator)
-    membership = db.query(ServerMember).filter(
+    added = add_members(db, server_id, members_add.user_ids, members_add.role)
+    db.commit()
+    
+    await announce_changes(manager, permissions, server_id, added=added, role=members_add.role)
+    
+    return ServerMembersAddResponse(added=added, skipped=len(set(members_add.user_ids)) - len(added))
+
+
+@router.delete("/{server_id}/members/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def remove_server_member(
+    server_id: int,
+    user_id: int,
+    db: Session = Depends(get_db),
+    scope: Scope = Depends(require(Permission.KICK_MEMBERS)),
+    manager: ConnectionManager = Depends(get_manager),
+    permissions: PermissionCache = Depends(get_permissions)
+):
+    """Remove (kick) a member ranked below the caller.
+    
+    The member's open connections to the server's channels are closed.
+    
+    Args:
+        server_id: Server ID
+        user_id: ID of the member to remove
+        db: Database session
+        scope: Caller's permissions in the server
+        manager: WebSocket connection manager
+        permissions: The application's permission cache
+        
+    Raises:
+        HTTPException: If not authorized or the user is not a member
+    """
+    role = db.query(ServerMember.role).filter(
         ServerMember.server_id == server_id,
-        ServerMember.user_id == current_user.id
-    ).first()
+        ServerMember.user_id == user_id
+    ).scalar()
+    
+    if role is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Member not found"
+        )
     
-    if not membership or membership.role == MemberRole.MEMBER:
+    if not can_manage_role(scope.role, role):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have permission to create channels"
+            detail="You can only manage roles below your own"
+        )
+    
+    removed = remove_members(db, server_id, [user_id])
+    db.commit()
+    
+    logger.info("Member %s removed from server %s", user_id, server_id)
+    
+    await announce_changes(manager, permissions, server_id, removed=removed)
+
+
+@router.post(
+    "/{server_id}/leave",
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[Depends(require(Permission.VIEW))]
+)
+async def leave_server(
+    server_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    manager: ConnectionManager = Depends(get_manager),
+    permissions: PermissionCache = Depends(get_permissions)
+):
+    """Leave a server.
+    
+    Args:
+        server_id: Server ID
+        db: Database session
+        current_user: Current authenticated user
+        manager: WebSocket connection manager
+        permissions: The application's permission cache
+        
+    Raises:
+        HTTPException: If not a member, or the owner (who must delete the server instead)
+    """
+    removed = remove_members(db, server_id, [current_user.id])
+    
+    if not removed:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The owner cannot leave the server"
+        )
+    
+    db.commit()
+    
+    logger.info("User %s left server %s", current_user.id, server_id)
+    
+    await announce_changes(manager, permissions, server_id, removed=removed)
+
+
+@router.post(
+    "/{server_id}/invites",
+    response_model=InviteResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(require(Permission.CREATE_INVITES))]
+)
+async def create_server_invite(
+    server_id: int,
+    invite_data: InviteCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Create an invite code for a server.
+    
+    Args:
+        server_id: Server ID
+        invite_data: Use limit and lifetime (null for unlimited)
+        db: Database session
+        current_user: Current authenticated user
+        
+    Returns:
+        Created invite
+        
+    Raises:
+        HTTPException: If not a member
+    """
+    invite = create_invite(
+        db, server_id, current_user.id, invite_data.max_uses, invite_data.max_age_seconds
+    )
+    db.commit()
+    db.refresh(invite)
+    
+    logger.info("Invite %s created for server %s by user %s", invite.code, server_id, current_user.id)
+    
+    return invite
+
+
+@router.get(
+    "/{server_id}/invites",
+    response_model=List[InviteResponse],
+    dependencies=[Depends(require(Permission.MANAGE_SERVER))]
+)
+async def get_server_invites(
+    server_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get a server's invites, including expired and used-up ones.
+    
+    Args:
+        server_id: Server ID
+        db: Database session
+        current_user: Current authenticated user
+        
+    Returns:
+        List of invites, newest first
+        
+    Raises:
+        HTTPException: If not authorized
+    """
+    return db.query(Invite).filter(Invite.server_id == server_id).order_by(Invite.id.desc()).all()
+
+
+@router.delete(
+    "/{server_id}/invites/{code}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[Depends(require(Permission.MANAGE_SERVER))]
+)
+async def delete_server_invite(
+    server_id: int,
+    code: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Revoke an invite code.
+    
+    Args:
+        server_id: Server ID
+        code: Invite code
+        db: Database session
+        current_user: Current authenticated user
+        
+    Raises:
+        HTTPException: If not authorized or the invite not found
+    """
+    deleted = db.query(Invite).filter(Invite.server_id == server_id, Invite.code == code).delete()
+    
+    if not deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Invite not found"
         )
     
+    db.commit()
+
+
+@router.post(
+    "/{server_id}/channels",
+    response_model=ChannelResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(require(Permission.MANAGE_CHANNELS))]
+)
+async def create_channel(
+    server_id: int,
+    channel_data: ChannelCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    manager: ConnectionManager = Depends(get_manager)
+):
+    """Create a new channel in a server.
+    
+    Args:
+        server_id: Server ID
+        channel_data: Channel creation data
+        db: Database session
+        current_user: Current authenticated user
+        manager: WebSocket connection manager
+        
+    Returns:
+        Created channel
+        
+    Raises:
+        HTTPException: If not authorized or server not found
+    """
     # Create channel
     new_channel = Channel(
         server_id=server_id,
@@ -317,12 +660,24 @@ async def create_channel(
     db.commit()
     db.refresh(new_channel)
     
-    logger.info(f"Channel created: {new_channel.name} (ID: {new_channel.id}) in server {server_id}")
+    logger.info("Channel created: %s (ID: %s) in server %s", new_channel.name, new_channel.id, server_id)
+    
+    await manager.broadcast_to_server(
+        {
+            "type": "channel_create",
+            "data": ChannelResponse.model_validate(new_channel).model_dump(mode="json")
+        },
+        server_id
+    )
     
     return new_channel
 
 
-@router.get("/{server_id}/channels", response_model=List[ChannelResponse])
+@router.get(
+    "/{server_id}/channels",
+    response_model=List[ChannelResponse],
+    dependencies=[Depends(require(Permission.VIEW))]
+)
 async def get_server_channels(
     server_id: int,
     db: Session = Depends(get_db),
@@ -341,19 +696,72 @@ async def get_server_channels(
     Raises:
         HTTPException: If user not a member
     """
-    # Check if user is a member
-    membership = db.query(ServerMember).filter(
-        ServerMember.server_id == server_id,
-        ServerMember.user_id == current_user.id
-    ).first()
-    
-    if not membership:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You are not a member of this server"
-        )
-    
     # Get all channels
-    channels = db.query(Channel).filter(Channel.server_id == server_id).all()
+    channels = db.query(Channel).filter(Channel.server_id == server_id, Channel.deleted_at.is_(None)).all()
     
     return channels
+
+
+@router.get(
+    "/{server_id}/retention",
+    response_model=RetentionPolicyResponse,
+    dependencies=[Depends(require(Permission.VIEW))]
+)
+async def get_server_retention(
+    server_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get a server's message retention policy.
+    
+    Args:
+        server_id: Server ID
+        db: Database session
+        current_user: Current authenticated user
+        
+    Returns:
+        Retention policy (all fields null if the server has none)
+        
+    Raises:
+        HTTPException: If user not a member
+    """
+    policy = db.query(RetentionPolicy).filter(RetentionPolicy.server_id == server_id).first()
+    return policy or RetentionPolicyResponse(server_id=server_id)
+
+
+@router.put(
+    "/{server_id}/retention",
+    response_model=RetentionPolicyResponse,
+    dependencies=[Depends(require(Permission.MANAGE_SERVER))]
+)
+async def set_server_retention(
+    server_id: int,
+    policy_data: RetentionPolicyUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Set a server's message retention policy (owner or admin).
+    
+    Channel policies override it field by field.
+    
+    Args:
+        server_id: Server ID
+        policy_data: Archive and delete ages in days (null inherits the default)
+        db: Database session
+        current_user: Current authenticated user
+        
+    Returns:
+        Stored retention policy
+        
+    Raises:
+        HTTPException: If not authorized
+    """
+    policy = set_policy(
+        db, policy_data.archive_after_days, policy_data.delete_after_days, server_id=server_id
+    )
+    db.commit()
+    db.refresh(policy)
+    
+    logger.info("Retention policy set for server %s: %s", server_id, policy_data.model_dump())
+    
+    return policy
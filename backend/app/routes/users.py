@@ -116,7 +116,7 @@ async def update_current_user(
     db.commit()
     db.refresh(current_user)
     
-    logger.info(f"User profile updated: {current_user.username} (ID: {current_user.id})")
+    logger.info("User profile updated: %s (ID: %s)", current_user.username, current_user.id)
     
     return current_user
 
@@ -141,6 +141,6 @@ async def update_user_status(
     db.commit()
     db.refresh(current_user)
     
-    logger.info(f"User status updated: {current_user.username} -> {new_status}")
+    logger.info("User status updated: %s -> %s", current_user.username, new_status)
     
     return current_user
@@ -0,0 +1,430 @@
+"""In-process scheduler for periodic background jobs.
+
+Jobs run on interval or cron triggers. Cluster jobs (the default) run once
+per cluster: workers elect a leader through a lease row in
+``scheduler_leases``, and only the leader claims due runs. Each run is
+claimed in ``scheduled_jobs`` with a lock that the worker keeps extending
+while the job runs; if the worker dies, the lock expires and the run is
+claimed again (at-least-once). A failed run is retried after
+``SCHEDULER_RETRY_SECONDS``. Local jobs (``cluster=False``) run in every
+process and keep no state in the database.
+
+Jobs of the same ``kind`` share a concurrency limit per process. Blocking
+jobs run in a worker thread; coroutine functions run on the event loop.
+"""
+
+import asyncio
+import inspect
+import logging
+import os
+import secrets
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .metrics import scheduler_is_leader, scheduler_job_duration_seconds, scheduler_job_runs_total
+from .models import ScheduledJob, SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+# Name of the leadership lease row
+LEADER_LEASE = "scheduler"
+
+
+class IntervalTrigger:
+    """Fires every ``seconds``, counted from the end of the previous run."""
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("Interval must be positive")
+        self.seconds = seconds
+
+    def next_after(self, moment: datetime) -> datetime:
+        return moment + timedelta(seconds=self.seconds)
+
+    def __str__(self) -> str:
+        return f"every {self.seconds:g}s"
+
+
+class CronTrigger:
+    """Fires on a five-field cron expression (minute hour day month weekday), in UTC.
+
+    Fields take ``*``, numbers, ranges (``1-5``), lists (``1,15``) and steps
+    (``*/10``, ``0-30/5``). Weekdays run 0-6 from Sunday (7 is Sunday too).
+    As in cron, a time matches if either the day or the weekday field does
+    when both are restricted.
+    """
+
+    BOUNDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self.BOUNDS)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for part in field.split(","):
+            span, _, step = part.partition("/")
+            if span == "*":
+                start, end = low, high
+            elif "-" in span:
+                start, end = (int(bound) for bound in span.split("-", 1))
+            else:
+                start = end = int(span)
+                if step:
+                    end = high
+            if not low <= start <= end <= high:
+                raise ValueError(f"Cron field {field!r} is outside {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First matching minute strictly after ``moment``."""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Skip whole months, days and hours that cannot match; five years covers every valid expression
+        limit = candidate + timedelta(days=5 * 366)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+    def __str__(self) -> str:
+        return f"cron {self.expression}"
+
+
+class Job:
+    """A registered job and its per-process state."""
+
+    __slots__ = ("name", "func", "trigger", "kind", "cluster", "next_run_at")
+
+    def __init__(self, name: str, func: Callable, trigger, kind: str, cluster: bool):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.kind = kind
+        self.cluster = cluster
+        # Local jobs only; cluster jobs keep theirs in the database
+        self.next_run_at: Optional[datetime] = None
+
+
+def with_session(session_factory, func: Callable[[Session], object]) -> Callable[[], object]:
+    """Wrap ``func(db)`` as a job that runs in a fresh session.
+
+    Exceptions propagate, so the scheduler records the run as failed and
+    retries it.
+    """
+    def job():
+        db = session_factory()
+        try:
+            return func(db)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    return job
+
+
+class Scheduler:
+    """Runs registered jobs on their triggers, once per cluster or once per process."""
+
+    def __init__(
+        self,
+        tick_seconds: float = 1.0,
+        poll_seconds: float = 5.0,
+        lease_seconds: float = 30.0,
+        retry_seconds: float = 60.0,
+        limits: Optional[Dict[str, int]] = None,
+        default_limit: int = 1,
+        node_id: Optional[str] = None,
+        clock: Callable[[], datetime] = datetime.utcnow,
+    ):
+        """Initialize the scheduler.
+
+        Args:
+            tick_seconds: How often local jobs are checked
+            poll_seconds: How often leadership is renewed and cluster jobs are claimed
+            lease_seconds: Lifetime of the leader lease and of run locks
+            retry_seconds: Delay before a failed cluster run is retried
+            limits: Jobs of each kind allowed to run at once in this process
+            default_limit: Limit for kinds not in ``limits``
+            node_id: This worker's name in the job table (default: host, pid and a random suffix)
+            clock: Current naive UTC time (for tests)
+        """
+        self.tick_seconds = tick_seconds
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.retry_seconds = retry_seconds
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+        self.node_id = node_id or f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+        self._clock = clock
+        self.jobs: Dict[str, Job] = {}
+        self.is_leader = False
+        self._session_factory = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._next_poll: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add_job(self, name: str, func: Callable, trigger, kind: str = "default", cluster: bool = True):
+        """Register a job.
+
+        Args:
+            name: Unique job name (the key of its row in ``scheduled_jobs``)
+            func: Callable without arguments; blocking functions run in a thread
+            trigger: ``IntervalTrigger`` or ``CronTrigger``
+            kind: Concurrency group
+            cluster: Run once per cluster (leader only, persisted) rather than in every process
+        """
+        if name in self.jobs:
+            raise ValueError(f"Job {name!r} is already registered")
+        self.jobs[name] = Job(name, func, trigger, kind, cluster)
+
+    def start(self, session_factory):
+        """Start ticking on the running loop (idempotent)."""
+        self._session_factory = session_factory
+        if self._task is None and self.jobs and self.tick_seconds > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop ticking, stop waiting for running jobs and give up leadership.
+
+        Jobs already running in threads finish on their own; cluster runs
+        cut short this way are retried elsewhere once their lock expires.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._running.values()):
+            task.cancel()
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+        if self.is_leader:
+            await asyncio.to_thread(self._resign)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.exception("Scheduler tick failed: %s", e)
+            await asyncio.sleep(self.tick_seconds)
+
+    async def tick(self, now: Optional[datetime] = None) -> List[asyncio.Task]:
+        """Start every job that is due.
+
+        Returns:
+            Tasks of the runs started by this tick
+        """
+        now = now or self._clock()
+        started = []
+        for job in self.jobs.values():
+            if job.cluster or job.name in self._running:
+                continue
+            if job.next_run_at is None:
+                job.next_run_at = job.trigger.next_after(now)
+            elif job.next_run_at <= now:
+                job.next_run_at = job.trigger.next_after(now)
+                started.append(self._spawn(job))
+
+        cluster_jobs = [job.name for job in self.jobs.values() if job.cluster]
+        if cluster_jobs and self._session_factory is not None and (self._next_poll is None or now >= self._next_poll):
+            self._next_poll = now + timedelta(seconds=self.poll_seconds)
+            claimed = await asyncio.to_thread(self._poll, now, cluster_jobs, sorted(self._running))
+            started.extend(self._spawn(self.jobs[name]) for name in claimed)
+        return started
+
+    async def wait(self):
+        """Wait for every running job (for tests and one-off runs)."""
+        while self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+
+    def _spawn(self, job: Job) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(self._execute(job))
+        self._running[job.name] = task
+        task.add_done_callback(lambda _: self._running.pop(job.name, None))
+        return task
+
+    async def _execute(self, job: Job):
+        semaphore = self._semaphores.get(job.kind)
+        if semaphore is None:
+            semaphore = self._semaphores[job.kind] = asyncio.Semaphore(self.limits.get(job.kind, self.default_limit))
+        error = None
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                if inspect.iscoroutinefunction(job.func):
+                    await job.func()
+                else:
+                    await asyncio.to_thread(job.func)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                logger.exception("Job %s failed: %s", job.name, e)
+            duration = time.perf_counter() - started
+        scheduler_job_runs_total.inc(job.name, "failed" if error else "ok")
+        scheduler_job_duration_seconds.observe(duration, job.name)
+        logger.info("Job %s finished in %.1fs (%s)", job.name, duration, "failed" if error else "ok")
+        if job.cluster:
+            await asyncio.to_thread(self._finish, job, error, self._clock())
+
+    def _poll(self, now: datetime, names: Sequence[str], running: Sequence[str]) -> List[str]:
+        """Renew leadership and run locks, then claim the due runs this worker may start."""
+        db = self._session_factory()
+        try:
+            self.is_leader = self._elect(db, now)
+            scheduler_is_leader.set(1 if self.is_leader else 0)
+            lease_end = now + timedelta(seconds=self.lease_seconds)
+            if running:
+                db.execute(
+                    update(ScheduledJob)
+                    .where(ScheduledJob.name.in_(running), ScheduledJob.locked_by == self.node_id)
+                    .values(locked_until=lease_end)
+                )
+                db.commit()
+            if not self.is_leader:
+                return []
+            self._register(db, now, names)
+            return [name for name in names if name not in running and self._claim(db, name, now, lease_end)]
+        finally:
+            db.close()
+
+    def _elect(self, db: Session, now: datetime) -> bool:
+        """Take or renew the leader lease if it is free, expired or already ours."""
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        renewed = db.execute(
+            update(SchedulerLease)
+            .where(
+                SchedulerLease.name == LEADER_LEASE,
+                or_(SchedulerLease.holder == self.node_id, SchedulerLease.expires_at < now)
+            )
+            .values(holder=self.node_id, expires_at=expires_at)
+        ).rowcount
+        db.commit()
+        if renewed:
+            if not self.is_leader:
+                logger.info("Scheduler %s is now the leader", self.node_id)
+            return True
+        if db.get(SchedulerLease, LEADER_LEASE) is not None:
+            return False
+        try:
+            db.add(SchedulerLease(name=LEADER_LEASE, holder=self.node_id, expires_at=expires_at))
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return False
+        logger.info("Scheduler %s is now the leader", self.node_id)
+        return True
+
+    def _register(self, db: Session, now: datetime, names: Sequence[str]):
+        """Add rows for cluster jobs seen for the first time."""
+        known = {name for (name,) in db.query(ScheduledJob.name).filter(ScheduledJob.name.in_(names))}
+        for name in names:
+            if name not in known:
+                job = self.jobs[name]
+                db.add(ScheduledJob(name=name, trigger=str(job.trigger), next_run_at=job.trigger.next_after(now)))
+        try:
+            db.commit()
+        except IntegrityError:
+            # A previous leader registered them at the same moment
+            db.rollback()
+
+    def _claim(self, db: Session, name: str, now: datetime, lease_end: datetime) -> bool:
+        """Lock a due run of ``name``, unless another worker holds a live lock on it."""
+        unlocked = or_(ScheduledJob.locked_until.is_(None), ScheduledJob.locked_until < now)
+        previous = db.query(ScheduledJob.locked_by, ScheduledJob.attempts).filter(
+            ScheduledJob.name == name, ScheduledJob.next_run_at <= now, unlocked
+        ).first()
+        if previous is None:
+            return False
+        claimed = db.execute(
+            update(ScheduledJob)
+            .where(ScheduledJob.name == name, ScheduledJob.next_run_at <= now, unlocked)
+            .values(
+                locked_by=self.node_id,
+                locked_until=lease_end,
+                attempts=ScheduledJob.attempts + 1,
+                last_started_at=now,
+            )
+        ).rowcount
+        db.commit()
+        if claimed and previous.locked_by is not None:
+            logger.warning("Job %s was left unfinished by %s; running it again", name, previous.locked_by)
+        return bool(claimed)
+
+    def _finish(self, job: Job, error: Optional[str], now: datetime):
+        """Release the run lock and schedule the next run (or a retry)."""
+        next_run_at = job.trigger.next_after(now)
+        if error:
+            next_run_at = min(next_run_at, now + timedelta(seconds=self.retry_seconds))
+        values = {
+            "locked_by": None,
+            "locked_until": None,
+            "last_finished_at": now,
+            "last_status": "failed" if error else "ok",
+            "last_error": error,
+            "next_run_at": next_run_at,
+        }
+        if not error:
+            values["attempts"] = 0
+        db = self._session_factory()
+        try:
+            db.execute(
+                update(ScheduledJob)
+                .where(ScheduledJob.name == job.name, ScheduledJob.locked_by == self.node_id)
+                .values(**values)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _resign(self):
+        """Expire our leader lease so another worker takes over at its next poll."""
+        db = self._session_factory()
+        try:
+            db.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.name == LEADER_LEASE, SchedulerLease.holder == self.node_id)
+                .values(expires_at=datetime(1970, 1, 1))
+            )
+            db.commit()
+        finally:
+            db.close()
+        self.is_leader = False
+        scheduler_is_leader.set(0)
@@ -46,6 +46,18 @@ class Token(BaseModel):
     """JWT token response."""
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None  # access token lifetime in seconds
+
+
+class RefreshRequest(BaseModel):
+    """Refresh token exchange request."""
+    refresh_token: str = Field(..., min_length=1, max_length=128)
+
+
+class LogoutRequest(BaseModel):
+    """Logout request; the refresh token, if given, is revoked too."""
+    refresh_token: Optional[str] = Field(None, max_length=128)
 
 
 class TokenData(BaseModel):
@@ -63,8 +75,12 @@ class ServerBase(BaseModel):
 
 
 class ServerCreate(ServerBase):
-    """Schema for server creation."""
-    pass
+    """Schema for server creation.
+    
+    ``channels`` is the template of channels to create with the server;
+    without it the server gets a single ``general`` channel.
+    """
+    channels: Optional[List["ChannelCreate"]] = Field(None, min_length=1, max_length=50)
 
 
 class ServerUpdate(BaseModel):
@@ -96,6 +112,44 @@ class ServerMemberResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ServerMemberUpdate(BaseModel):
+    """Schema for changing a member's role."""
+    role: MemberRole
+
+
+class ServerMembersAdd(BaseModel):
+    """Schema for adding many users to a server at once."""
+    user_ids: List[int] = Field(..., min_length=1, max_length=10_000)
+    role: MemberRole = MemberRole.MEMBER
+
+
+class ServerMembersAddResponse(BaseModel):
+    """Schema for the result of a bulk add."""
+    added: List[int]
+    skipped: int
+
+
+# ============ Invite Schemas ============
+
+class InviteCreate(BaseModel):
+    """Schema for invite creation."""
+    max_uses: Optional[int] = Field(None, ge=1, le=100_000)
+    max_age_seconds: Optional[int] = Field(86_400, ge=60, le=30 * 86_400)
+
+
+class InviteResponse(BaseModel):
+    """Schema for invite response."""
+    code: str
+    server_id: int
+    created_by: Optional[int]
+    max_uses: Optional[int]
+    uses: int
+    expires_at: Optional[datetime]
+    created_at: datetime
+    
+    model_config = ConfigDict(from_attributes=True)
+
+
 # ============ Channel Schemas ============
 
 class ChannelBase(BaseModel):
@@ -124,6 +178,16 @@ class ChannelResponse(ChannelBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ServerCreatedResponse(ServerResponse):
+    """Schema for a newly created server with its owner membership and channels."""
+    members: List[ServerMemberResponse]
+    channels: List[ChannelResponse]
+
+
+# ServerCreate refers to ChannelCreate, defined after it
+ServerCreate.model_rebuild()
+
+
 # ============ Message Schemas ============
 
 class MessageBase(BaseModel):
@@ -133,7 +197,7 @@ class MessageBase(BaseModel):
 
 class MessageCreate(MessageBase):
     """Schema for message creation."""
-    pass
+    attachment_ids: List[int] = Field(default_factory=list, max_length=10)
 
 
 class MessageUpdate(BaseModel):
@@ -150,6 +214,45 @@ class MessageResponse(MessageBase):
     updated_at: datetime
     is_edited: bool
     user: UserResponse
+    attachments: List["AttachmentResponse"] = []
+    
+    model_config = ConfigDict(from_attributes=True)
+
+
+# ============ Attachment Schemas ============
+
+class AttachmentResponse(BaseModel):
+    """Schema for attachment response (the file itself is at ``/attachments/{id}``)."""
+    id: int
+    channel_id: int
+    message_id: Optional[int] = None
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    thumbnail_status: str
+    created_at: datetime
+    
+    model_config = ConfigDict(from_attributes=True)
+
+
+MessageResponse.model_rebuild()
+
+
+# ============ Retention Schemas ============
+
+class RetentionPolicyUpdate(BaseModel):
+    """Schema for setting a retention policy; null inherits the parent setting."""
+    archive_after_days: Optional[int] = Field(None, ge=1, le=36500)
+    delete_after_days: Optional[int] = Field(None, ge=1, le=36500)
+
+
+class RetentionPolicyResponse(RetentionPolicyUpdate):
+    """Schema for retention policy response."""
+    server_id: Optional[int] = None
+    channel_id: Optional[int] = None
     
     model_config = ConfigDict(from_attributes=True)
 
@@ -0,0 +1,271 @@
+"""Horizontal sharding of messages by channel.
+
+With ``MESSAGE_SHARD_URLS`` set, every channel's messages (and its archive
+segment index) live in one of N shard databases, chosen by a jump
+consistent hash of the channel id. Users, servers, members and channels
+stay on the primary database from ``DATABASE_URL``. Without shard URLs the
+router is disabled and everything uses the primary session, as before.
+
+Adding a shard to the end of the list moves only about 1/N of the channels;
+``python -m app.sharding rebalance --from OLD_URLS`` copies those channels'
+messages to their new shard and deletes them from the old one.
+"""
+
+import argparse
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Column, Index, MetaData, Table, delete, func, insert, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .config import settings
+from .database import create_db_engine, ensure_schema
+from .models import ArchiveSegment, Message, User
+
+logger = logging.getLogger(__name__)
+
+# Tables that live on the shards, keyed by channel_id
+SHARDED_TABLES = (Message.__table__, ArchiveSegment.__table__)
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping and Veach) of ``key`` into ``buckets``.
+
+    Growing ``buckets`` by one moves only ``1 / buckets`` of the keys, all
+    of them to the new bucket.
+    """
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_metadata() -> MetaData:
+    """Copies of the sharded tables without foreign keys (their targets stay on the primary)."""
+    metadata = MetaData()
+    for table in SHARDED_TABLES:
+        copy = Table(
+            table.name,
+            metadata,
+            *[
+                Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+                for column in table.columns
+            ],
+        )
+        for index in table.indexes:
+            Index(index.name, *[copy.c[column.name] for column in index.columns], unique=index.unique)
+    return metadata
+
+
+def create_shard_engine(url: str) -> Engine:
+    """Create an engine for one shard."""
+    return create_db_engine(url)
+
+
+def attach_users(users_db: Session, messages: List[Message]) -> List[Message]:
+    """Load the authors of shard messages from the primary database.
+
+    Shards have no users table, so ``Message.user`` is filled in here rather
+    than lazily. Messages whose author is gone are dropped, as the primary's
+    cascade would have done.
+    """
+    user_ids = {message.user_id for message in messages}
+    users = {user.id: user for user in users_db.query(User).filter(User.id.in_(user_ids))} if user_ids else {}
+    attached = []
+    for message in messages:
+        if message.user_id in users:
+            set_committed_value(message, "user", users[message.user_id])
+            attached.append(message)
+    return attached
+
+
+class ShardRouter:
+    """Maps channels to message shard databases."""
+
+    def __init__(self, urls: Sequence[str], engine_factory=create_shard_engine):
+        """Initialize the router.
+
+        Args:
+            urls: Shard database URLs; empty disables sharding
+            engine_factory: Builds an engine from a URL
+        """
+        self.urls = list(urls)
+        self.engines: List[Engine] = [engine_factory(url) for url in self.urls]
+        self._session_factories = [
+            sessionmaker(autocommit=False, autoflush=False, bind=engine) for engine in self.engines
+        ]
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    def __len__(self) -> int:
+        return len(self.engines)
+
+    def shard_for(self, channel_id: int) -> int:
+        """Index of the shard holding ``channel_id``'s messages."""
+        return jump_hash(channel_id, len(self.engines))
+
+    @contextmanager
+    def session(self, channel_id: int, primary: Session) -> Iterator[Session]:
+        """Session on the channel's shard, or ``primary`` when sharding is off.
+
+        Args:
+            channel_id: Channel ID
+            primary: Session on the primary database
+
+        Yields:
+            Session to run message queries in (closed on exit if it was opened here)
+        """
+        if not self.enabled:
+            yield primary
+            return
+        db = self._session_factories[self.shard_for(channel_id)]()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def find_message(self, message_id: int, primary: Session) -> Iterator[Tuple[Optional[Message], Session]]:
+        """Look a message up by id alone, asking each shard in turn.
+
+        Yields:
+            ``(message or None, session holding it)``; the session stays open
+            for updates until the block exits, and the message's author is
+            already loaded from ``primary``
+        """
+        if not self.enabled:
+            yield primary.query(Message).filter(Message.id == message_id).first(), primary
+            return
+        for factory in self._session_factories:
+            db = factory()
+            try:
+                message = db.query(Message).filter(Message.id == message_id).first()
+                if message is not None and attach_users(primary, [message]):
+                    yield message, db
+                    return
+            finally:
+                db.close()
+        yield None, primary
+
+    def create_all(self):
+        """Create the sharded tables on every shard."""
+        metadata = shard_metadata()
+        for engine in self.engines:
+            ensure_schema(engine, metadata, "shard")
+
+    def dispose(self):
+        """Close every shard's connection pool."""
+        for engine in self.engines:
+            engine.dispose()
+
+
+def rebalance(
+    source: ShardRouter,
+    target: ShardRouter,
+    channel_ids: Iterable[int],
+    batch_size: int = 5000,
+) -> Dict[str, int]:
+    """Move channels whose shard differs between two layouts.
+
+    Messages are copied in id order, resuming after the newest id already
+    on the target, so an interrupted run can simply be repeated. The source
+    rows are deleted only once a channel is fully copied. Run it while no
+    messages are being written (maintenance mode), otherwise writes that
+    land on the old shard after its channel was copied are lost.
+
+    Args:
+        source: Router for the layout the data is in now
+        target: Router for the new layout
+        channel_ids: Every channel ID (from the primary)
+        batch_size: Rows per copy batch
+
+    Returns:
+        Counts of ``channels`` moved and ``messages`` and ``segments`` copied
+    """
+    moved = {"channels": 0, "messages": 0, "segments": 0}
+    for channel_id in channel_ids:
+        from_index, to_index = source.shard_for(channel_id), target.shard_for(channel_id)
+        if source.urls[from_index] == target.urls[to_index]:
+            continue
+        with source.engines[from_index].connect() as src, target.engines[to_index].connect() as dst:
+            moved["messages"] += _copy_messages(src, dst, channel_id, batch_size)
+            moved["segments"] += _copy_segments(src, dst, channel_id)
+            for table in SHARDED_TABLES:
+                src.execute(delete(table).where(table.c.channel_id == channel_id))
+            src.commit()
+        moved["channels"] += 1
+        logger.info("Moved channel %s from shard %d to shard %d", channel_id, from_index, to_index)
+    return moved
+
+
+def _copy_messages(src: Connection, dst: Connection, channel_id: int, batch_size: int) -> int:
+    """Copy one channel's messages that the destination does not have yet (ids are global)."""
+    table = Message.__table__
+    copied = 0
+    last_id = dst.execute(select(func.max(table.c.id)).where(table.c.channel_id == channel_id)).scalar()
+    while True:
+        query = select(table).where(table.c.channel_id == channel_id)
+        if last_id is not None:
+            query = query.where(table.c.id > last_id)
+        rows = [dict(row._mapping) for row in src.execute(query.order_by(table.c.id).limit(batch_size))]
+        if not rows:
+            return copied
+        dst.execute(insert(table), rows)
+        dst.commit()
+        copied += len(rows)
+        last_id = rows[-1]["id"]
+
+
+def _copy_segments(src: Connection, dst: Connection, channel_id: int) -> int:
+    """Copy one channel's segment index rows, matched by path (their ids are per shard)."""
+    table = ArchiveSegment.__table__
+    present = set(dst.scalars(select(table.c.path).where(table.c.channel_id == channel_id)))
+    rows = [
+        {key: value for key, value in row._mapping.items() if key != "id"}
+        for row in src.execute(select(table).where(table.c.channel_id == channel_id))
+        if row.path not in present
+    ]
+    if rows:
+        dst.execute(insert(table), rows)
+        dst.commit()
+    return len(rows)
+
+
+def main():
+    """Rebalance messages after MESSAGE_SHARD_URLS changed."""
+    parser = argparse.ArgumentParser(description="Move channel messages to the shards of the current layout")
+    parser.add_argument("command", choices=["rebalance"])
+    parser.add_argument(
+        "--from", dest="source", default=None,
+        help="comma-separated shard URLs the data is in now (default: the primary DATABASE_URL)"
+    )
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    from .database import SessionLocal, init_db
+    from .models import Channel
+
+    logging.basicConfig(level=logging.INFO)
+    shards = ShardRouter(settings.message_shard_urls_list)
+    if not shards.enabled:
+        parser.exit(1, "MESSAGE_SHARD_URLS is not set; nothing to rebalance into\n")
+    init_db()
+    shards.create_all()
+    source = ShardRouter([url.strip() for url in (args.source or settings.DATABASE_URL).split(",") if url.strip()])
+    with SessionLocal() as db:
+        channel_ids = [channel_id for (channel_id,) in db.query(Channel.id).order_by(Channel.id)]
+    started = time.perf_counter()
+    moved = rebalance(source, shards, channel_ids, args.batch_size)
+    print(f"moved {moved['channels']} channels, {moved['messages']} messages in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
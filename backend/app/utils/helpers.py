@@ -1,7 +1,7 @@
 """Helper utility functions."""
 
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timezone
 
 
 def format_datetime(dt: Optional[datetime], format_str: str = "%Y-%m-%d %H:%M:%S") -> Optional[str]:
@@ -19,6 +19,20 @@ def format_datetime(dt: Optional[datetime], format_str: str = "%Y-%m-%d %H:%M:%S
     return dt.strftime(format_str)
 
 
+def to_utc_naive(dt: Optional[datetime]) -> Optional[datetime]:
+    """Convert an aware datetime to the naive UTC form stored in the database.
+    
+    Args:
+        dt: Datetime object (naive values are assumed to be UTC already)
+        
+    Returns:
+        Naive UTC datetime or None
+    """
+    if dt is not None and dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
 def truncate_string(text: str, max_length: int = 100, suffix: str = "...") -> str:
     """Truncate string to maximum length.
     
@@ -0,0 +1,206 @@
+"""Token-bucket rate limiting for REST routes and WebSocket frames."""
+
+import logging
+import time
+from typing import Dict, Optional
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - optional dependency
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimit:
+    """A named budget: ``rate`` tokens per second refilling up to ``burst``."""
+
+    __slots__ = ("rate", "burst")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+
+    def __repr__(self):
+        return f"<RateLimit(rate={self.rate}/s, burst={self.burst})>"
+
+
+class _Bucket:
+    """Token bucket state for a single key."""
+
+    __slots__ = ("tokens", "updated", "limit")
+
+    def __init__(self, tokens: float, updated: float, limit: RateLimit):
+        self.tokens = tokens
+        self.updated = updated
+        self.limit = limit
+
+
+class InMemoryBackend:
+    """Process-local token buckets.
+
+    Buckets live in a plain dict keyed by ``(budget, key)``. When the dict
+    grows past ``max_keys`` every bucket that has refilled completely is
+    dropped, since a full bucket carries no state worth keeping. If most
+    buckets are still busy the next sweep is postponed until the dict doubles,
+    keeping the amortised cost per request constant.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._sweep_at = max_keys
+        self._buckets: Dict[tuple, _Bucket] = {}
+
+    async def hit(self, budget: str, key, limit: RateLimit, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens from the bucket.
+
+        Returns:
+            0.0 if allowed, otherwise seconds until enough tokens are available
+        """
+        now = time.monotonic()
+        bucket_key = (budget, key)
+        bucket = self._buckets.get(bucket_key)
+
+        if bucket is None:
+            if len(self._buckets) >= self._sweep_at:
+                self._evict(now)
+            bucket = _Bucket(limit.burst, now, limit)
+            self._buckets[bucket_key] = bucket
+        else:
+            tokens = bucket.tokens + (now - bucket.updated) * limit.rate
+            bucket.tokens = tokens if tokens < limit.burst else limit.burst
+            bucket.updated = now
+
+        if bucket.tokens >= cost:
+            bucket.tokens -= cost
+            return 0.0
+        return (cost - bucket.tokens) / limit.rate
+
+    def _evict(self, now: float):
+        """Drop buckets that have fully refilled."""
+        stale = [
+            bucket_key for bucket_key, bucket in self._buckets.items()
+            if bucket.tokens + (now - bucket.updated) * bucket.limit.rate >= bucket.limit.burst
+        ]
+        for bucket_key in stale:
+            del self._buckets[bucket_key]
+        self._sweep_at = max(self.max_keys, 2 * len(self._buckets))
+        logger.debug("Evicted %d idle rate limit buckets", len(stale))
+
+    async def reset(self):
+        """Forget all buckets."""
+        self._buckets.clear()
+        self._sweep_at = self.max_keys
+
+
+# Atomic token bucket; uses the Redis clock so every node agrees on "now"
+_REDIS_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1])
+local ts = tonumber(data[2])
+if tokens == nil then
+    tokens = burst
+    ts = now
+end
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local retry = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(retry)
+"""
+
+
+class RedisBackend:
+    """Token buckets shared by every worker through Redis."""
+
+    def __init__(self, url: str, prefix: str = "ratelimit"):
+        if aioredis is None:
+            raise RuntimeError("The 'redis' package is required for RATE_LIMIT_BACKEND=redis")
+        self.prefix = prefix
+        self._client = aioredis.from_url(url)
+        self._script = self._client.register_script(_REDIS_SCRIPT)
+
+    async def hit(self, budget: str, key, limit: RateLimit, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens from the shared bucket."""
+        result = await self._script(
+            keys=[f"{self.prefix}:{budget}:{key}"],
+            args=[limit.rate, limit.burst, cost],
+        )
+        return float(result)
+
+    async def reset(self):
+        """Forget all buckets under our prefix."""
+        async for redis_key in self._client.scan_iter(f"{self.prefix}:*"):
+            await self._client.delete(redis_key)
+
+
+class RateLimiter:
+    """Named token-bucket budgets on top of a storage backend."""
+
+    def __init__(self, backend, limits: Dict[str, RateLimit], enabled: bool = True):
+        self.backend = backend
+        self.limits = limits
+        self.enabled = enabled
+
+    async def hit(self, budget: str, key, cost: float = 1.0) -> float:
+        """Consume from ``budget`` for ``key``.
+
+        Args:
+            budget: Budget name, e.g. ``"user"`` or ``"auth"``
+            key: User id or client address
+            cost: Tokens to take
+
+        Returns:
+            0.0 if allowed, otherwise the suggested retry delay in seconds
+        """
+        if not self.enabled:
+            return 0.0
+        return await self.backend.hit(budget, key, self.limits[budget], cost)
+
+    async def reset(self):
+        """Clear all buckets (used by tests and benchmarks)."""
+        await self.backend.reset()
+
+
+def create_rate_limiter(config) -> RateLimiter:
+    """Build the rate limiter described by application settings."""
+    limits = {
+        "user": RateLimit(config.RATE_LIMIT_USER_RATE, config.RATE_LIMIT_USER_BURST),
+        "send_message": RateLimit(config.RATE_LIMIT_MESSAGE_RATE, config.RATE_LIMIT_MESSAGE_BURST),
+        "auth": RateLimit(config.RATE_LIMIT_AUTH_RATE, config.RATE_LIMIT_AUTH_BURST),
+        "ws": RateLimit(config.RATE_LIMIT_WS_RATE, config.RATE_LIMIT_WS_BURST),
+        "export": RateLimit(config.RATE_LIMIT_EXPORT_RATE, config.RATE_LIMIT_EXPORT_BURST),
+        "upload": RateLimit(config.RATE_LIMIT_UPLOAD_RATE, config.RATE_LIMIT_UPLOAD_BURST),
+    }
+    if config.RATE_LIMIT_BACKEND == "redis":
+        backend = RedisBackend(config.RATE_LIMIT_REDIS_URL)
+    else:
+        backend = InMemoryBackend(config.RATE_LIMIT_MAX_KEYS)
+    return RateLimiter(backend, limits, enabled=config.RATE_LIMIT_ENABLED)
+
+
+def client_address(host: Optional[str], forwarded_for: Optional[str], trust_forwarded: bool = False) -> str:
+    """Resolve the address used as the per-IP rate limit key.
+
+    Args:
+        host: Peer address from the ASGI scope
+        forwarded_for: Value of the X-Forwarded-For header, if any
+        trust_forwarded: Whether X-Forwarded-For comes from a trusted proxy
+
+    Returns:
+        Client address
+    """
+    if forwarded_for and trust_forwarded:
+        return forwarded_for.split(",", 1)[0].strip()
+    return host or "unknown"
+
@@ -0,0 +1,118 @@
+"""In-memory revocation list for access tokens, synced from the database."""
+
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..metrics import revoked_tokens_active
+from ..models import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+# Rows committed up to this long after the last one seen (slow transactions,
+# clock skew between workers) are still picked up by the next sync
+SYNC_OVERLAP = timedelta(seconds=30)
+# How often a worker deletes rows whose tokens have expired anyway
+DB_PRUNE_INTERVAL_SECONDS = 600.0
+
+
+class RevocationList:
+    """Revoked access token ``jti`` values with their expiry times.
+
+    Lookups are a single dict probe, so ``AccessTokens`` can check
+    every request without touching the database. Revocations made in this
+    process apply immediately; those made by other workers arrive with the
+    next periodic sync. An entry is dropped once its token has expired,
+    which keeps the list as small as the number of logouts within one
+    access token lifetime.
+    """
+
+    def __init__(self):
+        # {jti: expires_at (epoch seconds)}
+        self._revoked: Dict[str, float] = {}
+        self._since: Optional[datetime] = None
+        self._next_db_prune = 0.0
+        revoked_tokens_active.set_function(lambda: len(self._revoked))
+
+    def is_revoked(self, jti: str) -> bool:
+        """Check whether a token id has been revoked."""
+        return jti in self._revoked
+
+    def add(self, jti: str, expires_at: float):
+        """Mark ``jti`` revoked in this process until ``expires_at``."""
+        self._revoked[jti] = expires_at
+
+    def revoke(self, db: Session, jti: str, expires_at: float):
+        """Revoke an access token everywhere.
+
+        The row is committed at once, and only then is the token marked
+        revoked in this process. A token another worker has recorded already
+        (a repeated logout this worker has not synced yet) counts as revoked.
+
+        Args:
+            db: Database session (committed, or rolled back on a duplicate)
+            jti: Token id (``jti`` claim)
+            expires_at: Token expiry (``exp`` claim)
+        """
+        db.add(RevokedToken(jti=jti, expires_at=datetime.utcfromtimestamp(expires_at)))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker recorded it first
+            db.rollback()
+        self.add(jti, expires_at)
+
+    def sync(self, db: Session) -> int:
+        """Load revocations recorded since the last sync and forget expired ones.
+
+        Args:
+            db: Database session
+
+        Returns:
+            Number of rows read
+        """
+        now = datetime.utcnow()
+        query = db.query(RevokedToken.jti, RevokedToken.expires_at, RevokedToken.revoked_at).filter(
+            RevokedToken.expires_at > now
+        )
+        if self._since is not None:
+            query = query.filter(RevokedToken.revoked_at >= self._since - SYNC_OVERLAP)
+        rows = query.all()
+        for jti, expires_at, revoked_at in rows:
+            self._revoked[jti] = (expires_at - datetime(1970, 1, 1)).total_seconds()
+            if self._since is None or revoked_at > self._since:
+                self._since = revoked_at
+        if self._since is None:
+            self._since = now
+
+        self.prune()
+        if time.monotonic() >= self._next_db_prune:
+            self._next_db_prune = time.monotonic() + DB_PRUNE_INTERVAL_SECONDS
+            db.query(RevokedToken).filter(RevokedToken.expires_at <= now).delete(synchronize_session=False)
+            db.commit()
+        return len(rows)
+
+    def prune(self, now: Optional[float] = None):
+        """Forget tokens that have expired (they fail verification anyway)."""
+        now = time.time() if now is None else now
+        expired = [jti for jti, expires_at in self._revoked.items() if expires_at <= now]
+        for jti in expired:
+            del self._revoked[jti]
+
+    def sync_once(self, session_factory):
+        """Run one ``sync`` in a fresh session, logging instead of raising."""
+        db = session_factory()
+        try:
+            self.sync(db)
+        except Exception as e:
+            logger.error("Revocation sync failed: %s", e)
+        finally:
+            db.close()
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
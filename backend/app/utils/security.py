@@ -1,10 +1,33 @@
 """Security utilities for password hashing and JWT tokens."""
 
+import asyncio
+import base64
+import calendar
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
+from typing import Optional, Sequence, Tuple
+from jose.exceptions import ExpiredSignatureError, JWTClaimsError, JWTError
 import bcrypt
+import orjson
 from ..config import settings
+from ..metrics import bcrypt_duration_seconds, bcrypt_queue_depth, token_cache_lookups_total
+from .revocation import RevocationList
+
+# bcrypt is deliberately slow and releases the GIL, so it runs on a small
+# dedicated pool instead of blocking the event loop
+_bcrypt_pool = ThreadPoolExecutor(
+    max_workers=settings.BCRYPT_POOL_SIZE,
+    thread_name_prefix="bcrypt"
+)
+_bcrypt_pending = 0
+_bcrypt_pending_lock = threading.Lock()
+bcrypt_queue_depth.set_function(lambda: _bcrypt_pending)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -45,40 +68,316 @@ def get_password_hash(password: str) -> str:
     return hashed.decode('utf-8')
 
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-    """Create a JWT access token.
+def _run_bcrypt(operation: str, func, *args):
+    """Run a bcrypt call on the pool thread, recording queue depth and timing."""
+    global _bcrypt_pending
+    with _bcrypt_pending_lock:
+        _bcrypt_pending -= 1
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        bcrypt_duration_seconds.observe(time.perf_counter() - started, operation)
+
+
+async def _submit_bcrypt(operation: str, func, *args):
+    """Queue a bcrypt call on the pool without blocking the event loop."""
+    global _bcrypt_pending
+    with _bcrypt_pending_lock:
+        _bcrypt_pending += 1
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_pool, _run_bcrypt, operation, func, *args)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the bcrypt pool.
     
     Args:
-        data: Data to encode in token (typically user_id)
-        expires_delta: Optional custom expiration time
+        plain_password: Plain text password
+        hashed_password: Hashed password from database
         
     Returns:
-        Encoded JWT token
+        True if password matches, False otherwise
     """
-    to_encode = data.copy()
+    return await _submit_bcrypt("verify", verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password on the bcrypt pool.
     
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    Args:
+        password: Plain text password
+        
+    Returns:
+        Hashed password
+    """
+    return await _submit_bcrypt("hash", get_password_hash, password)
+
+
+class JoseBackend:
+    """JWT encoding and verification through python-jose.
     
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    ``jose.jwt`` pulls in the cryptography backends (about 50 ms), so it is
+    imported with the first token instead of at startup.
+    """
+    
+    def __init__(self):
+        self._jwt = None
+    
+    @property
+    def jwt(self):
+        if self._jwt is None:
+            from jose import jwt
+            self._jwt = jwt
+        return self._jwt
     
-    return encoded_jwt
+    def encode(self, claims: dict, key: str, algorithm: str) -> str:
+        return self.jwt.encode(claims, key, algorithm=algorithm)
+    
+    def decode(self, token: str, key: str, algorithms: Sequence[str]) -> dict:
+        return self.jwt.decode(token, key, algorithms=list(algorithms))
 
 
-def decode_access_token(token: str) -> Optional[dict]:
-    """Decode and verify a JWT access token.
+class NativeBackend:
+    """HMAC-only JWT backend on hashlib/hmac and orjson.
+    
+    Produces and accepts the same tokens as ``JoseBackend`` for HS256/384/512
+    but skips python-jose's generic JWK and claim machinery, which dominates
+    its verification time. Checks the signature, ``exp`` and ``nbf``; raises
+    the same ``JWTError`` subclasses.
+    """
+    
+    DIGESTS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+    
+    def __init__(self, algorithm: str):
+        """Initialize the backend.
+        
+        Args:
+            algorithm: Signing algorithm; must be one of ``DIGESTS``
+            
+        Raises:
+            ValueError: If the algorithm is not an HMAC algorithm
+        """
+        if algorithm not in self.DIGESTS:
+            raise ValueError(f"JWT_BACKEND=native only supports {', '.join(self.DIGESTS)}, not {algorithm}")
+        self._headers = {
+            name: _b64encode(orjson.dumps({"alg": name, "typ": "JWT"}))
+            for name in self.DIGESTS
+        }
+    
+    def encode(self, claims: dict, key: str, algorithm: str) -> str:
+        claims = {
+            name: calendar.timegm(value.utctimetuple()) if isinstance(value, datetime) else value
+            for name, value in claims.items()
+        }
+        signing_input = self._headers[algorithm] + b"." + _b64encode(orjson.dumps(claims))
+        signature = hmac.new(key.encode("utf-8"), signing_input, self.DIGESTS[algorithm]).digest()
+        return (signing_input + b"." + _b64encode(signature)).decode("ascii")
+    
+    def decode(self, token: str, key: str, algorithms: Sequence[str]) -> dict:
+        try:
+            signing_input, _, signature = token.encode("ascii").rpartition(b".")
+            header_segment, _, payload_segment = signing_input.partition(b".")
+            header = orjson.loads(_b64decode(header_segment))
+            claims = orjson.loads(_b64decode(payload_segment))
+            signature = _b64decode(signature)
+        except (ValueError, TypeError, UnicodeError, orjson.JSONDecodeError):
+            raise JWTError("Invalid token")
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise JWTError("Invalid token")
+        
+        algorithm = header.get("alg")
+        if algorithm not in algorithms or algorithm not in self.DIGESTS:
+            raise JWTError("The specified alg value is not allowed")
+        expected = hmac.new(key.encode("utf-8"), signing_input, self.DIGESTS[algorithm]).digest()
+        if not hmac.compare_digest(expected, signature):
+            raise JWTError("Signature verification failed.")
+        
+        now = time.time()
+        try:
+            if "exp" in claims and now >= int(claims["exp"]):
+                raise ExpiredSignatureError("Signature has expired.")
+            if "nbf" in claims and now < int(claims["nbf"]):
+                raise JWTClaimsError("The token is not yet valid (nbf)")
+        except (ValueError, TypeError):
+            raise JWTClaimsError("Invalid exp or nbf claim")
+        return claims
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+class TokenCache:
+    """Bounded LRU of verified tokens → claims.
+    
+    Keyed by a digest of the whole token, signature included, so a hit means
+    these exact bytes were verified before. Entries are dropped once the
+    token's ``exp`` passes; tokens without ``exp`` are never cached.
+    """
+    
+    def __init__(self, maxsize: int):
+        """Initialize the cache.
+        
+        Args:
+            maxsize: Tokens kept at most (0 disables caching)
+        """
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+    
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+    
+    def get(self, token: str) -> Optional[dict]:
+        """Get the claims of a previously verified, unexpired token."""
+        if not self.maxsize:
+            return None
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            token_cache_lookups_total.inc("miss")
+            return None
+        claims, expires_at = entry
+        if time.time() >= expires_at:
+            self._entries.pop(key, None)
+            token_cache_lookups_total.inc("expired")
+            return None
+        self._entries.move_to_end(key)
+        token_cache_lookups_total.inc("hit")
+        # Callers may modify the payload they get back
+        return dict(claims)
+    
+    def put(self, token: str, claims: dict):
+        """Remember the claims of a token that just passed verification."""
+        if not self.maxsize or not isinstance(claims.get("exp"), (int, float)):
+            return
+        self._entries[self._key(token)] = (dict(claims), float(claims["exp"]))
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Forget every cached token."""
+        self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def create_jwt_backend(config):
+    """Build the JWT backend selected by ``JWT_BACKEND``."""
+    if config.JWT_BACKEND == "native":
+        return NativeBackend(config.ALGORITHM)
+    return JoseBackend()
+
+
+class AccessTokens:
+    """Issues and verifies one application's access tokens.
+    
+    Recently verified tokens are served from the token cache without
+    recomputing the signature. Revoked tokens are rejected either way.
+    """
+    
+    def __init__(
+        self,
+        backend,
+        secret_key: str,
+        algorithm: str,
+        lifetime: timedelta,
+        cache: TokenCache,
+        revocations: RevocationList
+    ):
+        """Initialize the token service.
+        
+        Args:
+            backend: JWT backend (``JoseBackend`` or ``NativeBackend``)
+            secret_key: Signing key
+            algorithm: Signing algorithm
+            lifetime: Default access token lifetime
+            cache: Verified-token cache
+            revocations: Revoked token ids to reject
+        """
+        self.backend = backend
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.lifetime = lifetime
+        self.cache = cache
+        self.revocations = revocations
+    
+    def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None) -> str:
+        """Create a JWT access token.
+        
+        Each token gets a random ``jti`` so it can be revoked on its own.
+        
+        Args:
+            data: Data to encode in token (typically user_id)
+            expires_delta: Optional custom expiration time
+            
+        Returns:
+            Encoded JWT token
+        """
+        to_encode = {"jti": secrets.token_hex(16), **data}
+        to_encode.update({"exp": datetime.utcnow() + (expires_delta or self.lifetime)})
+        return self.backend.encode(to_encode, self.secret_key, self.algorithm)
+    
+    def decode_access_token(self, token: str) -> Optional[dict]:
+        """Decode and verify a JWT access token.
+        
+        Args:
+            token: JWT token to decode
+            
+        Returns:
+            Decoded token payload or None if invalid or revoked
+        """
+        payload = self.cache.get(token)
+        if payload is None:
+            try:
+                payload = self.backend.decode(token, self.secret_key, [self.algorithm])
+            except JWTError:
+                return None
+            self.cache.put(token, payload)
+        jti = payload.get("jti")
+        if jti is not None and self.revocations.is_revoked(jti):
+            return None
+        return payload
+
+
+def create_access_tokens(config, revocations: RevocationList) -> AccessTokens:
+    """Build the token service described by application settings."""
+    return AccessTokens(
+        create_jwt_backend(config),
+        config.SECRET_KEY,
+        config.ALGORITHM,
+        timedelta(minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES),
+        TokenCache(config.TOKEN_CACHE_SIZE),
+        revocations,
+    )
+
+
+def new_refresh_token() -> Tuple[str, str]:
+    """Generate an opaque refresh token.
+    
+    Returns:
+        Tuple of (token for the client, SHA-256 hash to store)
+    """
+    token = secrets.token_urlsafe(32)
+    return token, hash_refresh_token(token)
+
+
+def hash_refresh_token(token: str) -> str:
+    """Hash a refresh token for storage and lookup.
+    
+    Refresh tokens are 256 random bits, so a fast unsalted hash is enough:
+    a leaked table cannot be turned back into usable tokens.
     
     Args:
-        token: JWT token to decode
+        token: Refresh token as sent by the client
         
     Returns:
-        Decoded token payload or None if invalid
+        Hex SHA-256 digest
     """
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload
-    except JWTError:
-        return None
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
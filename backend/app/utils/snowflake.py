@@ -0,0 +1,147 @@
+"""Time-ordered 64-bit ids (snowflakes) for messages.
+
+Layout, most significant bit first::
+
+    0 | 41 bits: milliseconds since EPOCH | 10 bits: worker | 12 bits: sequence
+
+Ids from one worker strictly increase, and ids from different workers sort
+by creation time to the millisecond, so ordering and cursor pagination need
+no other column and the creation time can be read back from the id. A
+worker allocates ids without a database round trip; uniqueness across
+processes and nodes comes from each one having its own worker id.
+
+Ids created before snowflakes existed are small autoincrement values, which
+sort before every snowflake.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from ..config import settings
+
+# 2015-01-01T00:00:00Z, early enough for imported history; 41 bits of
+# milliseconds last until 2084
+EPOCH = datetime(2015, 1, 1)
+EPOCH_MS = 1_420_070_400_000
+
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+TIMESTAMP_SHIFT = WORKER_BITS + SEQUENCE_BITS
+
+# Default worker ids are node id (5 bits) + process id (5 bits). Node 31
+# is reserved: its last worker id labels ids backfilled by bulk imports
+NODE_BITS = 5
+PROCESS_BITS = WORKER_BITS - NODE_BITS
+MAX_NODE = (1 << NODE_BITS) - 2
+BACKFILL_WORKER_ID = MAX_WORKER
+
+
+class SnowflakeGenerator:
+    """Thread-safe snowflake allocator for one worker.
+
+    If the clock steps backwards, or a millisecond's 4096 sequence numbers
+    run out, the generator keeps counting from its last timestamp instead
+    of waiting, so it never blocks and ids never repeat or go backwards.
+    """
+
+    def __init__(self, worker_id: int, clock=time.time):
+        """Initialize the generator.
+
+        Args:
+            worker_id: Worker id (0-1022), unique among live processes
+            clock: Time source in seconds (for tests)
+
+        Raises:
+            ValueError: If ``worker_id`` is outside 0-1022
+        """
+        if not 0 <= worker_id < BACKFILL_WORKER_ID:
+            raise ValueError(f"worker_id must be between 0 and {BACKFILL_WORKER_ID - 1}, got {worker_id}")
+        self.worker_id = worker_id
+        self._clock = clock
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        """Allocate the next id."""
+        with self._lock:
+            now_ms = int(self._clock() * 1000) - EPOCH_MS
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            else:
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    # Borrow the next millisecond; the clock catches up
+                    self._last_ms += 1
+                    self._sequence = 0
+            return make_snowflake(self._last_ms, self.worker_id, self._sequence)
+
+
+def make_snowflake(timestamp_ms: int, worker_id: int, sequence: int) -> int:
+    """Pack milliseconds since ``EPOCH``, a worker id and a sequence number."""
+    return (timestamp_ms << TIMESTAMP_SHIFT) | (worker_id << SEQUENCE_BITS) | sequence
+
+
+def default_worker_id(config=settings, pid: Optional[int] = None) -> int:
+    """Worker id from settings, or from the node id and process id.
+
+    ``SNOWFLAKE_WORKER_ID`` wins when set (>= 0). Otherwise the id combines
+    ``SNOWFLAKE_NODE_ID`` with the low bits of the pid, which keeps the
+    workers of one server (consecutive pids) apart without coordination.
+    """
+    if config.SNOWFLAKE_WORKER_ID >= 0:
+        return config.SNOWFLAKE_WORKER_ID
+    pid = os.getpid() if pid is None else pid
+    node = config.SNOWFLAKE_NODE_ID % (MAX_NODE + 1)
+    return (node << PROCESS_BITS) | (pid & ((1 << PROCESS_BITS) - 1))
+
+
+def snowflake_time(snowflake: int) -> datetime:
+    """Creation time (naive UTC, millisecond precision) encoded in an id."""
+    return EPOCH + timedelta(milliseconds=snowflake >> TIMESTAMP_SHIFT)
+
+
+def snowflake_ms(moment: datetime) -> int:
+    """Milliseconds from ``EPOCH`` to ``moment`` (naive UTC), clamped at 0."""
+    return max(0, (moment - EPOCH) // timedelta(milliseconds=1))
+
+
+def snowflake_at(moment: datetime) -> int:
+    """Smallest id a worker could allocate at ``moment`` (naive UTC).
+
+    ``Message.id >= snowflake_at(t)`` selects messages created at or after
+    ``t`` using the primary key alone.
+    """
+    return snowflake_ms(moment) << TIMESTAMP_SHIFT
+
+
+_generator: Optional[SnowflakeGenerator] = None
+_generator_lock = threading.Lock()
+
+
+def next_message_id() -> int:
+    """Allocate a message id from this process's generator.
+
+    The generator is created on first use, so forked workers each pick up
+    their own pid.
+    """
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                _generator = SnowflakeGenerator(default_worker_id())
+    return _generator.next_id()
+
+
+def _reset_after_fork():
+    global _generator
+    _generator = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
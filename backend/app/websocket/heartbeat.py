@@ -0,0 +1,55 @@
+"""Hashed timer wheel for WebSocket heartbeats."""
+
+from typing import Hashable, List, Set
+
+
+class TimerWheel:
+    """Visit every registered key once per revolution, spread over the slots.
+
+    Keys are hashed into a fixed slot, so one heartbeat task advancing one
+    slot per tick pings ``1/slots`` of the connections each time instead of
+    all of them at once (or running a timer per socket). Add and discard
+    are O(1); a key's slot is recomputed from its hash, so the wheel stores
+    nothing per key beyond one set entry.
+    """
+
+    __slots__ = ("slots", "position", "_size")
+
+    def __init__(self, slots: int):
+        """Initialize the wheel.
+
+        Args:
+            slots: Number of slots (ticks per revolution)
+        """
+        self.slots: List[Set[Hashable]] = [set() for _ in range(max(1, slots))]
+        self.position = 0
+        self._size = 0
+
+    def _slot(self, key: Hashable) -> Set[Hashable]:
+        return self.slots[hash(key) % len(self.slots)]
+
+    def add(self, key: Hashable):
+        """Schedule ``key`` (no-op if already scheduled)."""
+        slot = self._slot(key)
+        if key not in slot:
+            slot.add(key)
+            self._size += 1
+
+    def discard(self, key: Hashable):
+        """Unschedule ``key`` if present."""
+        slot = self._slot(key)
+        if key in slot:
+            slot.remove(key)
+            self._size -= 1
+
+    def advance(self) -> List[Hashable]:
+        """Move to the next slot, returning the keys due in the current one."""
+        due = list(self.slots[self.position])
+        self.position = (self.position + 1) % len(self.slots)
+        return due
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._slot(key)
@@ -1,121 +1,656 @@
 """WebSocket connection manager for real-time messaging."""
 
+from collections import deque
 from fastapi import WebSocket
-from typing import Dict, List, Set
+from itertools import islice
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
 import json
 import logging
+import random
+import secrets
+import time
+
+from ..metrics import (
+    ws_active_channels,
+    ws_active_connections,
+    ws_broadcast_duration_seconds,
+    ws_broadcast_recipients,
+    ws_reaped_connections_total,
+    ws_replayed_events_total,
+    ws_resumes_total,
+    ws_send_failures_total,
+)
+from .heartbeat import TimerWheel
+from .registry import Connection, ConnectionRegistry
 
 logger = logging.getLogger(__name__)
 
+# Close code for connections that stopped answering pings
+HEARTBEAT_TIMEOUT_CLOSE_CODE = 4000
+# Close code for connections of users who left or were removed from the server
+REMOVED_CLOSE_CODE = 4003
+
+
+class _Session:
+    """A dropped session that can still be resumed until ``expires_at``.
+    
+    Live sessions need no record: their id is kept on the ``Connection``.
+    """
+    
+    __slots__ = ("user_id", "channel_id", "expires_at")
+    
+    def __init__(self, user_id: int, channel_id: int, expires_at: float):
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.expires_at = expires_at
+
 
 class ConnectionManager:
-    """Manages WebSocket connections for real-time messaging."""
+    """Manages WebSocket connections for real-time messaging.
     
-    def __init__(self):
-        """Initialize connection manager."""
-        # Store active connections: {channel_id: {user_id: websocket}}
-        self.active_connections: Dict[int, Dict[int, WebSocket]] = {}
-        # Track user presence: {user_id: set of channel_ids}
-        self.user_channels: Dict[int, Set[int]] = {}
+    Every broadcast is stamped with a per-channel sequence number (``seq``)
+    and kept in a bounded per-channel replay ring. A client that reconnects
+    with its ``session_id`` and the last ``seq`` it saw gets only the events
+    it missed, straight from memory; if the ring no longer reaches back that
+    far it is told to resync through the REST history endpoint instead.
+    
+    A single heartbeat task walks a timer wheel, pinging each socket once per
+    ``heartbeat_interval`` and reaping sockets that sent nothing (pong or
+    otherwise) for ``heartbeat_interval + heartbeat_timeout`` seconds.
+    Sockets a send failed on are reaped by the next tick, or right after the
+    failing broadcast when no heartbeat task is running.
+    """
+    
+    def __init__(
+        self,
+        replay_buffer_size: int = 500,
+        session_ttl: float = 300.0,
+        heartbeat_interval: float = 30.0,
+        heartbeat_timeout: float = 10.0,
+        heartbeat_tick: float = 1.0,
+        reap_batch_size: int = 200,
+    ):
+        """Initialize connection manager.
+        
+        Args:
+            replay_buffer_size: Events kept per channel for resume
+            session_ttl: Seconds a dropped session can still be resumed
+            heartbeat_interval: Seconds between pings to each socket (0 disables)
+            heartbeat_timeout: Extra silence tolerated before a socket is reaped
+            heartbeat_tick: Timer wheel resolution in seconds
+            reap_batch_size: Dead sockets dropped per tick at most
+        """
+        # Live connections indexed by channel, user and server
+        self.registry = ConnectionRegistry()
+        
+        # Resume state: last seq per channel, recent (seq, event, excluded user) per
+        # channel, and dropped sessions that can still resume
+        self.replay_buffer_size = replay_buffer_size
+        self.session_ttl = session_ttl
+        self.channel_seq: Dict[int, int] = {}
+        self.replay_buffers: Dict[int, Deque[Tuple[int, dict, Optional[int]]]] = {}
+        self.sessions: Dict[str, _Session] = {}
+        self._next_sweep = 0.0
+        
+        # Set once shutdown starts; new connections are refused from then on
+        self.draining = False
+        
+        # Heartbeat: every Connection sits in the timer wheel
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.heartbeat_tick = heartbeat_tick
+        self.reap_batch_size = reap_batch_size
+        self._wheel = TimerWheel(
+            round(heartbeat_interval / heartbeat_tick) if heartbeat_interval else 1
+        )
+        self._reap_queue: Deque[Connection] = deque()
+        self._reap_pending: Set[Connection] = set()
+        self._reaping = False
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._closing: Set[asyncio.Task] = set()
+        
+        # Gauges are computed at scrape time, so connect/disconnect pay nothing
+        ws_active_connections.set_function(lambda: len(self.registry))
+        ws_active_channels.set_function(lambda: len(self.registry.channels))
     
-    async def connect(self, websocket: WebSocket, user_id: int, server_id: int, channel_id: int):
+    async def connect(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        server_id: int,
+        channel_id: int,
+        session_id: Optional[str] = None,
+        last_seq: Optional[int] = None,
+    ) -> str:
         """Accept and register a new WebSocket connection.
         
+        Sends a ``hello`` event carrying the session id, then either the
+        events missed since ``last_seq`` or a ``resync_required`` event.
+        
         Args:
             websocket: WebSocket connection
             user_id: User ID
             server_id: Server ID
             channel_id: Channel ID
+            session_id: Session to resume, from a previous ``hello``
+            last_seq: Last sequence number the client received
+        
+        Returns:
+            Session ID for this connection
         """
         await websocket.accept()
+        self._expire_sessions()
+        
+        resuming = last_seq is not None and self._claim_session(session_id, user_id, channel_id)
+        if not resuming:
+            session_id = secrets.token_urlsafe(16)
+        
+        current_seq = self.channel_seq.get(channel_id, 0)
+        replayable = resuming and self._can_replay(channel_id, last_seq)
+        await websocket.send_json({
+            "type": "hello",
+            "data": {"session_id": session_id, "seq": current_seq, "resumed": replayable}
+        })
         
-        # Initialize channel connections if not exists
-        if channel_id not in self.active_connections:
-            self.active_connections[channel_id] = {}
+        if last_seq is not None:
+            ws_resumes_total.inc("replayed" if replayable else "resync")
+        if replayable:
+            cursor = last_seq
+        else:
+            cursor = current_seq
+            if last_seq is not None:
+                await websocket.send_json({
+                    "type": "resync_required",
+                    "data": {"channel_id": channel_id, "seq": current_seq}
+                })
         
-        # Add connection
-        self.active_connections[channel_id][user_id] = websocket
+        # Catch up until nothing is missing, then register without awaiting in
+        # between so no broadcast can slip through the gap
+        while True:
+            missed = self._events_after(channel_id, cursor, user_id)
+            if not missed:
+                break
+            for seq, event in missed:
+                await websocket.send_json(event)
+                cursor = seq
+            ws_replayed_events_total.inc(amount=len(missed))
         
-        # Track user channels
-        if user_id not in self.user_channels:
-            self.user_channels[user_id] = set()
-        self.user_channels[user_id].add(channel_id)
+        # Add connection; a previous socket of this user in this channel is replaced
+        connection = Connection(websocket, user_id, server_id, channel_id, session_id)
+        replaced = self.registry.add(connection)
+        if replaced is not None:
+            self._wheel.discard(replaced)
+        self._wheel.add(connection)
         
-        logger.info(f"User {user_id} connected to channel {channel_id}")
-        logger.info(f"Active connections in channel {channel_id}: {len(self.active_connections[channel_id])}")
+        logger.info(
+            "User %s connected to channel %s (%d connections, resumed=%s)",
+            user_id, channel_id, len(self.registry.in_channel(channel_id)), replayable
+        )
+        return session_id
     
-    def disconnect(self, websocket: WebSocket, user_id: int, server_id: int, channel_id: int):
+    def disconnect(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        server_id: int,
+        channel_id: int,
+        session_id: Optional[str] = None,
+    ) -> bool:
         """Remove a WebSocket connection.
         
+        Idempotent, and a no-op if ``websocket`` was already replaced by a
+        newer connection of the same user to the same channel.
+        
         Args:
             websocket: WebSocket connection
             user_id: User ID
             server_id: Server ID
             channel_id: Channel ID
-        """
-        # Remove from active connections
-        if channel_id in self.active_connections:
-            if user_id in self.active_connections[channel_id]:
-                del self.active_connections[channel_id][user_id]
+            session_id: Session to keep resumable for ``session_ttl`` seconds
             
-            # Clean up empty channel
-            if not self.active_connections[channel_id]:
-                del self.active_connections[channel_id]
+        Returns:
+            True if the connection was registered and has been removed
+        """
+        connection = self.registry.get(channel_id, user_id)
+        if connection is None or connection.websocket is not websocket:
+            return False
         
-        # Remove from user channels tracking
-        if user_id in self.user_channels:
-            self.user_channels[user_id].discard(channel_id)
-            
-            # Clean up empty user tracking
-            if not self.user_channels[user_id]:
-                del self.user_channels[user_id]
+        self.registry.remove(connection)
+        self._wheel.discard(connection)
+        
+        # Keep the session resumable for a while
+        session_id = session_id or connection.session_id
+        if session_id:
+            self.sessions[session_id] = _Session(
+                user_id, channel_id, time.monotonic() + self.session_ttl
+            )
+        
+        logger.info("User %s disconnected from channel %s", user_id, channel_id)
+        return True
+    
+    async def leave(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        server_id: int,
+        channel_id: int,
+        session_id: Optional[str] = None,
+    ) -> bool:
+        """Disconnect and tell the rest of the channel (``user_leave``).
+        
+        Safe to call more than once for the same socket; only the call that
+        actually removes it announces the leave. Skipped while draining,
+        since everyone is leaving at once.
         
-        logger.info(f"User {user_id} disconnected from channel {channel_id}")
+        Returns:
+            True if the connection was removed by this call
+        """
+        if not self.disconnect(websocket, user_id, server_id, channel_id, session_id=session_id):
+            return False
+        if not self.draining:
+            await self.broadcast(
+                {
+                    "type": "user_leave",
+                    "data": {
+                        "user_id": user_id,
+                        "channel_id": channel_id
+                    }
+                },
+                channel_id
+            )
+        return True
+    
+    def touch(self, user_id: int, channel_id: int):
+        """Record inbound traffic (any frame counts as a heartbeat)."""
+        connection = self.registry.get(channel_id, user_id)
+        if connection is not None:
+            connection.last_seen = time.monotonic()
     
     async def send_personal_message(self, message: dict, user_id: int, channel_id: int):
         """Send a message to a specific user in a channel.
         
+        Personal messages are not sequenced and are not replayed on resume.
+        
         Args:
             message: Message data to send
             user_id: Target user ID
             channel_id: Channel ID
         """
-        if channel_id in self.active_connections:
-            if user_id in self.active_connections[channel_id]:
-                websocket = self.active_connections[channel_id][user_id]
-                try:
-                    await websocket.send_json(message)
-                except Exception as e:
-                    logger.error(f"Error sending message to user {user_id}: {e}")
+        connection = self.registry.get(channel_id, user_id)
+        if connection is not None:
+            try:
+                await connection.websocket.send_json(message)
+            except Exception as e:
+                ws_send_failures_total.inc()
+                logger.error("Error sending message to user %s: %s", user_id, e)
     
     async def broadcast(self, message: dict, channel_id: int, exclude_user: int = None):
         """Broadcast a message to all users in a channel.
         
+        The message is stamped with the channel's next ``seq`` and recorded
+        for replay even if nobody is connected right now.
+        
         Args:
             message: Message data to broadcast
             channel_id: Channel ID
             exclude_user: Optional user ID to exclude from broadcast
         """
-        if channel_id not in self.active_connections:
+        message = self._record(message, channel_id, exclude_user)
+        members = self.registry.in_channel(channel_id)
+        if not members:
             return
         
-        disconnected_users = []
+        started = time.perf_counter()
+        recipients = 0
         
-        for user_id, websocket in self.active_connections[channel_id].items():
+        # Iterate over a snapshot: sends yield to the loop and peers may connect meanwhile
+        for connection in list(members.values()):
             # Skip excluded user
-            if exclude_user and user_id == exclude_user:
+            if exclude_user and connection.user_id == exclude_user:
                 continue
             
+            recipients += 1
+            try:
+                await connection.websocket.send_json(message)
+            except Exception as e:
+                ws_send_failures_total.inc()
+                logger.error("Error broadcasting to user %s: %s", connection.user_id, e)
+                # Leave through the reaper so presence is updated too
+                self._queue_reap(connection)
+        
+        ws_broadcast_duration_seconds.observe(time.perf_counter() - started)
+        ws_broadcast_recipients.observe(recipients)
+        await self._reap_without_heartbeat()
+    
+    async def broadcast_to_server(self, message: dict, server_id: int, exclude_user: int = None) -> int:
+        """Send a message once to every user connected to any channel of a server.
+        
+        A user with several channels of the server open gets the event on one
+        of those sockets only. Server events are not sequenced and are not
+        replayed on resume; clients refetch server state after a fresh
+        (``resumed: false``) hello.
+        
+        Args:
+            message: Message data to send
+            server_id: Server ID
+            exclude_user: Optional user ID to exclude from broadcast
+        
+        Returns:
+            Number of users the message was sent to
+        """
+        started = time.perf_counter()
+        delivered: Set[int] = set()
+        
+        # Snapshot the list: sends yield to the loop and may interleave with disconnects
+        for connection in list(self.registry.for_server(server_id)):
+            if connection.user_id in delivered or connection.user_id == exclude_user:
+                continue
             try:
-                await websocket.send_json(message)
+                await connection.websocket.send_json(message)
             except Exception as e:
-                logger.error(f"Error broadcasting to user {user_id}: {e}")
-                disconnected_users.append(user_id)
+                ws_send_failures_total.inc()
+                logger.error("Error broadcasting to user %s: %s", connection.user_id, e)
+                self._queue_reap(connection)
+                # Another of the user's sockets may still get it
+                continue
+            delivered.add(connection.user_id)
+        
+        ws_broadcast_duration_seconds.observe(time.perf_counter() - started)
+        ws_broadcast_recipients.observe(len(delivered))
+        await self._reap_without_heartbeat()
+        return len(delivered)
+
+    async def remove_from_server(self, server_id: int, user_ids: Iterable[int]) -> int:
+        """Close the sockets that removed members have open to a server's channels.
+        
+        Each socket is dropped from the registry (announcing ``user_leave``
+        to its channel), its session is made unresumable, and it is closed
+        with ``REMOVED_CLOSE_CODE``. One pass over each user's connections.
+        Sockets are matched by the server their channel belongs to, which
+        the endpoint registers them under, so the URL cannot hide one.
+        
+        Args:
+            server_id: Server ID
+            user_ids: Users no longer in the server
+            
+        Returns:
+            Number of sockets closed
+        """
+        removed = [
+            connection
+            for user_id in set(user_ids)
+            for connection in list(self.registry.for_user(user_id))
+            if connection.server_id == server_id
+        ]
+        closed = []
+        for connection in removed:
+            if await self.leave(
+                connection.websocket, connection.user_id, connection.server_id, connection.channel_id
+            ):
+                self.sessions.pop(connection.session_id, None)
+                closed.append(connection.websocket)
+        
+        if closed:
+            await asyncio.gather(*(
+                self._close_quietly(websocket, REMOVED_CLOSE_CODE, "Removed from server")
+                for websocket in closed
+            ))
+        return len(closed)
+    
+    def start_heartbeat(self):
+        """Start the heartbeat task on the running loop (idempotent)."""
+        if self.heartbeat_interval and self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.get_running_loop().create_task(self._run_heartbeat())
+    
+    async def stop_heartbeat(self):
+        """Cancel the heartbeat task."""
+        task, self._heartbeat_task = self._heartbeat_task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    
+    async def _run_heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_tick)
+            try:
+                await self.heartbeat_tick_once()
+            except Exception:
+                logger.exception("Heartbeat tick failed")
+    
+    async def heartbeat_tick_once(self, now: Optional[float] = None) -> int:
+        """Ping the sockets due this tick, reap one batch of dead ones and expire old sessions.
+        
+        Args:
+            now: Monotonic time override (for tests)
+            
+        Returns:
+            Number of connections reaped
+        """
+        if now is None:
+            now = time.monotonic()
+        deadline = self.heartbeat_interval + self.heartbeat_timeout
+        
+        due = []
+        for connection in self._wheel.advance():
+            if now - connection.last_seen > deadline:
+                self._wheel.discard(connection)
+                self._queue_reap(connection)
+            else:
+                due.append(connection)
+        
+        if due:
+            results = await asyncio.gather(
+                *(connection.websocket.send_json({"type": "ping", "data": {}}) for connection in due),
+                return_exceptions=True,
+            )
+            for connection, result in zip(due, results):
+                if isinstance(result, Exception):
+                    self._queue_reap(connection)
+        
+        # Throttled; otherwise buffers of a channel everyone left wait for the next connect
+        self._expire_sessions()
+        return await self._reap_batch()
+    
+    def _queue_reap(self, connection: Connection):
+        """Queue a dead connection for the reaper, once."""
+        if connection not in self._reap_pending:
+            self._reap_pending.add(connection)
+            self._reap_queue.append(connection)
+    
+    async def _reap_without_heartbeat(self):
+        """Reap queued connections at once when no heartbeat task will.
+        
+        Leaves announced while reaping may queue more dead sockets; they
+        are left to the reap already running instead of recursing.
+        """
+        if self._heartbeat_task is not None or self._reaping:
+            return
+        while self._reap_queue:
+            await self._reap_batch()
+    
+    async def _reap_batch(self) -> int:
+        """Drop up to ``reap_batch_size`` queued dead connections."""
+        batch = []
+        while self._reap_queue and len(batch) < self.reap_batch_size:
+            connection = self._reap_queue.popleft()
+            self._reap_pending.discard(connection)
+            batch.append(connection)
+        
+        reaped = []
+        self._reaping = True
+        try:
+            for connection in batch:
+                # leave() is a no-op if it is already gone or was replaced by a reconnect
+                if await self.leave(
+                    connection.websocket, connection.user_id, connection.server_id,
+                    connection.channel_id, connection.session_id,
+                ):
+                    reaped.append(connection.websocket)
+        finally:
+            self._reaping = False
+        
+        if reaped:
+            ws_reaped_connections_total.inc(amount=len(reaped))
+            logger.info("Reaped %d dead WebSocket connections", len(reaped))
+            # Half-open peers never answer the close handshake; don't wait on them
+            await asyncio.gather(*(
+                self._close_quietly(websocket, HEARTBEAT_TIMEOUT_CLOSE_CODE, "Heartbeat timeout")
+                for websocket in reaped
+            ))
+        return len(reaped)
+    
+    async def _close_quietly(self, websocket: WebSocket, code: int, reason: str):
+        """Close a socket without waiting long on peers that never ack the close.
+        
+        The server waits for the peer's close frame (up to its own close
+        timeout), so the close keeps running in the background after one
+        second instead of being cancelled.
+        """
+        task = asyncio.ensure_future(websocket.close(code=code, reason=reason))
+        self._closing.add(task)
+        task.add_done_callback(self._close_done)
+        await asyncio.wait([task], timeout=1.0)
+    
+    def _close_done(self, task: asyncio.Task):
+        self._closing.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("Error closing WebSocket: %s", task.exception())
+    
+    async def drain(
+        self,
+        batch_size: int = 500,
+        batch_interval: float = 0.5,
+        max_reconnect_delay: float = 10.0,
+    ) -> int:
+        """Ask every connected client to reconnect elsewhere, in batches.
+        
+        Each socket gets a ``reconnect`` event with a random ``delay_ms`` in
+        ``[0, max_reconnect_delay]`` and is then closed with code 1012
+        (service restart), so clients spread their reconnects over time
+        instead of all hitting the remaining nodes at once.
+        
+        Args:
+            batch_size: Sockets closed per batch
+            batch_interval: Pause between batches in seconds
+            max_reconnect_delay: Upper bound of the reconnect hint in seconds
+            
+        Returns:
+            Number of sockets drained
+        """
+        self.draining = True
+        await self.stop_heartbeat()
+        sockets = [connection.websocket for connection in self.registry]
+        logger.info("Draining %d WebSocket connections", len(sockets))
+        
+        for start in range(0, len(sockets), batch_size):
+            if start:
+                await asyncio.sleep(batch_interval)
+            await asyncio.gather(*(
+                self._send_reconnect_hint(websocket, max_reconnect_delay)
+                for websocket in sockets[start:start + batch_size]
+            ))
+        return len(sockets)
+    
+    async def _send_reconnect_hint(self, websocket: WebSocket, max_reconnect_delay: float):
+        """Send a jittered reconnect hint and close one socket."""
+        try:
+            await websocket.send_json({
+                "type": "reconnect",
+                "data": {
+                    "reason": "server_restart",
+                    "delay_ms": int(random.uniform(0, max_reconnect_delay) * 1000)
+                }
+            })
+        except Exception as e:
+            # Already gone; the receive loop cleans up
+            logger.debug("Error draining WebSocket: %s", e)
+        await self._close_quietly(websocket, 1012, "Server restarting")
+    
+    def _record(self, message: dict, channel_id: int, exclude_user: Optional[int]) -> dict:
+        """Stamp ``message`` with the channel's next seq and buffer it."""
+        seq = self.channel_seq.get(channel_id, 0) + 1
+        self.channel_seq[channel_id] = seq
+        stamped = {**message, "seq": seq}
+        
+        buffer = self.replay_buffers.get(channel_id)
+        if buffer is None:
+            buffer = self.replay_buffers[channel_id] = deque(maxlen=self.replay_buffer_size)
+        buffer.append((seq, stamped, exclude_user))
+        return stamped
+    
+    def _can_replay(self, channel_id: int, last_seq: int) -> bool:
+        """Check whether every event after ``last_seq`` is still buffered."""
+        current_seq = self.channel_seq.get(channel_id, 0)
+        if last_seq < 0 or last_seq > current_seq:
+            # Sequence from a previous server process
+            return False
+        if last_seq == current_seq:
+            return True
+        buffer = self.replay_buffers.get(channel_id)
+        return bool(buffer) and buffer[0][0] <= last_seq + 1
+    
+    def _events_after(self, channel_id: int, seq: int, user_id: int) -> List[Tuple[int, dict]]:
+        """Buffered events newer than ``seq`` that ``user_id`` should receive."""
+        buffer = self.replay_buffers.get(channel_id)
+        if not buffer or buffer[-1][0] <= seq:
+            return []
+        # Seqs in a buffer are contiguous, so the start index is a subtraction
+        start = max(0, seq - buffer[0][0] + 1)
+        return [
+            (event_seq, event)
+            for event_seq, event, excluded in islice(buffer, start, None)
+            if excluded != user_id
+        ]
+    
+    def _claim_session(self, session_id: Optional[str], user_id: int, channel_id: int) -> bool:
+        """Check that ``session_id`` belongs to this user and channel, and take it over.
+        
+        The session is either a dropped one, or still attached to a socket the
+        server hasn't noticed is dead yet (which the new connection replaces).
+        """
+        if not session_id:
+            return False
+        session = self.sessions.get(session_id)
+        if session is not None:
+            if session.user_id != user_id or session.channel_id != channel_id:
+                return False
+            del self.sessions[session_id]
+            return True
+        connection = self.registry.get(channel_id, user_id)
+        return connection is not None and connection.session_id == session_id
+    
+    async def expire_sessions(self):
+        """Run the session sweep (scheduler job for when the heartbeat is off)."""
+        self._expire_sessions()
+    
+    def _expire_sessions(self):
+        """Drop expired sessions, and the buffers and sequences nobody can resume from.
+        
+        A channel's sequence restarts from 0 once it has no connections and
+        no resumable sessions; no client is left holding an old ``last_seq``
+        that could be mistaken for a new one.
+        """
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + max(1.0, self.session_ttl / 4)
+        
+        for session_id, session in list(self.sessions.items()):
+            if session.expires_at <= now:
+                del self.sessions[session_id]
         
-        # Clean up disconnected users
-        for user_id in disconnected_users:
-            if user_id in self.active_connections[channel_id]:
-                del self.active_connections[channel_id][user_id]
+        live_channels = {session.channel_id for session in self.sessions.values()}
+        live_channels.update(self.registry.channels)
+        for channel_id in list(self.replay_buffers):
+            if channel_id not in live_channels:
+                del self.replay_buffers[channel_id]
+        for channel_id in list(self.channel_seq):
+            if channel_id not in live_channels:
+                del self.channel_seq[channel_id]
     
     def get_channel_users(self, channel_id: int) -> List[int]:
         """Get list of users currently connected to a channel.
@@ -126,9 +661,7 @@ class ConnectionManager:
         Returns:
             List of user IDs
         """
-        if channel_id in self.active_connections:
-            return list(self.active_connections[channel_id].keys())
-        return []
+        return list(self.registry.in_channel(channel_id))
     
     def is_user_online(self, user_id: int) -> bool:
         """Check if a user is online (connected to any channel).
@@ -139,7 +672,7 @@ class ConnectionManager:
         Returns:
             True if user is online, False otherwise
         """
-        return user_id in self.user_channels and len(self.user_channels[user_id]) > 0
+        return self.registry.has_user(user_id)
     
     def get_user_channels(self, user_id: int) -> Set[int]:
         """Get all channels a user is currently connected to.
@@ -150,4 +683,4 @@ class ConnectionManager:
         Returns:
             Set of channel IDs
         """
-        return self.user_channels.get(user_id, set())
+        return {connection.channel_id for connection in self.registry.for_user(user_id)}
@@ -0,0 +1,167 @@
+"""Compact registry of live WebSocket connections.
+
+Each connection is one slotted ``Connection`` record. It is indexed by
+channel (``{channel_id: {user_id: Connection}}``, needed for fan-out) and
+threaded onto intrusive doubly linked lists per user and per server, so the
+user and server indexes cost two pointers per connection instead of a set
+per user. Every add and remove is O(1).
+"""
+
+import time
+from typing import Dict, Iterator, Optional
+
+from fastapi import WebSocket
+
+
+class Connection:
+    """One live WebSocket: who it belongs to and where it is subscribed."""
+
+    __slots__ = (
+        "websocket", "user_id", "server_id", "channel_id", "session_id", "last_seen",
+        "user_prev", "user_next", "server_prev", "server_next",
+    )
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        server_id: int,
+        channel_id: int,
+        session_id: Optional[str] = None,
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.server_id = server_id
+        self.channel_id = channel_id
+        self.session_id = session_id
+        self.last_seen = time.monotonic()
+        self.user_prev: Optional[Connection] = None
+        self.user_next: Optional[Connection] = None
+        self.server_prev: Optional[Connection] = None
+        self.server_next: Optional[Connection] = None
+
+    def __repr__(self) -> str:
+        return (
+            f"Connection(user_id={self.user_id}, server_id={self.server_id}, "
+            f"channel_id={self.channel_id})"
+        )
+
+
+class ConnectionRegistry:
+    """Channel, user and server indexes over ``Connection`` records.
+
+    A user has at most one connection per channel; adding a second one
+    replaces the first.
+    """
+
+    def __init__(self):
+        # {channel_id: {user_id: Connection}}
+        self.channels: Dict[int, Dict[int, Connection]] = {}
+        # Heads of the per-user and per-server linked lists
+        self._users: Dict[int, Connection] = {}
+        self._servers: Dict[int, Connection] = {}
+        self._count = 0
+
+    def add(self, connection: Connection) -> Optional[Connection]:
+        """Register ``connection``.
+
+        Returns:
+            The connection it replaced (same user and channel), if any
+        """
+        members = self.channels.get(connection.channel_id)
+        if members is None:
+            members = self.channels[connection.channel_id] = {}
+        replaced = members.get(connection.user_id)
+        if replaced is not None:
+            self._unlink(replaced)
+        else:
+            self._count += 1
+        members[connection.user_id] = connection
+
+        head = self._users.get(connection.user_id)
+        connection.user_next = head
+        if head is not None:
+            head.user_prev = connection
+        self._users[connection.user_id] = connection
+
+        head = self._servers.get(connection.server_id)
+        connection.server_next = head
+        if head is not None:
+            head.server_prev = connection
+        self._servers[connection.server_id] = connection
+        return replaced
+
+    def remove(self, connection: Connection) -> bool:
+        """Unregister ``connection``.
+
+        Returns:
+            False if it was not registered (already removed or replaced)
+        """
+        members = self.channels.get(connection.channel_id)
+        if members is None or members.get(connection.user_id) is not connection:
+            return False
+        del members[connection.user_id]
+        if not members:
+            del self.channels[connection.channel_id]
+        self._unlink(connection)
+        self._count -= 1
+        return True
+
+    def _unlink(self, connection: Connection):
+        """Take ``connection`` off the user and server lists."""
+        if connection.user_prev is not None:
+            connection.user_prev.user_next = connection.user_next
+        elif self._users.get(connection.user_id) is connection:
+            if connection.user_next is not None:
+                self._users[connection.user_id] = connection.user_next
+            else:
+                del self._users[connection.user_id]
+        if connection.user_next is not None:
+            connection.user_next.user_prev = connection.user_prev
+
+        if connection.server_prev is not None:
+            connection.server_prev.server_next = connection.server_next
+        elif self._servers.get(connection.server_id) is connection:
+            if connection.server_next is not None:
+                self._servers[connection.server_id] = connection.server_next
+            else:
+                del self._servers[connection.server_id]
+        if connection.server_next is not None:
+            connection.server_next.server_prev = connection.server_prev
+
+        connection.user_prev = connection.user_next = None
+        connection.server_prev = connection.server_next = None
+
+    def get(self, channel_id: int, user_id: int) -> Optional[Connection]:
+        """Get a user's connection to a channel."""
+        members = self.channels.get(channel_id)
+        return members.get(user_id) if members else None
+
+    def in_channel(self, channel_id: int) -> Dict[int, Connection]:
+        """Connections subscribed to a channel, keyed by user ID (do not mutate)."""
+        return self.channels.get(channel_id) or {}
+
+    def for_user(self, user_id: int) -> Iterator[Connection]:
+        """Iterate a user's connections (take a ``list()`` before removing any)."""
+        connection = self._users.get(user_id)
+        while connection is not None:
+            yield connection
+            connection = connection.user_next
+
+    def for_server(self, server_id: int) -> Iterator[Connection]:
+        """Iterate connections to any channel of a server (``list()`` before removing)."""
+        connection = self._servers.get(server_id)
+        while connection is not None:
+            yield connection
+            connection = connection.server_next
+
+    def has_user(self, user_id: int) -> bool:
+        """Check whether a user has any connection."""
+        return user_id in self._users
+
+    def __iter__(self) -> Iterator[Connection]:
+        for members in list(self.channels.values()):
+            yield from list(members.values())
+
+    def __len__(self) -> int:
+        return self._count
@@ -0,0 +1,4 @@
+"""Performance benchmarks for the Discord Clone backend.
+
+Run from the ``backend`` directory, e.g. ``python -m benchmarks.bench_serialization``.
+"""
@@ -0,0 +1,100 @@
+"""Benchmark per-request JWT authentication overhead.
+
+Times token verification alone and the full ``get_current_user`` dependency
+(verification plus the user lookup) for each combination of JWT backend and
+verified-token cache, so the before (python-jose, no cache) and after
+numbers come from one run.
+
+Usage:
+    python -m benchmarks.bench_auth [--iterations 20000] [--tokens 1000]
+"""
+
+import argparse
+import json
+import time
+
+from datetime import timedelta
+
+from app.config import settings
+from app.dependencies import get_current_user
+from app.utils.revocation import RevocationList
+from app.utils.security import AccessTokens, JoseBackend, NativeBackend, TokenCache
+
+from .common import create_bench_engine, seed_dataset
+
+
+def measure(func, tokens, iterations: int) -> float:
+    """Call ``func`` on ``tokens`` round-robin and return microseconds per call."""
+    started = time.perf_counter()
+    for i in range(iterations):
+        func(tokens[i % len(tokens)])
+    return round((time.perf_counter() - started) / iterations * 1_000_000, 2)
+
+
+def main() -> None:
+    """Run the benchmark and print a JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--tokens", type=int, default=1000, help="distinct live tokens")
+    args = parser.parse_args()
+
+    engine, session_factory = create_bench_engine()
+    user_id = seed_dataset(session_factory, users=1, bcrypt_rounds=4)["user_ids"][0]
+    db = session_factory()
+
+    def access_tokens(backend, cache_size: int) -> AccessTokens:
+        return AccessTokens(
+            backend,
+            settings.SECRET_KEY,
+            settings.ALGORITHM,
+            timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+            TokenCache(cache_size),
+            RevocationList(),
+        )
+
+    tokens = [
+        access_tokens(JoseBackend(), 0).create_access_token({"sub": str(user_id), "n": i})
+        for i in range(args.tokens)
+    ]
+
+    variants = {
+        "jose": (JoseBackend(), 0),
+        "jose+cache": (JoseBackend(), args.tokens),
+        "native": (NativeBackend(settings.ALGORITHM), 0),
+        "native+cache": (NativeBackend(settings.ALGORITHM), args.tokens),
+    }
+    report = {"iterations": args.iterations, "tokens": args.tokens, "us_per_call": {}}
+    try:
+        for name, (backend, cache_size) in variants.items():
+            service = access_tokens(backend, cache_size)
+
+            def authenticate(token: str):
+                # The dependency never awaits anything, so drive the coroutine by hand
+                coroutine = get_current_user(token, db, service)
+                try:
+                    coroutine.send(None)
+                except StopIteration:
+                    pass
+
+            # Warm the cache (and SQLAlchemy's statement cache) first
+            for token in tokens:
+                service.decode_access_token(token)
+                authenticate(token)
+            report["us_per_call"][name] = {
+                "decode_access_token": measure(service.decode_access_token, tokens, args.iterations),
+                "get_current_user": measure(authenticate, tokens, args.iterations),
+            }
+    finally:
+        db.close()
+        engine.dispose()
+
+    baseline = report["us_per_call"]["jose"]["decode_access_token"]
+    report["decode_speedup"] = {
+        name: round(baseline / timings["decode_access_token"], 1)
+        for name, timings in report["us_per_call"].items()
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
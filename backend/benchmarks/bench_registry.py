@@ -0,0 +1,98 @@
+"""Benchmark memory and speed of the WebSocket connection registry.
+
+Registers N synthetic connections spread over servers and channels with
+``ConnectionManager`` and reports bytes per connection (tracemalloc, socket
+stand-ins excluded) plus connect, lookup and disconnect throughput.
+
+Usage:
+    python -m benchmarks.bench_registry [--connections 100000] [--channels 1000]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import time
+import tracemalloc
+
+from app.websocket.manager import ConnectionManager
+
+
+class _NullSocket:
+    """WebSocket stand-in that discards everything."""
+
+    __slots__ = ()
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message: dict):
+        pass
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+
+async def run(connections: int, channels: int, servers: int, users: int) -> dict:
+    """Fill a registry, measure it, then tear it down."""
+    manager = ConnectionManager()
+    sockets = [_NullSocket() for _ in range(connections)]
+    plan = []
+    for i in range(connections):
+        # Shift the channel each time user ids wrap, so (user, channel) pairs stay unique
+        channel = (i + i // users) % channels
+        plan.append((sockets[i], i % users + 1, channel % servers + 1, channel + 1))
+
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    for websocket, user_id, server_id, channel_id in plan:
+        await manager.connect(websocket, user_id, server_id, channel_id)
+    connect_elapsed = time.perf_counter() - started
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    assert len(manager.registry) == connections, "duplicate (user, channel) pairs in plan"
+
+    started = time.perf_counter()
+    for channel_id in range(1, channels + 1):
+        manager.get_channel_users(channel_id)
+    for user_id in range(1, users + 1):
+        manager.get_user_channels(user_id)
+    lookup_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for websocket, user_id, server_id, channel_id in plan:
+        manager.disconnect(websocket, user_id, server_id, channel_id)
+    disconnect_elapsed = time.perf_counter() - started
+
+    return {
+        "connections": connections,
+        "channels": channels,
+        "servers": servers,
+        "users": users,
+        "registry_bytes": used,
+        "bytes_per_connection": round(used / connections, 1),
+        "connect_per_s": round(connections / connect_elapsed),
+        "lookups_per_s": round((channels + users) / lookup_elapsed),
+        "disconnect_per_s": round(connections / disconnect_elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the WebSocket connection registry")
+    parser.add_argument("--connections", type=int, default=100_000)
+    parser.add_argument("--channels", type=int, default=1000)
+    parser.add_argument("--servers", type=int, default=100)
+    parser.add_argument("--users", type=int, help="distinct users (default: one per connection)")
+    args = parser.parse_args()
+
+    logging.getLogger("app").setLevel(logging.WARNING)
+    result = asyncio.run(run(args.connections, args.channels, args.servers, args.users or args.connections))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Benchmark bytes-on-wire and serialization CPU for history endpoints.
+
+Measures ``GET /messages/channels/{id}/messages`` (100 messages) and
+``GET /servers/{id}/members`` with every supported ``Accept-Encoding`` and
+compares rendering the same payload through ``JSONResponse`` and
+``ORJSONResponse``.
+
+Usage:
+    python -m benchmarks.bench_serialization [--members 500] [--iterations 200]
+"""
+
+import argparse
+import json
+import logging
+import time
+from typing import Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.database import get_db
+from app.main import create_app
+from app.middleware.compression import available_encodings
+
+from .common import create_bench_engine, seed_dataset
+
+
+def measure_endpoint(client: TestClient, url: str, headers: dict, iterations: int) -> List[dict]:
+    """Fetch ``url`` once per encoding and time repeated requests."""
+    results = []
+    for encoding in ["identity"] + available_encodings():
+        request_headers = dict(headers, **{"Accept-Encoding": encoding})
+        # httpx transparently decodes gzip/br; read the raw stream for wire size
+        with client.stream("GET", url, headers=request_headers) as raw:
+            wire_bytes = sum(len(chunk) for chunk in raw.iter_raw())
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            client.get(url, headers=request_headers)
+        elapsed = time.perf_counter() - start
+
+        results.append({
+            "encoding": encoding,
+            "bytes_on_wire": wire_bytes,
+            "requests_per_sec": round(iterations / elapsed, 1),
+            "ms_per_request": round(elapsed / iterations * 1000, 3),
+        })
+    return results
+
+
+def measure_render(payload, iterations: int) -> Dict[str, float]:
+    """Compare CPU time spent rendering ``payload`` with each response class."""
+    results = {}
+    for response_class in (JSONResponse, ORJSONResponse):
+        start = time.process_time()
+        for _ in range(iterations):
+            response_class(payload)
+        elapsed = time.process_time() - start
+        results[response_class.__name__] = round(elapsed / iterations * 1_000_000, 1)
+    return results
+
+
+def main() -> None:
+    """Run the benchmark and print a JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    engine, session_factory = create_bench_engine()
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    dataset = seed_dataset(
+        session_factory, args.members, messages_per_channel=args.messages, bcrypt_rounds=4
+    )
+    ids = {
+        "user_id": dataset["user_ids"][0],
+        "server_id": dataset["server_ids"][0],
+        "channel_id": dataset["channel_ids"][0],
+    }
+    app = create_app(Settings(SCHEDULER_TICK_SECONDS=0, DRAIN_ON_SIGTERM=False, RATE_LIMIT_ENABLED=False))
+    app.dependency_overrides[get_db] = override_get_db
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {app.state.tokens.create_access_token({'sub': str(ids['user_id'])})}"}
+
+    endpoints = {
+        "get_messages": f"/messages/channels/{ids['channel_id']}/messages?limit=100",
+        "get_server_members": f"/servers/{ids['server_id']}/members",
+    }
+
+    report = {"members": args.members, "messages": args.messages, "endpoints": {}}
+    for name, url in endpoints.items():
+        payload = jsonable_encoder(client.get(url, headers=headers).json())
+        report["endpoints"][name] = {
+            "wire": measure_endpoint(client, url, headers, args.iterations),
+            "render_us_per_response": measure_render(payload, args.iterations),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark server creation throughput.
+
+Creates servers through the ``create_server`` route (one flushed
+transaction) and through the previous flow (commit the server, refresh it,
+then commit the owner and channels) on the same database, and reports
+servers created per second for each, with the default single channel and
+with a multi-channel template.
+
+Usage:
+    python -m benchmarks.bench_servers [--servers 2000] [--channels 5] [--url sqlite:///bench.db]
+"""
+
+import argparse
+import json
+import time
+
+from app.models import Channel, MemberRole, Server, ServerMember, User
+from app.routes.servers import DEFAULT_CHANNELS, create_server
+from app.schemas import ChannelCreate, ServerCreate, ServerResponse
+
+from .common import create_bench_engine, seed_dataset
+
+
+def create_server_two_commits(server_data: ServerCreate, db, current_user: User):
+    """The flow ``create_server`` used before it became one transaction."""
+    new_server = Server(
+        name=server_data.name,
+        description=server_data.description,
+        owner_id=current_user.id
+    )
+    db.add(new_server)
+    db.commit()
+    db.refresh(new_server)
+
+    db.add(ServerMember(server_id=new_server.id, user_id=current_user.id, role=MemberRole.OWNER))
+    for channel in server_data.channels or DEFAULT_CHANNELS:
+        db.add(Channel(server_id=new_server.id, name=channel.name, description=channel.description))
+    db.commit()
+    return ServerResponse.model_validate(new_server)
+
+
+def create_server_single_flush(server_data: ServerCreate, db, current_user: User):
+    # The route never awaits anything, so drive the coroutine by hand
+    coroutine = create_server(server_data, db, current_user)
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+
+
+def measure(func, requests, session_factory, user_id: int) -> float:
+    """Create one server per request, each in its own session like the app, and return servers per second."""
+    started = time.perf_counter()
+    for server_data in requests:
+        with session_factory() as db:
+            func(server_data, db, db.get(User, user_id))
+    return round(len(requests) / (time.perf_counter() - started), 1)
+
+
+def main() -> None:
+    """Run the benchmark and print a JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--servers", type=int, default=2000, help="servers created per variant")
+    parser.add_argument("--channels", type=int, default=5, help="channels in the template")
+    parser.add_argument("--url", default="sqlite://", help="database URL (in memory by default)")
+    args = parser.parse_args()
+
+    engine, session_factory = create_bench_engine(args.url)
+    user_id = seed_dataset(session_factory, users=1, bcrypt_rounds=4)["user_ids"][0]
+    template = [ChannelCreate(name=f"channel-{i}") for i in range(args.channels)]
+    shapes = {
+        "default": lambda i: ServerCreate(name=f"Server {i}"),
+        "template": lambda i: ServerCreate(name=f"Server {i}", channels=template),
+    }
+    variants = {"two_commits": create_server_two_commits, "single_flush": create_server_single_flush}
+
+    report = {"servers": args.servers, "template_channels": args.channels, "servers_per_second": {}}
+    try:
+        for shape, build in shapes.items():
+            requests = [build(i) for i in range(args.servers)]
+            # Warm SQLAlchemy's statement cache for both flows first
+            for func in variants.values():
+                measure(func, requests[:10], session_factory, user_id)
+            report["servers_per_second"][shape] = {
+                name: measure(func, requests, session_factory, user_id) for name, func in variants.items()
+            }
+    finally:
+        engine.dispose()
+
+    report["speedup"] = {
+        shape: round(rates["single_flush"] / rates["two_commits"], 2)
+        for shape, rates in report["servers_per_second"].items()
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Cold start profile of the application, checked against a time budget.
+
+Starts fresh interpreters and reports, as medians over ``--runs``:
+
+- ``import``: ``import app.main`` (FastAPI, SQLAlchemy, models, routers)
+- ``startup``: the startup event (schema check, revocation sync, scheduler)
+- ``first_request``: the first ``GET /health``
+- ``cold_start``: the three together, which is what the budget applies to
+
+once against an empty database (tables created and stamped) and once
+against a stamped one (the usual restart), plus an import-time breakdown
+from ``python -X importtime``, by top-level package and by ``app`` module.
+Exits with status 1 if the stamped cold start is over ``--budget-ms``.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 5] [--budget-ms 2500] [--top 10]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+# Runs in a fresh interpreter; the test client's own import is timed apart
+# so that it does not count as application startup
+PHASES = """
+import json, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+client_imported = time.perf_counter()
+with TestClient(app) as client:
+    ready = time.perf_counter()
+    assert client.get("/health").status_code == 200
+    answered = time.perf_counter()
+print(json.dumps({
+    "import": (imported - started) * 1000,
+    "startup": (ready - client_imported) * 1000,
+    "first_request": (answered - ready) * 1000,
+}))
+"""
+
+
+def child_env(database_url: str) -> Dict[str, str]:
+    """Environment for a measured interpreter: its own database, quiet logs, no background jobs."""
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": database_url,
+        "LOG_LEVEL": "WARNING",
+        "SCHEDULER_TICK_SECONDS": "0",
+        "DRAIN_ON_SIGTERM": "false",
+    })
+    return env
+
+
+def measure_phases(database_url: str) -> Dict[str, float]:
+    """Time one cold start in a new interpreter, in milliseconds per phase."""
+    result = subprocess.run(
+        [sys.executable, "-c", PHASES], env=child_env(database_url), capture_output=True, text=True, check=True
+    )
+    phases = json.loads(result.stdout.strip().splitlines()[-1])
+    phases["cold_start"] = phases["import"] + phases["startup"] + phases["first_request"]
+    return phases
+
+
+def parse_importtime(output: str) -> Dict[str, float]:
+    """Self time in milliseconds per module from ``-X importtime`` output."""
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(self_us) / 1000
+    return modules
+
+
+def group_imports(modules: Dict[str, float], top: int) -> dict:
+    """Sum self times by top-level package, and list the slowest ``app`` modules."""
+    packages = defaultdict(float)
+    for name, self_ms in modules.items():
+        packages[name.split(".")[0]] += self_ms
+    app_modules = {name: self_ms for name, self_ms in modules.items() if name.split(".")[0] == "app"}
+
+    def slowest(times: Dict[str, float]) -> Dict[str, float]:
+        ranked = sorted(times.items(), key=lambda item: item[1], reverse=True)[:top]
+        return {name: round(value, 1) for name, value in ranked}
+
+    return {
+        "total": round(sum(modules.values()), 1),
+        "by_package": slowest(packages),
+        "app_modules": slowest(app_modules),
+    }
+
+
+def measure_imports(database_url: str) -> Dict[str, float]:
+    """Self time per module of ``import app.main`` in a new interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=child_env(database_url), capture_output=True, text=True, check=True
+    )
+    return parse_importtime(result.stderr)
+
+
+def median_phases(samples: List[Dict[str, float]]) -> Dict[str, float]:
+    return {phase: round(statistics.median(sample[phase] for sample in samples), 1) for phase in samples[0]}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the profile, print a JSON report and return the exit status."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="interpreters started per measurement")
+    parser.add_argument("--budget-ms", type=float, default=2500, help="stamped cold start budget")
+    parser.add_argument("--top", type=int, default=10, help="entries per import breakdown")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        fresh = []
+        for run in range(args.runs):
+            fresh.append(measure_phases(f"sqlite:///{os.path.join(directory, f'fresh{run}.db')}"))
+        stamped_url = f"sqlite:///{os.path.join(directory, 'stamped.db')}"
+        measure_phases(stamped_url)
+        stamped = [measure_phases(stamped_url) for _ in range(args.runs)]
+        imports = [measure_imports(stamped_url) for _ in range(args.runs)]
+
+    # Median self time per module across runs
+    names = set().union(*imports)
+    modules = {name: statistics.median(sample.get(name, 0.0) for sample in imports) for name in names}
+    report = {
+        "runs": args.runs,
+        "phases_ms": {"fresh_database": median_phases(fresh), "stamped_database": median_phases(stamped)},
+        "imports_ms": group_imports(modules, args.top),
+        "budget_ms": args.budget_ms,
+    }
+    cold_start = report["phases_ms"]["stamped_database"]["cold_start"]
+    report["within_budget"] = cold_start <= args.budget_ms
+    print(json.dumps(report, indent=2))
+    if not report["within_budget"]:
+        print(f"Cold start {cold_start:.0f} ms is over the {args.budget_ms:.0f} ms budget", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
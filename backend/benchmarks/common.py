@@ -0,0 +1,156 @@
+"""Shared helpers for benchmarks: isolated databases, seeding and statistics."""
+
+import math
+import time
+from typing import Dict, List, Sequence
+
+import bcrypt
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models import Channel, MemberRole, Message, Server, ServerMember, User, UserStatus
+
+BENCH_PASSWORD = "benchpass123"
+
+
+def create_bench_engine(url: str = "sqlite://", pool_size: int = 5):
+    """Create an engine with all tables, in memory unless ``url`` says otherwise.
+
+    Args:
+        url: Database URL
+        pool_size: Connections to keep; must cover the benchmark concurrency,
+            because sessions hold their connection across awaits and a
+            blocking pool checkout on the event loop would stall every request
+
+    Returns:
+        Tuple of (engine, session factory)
+    """
+    if url == "sqlite://":
+        engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    elif url.startswith("sqlite"):
+        engine = create_engine(
+            url, connect_args={"check_same_thread": False}, pool_size=pool_size, max_overflow=0
+        )
+    else:
+        engine = create_engine(url, pool_size=pool_size, max_overflow=0)
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def seed_dataset(
+    session_factory,
+    users: int,
+    servers: int = 1,
+    channels_per_server: int = 1,
+    messages_per_channel: int = 0,
+    bcrypt_rounds: int = 12,
+) -> Dict[str, List[int]]:
+    """Bulk-insert a synthetic dataset.
+
+    Every user joins every server; the first user owns them all. All users
+    share one password hash (``BENCH_PASSWORD``) so seeding stays fast while
+    logins still pay the full bcrypt cost.
+
+    Returns:
+        Dict with ``user_ids``, ``usernames``, ``server_ids`` and ``channel_ids``
+    """
+    password_hash = bcrypt.hashpw(
+        BENCH_PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds=bcrypt_rounds)
+    ).decode("utf-8")
+    usernames = [f"bench{i}" for i in range(users)]
+
+    db = session_factory()
+    try:
+        db.execute(insert(User), [
+            {
+                "username": name,
+                "email": f"{name}@example.com",
+                "password_hash": password_hash,
+                "status": UserStatus.OFFLINE,
+            }
+            for name in usernames
+        ])
+        user_ids = list(db.scalars(select(User.id).order_by(User.id)))
+
+        db.execute(insert(Server), [
+            {"name": f"Bench {i}", "description": "Benchmark server", "owner_id": user_ids[0]}
+            for i in range(servers)
+        ])
+        server_ids = list(db.scalars(select(Server.id).order_by(Server.id)))
+
+        db.execute(insert(ServerMember), [
+            {
+                "server_id": server_id,
+                "user_id": user_id,
+                "role": MemberRole.OWNER if user_id == user_ids[0] else MemberRole.MEMBER,
+            }
+            for server_id in server_ids
+            for user_id in user_ids
+        ])
+
+        db.execute(insert(Channel), [
+            {"server_id": server_id, "name": f"channel-{i}"}
+            for server_id in server_ids
+            for i in range(channels_per_server)
+        ])
+        channel_ids = list(db.scalars(select(Channel.id).order_by(Channel.id)))
+
+        if messages_per_channel:
+            for channel_id in channel_ids:
+                db.execute(insert(Message), [
+                    {
+                        "channel_id": channel_id,
+                        "user_id": user_ids[i % len(user_ids)],
+                        "content": f"Benchmark message number {i} with some typical chat text in it",
+                        "is_edited": False,
+                    }
+                    for i in range(messages_per_channel)
+                ])
+        db.commit()
+    finally:
+        db.close()
+
+    return {
+        "user_ids": user_ids,
+        "usernames": usernames,
+        "server_ids": server_ids,
+        "channel_ids": channel_ids,
+    }
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(name: str, latencies: List[float], errors: int, elapsed: float) -> dict:
+    """Summarize latencies (seconds) into a JSON-friendly report entry."""
+    latencies = sorted(latencies)
+    total = len(latencies) + errors
+    return {
+        "workload": name,
+        "requests": total,
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+class Timer:
+    """Context manager measuring wall time with ``perf_counter``."""
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        return False
@@ -0,0 +1,361 @@
+"""Reproducible load test for the REST and WebSocket hot paths.
+
+Seeds a database with N users, servers, channels and messages, then drives
+concurrent workloads and reports throughput and p50/p95/p99 latency as JSON:
+
+- ``login``: login storm against ``POST /auth/login`` (bcrypt bound)
+- ``history``: random history pages from ``GET /messages/channels/{id}/messages``
+- ``send``: ``POST /messages/channels/{id}/messages``
+- ``ws_fanout``: one broadcast delivered to K subscribers of a channel
+
+By default the app runs in-process (httpx ASGI transport, WebSocket fan-out
+through ``ConnectionManager`` with in-memory sockets). With ``--url`` the same
+workloads hit a running server; ``--database`` must then point at that
+server's database so it can be seeded.
+
+Usage:
+    python -m benchmarks.loadtest --users 200 --requests 1000 --concurrency 50
+    python -m benchmarks.loadtest --output result.json
+    python -m benchmarks.loadtest --baseline result.json --tolerance 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from app.config import Settings, settings
+from app.database import get_db
+from app.main import create_app
+from app.utils.revocation import RevocationList
+from app.utils.security import create_access_tokens
+from app.websocket.manager import ConnectionManager
+
+from .common import BENCH_PASSWORD, Timer, create_bench_engine, seed_dataset, summarize
+
+WORKLOADS = ("login", "history", "send", "ws_fanout")
+
+
+async def run_workload(
+    name: str,
+    operation: Callable[[int], Awaitable[bool]],
+    total: int,
+    concurrency: int,
+) -> dict:
+    """Run ``operation`` ``total`` times across ``concurrency`` workers.
+
+    Args:
+        name: Workload name for the report
+        operation: Coroutine function returning True on success
+        total: Number of operations
+        concurrency: Number of concurrent workers
+
+    Returns:
+        Summary dict with throughput and latency percentiles
+    """
+    latencies: List[float] = []
+    errors = 0
+    pending = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in pending:
+            started = time.perf_counter()
+            try:
+                ok = await operation(i)
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    with Timer() as timer:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(name, latencies, errors, timer.elapsed)
+
+
+class _BenchSocket:
+    """In-memory WebSocket stand-in that timestamps deliveries."""
+
+    def __init__(self, deliveries: List[float]):
+        self.deliveries = deliveries
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message: dict):
+        self.deliveries.append(time.perf_counter())
+
+    async def send_text(self, text: str):
+        self.deliveries.append(time.perf_counter())
+
+
+async def ws_fanout_in_process(subscribers: int, messages: int) -> dict:
+    """Measure broadcast fan-out through ConnectionManager with K sockets."""
+    manager = ConnectionManager()
+    deliveries: List[float] = []
+    for user_id in range(1, subscribers + 1):
+        await manager.connect(_BenchSocket(deliveries), user_id, 1, 1)
+
+    latencies = []
+    with Timer() as timer:
+        for i in range(messages):
+            deliveries.clear()
+            started = time.perf_counter()
+            await manager.broadcast({"type": "message", "data": {"content": f"fanout {i}"}}, 1)
+            if len(deliveries) == subscribers:
+                latencies.append(deliveries[-1] - started)
+    result = summarize("ws_fanout", latencies, messages - len(latencies), timer.elapsed)
+    result["subscribers"] = subscribers
+    return result
+
+
+async def ws_fanout_remote(
+    url: str, tokens: Dict[int, str], user_ids: List[int], server_id: int, channel_id: int,
+    subscribers: int, messages: int
+) -> dict:
+    """Measure fan-out latency against a running server with real sockets."""
+    import websockets
+
+    ws_base = url.replace("http://", "ws://").replace("https://", "wss://")
+
+    def socket_url(user_id: int) -> str:
+        token = tokens[user_id]
+        return f"{ws_base}/ws/{user_id}/{server_id}/{channel_id}?token={token}"
+
+    receivers = [await websockets.connect(socket_url(uid)) for uid in user_ids[1:subscribers + 1]]
+    sender = await websockets.connect(socket_url(user_ids[0]))
+
+    async def wait_for(socket, marker: str) -> float:
+        while True:
+            frame = json.loads(await socket.recv())
+            if frame.get("type") == "message" and frame["data"].get("marker") == marker:
+                return time.perf_counter()
+
+    latencies = []
+    errors = 0
+    try:
+        with Timer() as timer:
+            for i in range(messages):
+                marker = f"fanout-{i}"
+                started = time.perf_counter()
+                await sender.send(json.dumps({"content": marker, "marker": marker}))
+                try:
+                    arrivals = await asyncio.wait_for(
+                        asyncio.gather(*(wait_for(r, marker) for r in receivers)), timeout=10
+                    )
+                    latencies.append(max(arrivals) - started)
+                except asyncio.TimeoutError:
+                    errors += 1
+    finally:
+        for socket in receivers + [sender]:
+            await socket.close()
+
+    result = summarize("ws_fanout", latencies, errors, timer.elapsed)
+    result["subscribers"] = len(receivers)
+    return result
+
+
+async def run_suite(options: argparse.Namespace) -> dict:
+    """Seed the database and run the selected workloads.
+
+    Returns:
+        Report dict with one entry per workload
+    """
+    database_url = options.database
+    temp_dir = None
+    if not database_url:
+        temp_dir = tempfile.TemporaryDirectory()
+        database_url = f"sqlite:///{os.path.join(temp_dir.name, 'loadtest.db')}"
+
+    engine, session_factory = create_bench_engine(database_url, pool_size=options.concurrency + 1)
+    dataset = seed_dataset(
+        session_factory,
+        users=options.users,
+        servers=options.servers,
+        channels_per_server=options.channels,
+        messages_per_channel=options.messages,
+        bcrypt_rounds=options.bcrypt_rounds,
+    )
+    rng = random.Random(options.seed)
+
+    if options.url:
+        client = httpx.AsyncClient(base_url=options.url, timeout=30)
+        # Signed with the environment's key, like the server's own tokens
+        access_tokens = create_access_tokens(settings, RevocationList())
+    else:
+        # A private application, so concurrent runs (and the test suite) share nothing with it
+        app = create_app(Settings(
+            DATABASE_URL=database_url, SCHEDULER_TICK_SECONDS=0, DRAIN_ON_SIGTERM=False, RATE_LIMIT_ENABLED=False
+        ))
+        access_tokens = app.state.tokens
+
+        def override_get_db():
+            # Sessions from the bench engine, whose pool covers the concurrency
+            db = session_factory()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = override_get_db
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    tokens = {uid: access_tokens.create_access_token({"sub": str(uid)}) for uid in dataset["user_ids"]}
+
+    def auth(user_id: int) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {tokens[user_id]}"}
+
+    async def login(_: int) -> bool:
+        username = rng.choice(dataset["usernames"])
+        response = await client.post(
+            "/auth/login", data={"username": username, "password": BENCH_PASSWORD}
+        )
+        return response.status_code == 200
+
+    async def history(_: int) -> bool:
+        channel_id = rng.choice(dataset["channel_ids"])
+        skip = rng.randrange(0, max(1, options.messages - 50))
+        response = await client.get(
+            f"/messages/channels/{channel_id}/messages?skip={skip}&limit=50",
+            headers=auth(rng.choice(dataset["user_ids"])),
+        )
+        return response.status_code == 200
+
+    async def send(i: int) -> bool:
+        channel_id = rng.choice(dataset["channel_ids"])
+        response = await client.post(
+            f"/messages/channels/{channel_id}/messages",
+            json={"content": f"load test message {i}"},
+            headers=auth(rng.choice(dataset["user_ids"])),
+        )
+        return response.status_code == 201
+
+    operations = {"login": login, "history": history, "send": send}
+    report = {
+        "config": {
+            "users": options.users,
+            "servers": options.servers,
+            "channels_per_server": options.channels,
+            "messages_per_channel": options.messages,
+            "requests": options.requests,
+            "concurrency": options.concurrency,
+            "target": options.url or "in-process",
+        },
+        "results": {},
+    }
+
+    try:
+        for name in options.workloads:
+            if name == "ws_fanout":
+                subscribers = min(options.subscribers, len(dataset["user_ids"]) - 1)
+                if options.url:
+                    result = await ws_fanout_remote(
+                        options.url, tokens, dataset["user_ids"], dataset["server_ids"][0],
+                        dataset["channel_ids"][0], subscribers, options.ws_messages,
+                    )
+                else:
+                    result = await ws_fanout_in_process(options.subscribers, options.ws_messages)
+            else:
+                total = options.login_requests if name == "login" else options.requests
+                result = await run_workload(name, operations[name], total, options.concurrency)
+            report["results"][name] = result
+    finally:
+        await client.aclose()
+        engine.dispose()
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    return report
+
+
+def find_regressions(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Compare a report against a baseline report.
+
+    A workload regresses when its p95 latency grows, or its throughput drops,
+    by more than ``tolerance`` (a fraction, e.g. 0.2 for 20%).
+
+    Returns:
+        Human-readable regression descriptions (empty if none)
+    """
+    regressions = []
+    for name, base in baseline.get("results", {}).items():
+        current = report["results"].get(name)
+        if current is None:
+            continue
+        if base["p95_ms"] and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {base['throughput_rps']} -> {current['throughput_rps']} req/s"
+            )
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {current['errors']}")
+    return regressions
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the command line parser."""
+    parser = argparse.ArgumentParser(description="Load test REST and WebSocket hot paths")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--servers", type=int, default=2)
+    parser.add_argument("--channels", type=int, default=5, help="channels per server")
+    parser.add_argument("--messages", type=int, default=500, help="messages per channel")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per REST workload")
+    parser.add_argument("--login-requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--subscribers", type=int, default=100, help="WebSocket fan-out width")
+    parser.add_argument("--ws-messages", type=int, default=200)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--workloads",
+        type=lambda value: [w.strip() for w in value.split(",") if w.strip()],
+        default=list(WORKLOADS),
+        help="comma-separated subset of: " + ", ".join(WORKLOADS),
+    )
+    parser.add_argument("--url", help="target a running server instead of the in-process app")
+    parser.add_argument("--database", help="database URL to seed (default: temporary SQLite)")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="fail if results regress against this report")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point."""
+    options = build_parser().parse_args(argv)
+    unknown = set(options.workloads) - set(WORKLOADS)
+    if unknown:
+        print(f"Unknown workloads: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 2
+
+    logging.getLogger("app").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    report = asyncio.run(run_suite(options))
+    output = json.dumps(report, indent=2)
+    print(output)
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as f:
+            f.write(output)
+
+    if options.baseline:
+        with open(options.baseline, encoding="utf-8") as f:
+            regressions = find_regressions(report, json.load(f), options.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
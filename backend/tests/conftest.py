@@ -0,0 +1,73 @@
+"""Shared pytest fixtures."""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.config import Settings
+from app.database import Base, init_db
+from app.main import create_app
+
+
+@pytest.fixture
+def session_factory():
+    """Session factory over a fresh in-memory database with all tables."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def isolated_app():
+    """Build applications with their own in-memory database and no background work.
+
+    Each call returns a new application; keyword arguments override settings.
+    Tests built on one never share a database, caches or rate limit buckets,
+    so modules can run in parallel (pytest-xdist).
+    """
+    def build(**overrides):
+        config = Settings(**{
+            "DATABASE_URL": "sqlite://",
+            "SCHEDULER_TICK_SECONDS": 0,
+            "DRAIN_ON_SIGTERM": False,
+            "WS_HEARTBEAT_INTERVAL_SECONDS": 0,
+            **overrides,
+        })
+        application = create_app(config)
+        init_db(application.state.engine)
+        return application
+
+    return build
+
+
+@pytest.fixture
+def app(isolated_app):
+    """Isolated application for one test."""
+    return isolated_app()
+
+
+@pytest.fixture
+def client(app):
+    """Test client for ``app``."""
+    return TestClient(app)
+
+
+@pytest.fixture
+def database(app):
+    """Session factory of ``app``'s database.
+
+    Modules seed it in their own fixtures and get the session factory back.
+    """
+    return app.state.session_factory
+
+
+@pytest.fixture
+def auth(app):
+    """Build ``Authorization`` headers with a token ``app`` accepts for a user id."""
+    def headers(user_id: int) -> dict:
+        return {"Authorization": f"Bearer {app.state.tokens.create_access_token({'sub': str(user_id)})}"}
+
+    return headers
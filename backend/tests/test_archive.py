@@ -0,0 +1,123 @@
+"""Tests for message retention and the archive tier."""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.archive import ArchiveStore, Archiver, read_history, set_policy
+from app.models import ArchiveSegment, Attachment, Channel, Message, Server, User
+
+NOW = datetime(2026, 1, 31, 12, 0, 0)
+
+
+@pytest.fixture
+def db(session_factory):
+    """Fresh in-memory database with one user, server and two channels."""
+    session = session_factory()
+    session.add(User(id=1, username="archiver", email="archiver@example.com", password_hash="x"))
+    session.add(Server(id=1, name="Archive", owner_id=1))
+    session.add_all([Channel(id=1, server_id=1, name="old"), Channel(id=2, server_id=1, name="quiet")])
+    # One message a day for 10 days in channel 1, oldest first
+    session.add_all([
+        Message(channel_id=1, user_id=1, content=f"day {age}", created_at=NOW - timedelta(days=age),
+                updated_at=NOW - timedelta(days=age))
+        for age in range(10, 0, -1)
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+def page_contents(db, store, skip, limit):
+    return [message.content for message in read_history(db, store, 1, skip, limit)]
+
+
+def test_archive_moves_old_messages_and_reads_stay_identical(db, tmp_path):
+    """Test that history pages are unchanged after rows move to segments."""
+    store = ArchiveStore(str(tmp_path))
+    pages = [(0, 4), (2, 5), (4, 4), (6, 4), (8, 4), (12, 4)]
+    before = [page_contents(db, store, skip, limit) for skip, limit in pages]
+
+    archiver = Archiver(store, archive_after_days=5, batch_size=2)
+    # Days 10..6 are older than the cutoff; day 5 is exactly on it and stays
+    assert archiver.run_once(db, now=NOW) == {"archived": 5, "deleted": 0}
+
+    assert db.query(Message).count() == 5
+    segments = db.query(ArchiveSegment).order_by(ArchiveSegment.first_id).all()
+    assert [segment.message_count for segment in segments] == [2, 2, 1]
+    assert (tmp_path / segments[0].path).exists()
+
+    assert [page_contents(db, store, skip, limit) for skip, limit in pages] == before
+    assert before[3] == ["day 10", "day 9", "day 8", "day 7"]
+    # A second pass finds nothing left to archive
+    assert archiver.run_once(db, now=NOW) == {"archived": 0, "deleted": 0}
+
+
+def test_channel_policy_overrides_server_policy(db, tmp_path):
+    """Test policy resolution and deletion across both tiers."""
+    store = ArchiveStore(str(tmp_path))
+    archiver = Archiver(store, archive_after_days=0, batch_size=2)
+    set_policy(db, archive_after_days=3, delete_after_days=None, server_id=1)
+    set_policy(db, archive_after_days=None, delete_after_days=8, channel_id=1)
+    db.commit()
+
+    assert archiver.plan(db) == [(1, 3, 8), (2, 3, 0)]
+    # Days 10..9 are deleted outright, days 8..4 archived as [8, 7], [6, 5], [4]
+    assert archiver.run_once(db, now=NOW) == {"archived": 5, "deleted": 2}
+    assert db.query(Message).count() == 3
+
+    # Two days later the delete cutoff is day 6: segment [8, 7] goes whole,
+    # [6, 5] stays until its newest message expires too
+    totals = archiver.run_once(db, now=NOW + timedelta(days=2))
+    assert totals["deleted"] == 2
+    assert page_contents(db, store, 0, 20)[0] == "day 6"
+
+
+def test_expired_messages_take_their_attachments(db, tmp_path):
+    """Test that expiry deletes the attachments of expired hot and archived messages only."""
+    ids = [message_id for message_id, in db.query(Message.id).order_by(Message.id)]
+    # Days 10, 8, 6 and 2 carry a file; one more is uploaded but not posted yet
+    posted = {age: ids[10 - age] for age in (10, 8, 6, 2)}
+    db.add_all([
+        Attachment(id=age, channel_id=1, uploader_id=1, message_id=message_id, filename=f"day{age}.txt",
+                   content_type="text/plain", size=1, sha256="0" * 64)
+        for age, message_id in posted.items()
+    ] + [Attachment(id=99, channel_id=1, uploader_id=1, filename="draft.txt", content_type="text/plain",
+                    size=1, sha256="0" * 64)])
+    db.commit()
+
+    archiver = Archiver(ArchiveStore(str(tmp_path)), archive_after_days=0, batch_size=2)
+    set_policy(db, archive_after_days=5, delete_after_days=9, channel_id=1)
+    db.commit()
+    # Day 10 expires while hot; days 9..6 move to segments [9, 8], [7, 6]
+    archiver.run_once(db, now=NOW)
+    assert sorted(attachment_id for attachment_id, in db.query(Attachment.id)) == [2, 6, 8, 99]
+
+    # Three days later segment [9, 8] expires whole, [7, 6] is still partly live
+    archiver.run_once(db, now=NOW + timedelta(days=3))
+    assert sorted(attachment_id for attachment_id, in db.query(Attachment.id)) == [2, 6, 99]
+
+
+def test_retention_endpoints_require_admin(client, database):
+    """Test reading and setting a server's policy over REST."""
+    client.post(
+        "/auth/register",
+        json={"username": "retention", "email": "retention@example.com", "password": "testpass123"}
+    )
+    token = client.post(
+        "/auth/login", data={"username": "retention", "password": "testpass123"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    server_id = client.post("/servers", json={"name": "Retained"}, headers=headers).json()["id"]
+
+    response = client.get(f"/servers/{server_id}/retention", headers=headers)
+    assert response.json()["archive_after_days"] is None
+
+    response = client.put(f"/servers/{server_id}/retention", json={"archive_after_days": 30}, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {
+        "archive_after_days": 30, "delete_after_days": None, "server_id": server_id, "channel_id": None
+    }
+
+    response = client.put(f"/servers/{server_id}/retention", json={"archive_after_days": 0}, headers=headers)
+    assert response.status_code == 422
@@ -0,0 +1,269 @@
+"""Tests for attachment uploads, storage, thumbnails and ranged downloads."""
+
+import asyncio
+import hashlib
+import io
+import os
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.attachments import LocalAttachmentStore, RangeFileResponse, ThumbnailWorker, parse_range, thumbnail_key
+from app.metrics import attachment_uploads_total
+from app.middleware.compression import CompressionMiddleware
+from app.models import Attachment, Channel, Server, ServerMember, User
+
+PAYLOAD = bytes(range(256)) * 1200  # 300 KiB
+
+
+@pytest.fixture
+def app(isolated_app, tmp_path):
+    """App storing attachments under ``tmp_path``; server 1 with owner 1, member 2 and channel 1; user 3 outside."""
+    application = isolated_app(
+        ATTACHMENT_DIR=str(tmp_path),
+        ATTACHMENT_MAX_BYTES=512 * 1024,
+        ATTACHMENT_WRITE_BUFFER_BYTES=64 * 1024,
+    )
+    with application.state.session_factory() as db:
+        db.add_all([
+            User(id=user_id, username=f"user{user_id}", email=f"user{user_id}@example.com", password_hash="x")
+            for user_id in (1, 2, 3)
+        ])
+        db.add(Server(id=1, name="Files", owner_id=1))
+        db.add_all([
+            ServerMember(server_id=1, user_id=1, role="owner"),
+            ServerMember(server_id=1, user_id=2, role="member"),
+        ])
+        db.add(Channel(id=1, server_id=1, name="general"))
+        db.commit()
+    return application
+
+
+def upload(client: TestClient, auth, content, user_id: int = 1, filename: str = "data.bin", content_type: str = None):
+    headers = auth(user_id)
+    if content_type:
+        headers["Content-Type"] = content_type
+    return client.post(f"/channels/1/attachments?filename={filename}", content=content, headers=headers)
+
+
+def test_uploads_are_streamed_to_content_addressed_blobs(app, auth, tmp_path):
+    """Test that identical uploads share one blob and oversize uploads leave nothing behind."""
+    client = TestClient(app)
+    before = {result: attachment_uploads_total.value(result) for result in ("stored", "deduplicated", "too_large")}
+
+    # Sent chunked, without a Content-Length
+    first = upload(client, auth, (PAYLOAD[i:i + 10_000] for i in range(0, len(PAYLOAD), 10_000)), filename="a.bin")
+    second = upload(client, auth, PAYLOAD, user_id=2, filename="..\\b.bin", content_type="application/x-thing")
+    assert first.status_code == second.status_code == 201
+    sha256 = hashlib.sha256(PAYLOAD).hexdigest()
+    assert first.json()["sha256"] == second.json()["sha256"] == sha256
+    assert first.json()["size"] == len(PAYLOAD) and first.json()["message_id"] is None
+    assert (second.json()["filename"], second.json()["content_type"]) == ("b.bin", "application/x-thing")
+    assert first.json()["content_type"] == "application/octet-stream"
+
+    blobs = [os.path.join(root, name) for root, _, names in os.walk(tmp_path / "blobs") for name in names]
+    assert [os.path.basename(path) for path in blobs] == [sha256]
+    with open(blobs[0], "rb") as blob:
+        assert blob.read() == PAYLOAD
+
+    # Over the limit, declared or only found out while streaming
+    assert upload(client, auth, b"x" * (512 * 1024 + 1)).status_code == 413
+    assert upload(client, auth, (b"x" * 65536 for _ in range(9))).status_code == 413
+    assert upload(client, auth, b"").status_code == 400
+    assert upload(client, auth, b"data", user_id=3).status_code == 403
+    assert os.listdir(tmp_path / "staging") == []
+    # Rejected uploads leave no blob behind
+    blobs = [name for _, _, names in os.walk(tmp_path / "blobs") for name in names]
+    assert blobs == [sha256]
+    assert {result: attachment_uploads_total.value(result) - count for result, count in before.items()} == {
+        "stored": 1, "deduplicated": 1, "too_large": 2
+    }
+
+
+def test_posted_attachments_come_with_their_messages(app, auth):
+    """Test posting attachments with a message, reading them back and who may fetch them."""
+    client = TestClient(app)
+    mine = upload(client, auth, b"report", filename="report.txt", content_type="text/plain").json()["id"]
+    theirs = upload(client, auth, b"draft", user_id=2).json()["id"]
+
+    response = client.post(
+        "/messages/channels/1/messages", json={"content": "see attached", "attachment_ids": [mine]}, headers=auth(1)
+    )
+    assert response.status_code == 201
+    message_id = response.json()["id"]
+    assert [(a["id"], a["message_id"], a["filename"]) for a in response.json()["attachments"]] == [
+        (mine, message_id, "report.txt")
+    ]
+    client.post("/messages/channels/1/messages", json={"content": "no files"}, headers=auth(1))
+    history = client.get("/messages/channels/1/messages", headers=auth(2)).json()
+    assert [len(message["attachments"]) for message in history] == [1, 0]
+
+    # Posted once, by its uploader only
+    for attachment_id in (mine, theirs):
+        response = client.post(
+            "/messages/channels/1/messages", json={"content": "again", "attachment_ids": [attachment_id]},
+            headers=auth(1)
+        )
+        assert response.status_code == 400
+
+    # Posted: every reader of the channel; unposted: the uploader alone
+    assert client.get(f"/attachments/{mine}", headers=auth(2)).content == b"report"
+    assert client.get(f"/attachments/{mine}", headers=auth(3)).status_code == 403
+    assert client.get(f"/attachments/{theirs}", headers=auth(1)).status_code == 404
+    assert client.get(f"/attachments/{theirs}", headers=auth(2)).status_code == 200
+
+    assert client.delete(f"/messages/messages/{message_id}", headers=auth(1)).status_code == 204
+    assert client.get(f"/attachments/{mine}", headers=auth(1)).status_code == 404
+
+
+def test_downloads_serve_byte_ranges(app, auth):
+    """Test single ranges, conditional requests and that ranged files are never re-encoded."""
+    client = TestClient(app)
+    attachment_id = upload(client, auth, PAYLOAD, filename="résumé.txt", content_type="text/plain").json()["id"]
+    with app.state.session_factory() as db:
+        db.query(Attachment).update({Attachment.message_id: 1})
+        db.commit()
+    url = f"/attachments/{attachment_id}"
+
+    full = client.get(url, headers={**auth(1), "Accept-Encoding": "gzip"})
+    assert full.status_code == 200 and full.content == PAYLOAD
+    assert "content-encoding" not in full.headers
+    assert full.headers["accept-ranges"] == "bytes"
+    assert full.headers["content-disposition"] == "attachment; filename*=utf-8''r%C3%A9sum%C3%A9.txt"
+    etag = full.headers["etag"]
+
+    last = len(PAYLOAD) - 1
+    cases = {"bytes=10-19": (10, 19), "bytes=-5": (last - 4, last), "bytes=300000-": (300000, last)}
+    for header, (start, end) in cases.items():
+        response = client.get(url, headers={**auth(1), "Range": header})
+        assert response.status_code == 206, header
+        assert response.headers["content-range"] == f"bytes {start}-{end}/{len(PAYLOAD)}"
+        assert response.content == PAYLOAD[start:end + 1]
+
+    response = client.get(url, headers={**auth(1), "Range": f"bytes={len(PAYLOAD)}-"})
+    assert response.status_code == 416 and response.headers["content-range"] == f"bytes */{len(PAYLOAD)}"
+    assert client.get(url, headers={**auth(1), "Range": "bytes=0-1,5-6"}).status_code == 200
+    assert client.get(url, headers={**auth(1), "If-None-Match": etag}).status_code == 304
+    assert client.get(url, headers={**auth(1), "Range": "bytes=0-9", "If-Range": etag}).status_code == 206
+    assert client.get(url, headers={**auth(1), "Range": "bytes=0-9", "If-Range": '"stale"'}).status_code == 200
+
+    assert parse_range("bytes=5-3", 10) is None and parse_range("items=0-1", 10) is None
+    assert parse_range("bytes=0-99", 10) == (0, 9)
+
+
+def test_zero_copy_send_is_used_when_the_server_offers_it(tmp_path):
+    """Test that ranges go out as one zero-copy message, whole files as a path send, through compression too."""
+    store = LocalAttachmentStore(str(tmp_path))
+    store.put("blobs/aa/bb/file", PAYLOAD)
+
+    async def serve(extensions: dict, range_header: str = None):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        response = RangeFileResponse(
+            store, "blobs/aa/bb/file", len(PAYLOAD), "image/png", "aa", range_header=range_header
+        )
+        middleware = CompressionMiddleware(response, minimum_size=0)
+        scope = {
+            "type": "http", "method": "GET", "extensions": extensions,
+            "headers": [(b"accept-encoding", b"gzip")],
+        }
+        await middleware(scope, None, send)
+        return sent
+
+    sent = asyncio.run(serve({"http.response.zerocopysend": {}}, "bytes=100-199"))
+    assert [message["type"] for message in sent] == ["http.response.start", "http.response.zerocopysend"]
+    assert (sent[0]["status"], sent[1]["offset"], sent[1]["count"]) == (206, 100, 100)
+    assert sent[1]["file"].name == store.path_for("blobs/aa/bb/file") and sent[1]["file"].closed
+
+    sent = asyncio.run(serve({"http.response.pathsend": {}}))
+    assert sent[1] == {"type": "http.response.pathsend", "path": os.path.abspath(store.path_for("blobs/aa/bb/file"))}
+
+    sent = asyncio.run(serve({}))
+    assert b"".join(message["body"] for message in sent[1:]) == PAYLOAD
+    assert len(sent) == 3  # two 256 KiB reads
+
+
+def test_thumbnails_render_once_per_content(app, auth):
+    """Test that the worker pool renders an image once and every upload of it gets the thumbnail."""
+    renders = []
+
+    def fake_render(source, size):
+        renders.append(source.read())
+        return b"webp-" + str(size).encode(), 640, 480
+
+    thumbnails = app.state.thumbnails
+    thumbnails.render = fake_render
+    with TestClient(app) as client:
+        uploads = [
+            upload(client, auth, b"\x89PNG image", user_id=user_id, filename="cat.png", content_type="image/png").json()
+            for user_id in (1, 2, 1)
+        ]
+        document = upload(client, auth, b"%PDF", filename="doc.pdf", content_type="application/pdf").json()
+        client.portal.call(thumbnails.join)
+
+        assert renders == [b"\x89PNG image"]
+        assert [item["thumbnail_status"] for item in uploads] == ["pending"] * 3
+        assert document["thumbnail_status"] == "none"
+        first, second = uploads[0]["id"], uploads[1]["id"]
+        with app.state.session_factory() as db:
+            rows = db.query(Attachment).filter(Attachment.id.in_([item["id"] for item in uploads])).all()
+            assert {(row.thumbnail_status, row.width, row.height) for row in rows} == {("ready", 640, 480)}
+        response = client.get(f"/attachments/{first}/thumbnail", headers=auth(1))
+        assert response.status_code == 200 and response.content == b"webp-256"
+        assert response.headers["content-type"] == "image/webp"
+        assert client.get(f"/attachments/{second}/thumbnail", headers=auth(1)).status_code == 404  # unposted
+        assert client.get(f"/attachments/{document['id']}/thumbnail", headers=auth(1)).status_code == 404
+
+
+def test_a_full_thumbnail_queue_fails_uploads_off_the_event_loop(app, auth):
+    """Test that an upload finding the queue full is marked failed without a database commit on the loop."""
+    release = threading.Event()
+    finished_on = []
+    thumbnails = app.state.thumbnails
+    thumbnails.workers, thumbnails.queue_size = 1, 1
+    finish = thumbnails._finish
+
+    def slow_render(source, size):
+        release.wait(5)
+        return b"webp", 1, 1
+
+    def recording_finish(sha256, status, width, height):
+        finished_on.append((status, threading.get_ident()))
+        finish(sha256, status, width, height)
+
+    thumbnails.render = slow_render
+    thumbnails._finish = recording_finish
+    with TestClient(app) as client:
+        loop_thread = client.portal.call(threading.get_ident)
+        statuses = [
+            upload(client, auth, b"\x89PNG %d" % index, filename="cat.png", content_type="image/png").json()["thumbnail_status"]
+            for index in range(4)
+        ]
+        release.set()
+        client.portal.call(thumbnails.join)
+
+    assert statuses[0] == "pending" and statuses[-1] == "failed"
+    failures = [thread for status, thread in finished_on if status == "failed"]
+    assert failures and loop_thread not in failures
+
+
+def test_pillow_renders_bounded_webp_thumbnails(tmp_path):
+    """Test the real renderer: longest side scaled to the size, original dimensions reported."""
+    image_module = pytest.importorskip("PIL.Image")
+    source = io.BytesIO()
+    image_module.new("RGB", (600, 300), "red").save(source, "PNG")
+    store = LocalAttachmentStore(str(tmp_path))
+    digest = hashlib.sha256(source.getvalue()).hexdigest()
+    store.put(f"blobs/{digest[:2]}/{digest[2:4]}/{digest}", source.getvalue())
+
+    worker = ThumbnailWorker(store, workers=1, size=128)
+    with store.open(f"blobs/{digest[:2]}/{digest[2:4]}/{digest}") as blob:
+        data, width, height = worker.render(blob, 128)
+    assert (width, height) == (600, 300)
+    with image_module.open(io.BytesIO(data)) as thumbnail:
+        assert (thumbnail.format, thumbnail.size) == ("WEBP", (128, 64))
+    assert thumbnail_key(digest, 128).endswith(f"{digest}-128.webp")
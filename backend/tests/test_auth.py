@@ -1,38 +1,23 @@
 """Tests for authentication endpoints."""
 
+import time
+from datetime import datetime, timedelta
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
-from app.main import app
-from app.database import Base, get_db
-from app.models import User
-
-# Create test database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Create tables
-Base.metadata.create_all(bind=engine)
-
-
-def override_get_db():
-    """Override database dependency for testing."""
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()
+from jose import JWTError
+from sqlalchemy import event
 
+from app.models import RefreshToken, User
+from app.utils.revocation import RevocationList
+from app.utils.security import (
+    JoseBackend,
+    NativeBackend,
+    TokenCache,
+)
 
-app.dependency_overrides[get_db] = override_get_db
 
-client = TestClient(app)
-
-
-def test_register_user():
+def test_register_user(client):
     """Test user registration."""
     response = client.post(
         "/auth/register",
@@ -50,7 +35,7 @@ def test_register_user():
     assert "id" in data
 
 
-def test_register_duplicate_username():
+def test_register_duplicate_username(client):
     """Test registration with duplicate username."""
     # First registration
     client.post(
@@ -76,7 +61,7 @@ def test_register_duplicate_username():
     assert "already registered" in response.json()["detail"].lower()
 
 
-def test_login():
+def test_login(client):
     """Test user login."""
     # Register user first
     client.post(
@@ -101,9 +86,11 @@ def test_login():
     data = response.json()
     assert "access_token" in data
     assert data["token_type"] == "bearer"
+    assert data["refresh_token"]
+    assert data["expires_in"] == 15 * 60
 
 
-def test_login_invalid_credentials():
+def test_login_invalid_credentials(client):
     """Test login with invalid credentials."""
     response = client.post(
         "/auth/login",
@@ -115,3 +102,144 @@ def test_login_invalid_credentials():
     
     assert response.status_code == 401
     assert "incorrect" in response.json()["detail"].lower()
+
+
+def test_native_backend_interoperates_with_jose():
+    """Test that both JWT backends accept each other's tokens."""
+    jose_backend, native_backend = JoseBackend(), NativeBackend("HS256")
+    claims = {"sub": "7", "exp": datetime.utcnow() + timedelta(minutes=5)}
+
+    for encoder, decoder in [(jose_backend, native_backend), (native_backend, jose_backend)]:
+        token = encoder.encode(claims, "secret", "HS256")
+        assert decoder.decode(token, "secret", ["HS256"])["sub"] == "7"
+
+    token = native_backend.encode(claims, "secret", "HS256")
+    for bad_token, key in [(token, "other-secret"), (token[:-2] + "xx", "secret"), ("garbage", "secret")]:
+        with pytest.raises(JWTError):
+            native_backend.decode(bad_token, key, ["HS256"])
+
+    expired = native_backend.encode({"sub": "7", "exp": datetime.utcnow() - timedelta(seconds=1)}, "secret", "HS256")
+    with pytest.raises(JWTError):
+        native_backend.decode(expired, "secret", ["HS256"])
+    with pytest.raises(JWTError):
+        native_backend.decode(token, "secret", ["HS512"])
+
+
+def test_token_cache_is_bounded_and_honours_exp():
+    """Test LRU eviction and expiry of cached token claims."""
+    cache = TokenCache(maxsize=2)
+    now = time.time()
+    cache.put("a", {"sub": "1", "exp": now + 60})
+    cache.put("b", {"sub": "2", "exp": now + 60})
+    assert cache.get("a")["sub"] == "1"
+    cache.put("c", {"sub": "3", "exp": now + 60})
+    # "b" was least recently used
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+    cache.put("old", {"sub": "4", "exp": now - 1})
+    assert cache.get("old") is None
+    cache.put("forever", {"sub": "5"})
+    assert cache.get("forever") is None
+
+
+def test_decode_access_token_uses_cache(app):
+    """Test that a verified token is served from the cache and forged ones are not."""
+    tokens = app.state.tokens
+    token = tokens.create_access_token({"sub": "42"})
+    assert tokens.decode_access_token(token)["sub"] == "42"
+    assert len(tokens.cache) == 1
+
+    cached = tokens.decode_access_token(token)
+    cached["sub"] = "changed"
+    assert tokens.decode_access_token(token)["sub"] == "42"
+
+    header, payload, signature = token.split(".")
+    assert tokens.decode_access_token(f"{header}.{payload}.{signature[::-1]}") is None
+
+
+def login_tokens(client: TestClient, username: str) -> dict:
+    """Register ``username`` and return its login response."""
+    client.post(
+        "/auth/register",
+        json={"username": username, "email": f"{username}@example.com", "password": "testpass123"}
+    )
+    return client.post("/auth/login", data={"username": username, "password": "testpass123"}).json()
+
+
+def test_refresh_rotates_and_detects_reuse(client):
+    """Test refresh token rotation and family revocation on reuse."""
+    tokens = login_tokens(client, "refreshtest")
+
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    headers = {"Authorization": f"Bearer {rotated['access_token']}"}
+    assert client.get("/users/me", headers=headers).status_code == 200
+
+    # Replaying the old token revokes the whole family, including the new one
+    assert client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": rotated["refresh_token"]}).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": "unknown"}).status_code == 401
+
+
+def test_concurrent_refresh_with_one_token_is_reuse(app, client, database):
+    """Test that a refresh losing the race to rotate its token revokes the family instead of issuing tokens."""
+    tokens = login_tokens(client, "racetest")
+    engine = app.state.engine
+    raced = []
+
+    def rotate_elsewhere(conn, cursor, statement, *args):
+        # Another worker rotates the token between this request's read and its update
+        if not raced and statement.startswith("SELECT") and "FROM refresh_tokens" in statement:
+            raced.append(statement)
+            conn.exec_driver_sql("UPDATE refresh_tokens SET revoked_at = CURRENT_TIMESTAMP")
+
+    event.listen(engine, "after_cursor_execute", rotate_elsewhere)
+    try:
+        response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    finally:
+        event.remove(engine, "after_cursor_execute", rotate_elsewhere)
+
+    assert raced
+    assert response.status_code == 401
+    with database() as db:
+        assert db.query(RefreshToken).count() == 1
+
+
+def test_logout_revokes_access_and_refresh_tokens(client):
+    """Test that logout takes effect immediately, even for cached tokens."""
+    tokens = login_tokens(client, "logouttest")
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/users/me", headers=headers).status_code == 200
+
+    response = client.post("/auth/logout", json={"refresh_token": tokens["refresh_token"]}, headers=headers)
+    assert response.status_code == 200
+
+    assert client.get("/users/me", headers=headers).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+
+def test_revocation_list_syncs_from_database(database):
+    """Test that revocations recorded by another worker are picked up and expire."""
+    worker, other_worker = RevocationList(), RevocationList()
+    db = database()
+    try:
+        worker.sync(db)
+        other_worker.revoke(db, "a" * 32, time.time() + 60)
+        other_worker.revoke(db, "b" * 32, time.time() + 1)
+        # Logging out again on a worker that has not synced yet is not an error
+        duplicate = RevocationList()
+        duplicate.revoke(db, "a" * 32, time.time() + 60)
+        assert duplicate.is_revoked("a" * 32)
+
+        assert worker.sync(db) >= 2
+        assert worker.is_revoked("a" * 32)
+        assert not worker.is_revoked("c" * 32)
+
+        worker.prune(now=time.time() + 30)
+        assert worker.is_revoked("a" * 32)
+        assert not worker.is_revoked("b" * 32)
+    finally:
+        db.close()
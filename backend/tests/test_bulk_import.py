@@ -0,0 +1,76 @@
+"""Tests for the NDJSON bulk importer."""
+
+from datetime import datetime
+
+import orjson
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.bulk_import import BulkImporter, RecordError
+from app.database import Base
+from app.models import MemberRole, Message, ServerMember, User
+from app.utils.security import verify_password
+from app.utils.snowflake import snowflake_time
+
+
+@pytest.fixture
+def engine():
+    """Fresh in-memory database with all tables."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+def ndjson(*records) -> list:
+    return [orjson.dumps(record) + b"\n" for record in records]
+
+
+def test_import_loads_every_record_type(engine):
+    """Test a full load with hashed passwords, batching and rebuilt indexes."""
+    indexes_before = {index["name"] for index in inspect(engine).get_indexes("messages")}
+    lines = ndjson(
+        {"type": "user", "id": 1, "username": "alice", "email": "alice@example.com", "password": "secret123"},
+        {"type": "user", "id": 2, "username": "bob", "email": "bob@example.com", "password_hash": "$2b$04$x"},
+        {"type": "server", "id": 1, "name": "Imported", "owner_id": 1},
+        {"type": "member", "server_id": 1, "user_id": 1, "role": "owner"},
+        {"type": "member", "server_id": 1, "user_id": 2},
+        {"type": "channel", "id": 7, "server_id": 1, "name": "general"},
+    ) + ndjson(*[
+        {"type": "message", "channel_id": 7, "user_id": 1 + i % 2, "content": f"m{i}",
+         "created_at": f"2024-01-01T00:00:{i:02d}+01:00"}
+        for i in range(25)
+    ]) + [b"\n"]
+
+    report = BulkImporter(engine, batch_size=10, workers=2, bcrypt_rounds=4).run(lines)
+
+    assert {key: report[key] for key in ("user", "server", "member", "channel", "message", "rows")} == {
+        "user": 2, "server": 1, "member": 2, "channel": 1, "message": 25, "rows": 31
+    }
+    assert report["rows_per_second"] > 0
+    assert {index["name"] for index in inspect(engine).get_indexes("messages")} == indexes_before
+
+    db = sessionmaker(bind=engine)()
+    alice = db.query(User).filter(User.username == "alice").one()
+    assert verify_password("secret123", alice.password_hash)
+    assert db.query(ServerMember).filter(ServerMember.user_id == 2).one().role == MemberRole.MEMBER
+    messages = db.query(Message).order_by(Message.id).all()
+    # Offsets are converted to naive UTC like every other stored time
+    assert messages[0].created_at == datetime(2023, 12, 31, 23, 0, 0)
+    assert messages[0].updated_at == messages[0].created_at
+    # Ids are snowflakes backfilled from created_at, so they sort by time
+    assert [message.content for message in messages] == [f"m{i}" for i in range(25)]
+    assert snowflake_time(messages[-1].id) == messages[-1].created_at
+    db.close()
+
+
+def test_import_reports_bad_line(engine):
+    """Test that a bad record names its line and the indexes still come back."""
+    lines = ndjson({"type": "user", "id": 1, "username": "a", "email": "a@example.com", "password_hash": "x"})
+    lines += [b'{"type": "reaction"}\n']
+
+    with pytest.raises(RecordError, match="line 2"):
+        BulkImporter(engine).run(lines)
+    assert any(index["name"] == "ix_messages_id" for index in inspect(engine).get_indexes("messages"))
@@ -0,0 +1,109 @@
+"""Tests for response compression middleware."""
+
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.middleware.compression import CompressionMiddleware, negotiate_encoding
+
+
+def make_client(minimum_size: int = 100) -> TestClient:
+    """Build a tiny app wrapped in the compression middleware."""
+    app = FastAPI(default_response_class=ORJSONResponse)
+    app.add_middleware(CompressionMiddleware, minimum_size=minimum_size)
+
+    @app.get("/large")
+    async def large():
+        return [{"id": i, "content": "hello world"} for i in range(100)]
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/binary")
+    async def binary():
+        return Response(b"\x00" * 5000, media_type="image/png")
+
+    @app.get("/stream")
+    async def stream():
+        def chunks():
+            for i in range(50):
+                yield f"line {i}\n" * 20
+
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    @app.get("/text")
+    async def text():
+        return PlainTextResponse("x" * 5000)
+
+    return TestClient(app)
+
+
+def test_negotiate_prefers_server_order_on_ties():
+    """Test that equal q-values fall back to server preference."""
+    assert negotiate_encoding("gzip, br", ["br", "gzip"]) == "br"
+    assert negotiate_encoding("gzip;q=1.0, br;q=0.5", ["br", "gzip"]) == "gzip"
+    assert negotiate_encoding("br;q=0", ["br", "gzip"]) is None
+    assert negotiate_encoding("*", ["zstd", "gzip"]) == "zstd"
+    assert negotiate_encoding("", ["gzip"]) is None
+
+
+def test_large_json_is_gzipped():
+    """Test that large JSON responses are compressed."""
+    client = make_client()
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert len(response.json()) == 100
+
+
+def test_small_and_binary_responses_pass_through():
+    """Test that small and non-text responses are left alone."""
+    client = make_client()
+
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert small.json() == {"ok": True}
+
+    binary = client.get("/binary", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in binary.headers
+    assert len(binary.content) == 5000
+
+
+def test_streaming_response_is_compressed():
+    """Test that streaming responses are compressed incrementally."""
+    client = make_client()
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.text.count("\n") == 1000
+
+
+def test_no_accept_encoding_is_identity():
+    """Test that clients without Accept-Encoding get plain responses."""
+    client = make_client()
+    response = client.get("/text", headers={"Accept-Encoding": "identity"})
+
+    assert "content-encoding" not in response.headers
+    assert response.text == "x" * 5000
+
+
+def test_compressible_responses_vary_on_accept_encoding():
+    """Test that text responses carry Vary even when sent uncompressed, so caches key on the encoding."""
+    client = make_client()
+
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert small.headers["vary"] == "Accept-Encoding"
+
+    identity = client.get("/text", headers={"Accept-Encoding": "identity"})
+    assert identity.headers["vary"] == "Accept-Encoding"
+
+    compressed = client.get("/text", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["vary"] == "Accept-Encoding"  # added once
+
+    binary = client.get("/binary", headers={"Accept-Encoding": "gzip"})
+    assert "vary" not in binary.headers
@@ -0,0 +1,102 @@
+"""Tests for the streaming channel export."""
+
+import csv
+import gzip
+import io
+import tracemalloc
+from datetime import datetime, timedelta
+
+import orjson
+import pytest
+from sqlalchemy import insert
+
+from app.archive import ArchiveStore, Archiver
+from app.export import stream_export
+from app.models import Channel, Message, Server, ServerMember, User
+
+START = datetime(2026, 1, 1, 0, 0, 0)
+
+
+@pytest.fixture
+def sessions(app, database, tmp_path):
+    """In-memory database with a member, an outsider and 10 messages, 4 of them archived."""
+    db = database()
+    db.add_all([
+        User(id=1, username="exporter", email="exporter@example.com", password_hash="x"),
+        User(id=2, username="outsider", email="outsider@example.com", password_hash="x"),
+    ])
+    db.add(Server(id=1, name="Export", owner_id=1))
+    db.add(ServerMember(server_id=1, user_id=1, role="owner"))
+    db.add(Channel(id=1, server_id=1, name="general"))
+    db.add_all([
+        Message(channel_id=1, user_id=1, content=f"message, {i}", created_at=START + timedelta(days=i),
+                updated_at=START + timedelta(days=i))
+        for i in range(10)
+    ])
+    db.commit()
+
+    store = ArchiveStore(str(tmp_path))
+    app.state.store = store
+    Archiver(store, archive_after_days=1, batch_size=3).archive_channel(db, 1, START + timedelta(days=4))
+    db.close()
+
+    return database
+
+
+def test_export_ndjson_spans_archive_and_hot_rows(client, sessions, auth):
+    """Test that the export holds every message once, oldest first."""
+    with sessions() as db:
+        assert db.query(Message).count() == 6
+
+    response = client.get("/channels/1/export", headers=auth(1))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-disposition"] == 'attachment; filename="channel-1.ndjson"'
+
+    rows = [orjson.loads(line) for line in response.content.splitlines()]
+    assert [row["content"] for row in rows] == [f"message, {i}" for i in range(10)]
+    assert rows[0]["username"] == "exporter"
+    assert rows[0]["created_at"] == "2026-01-01T00:00:00"
+
+
+def test_export_csv_gzip_with_time_range(client, sessions, auth):
+    """Test the CSV encoder, file compression and the since/until filter."""
+    response = client.get(
+        "/channels/1/export",
+        params={"format": "csv", "gzip": "true", "since": "2026-01-03T00:00:00Z", "until": "2026-01-07T00:00:00"},
+        headers=auth(1)
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode("utf-8"))))
+    # Messages 2 and 3 come from the archive, 4 and 5 from the hot table
+    assert [row["content"] for row in rows] == [f"message, {i}" for i in range(2, 6)]
+    assert rows[0]["is_edited"] == "False"
+
+
+def test_export_requires_membership(client, sessions, auth):
+    """Test that only server members can export a channel."""
+    assert client.get("/channels/1/export", headers=auth(2)).status_code == 403
+    assert client.get("/channels/99/export", headers=auth(1)).status_code == 404
+    assert client.get("/channels/1/export?format=xml", headers=auth(1)).status_code == 422
+
+
+def test_export_memory_does_not_grow_with_history(app, sessions):
+    """Test that streaming 20,000 rows peaks well below the size of the export."""
+    with sessions() as db:
+        db.execute(insert(Message), [
+            {"channel_id": 1, "user_id": 1, "content": "x" * 200, "created_at": START + timedelta(days=20)}
+            for _ in range(20_000)
+        ])
+        db.commit()
+
+        tracemalloc.start()
+        try:
+            total = sum(len(chunk) for chunk in stream_export(db, app.state.store, 1))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    assert total > 4_000_000
+    assert peak < total / 4
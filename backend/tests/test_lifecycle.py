@@ -0,0 +1,74 @@
+"""Tests for graceful drain on shutdown."""
+
+import asyncio
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.lifecycle import DrainController
+from app.websocket.manager import ConnectionManager
+
+
+class FakeWebSocket:
+    """In-memory WebSocket that records frames and close codes."""
+
+    def __init__(self):
+        self.sent = []
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message: dict):
+        self.sent.append(message)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.close_code = code
+
+
+def test_drain_sends_jittered_hints_in_batches_then_runs_hooks():
+    """Test that every socket gets a bounded hint and 1012, then hooks run."""
+    calls = []
+
+    async def scenario():
+        connection_manager = ConnectionManager()
+        sockets = [FakeWebSocket() for _ in range(5)]
+        for user_id, socket in enumerate(sockets, start=1):
+            await connection_manager.connect(socket, user_id, 1, 1)
+
+        controller = DrainController(
+            connection_manager, batch_size=2, batch_interval=0, max_reconnect_delay=3.0
+        )
+        controller.add_shutdown_hook(lambda: calls.append("sync"))
+
+        async def async_hook():
+            calls.append("async")
+
+        controller.add_shutdown_hook(async_hook)
+        await controller.drain()
+        await controller.drain()  # second call is a no-op
+        return connection_manager, sockets
+
+    connection_manager, sockets = asyncio.run(scenario())
+
+    assert connection_manager.draining
+    assert calls == ["sync", "async"]
+    for socket in sockets:
+        hint = socket.sent[-1]
+        assert hint["type"] == "reconnect"
+        assert 0 <= hint["data"]["delay_ms"] <= 3000
+        assert socket.close_code == 1012
+
+
+def test_draining_fails_health_and_refuses_websockets(app, client):
+    """Test that a draining node reports 503 and rejects new sockets."""
+    app.state.manager.draining = True
+
+    response = client.get("/health")
+    assert response.status_code == 503
+    assert response.json()["status"] == "draining"
+
+    token = app.state.tokens.create_access_token({"sub": "1"})
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(f"/ws/1/1/1?token={token}") as websocket:
+            websocket.receive_json()
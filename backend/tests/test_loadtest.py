@@ -0,0 +1,38 @@
+"""Smoke test for the load-testing harness so it keeps working."""
+
+import asyncio
+
+from benchmarks.loadtest import build_parser, find_regressions, run_suite
+
+
+def test_loadtest_runs_all_workloads():
+    """Test a tiny in-process run of every workload."""
+    options = build_parser().parse_args([
+        "--users", "5",
+        "--servers", "1",
+        "--channels", "2",
+        "--messages", "60",
+        "--requests", "10",
+        "--login-requests", "3",
+        "--concurrency", "3",
+        "--subscribers", "4",
+        "--ws-messages", "5",
+        "--bcrypt-rounds", "4",
+    ])
+
+    report = asyncio.run(run_suite(options))
+
+    assert set(report["results"]) == {"login", "history", "send", "ws_fanout"}
+    for result in report["results"].values():
+        assert result["errors"] == 0
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+
+
+def test_find_regressions():
+    """Test baseline comparison thresholds."""
+    baseline = {"results": {"send": {"p95_ms": 10.0, "throughput_rps": 100.0, "errors": 0}}}
+    same = {"results": {"send": {"p95_ms": 11.0, "throughput_rps": 95.0, "errors": 0}}}
+    slower = {"results": {"send": {"p95_ms": 20.0, "throughput_rps": 50.0, "errors": 0}}}
+
+    assert find_regressions(same, baseline, tolerance=0.2) == []
+    assert len(find_regressions(slower, baseline, tolerance=0.2)) == 2
@@ -0,0 +1,46 @@
+"""Tests for structured, queue-based logging."""
+
+import json
+import logging
+
+from app.logging_config import JsonFormatter, SamplingFilter, parse_sampling
+
+
+def make_record(name: str, level: int, msg: str, *args, **extra) -> logging.LogRecord:
+    """Create a LogRecord the way Logger.makeRecord would."""
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_extra_fields():
+    """Test that records render as JSON with interpolated message and extras."""
+    record = make_record("app.test", logging.INFO, "user %s joined", 42, channel_id=7)
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry["msg"] == "user 42 joined"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "app.test"
+    assert entry["channel_id"] == 7
+    assert "ts" in entry
+
+
+def test_parse_sampling():
+    """Test parsing of the LOG_SAMPLING setting."""
+    assert parse_sampling("") == {}
+    assert parse_sampling("app.websocket=0.1, app.routes.messages=2") == {
+        "app.websocket": 0.1,
+        "app.routes.messages": 1.0,
+    }
+
+
+def test_sampling_filter_drops_info_but_keeps_warnings():
+    """Test that sampled loggers lose INFO records but never warnings."""
+    sampler = SamplingFilter({"app.websocket": 0.0, "app.websocket.manager.keep": 1.0})
+
+    assert not sampler.filter(make_record("app.websocket.manager", logging.INFO, "connected"))
+    assert sampler.filter(make_record("app.websocket.manager", logging.WARNING, "slow"))
+    assert sampler.filter(make_record("app.websocket.manager.keep", logging.INFO, "kept"))
+    assert sampler.filter(make_record("app.websocketx", logging.INFO, "other logger"))
+    assert sampler.filter(make_record("app.routes.auth", logging.INFO, "login"))
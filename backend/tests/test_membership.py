@@ -0,0 +1,183 @@
+"""Tests for invites, joining, leaving, kicking and bulk membership changes."""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from starlette.websockets import WebSocketDisconnect
+
+from app.membership import create_invite
+from app.models import Channel, Invite, MemberRole, Server, ServerMember, User
+from app.websocket.manager import REMOVED_CLOSE_CODE
+
+from .test_websocket import FakeWebSocket
+
+ROLES = {1: "owner", 2: "admin", 3: "moderator", 4: "member"}
+
+
+@pytest.fixture
+def sessions(database):
+    """Server 1 with channel 1 and one member per role; users 5 to 7 are not members."""
+    with database() as db:
+        db.add_all([
+            User(id=user_id, username=f"user{user_id}", email=f"user{user_id}@example.com", password_hash="x")
+            for user_id in range(1, 8)
+        ])
+        db.add(Server(id=1, name="Members", owner_id=1))
+        db.add_all([ServerMember(server_id=1, user_id=user_id, role=role) for user_id, role in ROLES.items()])
+        db.add(Channel(id=1, server_id=1, name="general"))
+        db.commit()
+    return database
+
+
+def member_ids(factory) -> list:
+    with factory() as db:
+        return sorted(user_id for (user_id,) in db.query(ServerMember.user_id).filter(ServerMember.server_id == 1))
+
+
+def test_invite_counts_uses_and_expires(client, sessions, auth):
+    """Test joining through a code until it is used up, and that expired codes are refused."""
+    response = client.post("/servers/1/invites", json={"max_uses": 2}, headers=auth(4))
+    assert response.status_code == 201
+    code = response.json()["code"]
+    assert client.post("/servers/1/invites", json={}, headers=auth(5)).status_code == 403
+
+    # Non-members are cached as such until they join
+    assert client.get("/servers/1", headers=auth(5)).status_code == 403
+    joined = client.post(f"/servers/join/{code}", headers=auth(5))
+    assert joined.status_code == 200
+    assert joined.json()["id"] == 1
+    assert client.get("/servers/1", headers=auth(5)).status_code == 200
+    # Joining again does not use the code up
+    assert client.post(f"/servers/join/{code}", headers=auth(5)).status_code == 200
+    assert client.post(f"/servers/join/{code}", headers=auth(6)).status_code == 200
+    assert client.post(f"/servers/join/{code}", headers=auth(7)).status_code == 404
+
+    invites = client.get("/servers/1/invites", headers=auth(2)).json()
+    assert [(invite["code"], invite["uses"]) for invite in invites] == [(code, 2)]
+    assert member_ids(sessions) == [1, 2, 3, 4, 5, 6]
+
+    with sessions() as db:
+        expired = create_invite(db, 1, 1, max_age_seconds=60, now=datetime.utcnow() - timedelta(minutes=2))
+        revoked = create_invite(db, 1, 1)
+        db.commit()
+        expired_code, revoked_code = expired.code, revoked.code
+    assert client.post(f"/servers/join/{expired_code}", headers=auth(7)).status_code == 404
+    assert client.delete(f"/servers/1/invites/{revoked_code}", headers=auth(3)).status_code == 403
+    assert client.delete(f"/servers/1/invites/{revoked_code}", headers=auth(2)).status_code == 204
+    assert client.post(f"/servers/join/{revoked_code}", headers=auth(7)).status_code == 404
+    assert 7 not in member_ids(sessions)
+
+
+def test_leave_and_kick_close_server_sockets(app, client, sessions, auth):
+    """Test that removed members lose access and their sockets in the server at once."""
+    manager = app.state.manager
+    sockets = {user_id: FakeWebSocket() for user_id in (3, 4)}
+    other_server = FakeWebSocket()
+
+    async def connect():
+        for user_id, websocket in sockets.items():
+            await manager.connect(websocket, user_id, 1, 1)
+        await manager.connect(other_server, 4, 2, 20)
+
+    asyncio.run(connect())
+    assert client.delete("/servers/1/members/2", headers=auth(3)).status_code == 403
+    assert client.delete("/servers/1/members/4", headers=auth(4)).status_code == 403
+    assert client.get("/servers/1", headers=auth(4)).status_code == 200
+    assert client.delete("/servers/1/members/4", headers=auth(3)).status_code == 204
+    assert client.get("/servers/1", headers=auth(4)).status_code == 403
+    assert client.delete("/servers/1/members/4", headers=auth(3)).status_code == 404
+
+    assert client.post("/servers/1/leave", headers=auth(1)).status_code == 400
+    assert client.post("/servers/1/leave", headers=auth(3)).status_code == 204
+    assert client.post("/servers/1/leave", headers=auth(3)).status_code == 403
+
+    assert member_ids(sessions) == [1, 2]
+    assert sockets[4].close_code == REMOVED_CLOSE_CODE
+    assert sockets[3].close_code == REMOVED_CLOSE_CODE
+    assert other_server.close_code is None
+    assert manager.get_channel_users(1) == []
+    assert manager.sessions == {}
+    removals = [frame["data"] for frame in sockets[3].sent if frame["type"] == "member_remove"]
+    assert removals == [{"server_id": 1, "user_ids": [4]}]
+
+
+def test_kicked_member_is_disconnected_and_cannot_reconnect(app, client, sessions, auth):
+    """Test that a kick closes a socket opened under any server id in its path, and the next connect is refused."""
+    token = app.state.tokens.create_access_token({"sub": "4"})
+    with client.websocket_connect(f"/ws/4/99/1?token={token}") as websocket:
+        assert websocket.receive_json()["type"] == "hello"
+        assert client.delete("/servers/1/members/4", headers=auth(3)).status_code == 204
+        assert app.state.manager.get_channel_users(1) == []
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+        assert closed.value.code == REMOVED_CLOSE_CODE
+
+    with pytest.raises(WebSocketDisconnect) as refused:
+        with client.websocket_connect(f"/ws/4/1/1?token={token}") as websocket:
+            websocket.receive_json()
+    assert refused.value.code == 1008
+
+
+def test_bulk_add_writes_all_rows_in_one_statement(client, sessions, auth):
+    """Test adding thousands of users with a single INSERT that skips existing members."""
+    with sessions() as db:
+        db.add_all([
+            User(id=user_id, username=f"bulk{user_id}", email=f"bulk{user_id}@example.com", password_hash="x")
+            for user_id in range(100, 3100)
+        ])
+        db.commit()
+        engine = db.get_bind()
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    user_ids = [4, 99_999] + list(range(100, 3100))
+    try:
+        response = client.post(
+            "/servers/1/members", json={"user_ids": user_ids, "role": "moderator"}, headers=auth(2)
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert response.status_code == 200
+    assert response.json()["added"] == list(range(100, 3100))
+    assert response.json()["skipped"] == 2
+    assert len([sql for sql in statements if sql.startswith("INSERT INTO server_members")]) == 1
+    with sessions() as db:
+        assert db.query(ServerMember).filter(ServerMember.role == MemberRole.MODERATOR).count() == 3001
+        assert db.query(Invite).count() == 0
+
+    assert client.get("/servers/1", headers=auth(2999)).status_code == 200
+    # Moderators are not admins, and admins cannot add admins
+    body = {"user_ids": [5]}
+    assert client.post("/servers/1/members", json=body, headers=auth(3)).status_code == 403
+    body["role"] = "admin"
+    assert client.post("/servers/1/members", json=body, headers=auth(2)).status_code == 403
+
+
+def test_create_server_is_one_transaction_without_reads(client, sessions, auth):
+    """Test that a templated server, its owner and channels are written without reading rows back."""
+    with sessions() as db:
+        engine = db.get_bind()
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    template = {"name": "Study", "channels": [{"name": "lobby"}, {"name": "notes", "description": "Shared notes"}]}
+    try:
+        response = client.post("/servers", json=template, headers=auth(5))
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert response.status_code == 201
+    server = response.json()
+    assert [channel["name"] for channel in server["channels"]] == ["lobby", "notes"]
+    assert [(member["user_id"], member["role"]) for member in server["members"]] == [(5, "owner")]
+    assert server["members"][0]["user"]["username"] == "user5"
+    # The only read is the caller's user row, before anything is written
+    assert [sql.split()[0] for sql in statements] == ["SELECT"] + ["INSERT"] * (len(statements) - 1)
+    assert {sql.split()[2] for sql in statements[1:]} == {"servers", "server_members", "channels"}
+    assert client.get(f"/servers/{server['id']}/channels", headers=auth(5)).json() == server["channels"]
+
+    default = client.post("/servers", json={"name": "Plain"}, headers=auth(5)).json()
+    assert [channel["name"] for channel in default["channels"]] == ["general"]
@@ -2,35 +2,9 @@
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 
-from app.main import app
-from app.database import Base, get_db
 
-# Create test database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test_messages.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-Base.metadata.create_all(bind=engine)
-
-
-def override_get_db():
-    """Override database dependency for testing."""
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()
-
-
-app.dependency_overrides[get_db] = override_get_db
-
-client = TestClient(app)
-
-
-def get_auth_token():
+def get_auth_token(client: TestClient):
     """Helper to get authentication token."""
     # Register and login
     client.post(
@@ -53,9 +27,9 @@ def get_auth_token():
     return response.json()["access_token"]
 
 
-def test_send_message():
+def test_send_message(client):
     """Test sending a message."""
-    token = get_auth_token()
+    token = get_auth_token(client)
     headers = {"Authorization": f"Bearer {token}"}
     
     # Create server and channel first
@@ -83,9 +57,9 @@ def test_send_message():
     assert "id" in data
 
 
-def test_get_messages():
+def test_get_messages(client):
     """Test retrieving message history."""
-    token = get_auth_token()
+    token = get_auth_token(client)
     headers = {"Authorization": f"Bearer {token}"}
     
     # Create server
@@ -0,0 +1,60 @@
+"""Tests for the metrics registry and /metrics endpoint."""
+
+from app.metrics import Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Test Prometheus text rendering of a labelled histogram."""
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5.0, "/a")
+
+    text = registry.render()
+    assert '# TYPE latency_seconds histogram' in text
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{route="/a"} 3' in text
+
+
+def test_counter_and_gauge_function():
+    """Test counters with labels and scrape-time gauges."""
+    registry = Registry()
+    counter = registry.counter("events_total", "Events", ("kind",))
+    counter.inc("a")
+    counter.inc("a", amount=2)
+    gauge = registry.gauge("queue_depth", "Depth")
+    gauge.set_function(lambda: 7)
+
+    text = registry.render()
+    assert 'events_total{kind="a"} 3' in text
+    assert "queue_depth 7" in text
+
+
+def test_non_finite_values_render_as_prometheus_literals():
+    """Test that infinite and NaN samples render instead of failing the scrape."""
+    registry = Registry()
+    gauge = registry.gauge("ratio", "Ratio", ("kind",))
+    gauge.set(float("inf"), "up")
+    gauge.set(float("-inf"), "down")
+    gauge.set(float("nan"), "unknown")
+
+    text = registry.render()
+    assert 'ratio{kind="up"} +Inf' in text
+    assert 'ratio{kind="down"} -Inf' in text
+    assert 'ratio{kind="unknown"} NaN' in text
+
+
+def test_metrics_endpoint_reports_route_templates(client):
+    """Test that requests are labelled by route template, not raw path."""
+    client.get("/servers/12345", headers={"Authorization": "Bearer invalid"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'route="/servers/{server_id}"' in response.text
+    assert "/servers/12345" not in response.text
+    assert "ws_active_connections" in response.text
+    assert "bcrypt_queue_depth" in response.text
@@ -0,0 +1,187 @@
+"""Tests for member permissions and the permission cache."""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from starlette.websockets import WebSocketDisconnect
+
+from app.models import Channel, MemberRole, Server, ServerMember, User
+from app.permissions import ROLE_PERMISSIONS, Permission, PermissionCache
+
+ROLES = {1: "owner", 2: "admin", 3: "moderator", 4: "member"}
+
+
+def seed(factory, roles: dict = ROLES):
+    """Server 1 with channel 1 and a member per entry of ``roles``; users 1-5 exist."""
+    with factory() as db:
+        db.add_all([
+            User(id=user_id, username=f"user{user_id}", email=f"user{user_id}@example.com", password_hash="x")
+            for user_id in range(1, 6)
+        ])
+        db.add(Server(id=1, name="Roles", owner_id=1))
+        db.add_all([ServerMember(server_id=1, user_id=user_id, role=role) for user_id, role in roles.items()])
+        db.add(Channel(id=1, server_id=1, name="general"))
+        db.commit()
+
+
+@pytest.fixture
+def sessions(database):
+    """Server 1 with channel 1 and one user per role, plus user 5 who is not a member."""
+    seed(database)
+    return database
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_roles_resolve_to_nested_bitsets():
+    """Test that each role holds every permission of the roles below it."""
+    order = [MemberRole.MEMBER, MemberRole.MODERATOR, MemberRole.ADMIN, MemberRole.OWNER]
+    for lower, higher in zip(order, order[1:]):
+        assert ROLE_PERMISSIONS[higher] & ROLE_PERMISSIONS[lower] == ROLE_PERMISSIONS[lower]
+        assert ROLE_PERMISSIONS[higher] != ROLE_PERMISSIONS[lower]
+    assert ROLE_PERMISSIONS[MemberRole.OWNER] & Permission.DELETE_SERVER
+    assert not ROLE_PERMISSIONS[MemberRole.ADMIN] & Permission.DELETE_SERVER
+
+
+def test_cache_hits_expire_and_invalidate(sessions):
+    """Test that warm lookups skip the database until invalidated or expired."""
+    clock = FakeClock()
+    cache = PermissionCache(maxsize=100, ttl=30, clock=clock)
+    db = sessions()
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    scope = cache.for_channel(db, 3, 1)
+    assert (scope.server_id, scope.role) == (1, MemberRole.MODERATOR)
+    assert scope.allows(Permission.MANAGE_CHANNELS) and not scope.allows(Permission.DELETE_CHANNELS)
+    assert len(statements) == 2
+    assert cache.for_channel(db, 3, 1) == scope
+    assert cache.for_server(db, 5, 1).permissions == Permission.NONE
+    assert cache.for_server(db, 5, 1).permissions == Permission.NONE
+    assert len(statements) == 3
+    assert cache.for_channel(db, 3, 99) is None
+    assert cache.for_server(db, 3, 99) is None
+
+    db.query(ServerMember).filter(ServerMember.user_id == 3).update({"role": MemberRole.MEMBER})
+    db.commit()
+    statements.clear()
+    assert cache.for_server(db, 3, 1).role == MemberRole.MODERATOR
+    cache.invalidate(1, 3)
+    assert cache.for_server(db, 3, 1).role == MemberRole.MEMBER
+    assert len(statements) == 1
+
+    # Changes made by other workers show up once the entry expires
+    db.query(ServerMember).filter(ServerMember.user_id == 3).update({"role": MemberRole.ADMIN})
+    db.commit()
+    clock.now = 29
+    assert cache.for_server(db, 3, 1).role == MemberRole.MEMBER
+    clock.now = 31
+    assert cache.for_server(db, 3, 1).role == MemberRole.ADMIN
+    db.close()
+
+
+def test_apps_keep_their_own_permission_cache(isolated_app):
+    """Test that a role cached by one application is not seen by another with the same ids."""
+    member_app, outsider_app = isolated_app(), isolated_app()
+    seed(member_app.state.session_factory)
+    seed(outsider_app.state.session_factory, roles={1: "owner"})
+
+    for application, status_code in ((member_app, 200), (outsider_app, 403)):
+        token = application.state.tokens.create_access_token({"sub": "4"})
+        response = TestClient(application).get("/channels/1", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status_code
+
+
+def test_routes_check_role_permissions(client, sessions, auth):
+    """Test route permissions per role, and 404 before 403."""
+    assert client.get("/channels/1", headers=auth(5)).status_code == 403
+    assert client.get("/channels/2", headers=auth(5)).status_code == 404
+    assert client.get("/servers/1/members", headers=auth(4)).status_code == 200
+
+    assert client.post("/servers/1/channels", json={"name": "nope"}, headers=auth(4)).status_code == 403
+    created = client.post("/servers/1/channels", json={"name": "mods"}, headers=auth(3))
+    assert created.status_code == 201
+    channel_id = created.json()["id"]
+    assert client.delete(f"/channels/{channel_id}", headers=auth(3)).status_code == 403
+    retention = {"archive_after_days": 30}
+    assert client.put("/servers/1/retention", json=retention, headers=auth(3)).status_code == 403
+    assert client.delete(f"/channels/{channel_id}", headers=auth(2)).status_code == 204
+    assert client.get(f"/channels/{channel_id}", headers=auth(2)).status_code == 404
+    assert client.delete("/servers/1", headers=auth(2)).status_code == 403
+
+    sent = client.post("/messages/channels/1/messages", json={"content": "hi"}, headers=auth(4)).json()
+    assert client.delete(f"/messages/messages/{sent['id']}", headers=auth(3)).status_code == 403
+    assert client.get(f"/messages/messages/{sent['id']}", headers=auth(5)).status_code == 403
+    assert client.delete(f"/messages/messages/{sent['id']}", headers=auth(2)).status_code == 204
+
+
+def test_role_changes_apply_immediately(app, client, sessions, auth):
+    """Test the role endpoint's rank rules and that cached permissions are dropped."""
+    assert client.post("/servers/1/channels", json={"name": "a"}, headers=auth(4)).status_code == 403
+
+    response = client.patch("/servers/1/members/4", json={"role": "moderator"}, headers=auth(2))
+    assert response.status_code == 200
+    assert response.json()["role"] == "moderator"
+    assert client.post("/servers/1/channels", json={"name": "a"}, headers=auth(4)).status_code == 201
+
+    # Nobody below the owner can create admins or touch them, and ownership never moves here
+    assert client.patch("/servers/1/members/4", json={"role": "admin"}, headers=auth(2)).status_code == 403
+    assert client.patch("/servers/1/members/2", json={"role": "member"}, headers=auth(2)).status_code == 403
+    assert client.patch("/servers/1/members/2", json={"role": "owner"}, headers=auth(1)).status_code == 403
+    assert client.patch("/servers/1/members/4", json={"role": "member"}, headers=auth(3)).status_code == 403
+    assert client.patch("/servers/1/members/5", json={"role": "member"}, headers=auth(1)).status_code == 404
+
+    assert client.patch("/servers/1/members/2", json={"role": "member"}, headers=auth(1)).status_code == 200
+    assert client.patch("/servers/1/members/4", json={"role": "member"}, headers=auth(2)).status_code == 403
+    assert len(app.state.permissions) > 0
+
+
+def test_websocket_needs_view_and_joins_the_channels_server(app, client, sessions, auth):
+    """Test that outsiders cannot open a server's channels or hear its events through another socket."""
+    with sessions() as db:
+        db.add(Server(id=2, name="Elsewhere", owner_id=5))
+        db.add(ServerMember(server_id=2, user_id=5, role="owner"))
+        db.add(Channel(id=2, server_id=2, name="own"))
+        db.commit()
+    token = app.state.tokens.create_access_token({"sub": "5"})
+
+    with pytest.raises(WebSocketDisconnect) as refused:
+        with client.websocket_connect(f"/ws/5/1/1?token={token}") as websocket:
+            websocket.receive_json()
+    assert refused.value.code == 1008
+
+    # The path names server 1, but channel 2 belongs to server 2
+    with client.websocket_connect(f"/ws/5/1/2?token={token}") as websocket:
+        assert websocket.receive_json()["type"] == "hello"
+        assert [connection.server_id for connection in app.state.manager.registry.for_user(5)] == [2]
+
+        assert client.patch("/channels/1", json={"name": "renamed"}, headers=auth(2)).status_code == 200
+        websocket.send_json({"content": "anyone?"})
+        # The first frame after hello is the echo of our own message, not server 1's channel_update
+        assert websocket.receive_json()["type"] == "message"
+
+
+def test_websocket_messages_need_send_permission(app, client, sessions):
+    """Test that each inbound frame is checked, so removals made by another worker apply to open sockets."""
+    token = app.state.tokens.create_access_token({"sub": "4"})
+    with client.websocket_connect(f"/ws/4/1/1?token={token}") as websocket:
+        assert websocket.receive_json()["type"] == "hello"
+        websocket.send_json({"content": "first"})
+        assert websocket.receive_json()["data"] == {"content": "first"}
+
+        # Another worker removed the member; this one's cache entry has expired
+        with sessions() as db:
+            db.query(ServerMember).filter(ServerMember.user_id == 4).delete()
+            db.commit()
+        app.state.permissions.invalidate(1, 4)
+
+        websocket.send_json({"content": "second"})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+        assert closed.value.code == 1008
@@ -0,0 +1,107 @@
+"""Tests for soft deletes of servers and channels and the purge job."""
+
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from app.archive import ArchiveStore
+from app.membership import create_invite
+from app.metrics import purge_pending, purge_rows_total
+from app.models import ArchiveSegment, Channel, Invite, Message, RetentionPolicy, Server, ServerMember, User
+from app.purge import Purger
+
+
+@pytest.fixture
+def sessions(database):
+    """Server 1 owned by user 1 with member 2, and channels 1 and 2 holding 10 messages each."""
+    with database() as db:
+        db.add_all([
+            User(id=user_id, username=f"user{user_id}", email=f"user{user_id}@example.com", password_hash="x")
+            for user_id in (1, 2, 3)
+        ])
+        db.add(Server(id=1, name="Doomed", owner_id=1))
+        db.add_all([
+            ServerMember(server_id=1, user_id=1, role="owner"),
+            ServerMember(server_id=1, user_id=2, role="member"),
+        ])
+        db.add_all([Channel(id=channel_id, server_id=1, name=f"c{channel_id}") for channel_id in (1, 2)])
+        db.add_all([
+            Message(channel_id=channel_id, user_id=1, content=f"{channel_id}-{i}")
+            for channel_id in (1, 2) for i in range(10)
+        ])
+        db.commit()
+    return database
+
+
+def test_deletes_hide_at_once_without_touching_children(client, sessions, auth):
+    """Test that deleting only marks rows, and that deleted rows are gone from every route."""
+    with sessions() as db:
+        code = create_invite(db, 1, 1).code
+        db.commit()
+        engine = db.get_bind()
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert client.delete("/channels/2", headers=auth(1)).status_code == 204
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert not [sql for sql in statements if "messages" in sql or sql.startswith("DELETE")]
+
+    assert client.get("/channels/2", headers=auth(1)).status_code == 404
+    assert client.get("/messages/channels/2/messages", headers=auth(1)).status_code == 404
+    assert [channel["id"] for channel in client.get("/servers/1/channels", headers=auth(1)).json()] == [1]
+
+    assert client.delete("/servers/1", headers=auth(1)).status_code == 204
+    assert client.get("/servers/1", headers=auth(2)).status_code == 404
+    assert client.get("/channels/1", headers=auth(2)).status_code == 404
+    assert client.get("/servers", headers=auth(2)).json() == []
+    assert client.post(f"/servers/join/{code}", headers=auth(3)).status_code == 404
+    assert client.delete("/servers/1", headers=auth(1)).status_code == 404
+    with sessions() as db:
+        assert db.query(Message).count() == 20
+        assert db.query(ServerMember).count() == 2
+
+
+def test_purge_removes_children_in_bounded_batches(sessions, tmp_path):
+    """Test the purge of a deleted server: batched DELETEs, archive files, progress and metrics."""
+    store = ArchiveStore(str(tmp_path))
+    path = store.path_for(2, 1, 5)
+    store.write(path, [{"id": 1}])
+    with sessions() as db:
+        db.add(ArchiveSegment(
+            channel_id=2, first_id=1, last_id=5, first_created_at=datetime(2025, 1, 1),
+            last_created_at=datetime(2025, 1, 1), message_count=5, path=path
+        ))
+        db.add_all([RetentionPolicy(server_id=1, archive_after_days=30), RetentionPolicy(channel_id=2)])
+        create_invite(db, 1, 1)
+        db.query(Server).filter(Server.id == 1).update({"deleted_at": datetime.utcnow()})
+        db.commit()
+        engine = db.get_bind()
+
+    purger = Purger(store, batch_size=3)
+    before = purge_rows_total.value("messages")
+    with sessions() as db:
+        assert purger.pending(db) == {"servers": 1, "channels": 2}
+        statements = []
+        listener = lambda *args: statements.append(args[2])  # noqa: E731
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            totals = purger.run_once(db)
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+
+        assert totals == {"servers": 1, "channels": 2, "messages": 20, "segments": 1, "members": 2}
+        # 10 messages per channel in batches of 3: 3 + 3 + 3 + 1, each its own statement
+        assert len([sql for sql in statements if sql.startswith("DELETE FROM messages")]) == 8
+        assert all("LIMIT" in sql for sql in statements if sql.startswith("DELETE FROM messages"))
+        for model in (Server, Channel, ServerMember, Message, ArchiveSegment, RetentionPolicy, Invite):
+            assert db.query(model).count() == 0, model
+        assert purger.pending(db) == {"servers": 0, "channels": 0}
+        assert purger.run_once(db)["channels"] == 0
+
+    assert not os.path.exists(os.path.join(str(tmp_path), path))
+    assert purge_rows_total.value("messages") - before == 20
+    assert purge_pending.value("channels") == 0
@@ -0,0 +1,105 @@
+"""Tests for token-bucket rate limiting."""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.models import Channel, Server, ServerMember, User
+from app.utils import rate_limit
+from app.utils.rate_limit import InMemoryBackend, RateLimit, RateLimiter, client_address
+
+
+@pytest.fixture
+def tight_limit(app):
+    """Shrink one of ``app``'s budgets."""
+    def apply(budget: str, burst: int):
+        app.state.limiter.limits[budget] = RateLimit(0.001, burst)
+
+    return apply
+
+
+def test_bucket_allows_burst_then_refills(monkeypatch):
+    """Test that a bucket drains after its burst and refills over time."""
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    test_limiter = RateLimiter(InMemoryBackend(), {"test": RateLimit(2.0, 3)})
+
+    async def run():
+        results = [await test_limiter.hit("test", 1) for _ in range(4)]
+        assert results[:3] == [0.0, 0.0, 0.0]
+        assert results[3] == pytest.approx(0.5)
+
+        # Other keys have their own bucket
+        assert await test_limiter.hit("test", 2) == 0.0
+
+        now[0] += 0.5
+        assert await test_limiter.hit("test", 1) == 0.0
+
+    asyncio.run(run())
+
+
+def test_idle_buckets_are_evicted(monkeypatch):
+    """Test that full buckets are dropped once the key limit is reached."""
+    now = [0.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    backend = InMemoryBackend(max_keys=10)
+    limit = RateLimit(1.0, 1)
+
+    async def run():
+        for key in range(10):
+            await backend.hit("test", key, limit)
+        now[0] += 5
+        await backend.hit("test", "new", limit)
+
+    asyncio.run(run())
+    assert len(backend._buckets) == 1
+
+
+def test_login_is_limited_per_ip(client, tight_limit):
+    """Test that repeated logins from one address get 429."""
+    tight_limit("auth", 2)
+
+    for _ in range(2):
+        response = client.post("/auth/login", data={"username": "nobody", "password": "wrongpass"})
+        assert response.status_code == 401
+
+    response = client.post("/auth/login", data={"username": "nobody", "password": "wrongpass"})
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+
+def test_limits_come_from_the_apps_settings(isolated_app):
+    """Test that each application limits by the settings it was built from."""
+    unlimited, tight = isolated_app(RATE_LIMIT_ENABLED=False), isolated_app(RATE_LIMIT_AUTH_BURST=2)
+    login = {"username": "nobody", "password": "wrongpass"}
+    unlimited_client, tight_client = TestClient(unlimited), TestClient(tight)
+    assert {unlimited_client.post("/auth/login", data=login).status_code for _ in range(25)} == {401}
+    assert [tight_client.post("/auth/login", data=login).status_code for _ in range(3)] == [401, 401, 429]
+
+    assert client_address("10.0.0.1", "203.0.113.7, 10.0.0.2") == "10.0.0.1"
+    assert client_address("10.0.0.1", "203.0.113.7, 10.0.0.2", trust_forwarded=True) == "203.0.113.7"
+
+
+def test_websocket_frames_are_limited(app, client, database, tight_limit):
+    """Test that a flooding WebSocket client is closed with code 1008."""
+    with database() as db:
+        db.add(User(id=4242, username="flooder", email="flooder@example.com", password_hash="x"))
+        db.add(Server(id=1, name="Flood", owner_id=4242))
+        db.add(ServerMember(server_id=1, user_id=4242, role="owner"))
+        db.add(Channel(id=1, server_id=1, name="general"))
+        db.commit()
+    tight_limit("ws", 2)
+    token = app.state.tokens.create_access_token({"sub": "4242"})
+
+    with client.websocket_connect(f"/ws/4242/1/1?token={token}") as websocket:
+        assert websocket.receive_json()["type"] == "hello"
+        for i in range(2):
+            websocket.send_json({"content": f"frame {i}"})
+            assert websocket.receive_json()["type"] == "message"
+
+        websocket.send_json({"content": "one too many"})
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            websocket.receive_json()
+        assert exc_info.value.code == 1008
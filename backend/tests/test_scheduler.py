@@ -0,0 +1,176 @@
+"""Tests for the background job scheduler."""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from app.metrics import scheduler_job_runs_total
+from app.models import ScheduledJob
+from app.scheduler import CronTrigger, IntervalTrigger, Scheduler
+
+
+class Clock:
+    """Settable naive UTC clock shared by schedulers in a test."""
+
+    def __init__(self):
+        self.now = datetime(2026, 1, 5, 12, 0)
+
+    def __call__(self) -> datetime:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += timedelta(seconds=seconds)
+
+
+def make_scheduler(node_id: str, clock: Clock, **kwargs) -> Scheduler:
+    return Scheduler(node_id=node_id, clock=clock, poll_seconds=0, lease_seconds=30, retry_seconds=60, **kwargs)
+
+
+def test_cron_trigger_next_times():
+    """Test steps, ranges, lists and the day-or-weekday rule of cron expressions."""
+    start = datetime(2026, 1, 5, 12, 7, 30)  # a Monday
+    assert CronTrigger("*/15 * * * *").next_after(start) == datetime(2026, 1, 5, 12, 15)
+    assert CronTrigger("30 3 * * *").next_after(start) == datetime(2026, 1, 6, 3, 30)
+    assert CronTrigger("0 9-17/4 * * 1-5").next_after(start) == datetime(2026, 1, 5, 13, 0)
+    assert CronTrigger("0 0 * * 0").next_after(start) == datetime(2026, 1, 11, 0, 0)
+    assert CronTrigger("0 0 * * 7").next_after(start) == datetime(2026, 1, 11, 0, 0)
+    assert CronTrigger("0 0 1,15 2 *").next_after(start) == datetime(2026, 2, 1, 0, 0)
+    # Day 13 or any Friday, whichever comes first
+    assert CronTrigger("0 0 13 * 5").next_after(start) == datetime(2026, 1, 9, 0, 0)
+    assert CronTrigger("0 0 29 2 *").next_after(start) == datetime(2028, 2, 29, 0, 0)
+    assert str(IntervalTrigger(90)) == "every 90s"
+    for bad in ("* * * *", "60 * * * *", "* * 0 * *"):
+        try:
+            CronTrigger(bad)
+        except ValueError:
+            continue
+        raise AssertionError(bad)
+
+
+def test_only_the_leader_runs_cluster_jobs_and_a_follower_takes_over(session_factory):
+    """Test that a cluster job runs once per due time across workers, and after the leader leaves."""
+    clock = Clock()
+    runs = []
+    workers = [make_scheduler(name, clock) for name in ("a", "b")]
+    for worker in workers:
+        worker.add_job("purge", lambda name=worker.node_id: runs.append(name), IntervalTrigger(60))
+        worker._session_factory = session_factory
+    a, b = workers
+
+    async def scenario():
+        for _ in range(3):
+            for worker in workers:
+                await worker.tick()
+                await worker.wait()
+            clock.advance(61)
+        leader = (a.is_leader, b.is_leader)
+        await a.stop()
+        await b.tick()
+        await b.wait()
+        return leader
+
+    assert asyncio.run(scenario()) == (True, False)
+    # Registered at the first tick, then due at the second, third and fourth
+    assert runs == ["a", "a", "b"]
+    assert b.is_leader
+    with session_factory() as db:
+        job = db.query(ScheduledJob).one()
+        assert (job.last_status, job.locked_by, job.attempts, job.trigger) == ("ok", None, 0, "every 60s")
+
+
+def test_unfinished_run_is_claimed_again_after_its_lock_expires(session_factory):
+    """Test at-least-once execution: a run whose worker died is retried elsewhere."""
+    clock = Clock()
+    hung = asyncio.Event()
+    runs = []
+
+    async def job_a():
+        runs.append("a")
+        await hung.wait()
+
+    a = make_scheduler("a", clock)
+    b = make_scheduler("b", clock)
+    a.add_job("archive", job_a, IntervalTrigger(60))
+    b.add_job("archive", lambda: runs.append("b"), IntervalTrigger(60))
+    a._session_factory = b._session_factory = session_factory
+
+    async def scenario():
+        await a.tick()
+        clock.advance(61)
+        tasks = await a.tick()
+        await asyncio.sleep(0)
+        # Worker "a" dies mid-run: no finish, no resignation
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        clock.advance(10)
+        assert await b.tick() == []
+        clock.advance(30)
+        await b.tick()
+        await b.wait()
+
+    asyncio.run(scenario())
+    assert runs == ["a", "b"]
+    with session_factory() as db:
+        job = db.query(ScheduledJob).one()
+        assert (job.last_status, job.locked_by, job.attempts) == ("ok", None, 0)
+
+
+def test_failed_run_is_retried_and_recorded(session_factory):
+    """Test that a failing job records its error and runs again after the retry delay."""
+    clock = Clock()
+    calls = []
+
+    def flaky():
+        calls.append(clock.now)
+        if len(calls) == 1:
+            raise RuntimeError("disk full")
+
+    scheduler = make_scheduler("a", clock)
+    scheduler.add_job("flaky", flaky, IntervalTrigger(3600))
+    scheduler._session_factory = session_factory
+    before = scheduler_job_runs_total.value("flaky", "failed")
+
+    async def scenario():
+        for step in (0, 3601, 30, 31):
+            clock.advance(step)
+            await scheduler.tick()
+            await scheduler.wait()
+            if step == 3601:
+                with session_factory() as db:
+                    job = db.query(ScheduledJob).one()
+                    assert (job.last_status, job.last_error, job.attempts) == ("failed", "RuntimeError: disk full", 1)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2 and calls[1] - calls[0] == timedelta(seconds=61)
+    assert scheduler_job_runs_total.value("flaky", "failed") - before == 1
+
+
+def test_jobs_of_one_kind_share_a_concurrency_limit():
+    """Test that jobs of a kind never exceed its limit, while other kinds run alongside."""
+    clock = Clock()
+    running = {"maintenance": 0, "other": 0}
+    peak = {"maintenance": 0, "other": 0}
+
+    def job(kind):
+        async def run():
+            running[kind] += 1
+            peak[kind] = max(peak[kind], running[kind])
+            await asyncio.sleep(0.01)
+            running[kind] -= 1
+        return run
+
+    scheduler = make_scheduler("a", clock, limits={"maintenance": 1}, default_limit=2)
+    for i in range(3):
+        scheduler.add_job(f"maintenance-{i}", job("maintenance"), IntervalTrigger(1), kind="maintenance", cluster=False)
+        scheduler.add_job(f"other-{i}", job("other"), IntervalTrigger(1), kind="other", cluster=False)
+
+    async def scenario():
+        await scheduler.tick()
+        clock.advance(1)
+        started = await scheduler.tick()
+        await scheduler.wait()
+        return started
+
+    assert len(asyncio.run(scenario())) == 6
+    assert peak == {"maintenance": 1, "other": 2}
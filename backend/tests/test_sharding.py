@@ -0,0 +1,145 @@
+"""Tests for message sharding by channel."""
+
+from datetime import datetime, timedelta
+
+import orjson
+import pytest
+
+from app.archive import ArchiveStore, Archiver
+from app.purge import Purger
+from app.models import ArchiveSegment, Channel, Message, Server, ServerMember, User
+from app.sharding import ShardRouter, jump_hash, rebalance
+
+CHANNELS = range(1, 9)
+
+
+def shard_router(tmp_path, count: int) -> ShardRouter:
+    router = ShardRouter([f"sqlite:///{tmp_path}/shard{i}.db" for i in range(count)])
+    router.create_all()
+    return router
+
+
+@pytest.fixture
+def sharded(app, database, tmp_path):
+    """Primary database with one server of 8 channels, and 3 message shards."""
+    with database() as db:
+        db.add(User(id=1, username="sharder", email="sharder@example.com", password_hash="x"))
+        db.add(Server(id=1, name="Sharded", owner_id=1))
+        db.add(ServerMember(server_id=1, user_id=1, role="owner"))
+        db.add_all([Channel(id=channel_id, server_id=1, name=f"c{channel_id}") for channel_id in CHANNELS])
+        db.commit()
+    router = shard_router(tmp_path, 3)
+    app.state.shards = router
+    yield database, router
+    router.dispose()
+
+
+def shard_messages(router: ShardRouter, index: int) -> list:
+    with router._session_factories[index]() as db:
+        return [(message.channel_id, message.content) for message in db.query(Message).order_by(Message.id)]
+
+
+def test_jump_hash_moves_only_keys_for_the_new_bucket():
+    """Test that growing from 3 to 4 buckets moves about a quarter of the keys, all to bucket 3."""
+    moved = [key for key in range(10_000) if jump_hash(key, 3) != jump_hash(key, 4)]
+    assert all(jump_hash(key, 4) == 3 for key in moved)
+    assert 2_200 < len(moved) < 2_800
+    assert {jump_hash(key, 3) for key in range(100)} == {0, 1, 2}
+
+
+def test_messages_live_on_their_channel_shard(client, sharded, auth):
+    """Test that every message endpoint reads and writes the channel's shard only."""
+    factory, router = sharded
+    sent = {}
+    # One message per channel keeps within the send_message burst
+    for channel_id in CHANNELS:
+        response = client.post(
+            f"/messages/channels/{channel_id}/messages", json={"content": f"{channel_id}-0"}, headers=auth(1)
+        )
+        assert response.status_code == 201
+        assert response.json()["user"]["username"] == "sharder"
+        sent[response.json()["id"]] = channel_id
+
+    with factory() as db:
+        assert db.query(Message).count() == 0
+    for index in range(3):
+        assert shard_messages(router, index) == [
+            (channel_id, f"{channel_id}-0") for channel_id in CHANNELS if router.shard_for(channel_id) == index
+        ]
+
+    history = client.get("/messages/channels/5/messages", headers=auth(1)).json()
+    assert [message["content"] for message in history] == ["5-0"]
+    assert history[0]["user"]["username"] == "sharder"
+
+    message_id = next(message_id for message_id, channel_id in sent.items() if channel_id == 7)
+    assert client.get(f"/messages/messages/{message_id}", headers=auth(1)).json()["content"] == "7-0"
+    response = client.patch(f"/messages/messages/{message_id}", json={"content": "edited"}, headers=auth(1))
+    assert response.json()["is_edited"] is True
+    assert (7, "edited") in shard_messages(router, router.shard_for(7))
+    assert client.delete(f"/messages/messages/{message_id}", headers=auth(1)).status_code == 204
+    assert client.get(f"/messages/messages/{message_id}", headers=auth(1)).status_code == 404
+
+    export = client.get("/channels/3/export", headers=auth(1))
+    assert [orjson.loads(line)["content"] for line in export.content.splitlines()] == ["3-0"]
+
+    assert client.delete("/channels/3", headers=auth(1)).status_code == 204
+    assert (3, "3-0") in shard_messages(router, router.shard_for(3))
+    with factory() as db:
+        Purger(ArchiveStore("unused"), shard_router=router).run_once(db)
+    assert all(channel_id != 3 for channel_id, _ in shard_messages(router, router.shard_for(3)))
+
+
+def test_archiver_and_history_use_the_shard(app, client, sharded, auth, tmp_path):
+    """Test that retention passes archive on the shard and history reads the segments back."""
+    factory, router = sharded
+    store = ArchiveStore(str(tmp_path / "archive"))
+    app.state.store = store
+    with router.session(2, None) as db:
+        db.add_all([
+            Message(channel_id=2, user_id=1, content=f"old {i}", created_at=datetime(2025, 1, 1 + i))
+            for i in range(3)
+        ])
+        db.commit()
+
+    with factory() as db:
+        totals = Archiver(store, archive_after_days=30, shard_router=router).run_once(
+            db, now=datetime(2025, 1, 1) + timedelta(days=60)
+        )
+    assert totals == {"archived": 3, "deleted": 0}
+    with router.session(2, None) as db:
+        assert db.query(Message).count() == 0
+        assert db.query(ArchiveSegment).one().message_count == 3
+
+    history = client.get("/messages/channels/2/messages", headers=auth(1)).json()
+    assert [message["content"] for message in history] == ["old 0", "old 1", "old 2"]
+    assert history[0]["user"]["username"] == "sharder"
+
+
+def test_rebalance_moves_channels_to_an_added_shard(tmp_path):
+    """Test growing from 2 to 3 shards, and that a repeated run copies nothing."""
+    old = shard_router(tmp_path, 2)
+    for channel_id in CHANNELS:
+        with old.session(channel_id, None) as db:
+            db.add_all([Message(channel_id=channel_id, user_id=1, content=f"{channel_id}-{i}") for i in range(3)])
+            db.add(ArchiveSegment(
+                channel_id=channel_id, first_id=1, last_id=2, first_created_at=datetime(2025, 1, 1),
+                last_created_at=datetime(2025, 1, 1), message_count=2, path=f"{channel_id}/segment.ndjson.gz"
+            ))
+            db.commit()
+    new = shard_router(tmp_path, 3)
+    expected = [channel_id for channel_id in CHANNELS if new.shard_for(channel_id) == 2]
+    assert expected and all(old.shard_for(channel_id) != 2 for channel_id in CHANNELS)
+
+    moved = rebalance(old, new, CHANNELS, batch_size=2)
+
+    assert moved == {"channels": len(expected), "messages": 3 * len(expected), "segments": len(expected)}
+    for channel_id in CHANNELS:
+        with new.session(channel_id, None) as db:
+            assert db.query(Message).filter(Message.channel_id == channel_id).count() == 3
+            assert db.query(ArchiveSegment).filter(ArchiveSegment.channel_id == channel_id).count() == 1
+    assert sum(len(shard_messages(new, index)) for index in range(3)) == 3 * len(CHANNELS)
+
+    again = rebalance(old, new, CHANNELS)
+    assert again["messages"] == 0 and again["segments"] == 0
+    old.dispose()
+    new.dispose()
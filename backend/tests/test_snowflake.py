@@ -0,0 +1,100 @@
+"""Tests for snowflake message ids."""
+
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils.snowflake import (
+    EPOCH_MS,
+    MAX_SEQUENCE,
+    SnowflakeGenerator,
+    default_worker_id,
+    snowflake_at,
+    snowflake_time,
+)
+
+from .test_messages import get_auth_token
+
+
+class FakeClock:
+    def __init__(self, ms: int):
+        self.ms = ms
+
+    def __call__(self) -> float:
+        return self.ms / 1000
+
+
+def test_ids_encode_time_worker_and_sequence():
+    """Test the bit layout and reading the time back."""
+    clock = FakeClock(EPOCH_MS + 1_000)
+    generator = SnowflakeGenerator(worker_id=5, clock=clock)
+    first, second = generator.next_id(), generator.next_id()
+
+    assert second == first + 1
+    assert first >> 22 == 1_000
+    assert (first >> 12) & 0x3FF == 5
+    assert snowflake_time(first) == datetime(2015, 1, 1, 0, 0, 1)
+    assert snowflake_at(datetime(2015, 1, 1, 0, 0, 1)) <= first < snowflake_at(datetime(2015, 1, 1, 0, 0, 1, 1000))
+
+
+def test_ids_keep_increasing_when_clock_stalls_or_steps_back():
+    """Test sequence exhaustion and a backwards clock never repeat an id."""
+    clock = FakeClock(EPOCH_MS + 10_000)
+    generator = SnowflakeGenerator(worker_id=1, clock=clock)
+    ids = [generator.next_id() for _ in range(MAX_SEQUENCE + 3)]
+    # The 4097th id in one millisecond borrows the next one
+    assert ids[MAX_SEQUENCE + 1] >> 22 == 10_001
+
+    clock.ms -= 5_000
+    ids.append(generator.next_id())
+    assert ids == sorted(set(ids))
+
+
+def test_ids_are_unique_across_threads():
+    """Test that concurrent callers never share an id."""
+    generator = SnowflakeGenerator(worker_id=2)
+    results = []
+
+    def allocate():
+        results.extend(generator.next_id() for _ in range(5000))
+
+    threads = [threading.Thread(target=allocate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(results)) == 20_000
+
+
+def test_worker_ids():
+    """Test explicit and derived worker ids."""
+    assert default_worker_id(SimpleNamespace(SNOWFLAKE_WORKER_ID=42, SNOWFLAKE_NODE_ID=3)) == 42
+    assert default_worker_id(SimpleNamespace(SNOWFLAKE_WORKER_ID=-1, SNOWFLAKE_NODE_ID=3), pid=100) == 3 << 5 | 4
+    with pytest.raises(ValueError):
+        SnowflakeGenerator(worker_id=1023)
+
+
+def test_history_cursor_pagination(client):
+    """Test that ids order history and ``before`` pages through it."""
+    headers = {"Authorization": f"Bearer {get_auth_token(client)}"}
+    server_id = client.post("/servers", json={"name": "Cursor"}, headers=headers).json()["id"]
+    channel_id = client.get(f"/servers/{server_id}/channels", headers=headers).json()[0]["id"]
+    sent = [
+        client.post(
+            f"/messages/channels/{channel_id}/messages", json={"content": f"c{i}"}, headers=headers
+        ).json()
+        for i in range(5)
+    ]
+    assert [message["id"] for message in sent] == sorted(message["id"] for message in sent)
+    assert sent[0]["id"] > 2 ** 40
+    assert snowflake_time(sent[0]["id"]).isoformat(timespec="milliseconds") == sent[0]["created_at"][:23]
+
+    url = f"/messages/channels/{channel_id}/messages"
+    newest = client.get(url, params={"limit": 2}, headers=headers).json()
+    assert [message["content"] for message in newest] == ["c3", "c4"]
+    older = client.get(url, params={"limit": 2, "before": newest[0]["id"]}, headers=headers).json()
+    assert [message["content"] for message in older] == ["c1", "c2"]
+    oldest = client.get(url, params={"limit": 2, "before": older[0]["id"]}, headers=headers).json()
+    assert [message["content"] for message in oldest] == ["c0"]
@@ -0,0 +1,99 @@
+"""Tests for application startup: the app factory, schema version stamp, lazy imports and profile."""
+
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, event, inspect
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base, ensure_schema, schema_fingerprint
+from app.models import User
+from benchmarks.bench_startup import group_imports, parse_importtime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_apps_built_by_the_factory_share_no_state(isolated_app):
+    """Test that two applications have their own database, sessions, caches and connection manager."""
+    first, second = isolated_app(), isolated_app(COMPRESSION_ENABLED=False, SECRET_KEY="second-secret")
+    names = (
+        "engine", "session_factory", "shards", "store", "attachments", "thumbnails", "revocations", "tokens",
+        "permissions", "limiter", "manager", "drain", "scheduler"
+    )
+    for name in names:
+        assert getattr(first.state, name) is not getattr(second.state, name), name
+    assert second.state.settings.COMPRESSION_ENABLED is False
+    # Each signs with its own key
+    token = first.state.tokens.create_access_token({"sub": "1"})
+    assert first.state.tokens.decode_access_token(token)["sub"] == "1"
+    assert second.state.tokens.decode_access_token(token) is None
+
+    user = {"username": "factory", "email": "factory@example.com", "password": "factorypass1"}
+    assert TestClient(first).post("/auth/register", json=user).status_code == 201
+    assert TestClient(second).post("/auth/login", data=user).status_code == 401
+    assert TestClient(second).post("/auth/register", json=user).status_code == 201
+    with first.state.session_factory() as db:
+        assert db.query(User).count() == 1
+    assert TestClient(second).get("/health").json()["status"] == "healthy"
+
+
+def test_schema_check_is_skipped_once_stamped():
+    """Test that a stamped database costs one query, and that a model change runs create_all again."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    assert ensure_schema(engine, Base.metadata) is True
+    assert "messages" in inspect(engine).get_table_names()
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert ensure_schema(engine, Base.metadata) is False
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert len(statements) == 1 and "schema_version" in statements[0]
+
+    changed = MetaData()
+    for table in Base.metadata.sorted_tables:
+        table.to_metadata(changed)
+    Table("reactions", changed, Column("id", Integer, primary_key=True))
+    assert schema_fingerprint(changed) != schema_fingerprint(Base.metadata)
+    assert ensure_schema(engine, changed) is True
+    assert "reactions" in inspect(engine).get_table_names()
+    # Another metadata keeps its own stamp in the same database
+    assert ensure_schema(engine, MetaData(), "shard") is True
+    assert ensure_schema(engine, changed) is False
+
+
+def test_jose_is_imported_with_the_first_token():
+    """Test that importing the app leaves python-jose's JWT module unloaded until a token is made."""
+    script = (
+        "import sys\n"
+        "import app.main\n"
+        "loaded = 'jose.jwt' in sys.modules\n"
+        "tokens = app.main.app.state.tokens\n"
+        "payload = tokens.decode_access_token(tokens.create_access_token({'sub': '1'}))\n"
+        "print(loaded, 'jose.jwt' in sys.modules, payload['sub'])\n"
+    )
+    env = dict(os.environ, JWT_BACKEND="jose", DATABASE_URL="sqlite://", SCHEDULER_TICK_SECONDS="0")
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    assert result.stdout.split() == ["False", "True", "1"]
+
+
+def test_import_breakdown_groups_by_package():
+    """Test parsing of -X importtime output into package and app module totals."""
+    output = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:      1500 |       1500 |     sqlalchemy.sql",
+        "import time:       500 |       2000 |   sqlalchemy",
+        "import time:      3000 |       3000 |     app.schemas",
+        "import time:      1000 |       6000 | app.main",
+        "some other stderr line",
+    ])
+    modules = parse_importtime(output)
+    assert modules == {"sqlalchemy.sql": 1.5, "sqlalchemy": 0.5, "app.schemas": 3.0, "app.main": 1.0}
+    report = group_imports(modules, top=1)
+    assert report == {"total": 6.0, "by_package": {"app": 4.0}, "app_modules": {"app.schemas": 3.0}}
@@ -0,0 +1,378 @@
+"""Tests for resumable WebSocket sessions."""
+
+import asyncio
+
+from app.models import Channel, Server, ServerMember, User
+from app.websocket.heartbeat import TimerWheel
+from app.websocket.manager import HEARTBEAT_TIMEOUT_CLOSE_CODE, ConnectionManager
+from app.websocket.registry import Connection, ConnectionRegistry
+
+
+class FakeWebSocket:
+    """In-memory WebSocket that records sent frames."""
+
+    def __init__(self):
+        self.sent = []
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message: dict):
+        self.sent.append(message)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.close_code = code
+
+
+class BrokenWebSocket(FakeWebSocket):
+    """WebSocket whose peer is gone: every send fails."""
+
+    async def send_json(self, message: dict):
+        if message["type"] != "hello":
+            raise ConnectionResetError("peer gone")
+        await super().send_json(message)
+
+
+def test_resume_replays_only_missed_events():
+    """Test that a reconnect with session_id and last_seq gets the gap only."""
+    async def scenario():
+        manager = ConnectionManager(replay_buffer_size=10)
+        first = FakeWebSocket()
+        session_id = await manager.connect(first, 1, 1, 1)
+        await manager.broadcast({"type": "message", "data": {"n": 1}}, 1)
+        last_seq = first.sent[-1]["seq"]
+        manager.disconnect(first, 1, 1, 1, session_id=session_id)
+
+        await manager.broadcast({"type": "message", "data": {"n": 2}}, 1)
+        await manager.broadcast({"type": "user_join", "data": {"user_id": 1}}, 1, exclude_user=1)
+        await manager.broadcast({"type": "message", "data": {"n": 3}}, 1)
+
+        second = FakeWebSocket()
+        resumed_id = await manager.connect(second, 1, 1, 1, session_id=session_id, last_seq=last_seq)
+        return session_id, resumed_id, second.sent
+
+    session_id, resumed_id, sent = asyncio.run(scenario())
+
+    assert resumed_id == session_id
+    assert sent[0]["type"] == "hello"
+    assert sent[0]["data"]["resumed"] is True
+    assert [frame["data"].get("n") for frame in sent[1:]] == [2, 3]
+    assert [frame["seq"] for frame in sent[1:]] == [2, 4]
+
+
+def test_resume_past_buffer_requires_resync():
+    """Test that a gap larger than the replay ring falls back to resync."""
+    async def scenario():
+        manager = ConnectionManager(replay_buffer_size=2)
+        first = FakeWebSocket()
+        session_id = await manager.connect(first, 1, 1, 1)
+        manager.disconnect(first, 1, 1, 1, session_id=session_id)
+        for n in range(5):
+            await manager.broadcast({"type": "message", "data": {"n": n}}, 1)
+
+        second = FakeWebSocket()
+        await manager.connect(second, 1, 1, 1, session_id=session_id, last_seq=0)
+        return second.sent
+
+    sent = asyncio.run(scenario())
+
+    assert [frame["type"] for frame in sent] == ["hello", "resync_required"]
+    assert sent[0]["data"]["resumed"] is False
+    assert sent[1]["data"]["seq"] == 5
+
+
+def test_unknown_session_gets_new_session():
+    """Test that a stale session id (e.g. after a restart) starts fresh."""
+    async def scenario():
+        manager = ConnectionManager()
+        socket = FakeWebSocket()
+        session_id = await manager.connect(socket, 1, 1, 1, session_id="stale", last_seq=42)
+        return session_id, socket.sent
+
+    session_id, sent = asyncio.run(scenario())
+
+    assert session_id != "stale"
+    assert sent[0]["data"]["session_id"] == session_id
+    assert sent[1]["type"] == "resync_required"
+
+
+def test_idle_channels_drop_their_buffer_and_sequence():
+    """Test that a channel nobody is connected to or can resume in keeps no state."""
+    async def scenario():
+        manager = ConnectionManager(session_ttl=60)
+        first, second = FakeWebSocket(), FakeWebSocket()
+        session_id = await manager.connect(first, 1, 1, 1)
+        await manager.connect(second, 2, 1, 2)
+        for channel_id in (1, 2):
+            await manager.broadcast({"type": "message", "data": {}}, channel_id)
+        manager.disconnect(first, 1, 1, 1, session_id=session_id)
+
+        # The session outlives the socket, then expires
+        await manager.connect(FakeWebSocket(), 3, 1, 3)
+        kept = 1 in manager.channel_seq
+        manager.sessions[session_id].expires_at = 0
+        manager._next_sweep = 0
+        await manager.connect(FakeWebSocket(), 4, 1, 3)
+        return manager, kept
+
+    manager, kept = asyncio.run(scenario())
+
+    assert kept
+    assert 1 not in manager.channel_seq and 1 not in manager.replay_buffers
+    assert manager.channel_seq[2] == 1
+
+
+def test_heartbeat_expires_sessions_when_nobody_reconnects():
+    """Test that an expired session's buffer is dropped by the heartbeat tick, and by the sweep job without one."""
+    async def scenario(sweep):
+        manager = ConnectionManager(session_ttl=60)
+        socket = FakeWebSocket()
+        session_id = await manager.connect(socket, 1, 1, 1)
+        await manager.broadcast({"type": "message", "data": {}}, 1)
+        manager.disconnect(socket, 1, 1, 1, session_id=session_id)
+        manager.sessions[session_id].expires_at = 0
+        manager._next_sweep = 0
+        await sweep(manager)
+        return manager
+
+    for sweep in (lambda manager: manager.heartbeat_tick_once(), lambda manager: manager.expire_sessions()):
+        manager = asyncio.run(scenario(sweep))
+        assert not manager.sessions
+        assert 1 not in manager.channel_seq and 1 not in manager.replay_buffers
+
+
+def test_sessions_are_swept_by_the_scheduler_only_without_a_heartbeat(isolated_app):
+    """Test that the local sweep job is registered only when the heartbeat tick is off."""
+    assert "ws_session_sweep" not in isolated_app(WS_HEARTBEAT_INTERVAL_SECONDS=30).state.scheduler.jobs
+    jobs = isolated_app(WS_HEARTBEAT_INTERVAL_SECONDS=0).state.scheduler.jobs
+    assert not jobs["ws_session_sweep"].cluster
+
+
+def test_websocket_endpoint_sends_hello_and_sequenced_events(app, client, database):
+    """Test the hello frame and seq stamping through the real endpoint."""
+    with database() as db:
+        db.add(User(id=901, username="socket", email="socket@example.com", password_hash="x"))
+        db.add(Server(id=1, name="Sockets", owner_id=901))
+        db.add(ServerMember(server_id=1, user_id=901, role="owner"))
+        db.add(Channel(id=9001, server_id=1, name="general"))
+        db.commit()
+    token = app.state.tokens.create_access_token({"sub": "901"})
+
+    with client.websocket_connect(f"/ws/901/1/9001?token={token}") as websocket:
+        hello = websocket.receive_json()
+        assert hello["type"] == "hello"
+        session_id = hello["data"]["session_id"]
+
+        websocket.send_json({"content": "hi"})
+        event = websocket.receive_json()
+        assert event["type"] == "message"
+        # seq hello+1 is our own (excluded) user_join
+        assert event["seq"] == hello["data"]["seq"] + 2
+
+    # Reconnect right away: nothing was missed except our own user_leave
+    with client.websocket_connect(
+        f"/ws/901/1/9001?token={token}&session_id={session_id}&last_seq={event['seq']}"
+    ) as websocket:
+        hello = websocket.receive_json()
+        assert hello["data"]["session_id"] == session_id
+        assert hello["data"]["resumed"] is True
+
+
+def test_server_broadcast_reaches_each_member_once():
+    """Test that server events are deduplicated across a user's open channels."""
+    async def scenario():
+        manager = ConnectionManager()
+        sockets = {key: FakeWebSocket() for key in [(1, 10), (1, 11), (2, 10), (3, 12)]}
+        for (user_id, channel_id), websocket in sockets.items():
+            await manager.connect(websocket, user_id, 1, channel_id)
+        other_server = FakeWebSocket()
+        await manager.connect(other_server, 4, 2, 20)
+
+        delivered = await manager.broadcast_to_server({"type": "server_update", "data": {"id": 1}}, 1)
+        excluded = await manager.broadcast_to_server({"type": "server_delete", "data": {"id": 1}}, 1, exclude_user=2)
+        return delivered, excluded, sockets, other_server
+
+    delivered, excluded, sockets, other_server = asyncio.run(scenario())
+
+    def events(websocket):
+        return [frame["type"] for frame in websocket.sent if frame["type"].startswith("server_")]
+
+    assert delivered == 3
+    assert excluded == 2
+    assert len(events(sockets[(1, 10)])) + len(events(sockets[(1, 11)])) == 2
+    assert events(sockets[(2, 10)]) == ["server_update"]
+    assert events(sockets[(3, 12)]) == ["server_update", "server_delete"]
+    assert events(other_server) == []
+    # Server events are not sequenced into any channel
+    assert all("seq" not in frame for frame in sockets[(3, 12)].sent[1:])
+
+
+def test_channel_routes_push_delta_events(client):
+    """Test that channel mutations reach connected server members."""
+    client.post(
+        "/auth/register",
+        json={"username": "wsdelta", "email": "wsdelta@example.com", "password": "testpass123"}
+    )
+    token = client.post(
+        "/auth/login", data={"username": "wsdelta", "password": "testpass123"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    server_id = client.post("/servers", json={"name": "Delta"}, headers=headers).json()["id"]
+    general_id = client.get(f"/servers/{server_id}/channels", headers=headers).json()[0]["id"]
+
+    with client.websocket_connect(f"/ws/{user_id}/{server_id}/{general_id}?token={token}") as websocket:
+        assert websocket.receive_json()["type"] == "hello"
+
+        created = client.post(
+            f"/servers/{server_id}/channels", json={"name": "random"}, headers=headers
+        ).json()
+        event = websocket.receive_json()
+        assert event["type"] == "channel_create"
+        assert event["data"]["id"] == created["id"]
+        assert event["data"]["name"] == "random"
+
+        client.patch(f"/channels/{created['id']}", json={"name": "renamed"}, headers=headers)
+        event = websocket.receive_json()
+        assert event == {
+            "type": "channel_update",
+            "data": {"id": created["id"], "server_id": server_id, "name": "renamed"}
+        }
+
+        client.delete(f"/channels/{created['id']}", headers=headers)
+        event = websocket.receive_json()
+        assert event == {"type": "channel_delete", "data": {"id": created["id"], "server_id": server_id}}
+
+
+def test_timer_wheel_visits_each_key_once_per_revolution():
+    """Test that every key is due exactly once per full turn."""
+    wheel = TimerWheel(4)
+    for key in range(10):
+        wheel.add(key)
+    wheel.add(3)
+    wheel.discard(7)
+
+    visited = [key for _ in range(4) for key in wheel.advance()]
+
+    assert sorted(visited) == [0, 1, 2, 3, 4, 5, 6, 8, 9]
+    assert len(wheel) == 9
+
+
+def test_heartbeat_pings_live_sockets_and_reaps_silent_ones():
+    """Test that silent sockets are reaped through the user_leave path."""
+    async def scenario():
+        manager = ConnectionManager(heartbeat_interval=4, heartbeat_timeout=2, heartbeat_tick=1)
+        alive, dead = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(alive, 1, 1, 1)
+        await manager.connect(dead, 2, 1, 1)
+
+        now = manager.registry.get(1, 1).last_seen + 10
+        manager.registry.get(1, 1).last_seen = now
+        reaped = 0
+        for _ in range(4):
+            reaped += await manager.heartbeat_tick_once(now=now)
+        return manager, alive, dead, reaped
+
+    manager, alive, dead, reaped = asyncio.run(scenario())
+
+    assert reaped == 1
+    assert dead.close_code == HEARTBEAT_TIMEOUT_CLOSE_CODE
+    assert manager.get_channel_users(1) == [1]
+    assert not manager.is_user_online(2)
+    assert any(frame["type"] == "ping" for frame in alive.sent)
+    leaves = [frame["data"] for frame in alive.sent if frame["type"] == "user_leave"]
+    assert leaves == [{"user_id": 2, "channel_id": 1}]
+
+
+def test_failed_sends_are_reaped_without_a_heartbeat_task():
+    """Test that a socket a broadcast failed on leaves at once without heartbeats, and is queued once with them."""
+    async def scenario():
+        manager = ConnectionManager(heartbeat_interval=0)
+        alive, dead = FakeWebSocket(), BrokenWebSocket()
+        await manager.connect(alive, 1, 1, 1)
+        await manager.connect(dead, 2, 1, 1)
+        await manager.broadcast({"type": "message", "data": {}}, 1)
+        without_heartbeat = (manager.get_channel_users(1), len(manager._reap_queue), dead.close_code)
+
+        # The heartbeat task reaps on its own schedule, so failures just queue, once per socket
+        manager = ConnectionManager(heartbeat_interval=3600)
+        await manager.connect(FakeWebSocket(), 1, 1, 1)
+        await manager.connect(BrokenWebSocket(), 2, 1, 1)
+        manager.start_heartbeat()
+        for _ in range(3):
+            await manager.broadcast({"type": "message", "data": {}}, 1)
+            await manager.broadcast_to_server({"type": "server_update", "data": {}}, 1)
+        queued = len(manager._reap_queue)
+        await manager.stop_heartbeat()
+        return alive, without_heartbeat, queued
+
+    alive, without_heartbeat, queued = asyncio.run(scenario())
+
+    assert without_heartbeat == ([1], 0, HEARTBEAT_TIMEOUT_CLOSE_CODE)
+    assert [frame["data"] for frame in alive.sent if frame["type"] == "user_leave"] == [
+        {"user_id": 2, "channel_id": 1}
+    ]
+    assert queued == 1
+
+
+def test_reaper_drops_in_batches():
+    """Test that at most reap_batch_size sockets are dropped per tick."""
+    async def scenario():
+        manager = ConnectionManager(heartbeat_interval=1, heartbeat_tick=1, reap_batch_size=2)
+        for user_id in range(1, 6):
+            await manager.connect(FakeWebSocket(), user_id, 1, 1)
+        now = time_after(manager, 60)
+        return [await manager.heartbeat_tick_once(now=now) for _ in range(3)]
+
+    assert asyncio.run(scenario()) == [2, 2, 1]
+
+
+def test_leave_ignores_replaced_socket():
+    """Test that a stale socket's leave doesn't remove its replacement."""
+    async def scenario():
+        manager = ConnectionManager()
+        old, new = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(old, 1, 1, 1)
+        await manager.connect(new, 1, 1, 1)
+        removed = await manager.leave(old, 1, 1, 1)
+        return manager, removed
+
+    manager, removed = asyncio.run(scenario())
+
+    assert removed is False
+    assert manager.is_user_online(1)
+
+
+def test_registry_indexes_by_channel_user_and_server():
+    """Test O(1) add/replace/remove across the channel, user and server indexes."""
+    registry = ConnectionRegistry()
+    a = Connection(object(), user_id=1, server_id=10, channel_id=100)
+    b = Connection(object(), user_id=1, server_id=10, channel_id=101)
+    c = Connection(object(), user_id=2, server_id=20, channel_id=200)
+    for connection in (a, b, c):
+        registry.add(connection)
+
+    assert len(registry) == 3
+    assert set(registry.for_user(1)) == {a, b}
+    assert set(registry.for_server(10)) == {a, b}
+    assert list(registry.in_channel(200).values()) == [c]
+
+    # Same user and channel: the new socket replaces the old one
+    a2 = Connection(object(), user_id=1, server_id=10, channel_id=100)
+    assert registry.add(a2) is a
+    assert registry.remove(a) is False
+    assert set(registry.for_user(1)) == {a2, b}
+    assert len(registry) == 3
+
+    assert registry.remove(b) is True
+    assert registry.remove(a2) is True
+    assert not registry.has_user(1)
+    assert list(registry.for_server(10)) == []
+    assert 100 not in registry.channels
+    assert len(registry) == 1
+
+
+def time_after(manager: ConnectionManager, seconds: float) -> float:
+    """Monotonic time ``seconds`` after the newest connection was seen."""
+    return max(connection.last_seen for connection in manager.registry) + seconds
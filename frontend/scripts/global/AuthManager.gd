@@ -6,8 +6,13 @@ extends Node
 # User data
 var current_user: Dictionary = {}
 var auth_token: String = ""
+var refresh_token: String = ""
 var is_authenticated: bool = false
 
+# Access tokens are short-lived; renew this long before they expire
+const REFRESH_MARGIN_SECONDS := 60.0
+var refresh_timer: Timer = null
+
 # Signals
 signal authentication_changed(authenticated: bool)
 signal user_data_updated(user_data: Dictionary)
@@ -15,19 +20,27 @@ signal user_data_updated(user_data: Dictionary)
 
 func _ready() -> void:
 	"""Initialize authentication manager."""
+	refresh_timer = Timer.new()
+	refresh_timer.one_shot = true
+	refresh_timer.timeout.connect(_refresh_tokens)
+	add_child(refresh_timer)
 	print("[AuthManager] Initialized")
 
 
-func login(token: String, user_data: Dictionary) -> void:
+func login(token: String, user_data: Dictionary, new_refresh_token: String = "", expires_in: int = 0) -> void:
 	"""Set authentication state after successful login.
 	
 	Args:
 		token: JWT authentication token
 		user_data: User profile data
+		new_refresh_token: Refresh token from the login response
+		expires_in: Access token lifetime in seconds
 	"""
 	auth_token = token
 	current_user = user_data
 	is_authenticated = true
+	refresh_token = new_refresh_token
+	_schedule_refresh(expires_in)
 	
 	print("[AuthManager] User logged in: ", user_data.get("username", "unknown"))
 	authentication_changed.emit(true)
@@ -35,8 +48,13 @@ func login(token: String, user_data: Dictionary) -> void:
 
 
 func logout() -> void:
-	"""Clear authentication state."""
+	"""Revoke the tokens on the server and clear authentication state."""
+	refresh_timer.stop()
+	if auth_token != "":
+		# Fire and forget: local state is cleared either way
+		NetworkManager.http_request("POST", "/auth/logout", {"refresh_token": refresh_token}, auth_token)
 	auth_token = ""
+	refresh_token = ""
 	current_user = {}
 	is_authenticated = false
 	
@@ -44,6 +62,33 @@ func logout() -> void:
 	authentication_changed.emit(false)
 
 
+func _schedule_refresh(expires_in: int) -> void:
+	"""Renew the access token shortly before it expires.
+	
+	Args:
+		expires_in: Access token lifetime in seconds
+	"""
+	if refresh_token == "" or expires_in <= 0:
+		return
+	refresh_timer.start(max(expires_in - REFRESH_MARGIN_SECONDS, expires_in / 2.0))
+
+
+func _refresh_tokens() -> void:
+	"""Exchange the refresh token for a new token pair."""
+	var result = await NetworkManager.http_request("POST", "/auth/refresh", {"refresh_token": refresh_token})
+	if not is_authenticated:
+		return
+	if result.success:
+		auth_token = result.data.get("access_token", "")
+		refresh_token = result.data.get("refresh_token", "")
+		_schedule_refresh(int(result.data.get("expires_in", 0)))
+		print("[AuthManager] Access token refreshed")
+	else:
+		# Refresh token expired or revoked: the session is over
+		print("[AuthManager] Token refresh failed: ", result.error)
+		logout()
+
+
 func get_token() -> String:
 	"""Get current authentication token.
 	
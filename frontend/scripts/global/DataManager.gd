@@ -27,9 +27,45 @@ signal members_updated(server_id: int, members_list: Array)
 
 func _ready() -> void:
 	"""Initialize data manager."""
+	NetworkManager.server_event.connect(_on_server_event)
 	print("[DataManager] Initialized")
 
 
+func _on_server_event(event_type: String, event_data: Dictionary) -> void:
+	"""Apply a server or channel delta pushed over the WebSocket.
+	
+	Args:
+		event_type: Event type (server_update, channel_create, ...)
+		event_data: Changed fields plus the affected IDs
+	"""
+	var id = int(event_data.get("id", -1))
+	match event_type:
+		"server_update":
+			for server in servers:
+				if server.get("id") == id:
+					server.merge(event_data, true)
+			servers_updated.emit(servers)
+		"server_delete":
+			servers = servers.filter(func(server): return server.get("id") != id)
+			if current_server_id == id:
+				current_server_id = -1
+				current_server = {}
+				channels.clear()
+				channels_updated.emit(channels)
+			servers_updated.emit(servers)
+		"channel_create":
+			if int(event_data.get("server_id", -1)) == current_server_id:
+				add_channel(event_data)
+		"channel_update":
+			for channel in channels:
+				if channel.get("id") == id:
+					channel.merge(event_data, true)
+			channels_updated.emit(channels)
+		"channel_delete":
+			channels = channels.filter(func(channel): return channel.get("id") != id)
+			channels_updated.emit(channels)
+
+
 ## Servers
 
 func set_servers(servers_list: Array) -> void:
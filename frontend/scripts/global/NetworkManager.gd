@@ -15,6 +15,17 @@ var reconnect_timer: Timer = null
 var reconnect_attempts: int = 0
 const MAX_RECONNECT_ATTEMPTS = 5
 
+# Session resume: the server replays events after last_seq on reconnect
+var session_id: String = ""
+var last_seq: int = 0
+var session_channel_id: int = -1
+var ws_user_id: int = -1
+var ws_server_id: int = -1
+var ws_token: String = ""
+
+# Reconnect delay suggested by a draining server (seconds, -1 if none)
+var reconnect_hint: float = -1.0
+
 # Signals
 signal message_received(message_data: Dictionary)
 signal user_joined(user_id: int)
@@ -22,6 +33,8 @@ signal user_left(user_id: int)
 signal connection_established()
 signal connection_lost()
 signal connection_error(error: String)
+signal resync_required(channel_id: int)
+signal server_event(event_type: String, event_data: Dictionary)
 
 
 func _ready() -> void:
@@ -150,6 +163,13 @@ func connect_websocket(user_id: int, server_id: int, channel_id: int, token: Str
 	websocket = WebSocketPeer.new()
 	var url = "%s/ws/%d/%d/%d?token=%s" % [WS_BASE_URL, user_id, server_id, channel_id, token]
 	
+	# Resume the previous session on this channel so only missed events are sent
+	if session_id != "" and session_channel_id == channel_id:
+		url += "&session_id=%s&last_seq=%d" % [session_id, last_seq]
+	else:
+		session_id = ""
+		last_seq = 0
+	
 	print("[NetworkManager] Connecting to WebSocket: ", url)
 	
 	var error = websocket.connect_to_url(url)
@@ -160,13 +180,16 @@ func connect_websocket(user_id: int, server_id: int, channel_id: int, token: Str
 		return false
 	
 	current_channel_id = channel_id
-	reconnect_attempts = 0
+	ws_user_id = user_id
+	ws_server_id = server_id
+	ws_token = token
 	
 	# Wait for connection
 	await get_tree().create_timer(1.0).timeout
 	
 	if websocket.get_ready_state() == WebSocketPeer.STATE_OPEN:
 		ws_connected = true
+		reconnect_attempts = 0
 		print("[NetworkManager] WebSocket connected")
 		connection_established.emit()
 		return true
@@ -210,13 +233,38 @@ func _handle_websocket_message(data: Dictionary) -> void:
 	var msg_type = data.get("type", "")
 	var msg_data = data.get("data", {})
 	
+	# Broadcast events carry a per-channel sequence number
+	if data.has("seq"):
+		var seq = int(data["seq"])
+		if seq <= last_seq:
+			return  # Already seen (duplicate after a resume)
+		last_seq = seq
+	
 	match msg_type:
+		"hello":
+			session_id = msg_data.get("session_id", "")
+			session_channel_id = current_channel_id
+			if not msg_data.get("resumed", false):
+				last_seq = int(msg_data.get("seq", 0))
+		"ping":
+			# Server heartbeat; silent clients are disconnected
+			send_websocket_message({"type": "pong"})
+		"reconnect":
+			# Server is restarting; it closes the socket right after this hint
+			reconnect_hint = msg_data.get("delay_ms", 0) / 1000.0
+		"resync_required":
+			# Too much was missed to replay; refetch history over HTTP
+			last_seq = int(msg_data.get("seq", 0))
+			resync_required.emit(current_channel_id)
 		"message":
 			message_received.emit(msg_data)
 		"user_join":
 			user_joined.emit(msg_data.get("user_id", 0))
 		"user_leave":
 			user_left.emit(msg_data.get("user_id", 0))
+		"server_update", "server_delete", "channel_create", "channel_update", "channel_delete":
+			# Sidebar deltas for the whole server, sent once per user
+			server_event.emit(msg_type, msg_data)
 		_:
 			print("[NetworkManager] Unknown message type: ", msg_type)
 
@@ -228,8 +276,12 @@ func _attempt_reconnect() -> void:
 		return
 	
 	reconnect_attempts += 1
-	var delay = pow(2, reconnect_attempts - 1)  # Exponential backoff
-	print("[NetworkManager] Reconnecting in %d seconds (attempt %d/%d)" % [delay, reconnect_attempts, MAX_RECONNECT_ATTEMPTS])
+	var delay = pow(2, reconnect_attempts - 1) + randf()  # Exponential backoff with jitter
+	if reconnect_hint >= 0.0:
+		# Use the server's jittered hint so a restart doesn't cause a reconnect storm
+		delay = reconnect_hint
+		reconnect_hint = -1.0
+	print("[NetworkManager] Reconnecting in %.1f seconds (attempt %d/%d)" % [delay, reconnect_attempts, MAX_RECONNECT_ATTEMPTS])
 	
 	reconnect_timer.start(delay)
 
@@ -237,5 +289,15 @@ func _attempt_reconnect() -> void:
 func _on_reconnect_timeout() -> void:
 	"""Handle reconnection timeout."""
 	print("[NetworkManager] Attempting to reconnect...")
-	# Reconnection logic should be handled by the scene that initiated the connection
-	connection_error.emit("Connection lost. Please reconnect.")
+	if current_channel_id < 0 or ws_token == "":
+		connection_error.emit("Connection lost. Please reconnect.")
+		return
+	
+	# The access token may have been refreshed since the socket was opened
+	if AuthManager.is_authenticated:
+		ws_token = AuthManager.get_token()
+	
+	# Reconnecting with the stored session resumes without refetching history
+	var success = await connect_websocket(ws_user_id, ws_server_id, current_channel_id, ws_token)
+	if not success:
+		_attempt_reconnect()
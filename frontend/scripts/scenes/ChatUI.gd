@@ -23,6 +23,7 @@ func _ready() -> void:
 	NetworkManager.message_received.connect(_on_websocket_message)
 	NetworkManager.connection_established.connect(_on_ws_connected)
 	NetworkManager.connection_lost.connect(_on_ws_disconnected)
+	NetworkManager.resync_required.connect(_on_resync_required)
 	
 	send_button.pressed.connect(_on_send_pressed)
 	message_input.text_submitted.connect(_on_message_submitted)
@@ -86,6 +87,16 @@ func _connect_websocket(channel_id: int) -> void:
 		print("[ChatUI] WebSocket connected")
 
 
+func _on_resync_required(channel_id: int) -> void:
+	"""Reload history when the server could not replay missed events.
+	
+	Args:
+		channel_id: Channel ID
+	"""
+	print("[ChatUI] Resync required, reloading channel: ", channel_id)
+	await _load_messages(channel_id)
+
+
 func _on_messages_updated(channel_id: int, messages: Array) -> void:
 	"""Update messages display.
 	
@@ -89,7 +89,7 @@ func _on_login_pressed() -> void:
 		var token = data.get("access_token", "")
 		
 		# Get user data
-		await _fetch_user_data(token)
+		await _fetch_user_data(token, data.get("refresh_token", ""), int(data.get("expires_in", 0)))
 	else:
 		var error_msg = data.get("detail", "Login failed")
 		show_status(error_msg, false)
@@ -155,11 +155,13 @@ func _on_register_pressed() -> void:
 		show_status(result.error, false)
 
 
-func _fetch_user_data(token: String) -> void:
+func _fetch_user_data(token: String, refresh_token: String = "", expires_in: int = 0) -> void:
 	"""Fetch user data after login.
 	
 	Args:
 		token: JWT authentication token
+		refresh_token: Refresh token from the login response
+		expires_in: Access token lifetime in seconds
 	"""
 	show_status("Fetching user data...", true)
 	
@@ -169,7 +171,7 @@ func _fetch_user_data(token: String) -> void:
 		var user_data = result.data
 		
 		# Update auth manager
-		AuthManager.login(token, user_data)
+		AuthManager.login(token, user_data, refresh_token, expires_in)
 		
 		show_status("Login successful!", true)
 		await get_tree().create_timer(0.5).timeout